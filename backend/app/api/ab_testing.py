@@ -38,10 +38,11 @@ from datetime import datetime, timedelta
 
 # Import the A/B testing framework
 from services.ab_testing_framework import (
-    ABTestingFramework, ABTest, TestVariant, TestParticipant, TestResult,
+    ABTest, TestVariant, TestParticipant, TestResult,
     TestType, TestStatus, TrafficAllocationMethod, StatisticalTest, MetricType
 )
 from services.prompt_analytics_service import prompt_analytics_service
+from services.service_container import get_ab_testing_framework
 from middleware.auth import get_current_user
 from utils.error_handlers import ValidationError
 
@@ -51,7 +52,8 @@ router = APIRouter()
 
 # Initialize A/B testing framework
 try:
-    ab_framework = ABTestingFramework()
+    # Istanza condivisa del container: i risultati bufferizzati vengono scritti allo shutdown
+    ab_framework = get_ab_testing_framework()
     logger.info("A/B testing framework initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize A/B testing framework: {str(e)}")
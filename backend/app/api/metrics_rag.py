@@ -5,7 +5,7 @@ from services.metrics import metrics
 
 try:
     from services.rag_service import RAGService
-    from services.rag_service import get_rag_service  # provider if available
+    from services.service_container import get_rag_service  # shared instance
 except Exception:
     RAGService = None
     get_rag_service = None
@@ -9,6 +9,7 @@ from services.metrics import metrics
 
 from services.llm_service import LLMService
 from services.rag_service import RAGService
+from services.service_container import service_container
 from services.nlp_utils import extract_nouns, normalize_terms, rank_concepts
 
 router = APIRouter(prefix="/mindmap", tags=["mindmap"]) 
@@ -310,10 +311,10 @@ def _format_sources(sources: Optional[List[Dict[str, Any]]]) -> List[str]:
     return unique
 
 def get_llm_service() -> LLMService:
-    return LLMService()
+    return service_container.get("llm")
 
 def get_rag_service() -> RAGService:
-    return RAGService()
+    return service_container.get("rag")
 
 @router.post("/expand", response_model=MindmapExpandResponse)
 async def expand_mindmap_node(
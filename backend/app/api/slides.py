@@ -21,6 +21,7 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 logger = logging.getLogger(__name__)
 
 from services.llm_service import LLMService
+from services.service_container import service_container
 
 router = APIRouter(prefix="/slides", tags=["slides"])
 
@@ -136,7 +137,7 @@ def get_slide_storage() -> SlideStorageService:
     return SlideStorageService()
 
 def get_llm_service() -> LLMService:
-    return LLMService()
+    return service_container.get("llm")
 
 @router.post("/generate", response_model=SlideGenerationResponse)
 async def generate_slides(
@@ -153,9 +154,7 @@ async def generate_slides(
         rag_context = ""
         if request.book_id:
             try:
-                from services.rag_service import RAGService
-
-                rag_service = RAGService()
+                rag_service = service_container.get("rag")
                 rag_response = await rag_service.retrieve_context(
                     f"Create slides about {request.topic}",
                     request.course_id,
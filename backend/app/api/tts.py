@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 
-from services.local_tts_service import synthesize_local, synthesize_batch_local, list_recordings as list_rec_meta
+from services.local_tts_service import synthesize_local_async, synthesize_batch_local_async, list_recordings as list_rec_meta
 from services.audio_library_service import (
     list_recordings as lib_list,
     update_recording,
@@ -35,6 +35,7 @@ class TTSBatchItem(BaseModel):
     voice: Optional[str] = None
     speed: Optional[float] = None
     tone: Optional[str] = None
+    speaker_id: Optional[str] = None
 
 class TTSBatchRequest(BaseModel):
     items: List[TTSBatchItem]
@@ -80,19 +81,19 @@ async def voices_custom_add_sample(voice_id: str, file: UploadFile = File(...))
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/synthesize")
-def synthesize(req: TTSRequest) -> Dict[str, Any]:
+async def synthesize(req: TTSRequest) -> Dict[str, Any]:
     try:
-        rec = synthesize_local(req.text, req.title, req.language, req.voice, req.speed, req.tone, req.speaker_id)
+        rec = await synthesize_local_async(req.text, req.title, req.language, req.voice, req.speed, req.tone, req.speaker_id)
         if req.categories:
-            update_recording(rec["id"], {"categories": req.categories})
+            rec = update_recording(rec["id"], {"categories": req.categories}) or rec
         return rec
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/synthesize/batch")
-def synthesize_batch_api(req: TTSBatchRequest) -> List[Dict[str, Any]]:
+async def synthesize_batch_api(req: TTSBatchRequest) -> List[Dict[str, Any]]:
     try:
-        return synthesize_batch_local([i.model_dump() for i in req.items])
+        return await synthesize_batch_local_async([i.model_dump() for i in req.items])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
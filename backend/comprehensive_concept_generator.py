@@ -16,6 +16,7 @@ from typing import List, Dict, Any
 sys.path.append(str(Path(__file__).parent))
 
 from services.concept_map_service import ConceptMapService
+from services.pdf_text_cache import pdf_text_cache
 import structlog
 
 logger = structlog.get_logger()
@@ -112,8 +113,8 @@ class ComprehensiveConceptGenerator:
 
             # Method 1: Try to use RAG service structure analysis
             try:
-                from services.rag_service import RAGService
-                rag_service = RAGService()
+                from services.service_container import get_rag_service
+                rag_service = get_rag_service()
                 structure = rag_service.analyze_pdf_structure(file_path)
                 rag_chapters = structure.get("chapters", [])
 
@@ -139,17 +140,12 @@ class ComprehensiveConceptGenerator:
 
             # Method 2: Manual chapter detection using patterns
             try:
-                import fitz  # PyMuPDF
-                doc = fitz.open(file_path)
+                pages = await asyncio.to_thread(pdf_text_cache.get_pages, file_path)
                 full_text = ""
 
-                for page_num in range(min(len(doc), 50)):  # Limit to first 50 pages for performance
-                    page = doc.load_page(page_num)
-                    text = page.get_text()
+                for page_num, text in enumerate(pages[:50]):  # Limit to first 50 pages for performance
                     full_text += f"\n--- PAGE {page_num + 1} ---\n{text}\n"
 
-                doc.close()
-
                 # Italian chapter patterns
                 chapter_patterns = [
                     r'Capitolo\s+(\d+)\s*[:\-\.]\s*(.+?)(?=\n|$|\nCapitolo|\n\d+\.)',
@@ -206,9 +202,8 @@ class ComprehensiveConceptGenerator:
 
             # Method 3: Create chapter-like structure from PDF content sections
             try:
-                import fitz
-                doc = fitz.open(file_path)
-                total_pages = len(doc)
+                pages = await asyncio.to_thread(pdf_text_cache.get_pages, file_path)
+                total_pages = len(pages)
 
                 # Create artificial chapters based on page ranges
                 pages_per_chapter = max(10, total_pages // 10)  # Max 10 chapters
@@ -219,9 +214,8 @@ class ComprehensiveConceptGenerator:
 
                     # Extract sample text for this section
                     section_text = ""
-                    for page_num in range(start_page - 1, min(end_page, total_pages)):
-                        page = doc.load_page(page_num)
-                        section_text += page.get_text()[:300]  # First 300 chars per page
+                    for page_text in pages[start_page - 1:end_page]:
+                        section_text += page_text[:300]  # First 300 chars per page
 
                     # Extract key terms from section text
                     words = section_text.split()
@@ -239,7 +233,6 @@ class ComprehensiveConceptGenerator:
                         "type": "section"
                     })
 
-                doc.close()
                 logger.info(f"✅ Section creation found {len(chapters)} sections")
                 return chapters[:15]  # Limit to 15 sections
 
@@ -260,18 +253,13 @@ class ComprehensiveConceptGenerator:
             if not file_path or not os.path.exists(file_path):
                 return ""
 
-            import fitz
-            doc = fitz.open(file_path)
+            pages = await asyncio.to_thread(pdf_text_cache.get_pages, file_path)
             sample_text = ""
 
             # Extract from first few pages
-            for page_num in range(min(3, len(doc))):
-                page = doc.load_page(page_num)
-                text = page.get_text()
+            for text in pages[:3]:
                 if text:
                     sample_text += text[:500] + "\n"  # First 500 chars per page
-
-            doc.close()
             return sample_text[:1000]  # Max 1000 chars total
 
         except Exception as e:
@@ -15,8 +15,7 @@ from typing import List, Dict, Any
 # Add backend to path
 sys.path.append(str(Path(__file__).parent))
 
-from services.rag_service import RAGService
-from services.llm_service import LLMService
+from services.service_container import get_llm_service, get_rag_service
 from services.concept_map_service import ConceptMapService
 import structlog
 
@@ -24,8 +23,8 @@ logger = structlog.get_logger()
 
 class EnhancedConceptExtractor:
     def __init__(self):
-        self.rag_service = RAGService()
-        self.llm_service = LLMService()
+        self.rag_service = get_rag_service()
+        self.llm_service = get_llm_service()
         self.concept_service = ConceptMapService()
 
     async def extract_concepts_from_all_pdfs(self, course_id: str):
@@ -9,8 +9,7 @@ from pathlib import Path
 from typing import Dict, List, Any, Optional
 from pydantic import BaseModel
 from fastapi import HTTPException
-from services.llm_service import LLMService
-from services.rag_service import RAGService
+from services.service_container import get_llm_service, get_rag_service
 
 class HybridConceptRequest(BaseModel):
     course_id: str
@@ -21,8 +20,8 @@ class HybridConceptRequest(BaseModel):
 
 class HybridConceptService:
     def __init__(self):
-        self.llm_service = LLMService()
-        self.rag_service = RAGService()
+        self.llm_service = get_llm_service()
+        self.rag_service = get_rag_service()
 
     async def get_hybrid_concepts(self, request: HybridConceptRequest) -> Dict[str, Any]:
         """
@@ -1,7 +1,11 @@
+# Il profiler degli import va installato prima di ogni altro import dell'applicazione
+from services.startup_profiler import startup_profiler, install_from_env as install_startup_profiler
+install_startup_profiler()
+
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from dataclasses import asdict
@@ -14,10 +18,13 @@ import logging
 from datetime import datetime, timedelta
 import structlog
 import asyncio
+from contextlib import asynccontextmanager
 
-from services.rag_service import RAGService
-from services.llm_service import LLMService, OPENROUTER_MODELS, ZAI_MODELS, OPENAI_MODELS, LOCAL_MODELS
-from services.course_service import CourseService
+from services.llm_service import OPENROUTER_MODELS, ZAI_MODELS, OPENAI_MODELS, LOCAL_MODELS
+from services.llm_transport import close_transports as close_llm_transports
+from services.service_container import (
+    service_container, get_rag_service, get_llm_service, get_course_service, get_annotation_service
+)
 from services.concept_map_service import concept_map_service
 # from services.enhanced_mindmap_service import EnhancedMindmapService, StudySessionContext
 # Temporarily disabled for startup
@@ -67,14 +74,16 @@ from services.book_service import BookService
 from services.study_tracker import StudyTracker
 from services.study_planner_service import StudyPlannerService
 from services.background_task_service import background_task_service
-from services.annotation_service import AnnotationService
-from services.ocr_service import ocr_service
+from services.ingestion_service import ingestion_service
+from services.pdf_text_cache import pdf_text_cache
+from utils.file_utils import async_ops
+# OCR (cv2, easyocr, pytesseract) caricato al primo utilizzo degli endpoint /ocr
+ocr_service = service_container.lazy("ocr")
 from services.advanced_search_service import advanced_search_service, SearchType, SortOrder, SearchFilter, SearchQuery
-from services.course_chat_session import course_chat_session_manager
+from services.course_chat_session import course_chat_session_manager, SessionContextType
 from services.course_rag_service import init_course_rag_service
 from services.spaced_repetition_service import spaced_repetition_service
 from services.active_recall_service import active_recall_engine
-from services.dual_coding_service import dual_coding_service
 from services.interleaved_practice_service import interleaved_practice_service
 from services.metacognition_service import metacognition_service
 from services.elaboration_network_service import elaboration_network_service
@@ -240,7 +249,7 @@ from utils.security import (
     SecurityLogger, rate_limit_check, SecurityConfig
 )
 from utils.exceptions import (
-    ErrorHandler, ValidationError, FileOperationError,
+    ErrorHandler, ValidationError,
     RateLimitError, SecurityError, safe_execute
 )
 
@@ -410,7 +419,29 @@ except ImportError:
 logger = get_logger(__name__)
 logger.info("Starting Tutor-AI Backend Application")
 
-app = FastAPI(title="AI Tutor Backend", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm-up dei servizi condivisi all'avvio; chiusura di connessioni e pool allo shutdown."""
+    if startup_profiler.installed:
+        startup_profiler.finish()
+        profile = startup_profiler.report()
+        logger.info("Startup import profile", total_ms=profile["total_ms"],
+                    modules_imported=profile["modules_imported"],
+                    slowest=[(entry["module"], entry["self_ms"]) for entry in profile["modules"][:10]])
+    await service_container.startup()
+    try:
+        yield
+    finally:
+        await service_container.shutdown()
+        await close_llm_transports()
+        ingestion_service.shutdown(wait=False)
+        pdf_text_cache.shutdown()
+        if tts_router:
+            from services.local_tts_service import shutdown_workers as shutdown_tts_workers
+            shutdown_tts_workers()
+
+
+app = FastAPI(title="AI Tutor Backend", version="1.0.0", lifespan=lifespan)
 
 # Add comprehensive API logging middleware
 from middleware.logging_middleware import APILoggingMiddleware
@@ -578,10 +609,10 @@ async def global_exception_handler(request: Request, exc: Exception):
         content=http_exc.detail
     )
 
-# Initialize services
-rag_service = RAGService()
-llm_service = LLMService()
-course_service = CourseService()
+# Initialize services (istanze condivise dal service container)
+rag_service = get_rag_service()
+llm_service = get_llm_service()
+course_service = get_course_service()
 book_service = BookService()
 study_tracker = StudyTracker()
 @app.get("/courses/{course_id}/progress")
@@ -590,9 +621,8 @@ async def get_course_progress(course_id: str):
 
 @app.get("/courses/{course_id}/study-sessions")
 async def get_course_sessions(course_id: str, limit: int = 10):
-    sessions = [s for s in study_tracker.get_sessions_raw() if s.get("course_id") == course_id]
-    sessions.sort(key=lambda s: s.get("start_time", ""), reverse=True)
-    return {"course_id": course_id, "sessions": sessions[:max(1, limit)]}
+    sessions = study_tracker.get_sessions_raw(course_id, limit=max(1, limit), newest_first=True)
+    return {"course_id": course_id, "sessions": sessions}
 
 @app.get("/courses/{course_id}/quiz/performance")
 async def get_quiz_performance(course_id: str):
@@ -602,21 +632,22 @@ async def get_quiz_performance(course_id: str):
 async def get_study_time_today(course_id: str):
     total = 0
     today = datetime.now().date()
-    for s in study_tracker.get_sessions_raw():
-        if s.get("course_id") == course_id:
-            try:
-                if datetime.fromisoformat(s.get("start_time")).date() == today:
-                    total += int(s.get("duration_minutes", 0))
-            except Exception:
-                continue
+    start_of_day = datetime.combine(today, datetime.min.time())
+    for s in study_tracker.get_sessions_raw(course_id, since=start_of_day):
+        try:
+            if datetime.fromisoformat(s.get("start_time")).date() == today:
+                total += int(s.get("duration_minutes", 0))
+        except Exception:
+            continue
     return {"course_id": course_id, "study_time_minutes": total}
 study_planner = StudyPlannerService()
 # enhanced_mindmap_service = EnhancedMindmapService()
 # Temporarily disabled for startup
-annotation_service = AnnotationService()
+annotation_service = get_annotation_service()
 
 # Initialize enhanced course chat services
 course_rag_service = init_course_rag_service(rag_service, llm_service)
+get_dual_coding_engine = service_container.provider("dual_coding")
 
 # Initialize Knowledge Area Service
 knowledge_area_service = KnowledgeAreaService(rag_service, llm_service, active_recall_engine)
@@ -665,6 +696,7 @@ class ChatMessage(BaseModel):
     session_id: Optional[str] = None
     use_hybrid_search: Optional[bool] = False  # Enable hybrid search
     search_k: Optional[int] = 5  # Number of documents to retrieve
+    stream: Optional[bool] = False  # Stream tokens as Server-Sent Events
 
 class EnhancedChatMessage(BaseModel):
     """Enhanced chat message for course-specific chatbot"""
@@ -678,6 +710,7 @@ class EnhancedChatMessage(BaseModel):
     response_length: Optional[str] = "medium"  # short, medium, long
     include_examples: Optional[bool] = True
     difficulty_preference: Optional[str] = "adaptive"  # adaptive, beginner, intermediate, advanced
+    stream: Optional[bool] = False  # Stream tokens as Server-Sent Events
 
 class QuizRequest(BaseModel):
     course_id: str
@@ -1892,32 +1925,9 @@ async def upload_material(course_id: str, file: UploadFile = File(...), request:
         if x_forwarded_for:
             client_ip = x_forwarded_for.split(",")[0].strip()
 
-        # Read file content for validation
-        file_content = await file.read()
-        file_size = len(file_content)
-
-        # Reset file position for later processing
-        await file.seek(0)
-
         # Get file MIME type
         mime_type = file.content_type or "application/octet-stream"
 
-        # Validate file upload with security checks
-        try:
-            validate_file_upload(file.filename, file_size, mime_type)
-        except ValueError as e:
-            SecurityLogger.log_suspicious_activity(
-                "Invalid file upload attempt",
-                {
-                    "filename": file.filename,
-                    "size": file_size,
-                    "mime_type": mime_type,
-                    "course_id": course_id
-                },
-                client_ip
-            )
-            raise ValidationError(str(e))
-
         # Sanitize filename to prevent directory traversal
         try:
             safe_filename_str = sanitize_filename(file.filename)
@@ -1975,13 +1985,33 @@ async def upload_material(course_id: str, file: UploadFile = File(...), request:
         if not file.filename.lower().endswith('.pdf'):
             raise ValidationError("Only PDF files are allowed")
 
-        # Validate PDF content
+        # Stream the upload to a temporary file (never held entirely in memory)
         temp_file_path = validated_file_path + ".tmp"
         try:
-            # Write to temporary file first
-            with open(temp_file_path, "wb") as temp_buffer:
-                temp_buffer.write(file_content)
+            file_size = await async_ops.save_upload(file, temp_file_path, max_bytes=SecurityConfig.MAX_FILE_SIZE)
+        except ValueError:
+            file_size = SecurityConfig.MAX_FILE_SIZE + 1
 
+        # Validate file upload with security checks
+        try:
+            validate_file_upload(file.filename, file_size, mime_type)
+        except ValueError as e:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            SecurityLogger.log_suspicious_activity(
+                "Invalid file upload attempt",
+                {
+                    "filename": file.filename,
+                    "size": file_size,
+                    "mime_type": mime_type,
+                    "course_id": course_id
+                },
+                client_ip
+            )
+            raise ValidationError(str(e))
+
+        # Validate PDF content
+        try:
             # Validate it's actually a PDF
             from utils.security import validate_pdf_content
             validate_pdf_content(temp_file_path)
@@ -2001,22 +2031,23 @@ async def upload_material(course_id: str, file: UploadFile = File(...), request:
             action="file_upload"
         )
 
-        # Process and index the PDF with error handling
-        try:
-            await rag_service.index_pdf(validated_file_path, course_id)
-        except Exception as e:
-            # If indexing fails, remove the uploaded file
-            if os.path.exists(validated_file_path):
-                os.remove(validated_file_path)
-            logger.error(f"PDF indexing failed for {validated_file_path}: {e}")
-            raise FileOperationError(f"Failed to process PDF: {e}")
+        # Index the PDF in background: if indexing fails the uploaded file is removed
+        task_id = ingestion_service.enqueue_pdf_indexing(
+            rag_service,
+            validated_file_path,
+            course_id,
+            remove_on_failure=True,
+            metadata={"original_filename": file.filename}
+        )
 
         return {
             "success": True,
-            "message": "File uploaded and indexed successfully",
+            "message": "File uploaded, indexing started",
             "filename": unique_filename,
             "original_filename": file.filename,
-            "size": file_size
+            "size": file_size,
+            "task_id": task_id,
+            "status_url": f"/tasks/{task_id}"
         }
 
     except (ValidationError, SecurityError) as e:
@@ -2185,18 +2216,17 @@ async def upload_book_material(course_id: str, book_id: str, file: UploadFile =
         os.makedirs(book_dir, exist_ok=True)
         file_path = f"{book_dir}/{file.filename}"
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await async_ops.save_upload(file, file_path)
 
-        # Process and index the PDF for the book (with error handling)
-        try:
-            await rag_service.index_pdf(file_path, course_id, book_id)
-            indexing_status = "File uploaded and indexed successfully"
-        except Exception as indexing_error:
-            print(f"Warning: RAG indexing failed: {indexing_error}")
-            indexing_status = "File uploaded successfully (indexing temporarily disabled)"
+        # Index the PDF for the book in background
+        task_id = ingestion_service.enqueue_pdf_indexing(rag_service, file_path, course_id, book_id)
 
-        return {"success": True, "message": indexing_status}
+        return {
+            "success": True,
+            "message": "File uploaded, indexing started",
+            "task_id": task_id,
+            "status_url": f"/tasks/{task_id}"
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -2401,6 +2431,42 @@ async def merge_course_pdfs(course_id: str):
         logger.error(f"Error merging course PDFs for course {course_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to merge course PDFs: {str(e)}")
 
+def _sse_event(event: str, data: Any) -> str:
+    """Formatta un evento Server-Sent Events con payload JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def _stream_chat_events(token_stream, finalize, start_payload: Dict[str, Any]) -> StreamingResponse:
+    """
+    Risposta SSE per la chat: evento `start`, un evento `token` per ogni frammento
+    generato, poi `done` con lo stesso payload della risposta non in streaming.
+    Il post-processing (`finalize`) gira solo dopo la chiusura dello stream.
+    """
+    async def event_source():
+        yield _sse_event("start", start_payload)
+        parts: List[str] = []
+        try:
+            async for delta in token_stream:
+                parts.append(delta)
+                yield _sse_event("token", {"delta": delta})
+        except Exception as e:
+            logger.error(f"Chat streaming failed: {e}")
+            yield _sse_event("error", {"detail": str(e)})
+            return
+
+        try:
+            result = await finalize("".join(parts))
+        except Exception as e:
+            logger.error(f"Chat post-processing failed: {e}")
+            yield _sse_event("error", {"detail": str(e)})
+            return
+        yield _sse_event("done", result)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/chat")
 async def chat(chat_message: ChatMessage):
     """Original chat endpoint - maintained for compatibility"""
@@ -2427,35 +2493,54 @@ async def chat(chat_message: ChatMessage):
                 user_id=chat_message.user_id
             )
 
+        async def finalize(response: str) -> Dict[str, Any]:
+            # Track session
+            session_id = study_tracker.track_interaction(
+                chat_message.course_id,
+                chat_message.session_id,
+                chat_message.message,
+                response
+            )
+
+            return {
+                "response": response,
+                "session_id": session_id,
+                "sources": context.get("sources", []),
+                "search_method": context.get("search_method", "semantic"),
+                "cache_info": {
+                    "cache_enabled": True,
+                    "cached": context.get("cached", False)
+                },
+                "search_stats": {
+                    "hybrid_used": chat_message.use_hybrid_search,
+                    "results_count": len(context.get("sources", []))
+                }
+            }
+
+        if chat_message.stream:
+            return _stream_chat_events(
+                llm_service.generate_response_stream(
+                    chat_message.message,
+                    context,
+                    chat_message.course_id,
+                    cache_query=chat_message.message
+                ),
+                finalize,
+                {
+                    "session_id": chat_message.session_id,
+                    "sources": context.get("sources", []),
+                    "search_method": context.get("search_method", "semantic")
+                }
+            )
+
         # Generate response (potentially cached)
         response = await llm_service.generate_response(
             chat_message.message,
             context,
-            chat_message.course_id
-        )
-
-        # Track session
-        session_id = study_tracker.track_interaction(
             chat_message.course_id,
-            chat_message.session_id,
-            chat_message.message,
-            response
+            cache_query=chat_message.message
         )
-
-        return {
-            "response": response,
-            "session_id": session_id,
-            "sources": context.get("sources", []),
-            "search_method": context.get("search_method", "semantic"),
-            "cache_info": {
-                "cache_enabled": True,
-                "cached": context.get("cached", False)
-            },
-            "search_stats": {
-                "hybrid_used": chat_message.use_hybrid_search,
-                "results_count": len(context.get("sources", []))
-            }
-        }
+        return await finalize(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -2478,7 +2563,7 @@ async def course_chat(chat_request: EnhancedChatMessage):
         if chat_request.difficulty_preference and chat_request.difficulty_preference != "adaptive":
             course_chat_session_manager.update_session_context(
                 session.id,
-                course_chat_session_manager.session_manager.SessionContextType.DIFFICULTY_LEVEL,
+                SessionContextType.DIFFICULTY_LEVEL,
                 {"current_level": chat_request.difficulty_preference}
             )
 
@@ -2503,158 +2588,195 @@ async def course_chat(chat_request: EnhancedChatMessage):
             )
 
         # Prepare enhanced prompt with session context
-        enhanced_prompt = await self._prepare_enhanced_prompt(
+        enhanced_prompt = await _prepare_enhanced_prompt(
             chat_request,
             session,
             context
         )
-
-        # Detect quiz intent in user message
-        quiz_intent = _detect_quiz_intent(chat_request.message)
+        llm_context = {
+            "text": enhanced_prompt["context"],
+            "sources": context.get("sources", []),
+            "scope": {"book_id": chat_request.book_id, **(context.get("scope") or {})},
+            # Contesto personale (sessione, progressi, preferenze): la risposta resta fuori dalla cache condivisa
+            "personalization_applied": context.get("personalization_applied", False) or enhanced_prompt["personalized"],
+            "session_context_used": context.get("session_context_used", False)
+        }
+        # Domande parafrasate nello stesso corso/libro con lo stesso stile condividono la risposta
+        answer_cache_variant = enhanced_prompt.get("answer_style", "")
+
+        if chat_request.stream:
+            return _stream_chat_events(
+                llm_service.generate_response_stream(
+                    enhanced_prompt["message"],
+                    llm_context,
+                    chat_request.course_id,
+                    cache_query=chat_request.message,
+                    cache_variant=answer_cache_variant
+                ),
+                lambda response: _finalize_course_chat(
+                    chat_request, session, context, enhanced_prompt, response, start_time
+                ),
+                {
+                    "session_id": session.id,
+                    "sources": context.get("sources", [])[:3]
+                }
+            )
 
         # Generate response
         response = await llm_service.generate_response(
             enhanced_prompt["message"],
-            enhanced_prompt["context"],
-            chat_request.course_id
+            llm_context,
+            chat_request.course_id,
+            cache_query=chat_request.message,
+            cache_variant=answer_cache_variant
         )
 
-        # Calculate response metrics
-        response_time_ms = int((time.time() - start_time) * 1000)
-        confidence_score = self._calculate_confidence_score(response, context)
-
-        # Extract topics from query and response
-        topic_tags = await self._extract_topic_tags(chat_request.message, response)
-
-        # Add message to session
-        message_record = course_chat_session_manager.add_message(
-            session_id=session.id,
-            role="user",
-            content=chat_request.message,
-            context_used=list(enhanced_prompt.get("context_types_used", [])),
-            response_time_ms=response_time_ms,
-            topic_tags=topic_tags
-        )
+        return await _finalize_course_chat(chat_request, session, context, enhanced_prompt, response, start_time)
 
-        # Add assistant response to session
-        assistant_message_record = course_chat_session_manager.add_message(
-            session_id=session.id,
-            role="assistant",
-            content=response,
-            sources=context.get("sources", []),
-            context_used=list(enhanced_prompt.get("context_types_used", [])),
-            confidence_score=confidence_score,
-            response_time_ms=0,  # Generation time already counted
-            topic_tags=topic_tags,
-            parent_message_id=message_record.id
-        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Update study tracker
-        study_tracker.track_interaction(
-            chat_request.course_id,
-            session.id,
-            chat_request.message,
-            response
-        )
+async def _finalize_course_chat(chat_request: EnhancedChatMessage, session, context: Dict[str, Any],
+                                enhanced_prompt: Dict[str, Any], response: str, start_time: float) -> Dict[str, Any]:
+    """Persist the exchange in the session and build the /course-chat response payload"""
+    import time
 
-        # Prepare response with quiz suggestion if detected
-        response_data = {
-            "response": response,
-            "session_id": session.id,
-            "message_id": message_record.id,
-            "sources": context.get("sources", [])[:3],  # Limit sources for response
-            "context_info": {
-                "personalization_applied": context.get("personalization_applied", False),
-                "session_context_used": context.get("session_context_used", False),
-                "context_layers": context.get("context_layers", {}),
-                "topics_discussed": topic_tags
-            },
-            "chat_metadata": {
-                "response_time_ms": response_time_ms,
-                "confidence_score": confidence_score,
-                "enhanced_rag_used": chat_request.use_enhanced_rag,
-                "session_message_count": len(session.messages),
-                "personalization_factors": self._get_session_personalization_factors(session.id)
-            },
-            "learning_insights": {
-                "suggested_follow_up_questions": await self._generate_follow_up_questions(
-                    chat_request.course_id, session.id, chat_request.message
-                ),
-                "concepts_covered": self._get_recent_concepts(session.id),
-                "mastery_indicators": await self._get_mastery_indicators(chat_request.course_id, session.id)
-            }
-        }
+    # Detect quiz intent in user message
+    quiz_intent = _detect_quiz_intent(chat_request.message)
 
-        # Add quiz suggestion if intent detected with high confidence
-        if quiz_intent["wants_quiz"] and quiz_intent["confidence"] >= 0.7:
-            try:
-                # Generate quiz suggestions
-                from services.knowledge_area_service import knowledge_area_service
+    # Calculate response metrics
+    response_time_ms = int((time.time() - start_time) * 1000)
+    confidence_score = _calculate_confidence_score(response, context)
 
-                # Use detected topic or fallback to context-based recommendations
-                quiz_topic = quiz_intent["topic"] if quiz_intent["topic"] else chat_request.message
+    # Extract topics from query and response
+    topic_tags = await _extract_topic_tags(chat_request.message, response)
 
-                recommendations = await knowledge_area_service.get_recommended_quizzes(
-                    chat_request.course_id,
-                    user_id=chat_request.user_id or session.id,
-                    topic_filter=quiz_topic,
-                    max_quizzes=quiz_intent["num_questions"]
-                )
+    # Add message to session
+    message_record = course_chat_session_manager.add_message(
+        session_id=session.id,
+        role="user",
+        content=chat_request.message,
+        context_used=list(enhanced_prompt.get("context_types_used", [])),
+        response_time_ms=response_time_ms,
+        topic_tags=topic_tags
+    )
 
-                if recommendations:
-                    response_data["quiz_suggestion"] = {
-                        "auto_detected": True,
-                        "confidence": quiz_intent["confidence"],
-                        "difficulty": quiz_intent["difficulty"],
-                        "num_questions": quiz_intent["num_questions"],
-                        "topic": quiz_topic,
-                        "quiz_type": quiz_intent["quiz_type"],
-                        "suggested_quizzes": [
-                            {
-                                "concept_id": rec.concept_id,
-                                "concept_name": rec.concept_name,
-                                "quiz_type": rec.quiz_type,
-                                "difficulty": rec.difficulty or quiz_intent["difficulty"],
-                                "estimated_time": rec.estimated_time or 5,
-                                "description": f"Quiz su {rec.concept_name}"
-                            }
-                            for rec in recommendations[:quiz_intent["num_questions"]]
-                        ]
-                    }
-                else:
-                    # Fallback: basic quiz generation suggestion
-                    response_data["quiz_suggestion"] = {
-                        "auto_detected": True,
-                        "confidence": quiz_intent["confidence"],
-                        "difficulty": quiz_intent["difficulty"],
-                        "num_questions": quiz_intent["num_questions"],
-                        "topic": quiz_topic,
-                        "quiz_type": quiz_intent["quiz_type"],
-                        "fallback_mode": True,
-                        "message": f"Posso generare un quiz su '{quiz_topic}' con {quiz_intent['num_questions']} domande di difficoltà {quiz_intent['difficulty']}"
-                    }
+    # Add assistant response to session
+    assistant_message_record = course_chat_session_manager.add_message(
+        session_id=session.id,
+        role="assistant",
+        content=response,
+        sources=context.get("sources", []),
+        context_used=list(enhanced_prompt.get("context_types_used", [])),
+        confidence_score=confidence_score,
+        response_time_ms=0,  # Generation time already counted
+        topic_tags=topic_tags,
+        parent_message_id=message_record.id
+    )
 
-            except Exception as e:
-                # Log error but don't break the chat response
-                import logging
-                logging.warning(f"Error generating quiz suggestion: {e}")
+    # Update study tracker
+    study_tracker.track_interaction(
+        chat_request.course_id,
+        session.id,
+        chat_request.message,
+        response
+    )
 
-                # Still provide basic quiz suggestion
+    # Prepare response with quiz suggestion if detected
+    response_data = {
+        "response": response,
+        "session_id": session.id,
+        "message_id": message_record.id,
+        "sources": context.get("sources", [])[:3],  # Limit sources for response
+        "context_info": {
+            "personalization_applied": context.get("personalization_applied", False),
+            "session_context_used": context.get("session_context_used", False),
+            "context_layers": context.get("context_layers", {}),
+            "topics_discussed": topic_tags
+        },
+        "chat_metadata": {
+            "response_time_ms": response_time_ms,
+            "confidence_score": confidence_score,
+            "enhanced_rag_used": chat_request.use_enhanced_rag,
+            "session_message_count": len(session.messages),
+            "personalization_factors": _get_session_personalization_factors(session.id)
+        },
+        "learning_insights": {
+            "suggested_follow_up_questions": await _generate_follow_up_questions(
+                chat_request.course_id, session.id, chat_request.message
+            ),
+            "concepts_covered": _get_recent_concepts(session.id),
+            "mastery_indicators": await _get_mastery_indicators(chat_request.course_id, session.id)
+        }
+    }
+
+    # Add quiz suggestion if intent detected with high confidence
+    if quiz_intent["wants_quiz"] and quiz_intent["confidence"] >= 0.7:
+        try:
+            # Generate quiz suggestions
+            from services.knowledge_area_service import knowledge_area_service
+
+            # Use detected topic or fallback to context-based recommendations
+            quiz_topic = quiz_intent["topic"] if quiz_intent["topic"] else chat_request.message
+
+            recommendations = await knowledge_area_service.get_recommended_quizzes(
+                chat_request.course_id,
+                user_id=chat_request.user_id or session.id,
+                topic_filter=quiz_topic,
+                max_quizzes=quiz_intent["num_questions"]
+            )
+
+            if recommendations:
+                response_data["quiz_suggestion"] = {
+                    "auto_detected": True,
+                    "confidence": quiz_intent["confidence"],
+                    "difficulty": quiz_intent["difficulty"],
+                    "num_questions": quiz_intent["num_questions"],
+                    "topic": quiz_topic,
+                    "quiz_type": quiz_intent["quiz_type"],
+                    "suggested_quizzes": [
+                        {
+                            "concept_id": rec.concept_id,
+                            "concept_name": rec.concept_name,
+                            "quiz_type": rec.quiz_type,
+                            "difficulty": rec.difficulty or quiz_intent["difficulty"],
+                            "estimated_time": rec.estimated_time or 5,
+                            "description": f"Quiz su {rec.concept_name}"
+                        }
+                        for rec in recommendations[:quiz_intent["num_questions"]]
+                    ]
+                }
+            else:
+                # Fallback: basic quiz generation suggestion
                 response_data["quiz_suggestion"] = {
                     "auto_detected": True,
                     "confidence": quiz_intent["confidence"],
                     "difficulty": quiz_intent["difficulty"],
                     "num_questions": quiz_intent["num_questions"],
-                    "topic": quiz_intent["topic"] or chat_request.message,
+                    "topic": quiz_topic,
                     "quiz_type": quiz_intent["quiz_type"],
                     "fallback_mode": True,
-                    "error": "quiz_generation_failed"
+                    "message": f"Posso generare un quiz su '{quiz_topic}' con {quiz_intent['num_questions']} domande di difficoltà {quiz_intent['difficulty']}"
                 }
 
-        return response_data
+        except Exception as e:
+            # Log error but don't break the chat response
+            import logging
+            logging.warning(f"Error generating quiz suggestion: {e}")
+
+            # Still provide basic quiz suggestion
+            response_data["quiz_suggestion"] = {
+                "auto_detected": True,
+                "confidence": quiz_intent["confidence"],
+                "difficulty": quiz_intent["difficulty"],
+                "num_questions": quiz_intent["num_questions"],
+                "topic": quiz_intent["topic"] or chat_request.message,
+                "quiz_type": quiz_intent["quiz_type"],
+                "fallback_mode": True,
+                "error": "quiz_generation_failed"
+            }
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return response_data
 
 # Helper methods for enhanced chat endpoint
 def _detect_quiz_intent(message: str) -> dict:
@@ -2785,11 +2907,16 @@ async def _prepare_enhanced_prompt(chat_request: EnhancedChatMessage, session, c
     # Build context types used
     context_types_used = []
     prompt_parts = [chat_request.message]
+    # Istruzioni di stile che cambiano la risposta (variante della cache semantica)
+    answer_style = [chat_request.response_length or "", str(bool(chat_request.include_examples))]
+    # Dati personali dello studente nel prompt (non coperti dalla variante di stile)
+    personalized = False
 
     # Add learning style context
     if learning_style:
         context_types_used.append("learning_style")
         preferred_format = learning_style.get("preferred_format", "explanations")
+        answer_style.append(preferred_format)
         prompt_parts.append(
             f"Adatta le tue risposte al formato {preferred_format}. "
             f"Interazione preferita: {learning_style.get('interaction_style', 'conversational')}."
@@ -2804,6 +2931,7 @@ async def _prepare_enhanced_prompt(chat_request: EnhancedChatMessage, session, c
         current_level = difficulty_level.get("current_level", "intermediate")
         if chat_request.difficulty_preference != "adaptive":
             current_level = chat_request.difficulty_preference
+        answer_style.append(current_level)
         prompt_parts.append(f"Rispondi a livello {current_level}.")
         prompt_parts.append(f"La difficoltà attuale indicata è: {current_level}.")
 
@@ -2815,6 +2943,7 @@ async def _prepare_enhanced_prompt(chat_request: EnhancedChatMessage, session, c
             recent_mastery = list(mastery_levels.items())[-3:]  # Last 3 items
             mastery_text = ", ".join([f"{k}: {v}" for k, v in recent_mastery])
             if mastery_text:
+                personalized = True
                 prompt_parts.append(f"Risultati recenti di apprendimento: {mastery_text}.")
 
     # Add response length preference
@@ -2839,8 +2968,10 @@ async def _prepare_enhanced_prompt(chat_request: EnhancedChatMessage, session, c
 
     return {
         "message": " ".join(prompt_parts),
-        "context": context.get("context", ""),
-        "context_types_used": context_types_used
+        "context": context.get("context") or context.get("text", ""),
+        "context_types_used": context_types_used,
+        "answer_style": "|".join(answer_style),
+        "personalized": personalized
     }
 
 def _calculate_confidence_score(response: str, context: Dict[str, Any]) -> float:
@@ -2898,21 +3029,21 @@ def _get_session_personalization_factors(session_id: str) -> List[str]:
 
     # Check if session has learning style preferences
     learning_style = course_chat_session_manager.get_session_context(
-        session_id, course_chat_session_manager.SessionContextType.LEARNING_STYLE
+        session_id, SessionContextType.LEARNING_STYLE
     )
     if learning_style:
         factors.append("learning_style_personalization")
 
     # Check if session has difficulty preferences
     difficulty = course_chat_session_manager.get_session_context(
-        session_id, course_chat_session_manager.SessionContextType.DIFFICULTY_LEVEL
+        session_id, SessionContextType.DIFFICULTY_LEVEL
     )
     if difficulty and difficulty.get("current_level") != "intermediate":
         factors.append("difficulty_adaptation")
 
     # Check if session has concept mapping
     concept_map = course_chat_session_manager.get_session_context(
-        session_id, course_chat_session_manager.SessionContextType.CONCEPT_MAP
+        session_id, SessionContextType.CONCEPT_MAP
     )
     if concept_map and concept_map.get("concepts"):
         factors.append("concept_relationship_tracking")
@@ -2923,7 +3054,7 @@ async def _generate_follow_up_questions(course_id: str, session_id: str, current
     """Generate intelligent follow-up questions based on context"""
     # Get session context
     topic_history = course_chat_session_manager.get_session_context(
-        session_id, course_chat_session_manager.SessionContextType.TOPIC_HISTORY
+        session_id, SessionContextType.TOPIC_HISTORY
     )
 
     # Extract key concepts from current query
@@ -2956,7 +3087,7 @@ async def _generate_follow_up_questions(course_id: str, session_id: str, current
 def _get_recent_concepts(session_id: str) -> List[str]:
     """Get recently discussed concepts from session"""
     concept_map = course_chat_session_manager.get_session_context(
-        session_id, course_chat_session_manager.SessionContextType.CONCEPT_MAP
+        session_id, SessionContextType.CONCEPT_MAP
     )
 
     if concept_map:
@@ -2966,7 +3097,7 @@ def _get_recent_concepts(session_id: str) -> List[str]:
 async def _get_mastery_indicators(course_id: str, session_id: str) -> Dict[str, Any]:
     """Get mastery indicators for the session"""
     study_progress = course_chat_session_manager.get_session_context(
-        session_id, course_chat_session_manager.SessionContextType.STUDY_PROGRESS
+        session_id, SessionContextType.STUDY_PROGRESS
     )
 
     if not study_progress:
@@ -3196,7 +3327,7 @@ async def clear_cache(cache_type: Optional[str] = None):
 async def invalidate_cache(invalidation_request: CacheInvalidationRequest):
     """Invalidate cache for specific course/book"""
     try:
-        rag_service.invalidate_course_cache(
+        await rag_service.invalidate_course_cache(
             invalidation_request.course_id,
             invalidation_request.book_id
         )
@@ -4046,7 +4177,6 @@ async def analyze_book_content(course_id: str, book_id: str, request: BookConcep
     try:
         from services.rag_service import BookContentAnalyzer
 
-        rag_service = RAGService()
         book_analyzer = BookContentAnalyzer(rag_service)
 
         analysis = await book_analyzer.analyze_book_content(course_id, book_id)
@@ -4618,15 +4748,21 @@ async def cancel_task(task_id: str):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "services": service_container.health()
+    }
+
+@app.get("/health/startup")
+async def startup_profile(top: int = Query(25, ge=1, le=500)):
+    """Tempi di import per modulo misurati all'avvio (richiede STARTUP_PROFILE=true)."""
+    return startup_profiler.report(top=top)
 
 @app.get("/ai/provider")
 async def get_ai_provider_info():
     """Get current AI provider information"""
     try:
-        from services.llm_service import LLMService
-        llm_service = LLMService()
-
         provider_info = {
             "provider": llm_service.model_type,
             "model": llm_service.model,
@@ -5041,18 +5177,14 @@ async def get_search_facets(query: str = ""):
             result = await advanced_search_service.search(search_query)
             return {"facets": result.facets}
         else:
-            # Return available facets without search
-            # This would typically come from cached metadata
+            # Conteggi letti direttamente dalle tabelle dell'indice
+            facets = await asyncio.to_thread(advanced_search_service.get_facets)
             return {
                 "facets": {
-                    "types": {
-                        "annotation": 0,
-                        "ocr_result": 0,
-                        "pdf_content": 0
-                    },
-                    "courses": {},
-                    "users": {},
-                    "tags": {}
+                    "types": {"annotation": 0, "ocr_result": 0, "pdf_content": 0, **facets.get("types", {})},
+                    "courses": facets.get("courses", {}),
+                    "users": facets.get("users", {}),
+                    "tags": facets.get("tags", {})
                 }
             }
     except Exception as e:
@@ -5063,7 +5195,7 @@ async def get_search_facets(query: str = ""):
 async def rebuild_search_indexes():
     """Rebuild search indexes"""
     try:
-        advanced_search_service.rebuild_indexes()
+        await asyncio.to_thread(advanced_search_service.rebuild_indexes)
         return {"message": "Search indexes rebuilt successfully"}
     except Exception as e:
         logger.error(f"Error rebuilding search indexes: {e}")
@@ -5145,7 +5277,8 @@ async def get_search_stats():
 async def create_learning_card(card_request: LearningCardCreate):
     """Create a new learning card"""
     try:
-        card_id = spaced_repetition_service.create_card(
+        card_id = await asyncio.to_thread(
+            spaced_repetition_service.create_card,
             course_id=card_request.course_id,
             question=card_request.question,
             answer=card_request.answer,
@@ -5156,31 +5289,28 @@ async def create_learning_card(card_request: LearningCardCreate):
         )
 
         # Retrieve the created card
-        from services.spaced_repetition_service import SpacedRepetitionService
-        temp_service = SpacedRepetitionService()
-        cards = temp_service.get_due_cards(card_request.course_id, limit=1)
-
-        for card in cards:
-            if card.id == card_id:
-                return LearningCardResponse(
-                    id=card.id,
-                    course_id=card.course_id,
-                    concept_id=card.concept_id,
-                    question=card.question,
-                    answer=card.answer,
-                    card_type=card.card_type,
-                    difficulty=card.difficulty,
-                    ease_factor=card.ease_factor,
-                    interval_days=card.interval_days,
-                    repetitions=card.repetitions,
-                    next_review=card.next_review,
-                    created_at=card.created_at,
-                    last_reviewed=card.last_reviewed,
-                    review_count=card.review_count,
-                    total_quality=card.total_quality,
-                    context_tags=card.context_tags,
-                    source_material=card.source_material
-                )
+        card = await asyncio.to_thread(spaced_repetition_service.get_card, card_id)
+
+        if card:
+            return LearningCardResponse(
+                id=card.id,
+                course_id=card.course_id,
+                concept_id=card.concept_id,
+                question=card.question,
+                answer=card.answer,
+                card_type=card.card_type,
+                difficulty=card.difficulty,
+                ease_factor=card.ease_factor,
+                interval_days=card.interval_days,
+                repetitions=card.repetitions,
+                next_review=card.next_review,
+                created_at=card.created_at,
+                last_reviewed=card.last_reviewed,
+                review_count=card.review_count,
+                total_quality=card.total_quality,
+                context_tags=card.context_tags,
+                source_material=card.source_material
+            )
 
         raise HTTPException(status_code=404, detail="Card not found after creation")
     except Exception as e:
@@ -5192,7 +5322,7 @@ async def get_due_cards(course_id: str, limit: int = 20, card_types: str = None)
     """Get cards due for review"""
     try:
         card_types_list = card_types.split(',') if card_types else None
-        cards = spaced_repetition_service.get_due_cards(
+        cards = await spaced_repetition_service.get_due_cards_async(
             course_id=course_id,
             limit=limit,
             card_types=card_types_list
@@ -5228,7 +5358,7 @@ async def get_due_cards(course_id: str, limit: int = 20, card_types: str = None)
 async def review_card(review_request: CardReviewRequest):
     """Process card review and update scheduling"""
     try:
-        result = spaced_repetition_service.review_card(
+        result = await spaced_repetition_service.review_card_async(
             card_id=review_request.card_id,
             quality_rating=review_request.quality_rating,
             response_time_ms=review_request.response_time_ms,
@@ -5248,11 +5378,43 @@ async def review_card(review_request: CardReviewRequest):
         logger.error(f"Error reviewing card: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/spaced-repetition/review/batch", response_model=List[CardReviewResponse])
+async def review_cards_batch(review_requests: List[CardReviewRequest]):
+    """Apply all the reviews of a study session in a single transaction"""
+    try:
+        results = await spaced_repetition_service.review_cards_async([
+            {
+                "card_id": review_request.card_id,
+                "quality_rating": review_request.quality_rating,
+                "response_time_ms": review_request.response_time_ms,
+                "session_id": review_request.session_id
+            }
+            for review_request in review_requests
+        ])
+
+        return [
+            CardReviewResponse(
+                card_id=result["card_id"],
+                next_review=datetime.fromisoformat(result["next_review"]),
+                interval_days=result["interval_days"],
+                ease_factor=result["ease_factor"],
+                repetitions=result["repetitions"],
+                quality_rating=result["quality_rating"],
+                review_session_id=result["review_session_id"]
+            )
+            for result in results
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error reviewing cards: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/spaced-repetition/analytics/{course_id}", response_model=LearningAnalytics)
 async def get_learning_analytics(course_id: str, days: int = 30):
     """Get comprehensive learning analytics for a course"""
     try:
-        analytics = spaced_repetition_service.get_learning_analytics(
+        analytics = await spaced_repetition_service.get_learning_analytics_async(
             course_id=course_id,
             days=days
         )
@@ -5271,7 +5433,7 @@ async def get_learning_analytics(course_id: str, days: int = 30):
 async def get_study_recommendations(course_id: str):
     """Get personalized study recommendations"""
     try:
-        recommendations = spaced_repetition_service.get_study_recommendations(course_id)
+        recommendations = await asyncio.to_thread(spaced_repetition_service.get_study_recommendations, course_id)
 
         return StudyRecommendations(
             recommendations=recommendations["recommendations"],
@@ -5308,7 +5470,7 @@ async def create_study_session(session_request: StudySessionRequest):
         import uuid
         session_id = str(uuid.uuid4())
 
-        cards = spaced_repetition_service.get_due_cards(
+        cards = await spaced_repetition_service.get_due_cards_async(
             course_id=session_request.course_id,
             limit=session_request.limit,
             card_types=session_request.card_types
@@ -5357,11 +5519,6 @@ async def generate_cards_from_chat(
 ):
     """Generate learning cards from chat conversation"""
     try:
-        # Initialize course RAG service
-        rag_service = RAGService()
-        llm_service = LLMService()
-        course_rag_service = init_course_rag_service(rag_service, llm_service)
-
         card_ids = await course_rag_service.auto_generate_cards_from_conversation(
             course_id=course_id,
             session_id=session_id,
@@ -5385,11 +5542,6 @@ async def generate_cards_from_sources(
 ):
     """Generate learning cards from RAG sources"""
     try:
-        # Initialize course RAG service
-        rag_service = RAGService()
-        llm_service = LLMService()
-        course_rag_service = init_course_rag_service(rag_service, llm_service)
-
         card_ids = await course_rag_service.generate_cards_from_sources(
             course_id=course_id,
             sources=sources,
@@ -5540,11 +5692,6 @@ async def generate_questions_from_chat(
 ):
     """Generate Active Recall questions from chat conversation"""
     try:
-        # Initialize course RAG service
-        rag_service = RAGService()
-        llm_service = LLMService()
-        course_rag_service = init_course_rag_service(rag_service, llm_service)
-
         question_ids = await course_rag_service.auto_generate_questions_from_conversation(
             course_id=course_id,
             session_id=session_id,
@@ -5570,11 +5717,6 @@ async def generate_contextual_questions(
 ):
     """Generate contextual Active Recall questions based on topic"""
     try:
-        # Initialize course RAG service
-        rag_service = RAGService()
-        llm_service = LLMService()
-        course_rag_service = init_course_rag_service(rag_service, llm_service)
-
         question_ids = await course_rag_service.generate_contextual_questions(
             course_id=course_id,
             session_id=session_id,
@@ -5604,11 +5746,6 @@ async def get_adaptive_practice_session(
 ):
     """Get adaptive practice questions based on user performance"""
     try:
-        # Initialize course RAG service
-        rag_service = RAGService()
-        llm_service = LLMService()
-        course_rag_service = init_course_rag_service(rag_service, llm_service)
-
         question_ids = await course_rag_service.get_adaptive_practice_session(
             course_id=course_id,
             session_id=session_id,
@@ -5634,9 +5771,7 @@ async def create_dual_coding_content(request: DualCodingRequest):
     """Create integrated visual-verbal learning content"""
     try:
         # Initialize the dual coding service with proper services
-        rag_service = RAGService()
-        llm_service = LLMService()
-        dual_coding_engine = dual_coding_service.__class__(llm_service, rag_service)
+        dual_coding_engine = get_dual_coding_engine()
 
         response = await dual_coding_engine.create_dual_coding_content(
             content=request.content,
@@ -5665,9 +5800,7 @@ async def enhance_content(request: ContentEnhancementRequest):
     """Enhance existing content with dual coding elements"""
     try:
         # Initialize services
-        rag_service = RAGService()
-        llm_service = LLMService()
-        dual_coding_engine = dual_coding_service.__class__(llm_service, rag_service)
+        dual_coding_engine = get_dual_coding_engine()
 
         # Create basic dual coding content first
         base_response = await dual_coding_engine.create_dual_coding_content(
@@ -5,6 +5,7 @@ Redis-based caching with fallback to memory cache
 
 import os
 import json
+import fnmatch
 import hashlib
 import time
 from typing import Any, Optional, Dict, Union, Callable
@@ -13,6 +14,8 @@ from functools import wraps
 import asyncio
 import logging
 
+from services.tiered_cache import LRUCache, SingleFlight
+
 logger = logging.getLogger(__name__)
 
 # Try to import Redis, fallback to memory cache
@@ -23,90 +26,34 @@ except ImportError:
     REDIS_AVAILABLE = False
     logger.warning("Redis not available, using memory cache fallback")
 
-class MemoryCache:
-    """Simple in-memory cache as fallback when Redis is not available"""
+class MemoryCache(LRUCache):
+    """In-memory L1 cache (O(1) LRU eviction, TTL wheel expiry), also used when Redis is not available"""
 
     def __init__(self, max_size: int = 1000):
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.max_size = max_size
-        self.access_times: Dict[str, float] = {}
-
-    def get(self, key: str) -> Optional[Any]:
-        """Get item from cache"""
-        if key in self.cache:
-            item = self.cache[key]
-            if time.time() < item['expires_at']:
-                self.access_times[key] = time.time()
-                return item['value']
-            else:
-                # Item expired, remove it
-                del self.cache[key]
-                if key in self.access_times:
-                    del self.access_times[key]
-        return None
+        super().__init__(max_size=max_size, default_ttl=300)
 
     def set(self, key: str, value: Any, ttl: int = 300) -> bool:
         """Set item in cache with TTL"""
         try:
-            # Remove expired items if cache is full
-            if len(self.cache) >= self.max_size:
-                self._cleanup_expired()
-                if len(self.cache) >= self.max_size:
-                    self._evict_lru()
-
-            expires_at = time.time() + ttl
-            self.cache[key] = {
-                'value': value,
-                'expires_at': expires_at,
-                'created_at': time.time()
-            }
-            self.access_times[key] = time.time()
-            return True
+            return super().set(key, value, ttl=ttl)
         except Exception as e:
             logger.error(f"Memory cache set error: {e}")
             return False
 
-    def delete(self, key: str) -> bool:
-        """Delete item from cache"""
-        if key in self.cache:
-            del self.cache[key]
-        if key in self.access_times:
-            del self.access_times[key]
-        return True
-
     def clear(self) -> bool:
         """Clear all cache items"""
-        self.cache.clear()
-        self.access_times.clear()
+        super().clear()
         return True
 
-    def _cleanup_expired(self):
-        """Remove expired items"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, item in self.cache.items()
-            if current_time >= item['expires_at']
-        ]
-        for key in expired_keys:
-            del self.cache[key]
-            if key in self.access_times:
-                del self.access_times[key]
-
-    def _evict_lru(self):
-        """Evict least recently used item"""
-        if not self.access_times:
-            return
-
-        lru_key = min(self.access_times.items(), key=lambda x: x[1])[0]
-        self.delete(lru_key)
-
 class CacheManager:
-    """Unified cache manager with Redis backend and memory fallback"""
+    """Two-tier cache manager: in-process memory cache (L1) in front of Redis (L2)"""
 
     def __init__(self, redis_url: str = None, default_ttl: int = 300):
         self.default_ttl = default_ttl
         self.redis_client = None
         self.memory_cache = MemoryCache()
+        # With Redis, L1 entries live shorter so that other workers' invalidations propagate
+        self.l1_max_ttl = int(os.getenv('CACHE_L1_MAX_TTL', 60))
 
         # Initialize Redis if available
         if REDIS_AVAILABLE and redis_url:
@@ -125,20 +72,27 @@ class CacheManager:
                 logger.warning(f"Redis connection failed: {e}, using memory cache")
                 self.redis_client = None
 
+    def _l1_ttl(self, ttl: int) -> int:
+        return min(ttl, self.l1_max_ttl) if self.redis_client else ttl
+
     def get(self, key: str) -> Optional[Any]:
-        """Get item from cache (Redis first, fallback to memory)"""
+        """Get item from cache (memory first, then Redis with promotion to memory)"""
         try:
-            # Try Redis first
+            value = self.memory_cache.get(key)
+            if value is not None:
+                return value
+
             if self.redis_client:
                 cached_value = self.redis_client.get(key)
                 if cached_value:
                     try:
-                        return json.loads(cached_value)
+                        value = json.loads(cached_value)
                     except json.JSONDecodeError:
-                        return cached_value
+                        value = cached_value
+                    self.memory_cache.set(key, value, self._l1_ttl(self.default_ttl))
+                    return value
 
-            # Fallback to memory cache
-            return self.memory_cache.get(key)
+            return None
         except Exception as e:
             logger.error(f"Cache get error for key {key}: {e}")
             return None
@@ -162,8 +116,8 @@ class CacheManager:
                     logger.warning(f"Redis set error: {e}")
                     success = False
 
-            # Always store in memory cache as backup
-            memory_success = self.memory_cache.set(key, value, ttl)
+            # Always store in memory cache (L1)
+            memory_success = self.memory_cache.set(key, value, self._l1_ttl(ttl))
 
             return success and memory_success
         except Exception as e:
@@ -196,21 +150,23 @@ class CacheManager:
         try:
             cleared_count = 0
 
-            # Try Redis pattern deletion
+            # Try Redis pattern deletion (SCAN in batches instead of a blocking KEYS)
             if self.redis_client:
                 try:
-                    keys = self.redis_client.keys(pattern)
-                    if keys:
-                        cleared_count += len(keys)
-                        self.redis_client.delete(*keys)
+                    batch = []
+                    for key in self.redis_client.scan_iter(match=pattern, count=500):
+                        batch.append(key)
+                        if len(batch) >= 500:
+                            cleared_count += self.redis_client.unlink(*batch)
+                            batch = []
+                    if batch:
+                        cleared_count += self.redis_client.unlink(*batch)
                 except Exception as e:
                     logger.warning(f"Redis pattern delete error: {e}")
 
             # Clear matching keys from memory cache
-            memory_keys = list(self.memory_cache.cache.keys())
-            for key in memory_keys:
-                if pattern.replace('*', '') in key:
-                    self.memory_cache.delete(key)
+            for key in self.memory_cache.keys():
+                if fnmatch.fnmatchcase(key, pattern) and self.memory_cache.delete(key):
                     cleared_count += 1
 
             return cleared_count
@@ -238,8 +194,11 @@ class CacheManager:
                 redis_stats = {'redis_connected': False}
 
             memory_stats = {
-                'memory_cache_size': len(self.memory_cache.cache),
-                'memory_cache_max_size': self.memory_cache.max_size
+                'memory_cache_size': len(self.memory_cache),
+                'memory_cache_max_size': self.memory_cache.max_size,
+                'memory_cache_hits': self.memory_cache.hits,
+                'memory_cache_misses': self.memory_cache.misses,
+                'memory_cache_evictions': self.memory_cache.evictions
             }
 
             return {
@@ -293,6 +252,9 @@ def cached(ttl: Optional[int] = None, key_prefix: str = "api"):
         return wrapper
     return decorator
 
+# Concurrent misses on the same key share one execution
+_async_flight = SingleFlight()
+
 def async_cached(ttl: Optional[int] = None, key_prefix: str = "api"):
     """Decorator to cache async function results"""
     def decorator(func: Callable) -> Callable:
@@ -306,10 +268,13 @@ def async_cached(ttl: Optional[int] = None, key_prefix: str = "api"):
             if cached_result is not None:
                 return cached_result
 
-            # Execute function and cache result
-            result = await func(*args, **kwargs)
-            cache_manager.set(cache_key_str, result, ttl)
-            return result
+            async def compute():
+                result = await func(*args, **kwargs)
+                cache_manager.set(cache_key_str, result, ttl)
+                return result
+
+            # Execute function once for all concurrent callers and cache result
+            return await _async_flight.do(cache_key_str, compute)
 
         return wrapper
     return decorator
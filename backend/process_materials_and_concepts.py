@@ -14,6 +14,7 @@ from datetime import datetime
 sys.path.append(str(Path(__file__).parent))
 
 from services.concept_map_service import ConceptMapService
+from services.course_service import CourseService
 from services.rag_service import RAGService
 from services.llm_service import LLMService
 import structlog
@@ -28,12 +29,10 @@ class MaterialProcessor:
     async def process_all_courses(self):
         """Processa tutti i corsi: prima indicizza i materiali, poi genera mappe concettuali."""
 
-        # Carica corsi
-        try:
-            with open("data/courses/courses.json", "r", encoding="utf-8") as f:
-                courses = json.load(f)
-        except FileNotFoundError:
-            logger.error("File corsi non trovato")
+        # Carica corsi (entity store: courses.json è solo il backup della migrazione)
+        courses = CourseService().get_all_courses_raw()
+        if not courses:
+            logger.error("Nessun corso trovato")
             return
 
         logger.info(f"Found {len(courses)} courses to process")
@@ -13,6 +13,7 @@ from datetime import datetime
 sys.path.append(str(Path(__file__).parent))
 
 from services.concept_map_service import ConceptMapService
+from services.course_service import CourseService
 from services.llm_service import LLMService
 import structlog
 
@@ -24,25 +25,11 @@ async def regenerate_all_concept_maps():
     # Initialize services
     concept_service = ConceptMapService()
 
-    # Load courses
-    courses_paths = [
-        "data/courses/courses.json",
-        "../data/courses/courses.json",
-        "/mnt/c/Users/pietr/Documents/progetto/tutor-ai/data/courses/courses.json"
-    ]
-
-    courses = []
-    for path in courses_paths:
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                courses = json.load(f)
-                logger.info(f"Caricati corsi da: {path}")
-                break
-        except FileNotFoundError:
-            continue
+    # Load courses (entity store: courses.json è solo il backup della migrazione)
+    courses = CourseService().get_all_courses_raw()
 
     if not courses:
-        logger.error("File corsi non trovato in nessun percorso")
+        logger.error("Nessun corso trovato")
         return
 
     logger.info(f"Found {len(courses)} courses to process")
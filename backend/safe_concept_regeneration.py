@@ -14,6 +14,7 @@ from datetime import datetime
 sys.path.append(str(Path(__file__).parent))
 
 from services.concept_map_service import ConceptMapService
+from services.course_service import CourseService
 import structlog
 
 logger = structlog.get_logger()
@@ -24,12 +25,10 @@ async def safe_regenerate_all_concept_maps():
     # Initialize services
     concept_service = ConceptMapService()
 
-    # Load courses
-    try:
-        with open("data/courses/courses.json", "r", encoding="utf-8") as f:
-            courses = json.load(f)
-    except FileNotFoundError:
-        logger.error("File corsi non trovato")
+    # Load courses (entity store: courses.json è solo il backup della migrazione)
+    courses = CourseService().get_all_courses_raw()
+    if not courses:
+        logger.error("Nessun corso trovato")
         return
 
     logger.info(f"Found {len(courses)} courses to process")
@@ -38,16 +38,20 @@ from enum import Enum
 import sqlite3
 import random
 import logging
-from dataclasses import field
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import field, replace
 
 # Import statistical libraries
 import scipy.stats as stats
 import numpy as np
 
 # Import AI services
-from services.llm_service import LLMService
+from services.service_container import get_llm_service
 from services.prompt_analytics_service import prompt_analytics_service
 from services.advanced_model_selector import AdvancedModelSelector
+from services.tiered_cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -249,20 +253,110 @@ class TestResult:
     outlier_indicators: List[str] = field(default_factory=list)
 
 
+@dataclass
+class VariantStatistics:
+    """
+    Sufficient statistics of a variant, updated incrementally as results arrive.
+
+    Counts, sums and sums of squares are enough for proportion tests, t-tests
+    and Beta posteriors, so analyses never need to scan the raw results.
+    """
+
+    n: int = 0
+    successes: int = 0
+    response_time_sum: float = 0.0
+    response_time_sumsq: float = 0.0
+    satisfaction_n: int = 0
+    satisfaction_sum: float = 0.0
+    satisfaction_sumsq: float = 0.0
+
+    def add(self, result: TestResult):
+        """Fold a single result into the running sums."""
+        self.n += 1
+        self.successes += 1 if result.success else 0
+        self.response_time_sum += result.response_time_ms
+        self.response_time_sumsq += result.response_time_ms ** 2
+        if result.user_satisfaction is not None:
+            self.satisfaction_n += 1
+            self.satisfaction_sum += result.user_satisfaction
+            self.satisfaction_sumsq += result.user_satisfaction ** 2
+
+    @staticmethod
+    def _std(n: int, total: float, sumsq: float) -> float:
+        if n < 2:
+            return 0.0
+        # Clamp tiny negative values caused by floating point cancellation
+        return math.sqrt(max(sumsq - total * total / n, 0.0) / (n - 1))
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.n if self.n else 0.0
+
+    @property
+    def response_time_mean(self) -> float:
+        return self.response_time_sum / self.n if self.n else 0.0
+
+    @property
+    def response_time_std(self) -> float:
+        return self._std(self.n, self.response_time_sum, self.response_time_sumsq)
+
+    @property
+    def satisfaction_mean(self) -> Optional[float]:
+        return self.satisfaction_sum / self.satisfaction_n if self.satisfaction_n else None
+
+    @property
+    def satisfaction_std(self) -> float:
+        return self._std(self.satisfaction_n, self.satisfaction_sum, self.satisfaction_sumsq)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "results": self.n,
+            "successes": self.successes,
+            "success_rate": self.success_rate,
+            "response_time_mean": self.response_time_mean,
+            "response_time_std": self.response_time_std,
+            "satisfaction_mean": self.satisfaction_mean,
+            "satisfaction_std": self.satisfaction_std
+        }
+
+
 class ABTestingFramework:
     """
     Comprehensive A/B Testing Framework for Prompt Performance
 
     Implements statistical A/B testing with real-time monitoring, automated
     analysis, and intelligent optimization recommendations.
+
+    Tests, assignments and results live in SQLite (WAL mode). Assignments are
+    cached in memory, results are written in batches, and every batch also
+    updates per-variant running sums, so analyses cost O(variants).
+
+    Configuration:
+        AB_TESTING_RESULT_BATCH_SIZE       results buffered before a write (default: 50)
+        AB_TESTING_FLUSH_INTERVAL          max seconds a result stays buffered (default: 5)
+        AB_TESTING_ASSIGNMENT_CACHE_SIZE   cached user assignments (default: 10000)
+        AB_TESTING_TEST_CACHE_TTL          seconds a loaded test is reused (default: 30)
     """
 
     def __init__(self, db_path: str = "data/ab_testing.db"):
         self.db_path = db_path
         self._ensure_database()
 
+        # Store state: caches, result buffer and per-variant running sums
+        self.result_batch_size = int(os.getenv("AB_TESTING_RESULT_BATCH_SIZE", "50"))
+        self.flush_interval = float(os.getenv("AB_TESTING_FLUSH_INTERVAL", "5"))
+        self._tests = LRUCache(max_size=256, default_ttl=float(os.getenv("AB_TESTING_TEST_CACHE_TTL", "30")))
+        self._assignments = LRUCache(max_size=int(os.getenv("AB_TESTING_ASSIGNMENT_CACHE_SIZE", "10000")))
+        self._lock = threading.RLock()
+        self._pending_results: List[TestResult] = []
+        self._last_flush = time.monotonic()
+        # Background flush every flush_interval seconds, started with the first buffered result
+        self._flush_thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self._variant_stats: Dict[str, Dict[str, VariantStatistics]] = {}
+
         # Initialize services
-        self.llm_service = LLMService()
+        self.llm_service = get_llm_service()
         self.analytics_service = prompt_analytics_service
         self.model_selector = AdvancedModelSelector()
 
@@ -292,6 +386,8 @@ class ABTestingFramework:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
         conn = sqlite3.connect(self.db_path)
+        # WAL lets readers run while a result batch is being written
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor = conn.cursor()
 
         # Tests table
@@ -419,6 +515,40 @@ class ABTestingFramework:
             CREATE INDEX IF NOT EXISTS idx_success ON test_results(success)
         """)
 
+        # Per-variant running sums, updated with every result batch
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS variant_statistics (
+                test_id TEXT NOT NULL,
+                variant_id TEXT NOT NULL,
+
+                n INTEGER NOT NULL DEFAULT 0,
+                successes INTEGER NOT NULL DEFAULT 0,
+                response_time_sum REAL NOT NULL DEFAULT 0,
+                response_time_sumsq REAL NOT NULL DEFAULT 0,
+                satisfaction_n INTEGER NOT NULL DEFAULT 0,
+                satisfaction_sum REAL NOT NULL DEFAULT 0,
+                satisfaction_sumsq REAL NOT NULL DEFAULT 0,
+
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (test_id, variant_id),
+                FOREIGN KEY (test_id) REFERENCES ab_tests (id)
+            )
+        """)
+
+        # Backfill the running sums from results stored before the table existed
+        if not cursor.execute("SELECT 1 FROM variant_statistics LIMIT 1").fetchone():
+            cursor.execute("""
+                INSERT INTO variant_statistics
+                SELECT test_id, variant_id,
+                       COUNT(*), SUM(success),
+                       SUM(response_time_ms), SUM(response_time_ms * response_time_ms),
+                       COUNT(user_satisfaction), COALESCE(SUM(user_satisfaction), 0),
+                       COALESCE(SUM(user_satisfaction * user_satisfaction), 0),
+                       ?
+                FROM test_results
+                GROUP BY test_id, variant_id
+            """, (datetime.utcnow().isoformat(),))
+
         # Test analytics cache
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS test_analytics_cache (
@@ -466,7 +596,7 @@ class ABTestingFramework:
             total_weight = sum(v.get("traffic_weight", 1.0) for v in variants)
 
             for i, variant_config in enumerate(variants):
-                variant_id = str(uuid.uuid4())
+                variant_id = variant_config.get("id") or str(uuid.uuid4())
                 weight = variant_config.get("traffic_weight", 1.0) / total_weight
 
                 variant = TestVariant(
@@ -483,6 +613,12 @@ class ABTestingFramework:
                 )
                 test_variants.append(variant)
 
+            # The control may be given by name, since variant IDs are generated here
+            control_variant_id = next(
+                (v.id for v in test_variants if control_variant_id in (v.id, v.name)),
+                control_variant_id
+            )
+
             # Create test object
             test = ABTest(
                 id=test_id,
@@ -597,7 +733,9 @@ class ABTestingFramework:
                     user_segment=self._determine_user_segment(user_id, session_context)
                 )
 
-                await self._save_participant(participant)
+                # A concurrent request may have assigned the user first: keep its variant
+                participant = await self._save_participant(participant)
+                variant = next((v for v in test.variants if v.id == participant.variant_id), variant)
                 logger.debug(f"Assigned user {user_id} to variant {variant.name} in test {test_id}")
 
             return variant
@@ -661,14 +799,11 @@ class ABTestingFramework:
             result.data_quality_flags = quality_flags
             result.outlier_indicators = outlier_flags
 
-            # Save result
+            # Save result (buffered) and update variant running sums
             await self._save_result(result)
 
-            # Update variant statistics
-            await self._update_variant_statistics(participant.variant_id, result)
-
             # Update participant statistics
-            await self._update_participant_statistics(participant.id, result)
+            await self._update_participant_statistics(participant, result)
 
             logger.debug(f"Recorded result for user {user_id} in test {test_id}")
             return True
@@ -681,6 +816,10 @@ class ABTestingFramework:
         """
         Perform comprehensive statistical analysis of test results.
 
+        Analyses run on the per-variant sufficient statistics (counts, sums and
+        sums of squares), so their cost depends on the number of variants, not
+        on the number of recorded results.
+
         Args:
             test_id: Test ID to analyze
 
@@ -692,26 +831,27 @@ class ABTestingFramework:
             if not test:
                 raise ValueError(f"Test {test_id} not found")
 
-            # Get test results
-            results = await self._get_test_results(test_id)
-            if not results:
+            # Include results still buffered and those recorded by other workers
+            await asyncio.to_thread(self.flush_results)
+            variant_stats = await self._get_variant_statistics(test_id, refresh=True)
+            if not any(stat.n for stat in variant_stats.values()):
                 return {"error": "No results available for analysis"}
 
             # Perform statistical analysis
-            analysis = await self._perform_statistical_analysis(test, results)
+            analysis = await self._perform_statistical_analysis(test, variant_stats)
 
             # Check for statistical significance
             significance_test = self.statistical_tests.get(test.statistical_test)
             if significance_test:
-                significance_result = await significance_test(test, results)
+                significance_result = await significance_test(test, variant_stats)
                 analysis.update(significance_result)
 
             # Generate insights and recommendations
-            insights = await self._generate_insights(test, results, analysis)
+            insights = await self._generate_insights(test, variant_stats, analysis)
             analysis["insights"] = insights
 
             # Risk assessment
-            risk_assessment = await self._assess_risks(test, results, analysis)
+            risk_assessment = await self._assess_risks(test, variant_stats, analysis)
             analysis["risk_assessment"] = risk_assessment
 
             # Update test with analysis results
@@ -742,6 +882,8 @@ class ABTestingFramework:
             if not test:
                 return {"error": "Test not found"}
 
+            await asyncio.to_thread(self.flush_results)
+
             # Get variant performance data
             variant_performance = await self._get_variant_performance(test_id)
 
@@ -789,48 +931,49 @@ class ABTestingFramework:
 
     # Statistical analysis methods
 
-    async def _z_test(self, test: ABTest, results: List[TestResult]) -> Dict[str, Any]:
+    async def _perform_statistical_analysis(
+        self,
+        test: ABTest,
+        variant_stats: Dict[str, VariantStatistics]
+    ) -> Dict[str, Any]:
+        """Descriptive statistics for each variant."""
+        variants = {}
+        for variant in test.variants:
+            stat = variant_stats.get(variant.id, VariantStatistics())
+            variants[variant.id] = {
+                "name": variant.name,
+                "is_control": variant.id == test.control_variant_id,
+                **stat.summary()
+            }
+
+        return {
+            "test_id": test.id,
+            "total_results": sum(stat.n for stat in variant_stats.values()),
+            "variants": variants
+        }
+
+    async def _z_test(self, test: ABTest, variant_stats: Dict[str, VariantStatistics]) -> Dict[str, Any]:
         """Perform Z-test for statistical significance."""
         try:
-            # Group results by variant
-            variant_results = {}
-            for result in results:
-                if result.variant_id not in variant_results:
-                    variant_results[result.variant_id] = []
-                variant_results[result.variant_id].append(result)
-
-            # Calculate metrics for each variant
-            variant_metrics = {}
-            for variant_id, variant_res in variant_results.items():
-                conversions = sum(1 for r in variant_res if r.success)
-                total = len(variant_res)
-                conversion_rate = conversions / total if total > 0 else 0
-
-                variant_metrics[variant_id] = {
-                    "conversions": conversions,
-                    "total": total,
-                    "conversion_rate": conversion_rate
-                }
-
             # Find control and treatment variants
-            control_metrics = variant_metrics.get(test.control_variant_id)
-            if not control_metrics:
+            control_stats = variant_stats.get(test.control_variant_id)
+            if not control_stats or not control_stats.n:
                 return {"error": "Control variant not found in results"}
 
             # Perform Z-test against control
             comparisons = []
-            for variant_id, metrics in variant_metrics.items():
-                if variant_id == test.control_variant_id:
+            for variant_id, variant_stat in variant_stats.items():
+                if variant_id == test.control_variant_id or not variant_stat.n:
                     continue
 
                 # Two-proportion Z-test
-                p1 = control_metrics["conversion_rate"]
-                p2 = metrics["conversion_rate"]
-                n1 = control_metrics["total"]
-                n2 = metrics["total"]
+                p1 = control_stats.success_rate
+                p2 = variant_stat.success_rate
+                n1 = control_stats.n
+                n2 = variant_stat.n
 
                 # Pooled proportion
-                p_pool = (control_metrics["conversions"] + metrics["conversions"]) / (n1 + n2)
+                p_pool = (control_stats.successes + variant_stat.successes) / (n1 + n2)
 
                 # Standard error
                 se = math.sqrt(p_pool * (1 - p_pool) * (1/n1 + 1/n2))
@@ -840,11 +983,11 @@ class ABTestingFramework:
                     z_stat = (p2 - p1) / se
 
                     # P-value (two-tailed)
-                    p_value = 2 * (1 - stats.norm.cdf(abs(z_stat)))
+                    p_value = float(2 * (1 - stats.norm.cdf(abs(z_stat))))
 
                     # Confidence interval
                     z_critical = stats.norm.ppf(1 - (1 - test.confidence_level) / 2)
-                    margin_of_error = z_critical * se
+                    margin_of_error = float(z_critical * se)
                     ci_lower = (p2 - p1) - margin_of_error
                     ci_upper = (p2 - p1) + margin_of_error
 
@@ -856,7 +999,7 @@ class ABTestingFramework:
                         "z_statistic": z_stat,
                         "p_value": p_value,
                         "confidence_interval": (ci_lower, ci_upper),
-                        "is_significant": p_value < (1 - test.confidence_level)
+                        "is_significant": bool(p_value < (1 - test.confidence_level))
                     })
 
             # Determine winner
@@ -876,74 +1019,60 @@ class ABTestingFramework:
             logger.error(f"Error in Z-test analysis: {str(e)}")
             return {"error": str(e)}
 
-    async def _t_test(self, test: ABTest, results: List[TestResult]) -> Dict[str, Any]:
-        """Perform t-test for continuous metrics."""
+    async def _t_test(self, test: ABTest, variant_stats: Dict[str, VariantStatistics]) -> Dict[str, Any]:
+        """Perform t-test for continuous metrics (response time)."""
         try:
-            # Group results by variant for response time analysis
-            variant_response_times = {}
-            for result in results:
-                if result.variant_id not in variant_response_times:
-                    variant_response_times[result.variant_id] = []
-                variant_response_times[result.variant_id].append(result.response_time_ms)
-
-            # Calculate statistics for each variant
-            variant_stats = {}
-            for variant_id, times in variant_response_times.items():
-                if times:
-                    variant_stats[variant_id] = {
-                        "mean": statistics.mean(times),
-                        "std": statistics.stdev(times) if len(times) > 1 else 0,
-                        "n": len(times),
-                        "median": statistics.median(times)
-                    }
-
             # Find control variant
             control_stats = variant_stats.get(test.control_variant_id)
-            if not control_stats:
+            if not control_stats or not control_stats.n:
                 return {"error": "Control variant not found in results"}
 
+            control_mean = control_stats.response_time_mean
+            control_std = control_stats.response_time_std
+
             # Perform t-tests against control
             comparisons = []
-            for variant_id, stats in variant_stats.items():
+            for variant_id, variant_stat in variant_stats.items():
                 if variant_id == test.control_variant_id:
                     continue
 
-                # Independent two-sample t-test
-                control_times = variant_response_times[test.control_variant_id]
-                treatment_times = variant_response_times[variant_id]
+                n1, n2 = control_stats.n, variant_stat.n
+                if n1 > 1 and n2 > 1:
+                    treatment_mean = variant_stat.response_time_mean
+                    treatment_std = variant_stat.response_time_std
 
-                if len(control_times) > 1 and len(treatment_times) > 1:
-                    t_stat, p_value = stats.ttest_ind(control_times, treatment_times)
+                    # Independent two-sample t-test from summary statistics
+                    t_stat, p_value = stats.ttest_ind_from_stats(
+                        control_mean, control_std, n1,
+                        treatment_mean, treatment_std, n2
+                    )
 
                     # Effect size (Cohen's d)
-                    pooled_std = math.sqrt(((len(control_times) - 1) * control_stats["std"]**2 +
-                                          (len(treatment_times) - 1) * stats["std"]**2) /
-                                         (len(control_times) + len(treatment_times) - 2))
+                    pooled_std = math.sqrt(((n1 - 1) * control_std**2 + (n2 - 1) * treatment_std**2) /
+                                           (n1 + n2 - 2))
 
-                    cohen_d = (stats["mean"] - control_stats["mean"]) / pooled_std if pooled_std > 0 else 0
+                    cohen_d = (treatment_mean - control_mean) / pooled_std if pooled_std > 0 else 0
 
                     # Confidence interval for difference in means
-                    se_diff = math.sqrt(control_stats["std"]**2 / len(control_times) +
-                                     stats["std"]**2 / len(treatment_times))
+                    se_diff = math.sqrt(control_std**2 / n1 + treatment_std**2 / n2)
 
-                    t_critical = stats.t.ppf(1 - (1 - test.confidence_level) / 2,
-                                           len(control_times) + len(treatment_times) - 2)
+                    t_critical = stats.t.ppf(1 - (1 - test.confidence_level) / 2, n1 + n2 - 2)
 
                     margin_of_error = t_critical * se_diff
-                    mean_diff = stats["mean"] - control_stats["mean"]
+                    mean_diff = treatment_mean - control_mean
                     ci_lower = mean_diff - margin_of_error
                     ci_upper = mean_diff + margin_of_error
 
                     comparisons.append({
                         "variant_id": variant_id,
-                        "control_mean": control_stats["mean"],
-                        "treatment_mean": stats["mean"],
+                        "control_mean": control_mean,
+                        "treatment_mean": treatment_mean,
                         "mean_difference": mean_diff,
                         "effect_size": cohen_d,
-                        "t_statistic": t_stat,
-                        "p_value": p_value,
+                        "t_statistic": float(t_stat),
+                        "p_value": float(p_value),
                         "confidence_interval": (ci_lower, ci_upper),
-                        "is_significant": p_value < (1 - test.confidence_level)
+                        "is_significant": bool(p_value < (1 - test.confidence_level))
                     })
 
             # Determine winner (lower response time is better)
@@ -964,38 +1093,48 @@ class ABTestingFramework:
             logger.error(f"Error in t-test analysis: {str(e)}")
             return {"error": str(e)}
 
-    async def _chi_square_test(self, test: ABTest, results: List[TestResult]) -> Dict[str, Any]:
-        """Perform chi-square test for categorical data."""
+    async def _chi_square_test(self, test: ABTest, variant_stats: Dict[str, VariantStatistics]) -> Dict[str, Any]:
+        """Perform chi-square test of independence on success/failure counts."""
         try:
-            # This would implement chi-square test for categorical outcomes
-            # Placeholder implementation
+            observed_ids = [variant_id for variant_id, stat in variant_stats.items() if stat.n]
+            if len(observed_ids) < 2:
+                return {"test_type": "chi_square_test", "error": "At least two variants with results are required"}
+
+            # Contingency table: one row per variant, columns successes / failures
+            table = np.array([
+                [variant_stats[variant_id].successes, variant_stats[variant_id].n - variant_stats[variant_id].successes]
+                for variant_id in observed_ids
+            ])
+            if (table.sum(axis=0) == 0).any():
+                return {"test_type": "chi_square_test", "error": "All results have the same outcome"}
+
+            chi2, p_value, dof, _ = stats.chi2_contingency(table)
+
             return {
                 "test_type": "chi_square_test",
-                "error": "Not implemented yet"
+                "chi_square": float(chi2),
+                "degrees_of_freedom": int(dof),
+                "p_value": float(p_value),
+                "success_rates": {variant_id: variant_stats[variant_id].success_rate for variant_id in observed_ids},
+                "is_significant": bool(p_value < (1 - test.confidence_level))
             }
 
         except Exception as e:
             logger.error(f"Error in chi-square test: {str(e)}")
             return {"error": str(e)}
 
-    async def _mann_whitney(self, test: ABTest, results: List[TestResult]) -> Dict[str, Any]:
+    async def _mann_whitney(self, test: ABTest, variant_stats: Dict[str, VariantStatistics]) -> Dict[str, Any]:
         """Perform Mann-Whitney U test for non-parametric data."""
         try:
-            # Group results by variant
-            variant_metrics = {}
-            for result in results:
-                if result.variant_id not in variant_metrics:
-                    variant_metrics[result.variant_id] = []
-                # Use user satisfaction as the metric
-                if result.user_satisfaction is not None:
-                    variant_metrics[result.variant_id].append(result.user_satisfaction)
+            # Rank-based test: needs the raw user satisfaction scores
+            variant_metrics = await asyncio.to_thread(self._load_satisfaction_scores, test.id)
 
             # Perform Mann-Whitney U test
             control_scores = variant_metrics.get(test.control_variant_id, [])
             comparisons = []
 
             for variant_id, scores in variant_metrics.items():
-                if variant_id == test.control_variant_id or not scores:
+                if variant_id == test.control_variant_id or not scores or not control_scores:
                     continue
 
                 # Mann-Whitney U test
@@ -1026,21 +1165,14 @@ class ABTestingFramework:
             logger.error(f"Error in Mann-Whitney test: {str(e)}")
             return {"error": str(e)}
 
-    async def _bayesian_ab_test(self, test: ABTest, results: List[TestResult]) -> Dict[str, Any]:
+    async def _bayesian_ab_test(self, test: ABTest, variant_stats: Dict[str, VariantStatistics]) -> Dict[str, Any]:
         """Perform Bayesian A/B test analysis."""
         try:
-            # Group results by variant
-            variant_results = {}
-            for result in results:
-                if result.variant_id not in variant_results:
-                    variant_results[result.variant_id] = []
-                variant_results[result.variant_id].append(result.success)
-
             # Calculate posterior distributions for each variant
             posterior_analyses = {}
-            for variant_id, successes in variant_results.items():
-                conversions = sum(successes)
-                failures = len(successes) - conversions
+            for variant_id, variant_stat in variant_stats.items():
+                conversions = variant_stat.successes
+                failures = variant_stat.n - conversions
 
                 # Beta posterior (assuming uniform prior Beta(1,1))
                 alpha_post = conversions + 1
@@ -1055,20 +1187,22 @@ class ABTestingFramework:
                     "std": math.sqrt(alpha_post * beta_post / ((alpha_post + beta_post)**2 * (alpha_post + beta_post + 1)))
                 }
 
-            # Calculate probability that each variant is best
-            variant_probabilities = {}
-            for variant_id, analysis in posterior_analyses.items():
-                # Monte Carlo simulation for probability of being best
-                samples = 10000
-                variant_samples = np.random.beta(analysis["alpha"], analysis["beta"], samples)
+            if len(posterior_analyses) < 2:
+                return {"test_type": "bayesian_ab", "error": "At least two variants with results are required"}
 
-                wins = 0
-                for other_id, other_analysis in posterior_analyses.items():
-                    if other_id != variant_id:
-                        other_samples = np.random.beta(other_analysis["alpha"], other_analysis["beta"], samples)
-                        wins += np.sum(variant_samples > other_samples)
+            # Monte Carlo simulation: one sample matrix (variants x samples) for all comparisons
+            samples = 10000
+            variant_ids = list(posterior_analyses.keys())
+            draws = np.vstack([
+                np.random.beta(posterior_analyses[variant_id]["alpha"], posterior_analyses[variant_id]["beta"], samples)
+                for variant_id in variant_ids
+            ])
 
-                variant_probabilities[variant_id] = wins / (samples * (len(posterior_analyses) - 1))
+            # Probability that each variant beats the others (averaged over pairwise comparisons)
+            variant_probabilities = {}
+            for index, variant_id in enumerate(variant_ids):
+                wins = (draws[index] > np.delete(draws, index, axis=0)).sum()
+                variant_probabilities[variant_id] = float(wins / (samples * (len(variant_ids) - 1)))
 
             # Find best variant
             best_variant_id = max(variant_probabilities.keys(), key=lambda k: variant_probabilities[k])
@@ -1087,34 +1221,25 @@ class ABTestingFramework:
             logger.error(f"Error in Bayesian A/B test: {str(e)}")
             return {"error": str(e)}
 
-    async def _sequential_analysis(self, test: ABTest, results: List[TestResult]) -> Dict[str, Any]:
+    async def _sequential_analysis(self, test: ABTest, variant_stats: Dict[str, VariantStatistics]) -> Dict[str, Any]:
         """Perform sequential analysis for early stopping."""
         try:
-            # Group results by variant
-            variant_results = {}
-            for result in results:
-                if result.variant_id not in variant_results:
-                    variant_results[result.variant_id] = []
-                variant_results[result.variant_id].append(result.success)
-
-            control_results = variant_results.get(test.control_variant_id, [])
+            control_stats = variant_stats.get(test.control_variant_id, VariantStatistics())
             comparisons = []
 
-            for variant_id, successes in variant_results.items():
+            for variant_id, variant_stat in variant_stats.items():
                 if variant_id == test.control_variant_id:
                     continue
 
                 # Calculate sequential test statistics
-                control_conversions = sum(control_results)
-                control_failures = len(control_results) - control_conversions
-
-                variant_conversions = sum(successes)
-                variant_failures = len(successes) - variant_conversions
+                control_conversions = control_stats.successes
+                variant_conversions = variant_stat.successes
+                variant_failures = variant_stat.n - variant_conversions
 
                 # Sequential probability ratio test (SPRT)
                 # This is a simplified implementation
-                control_rate = control_conversions / len(control_results) if control_results else 0
-                variant_rate = variant_conversions / len(successes) if successes else 0
+                control_rate = control_conversions / control_stats.n if control_stats.n else 0
+                variant_rate = variant_conversions / variant_stat.n if variant_stat.n else 0
 
                 # Calculate log-likelihood ratio
                 if control_rate > 0 and control_rate < 1 and variant_rate > 0 and variant_rate < 1:
@@ -1128,8 +1253,8 @@ class ABTestingFramework:
                     "control_rate": control_rate,
                     "variant_rate": variant_rate,
                     "log_likelihood_ratio": llr,
-                    "sample_size_control": len(control_results),
-                    "sample_size_variant": len(successes)
+                    "sample_size_control": control_stats.n,
+                    "sample_size_variant": variant_stat.n
                 })
 
             return {
@@ -1191,65 +1316,530 @@ class ABTestingFramework:
 
     async def _multi_armed_bandit_allocation(self, test: ABTest, user_id: str) -> Optional[TestVariant]:
         """Multi-armed bandit allocation for optimal learning."""
-        # This would implement Thompson sampling or UCB
-        # Simplified implementation using current performance
+        # Upper confidence bound on the success rate, from the running sums
+        variant_stats = await self._get_variant_statistics(test.id)
+        total_results = sum(stat.n for stat in variant_stats.values())
+
         variant_scores = []
         for variant in test.variants:
-            if variant.participant_count > 0:
-                success_rate = variant.success_count / variant.participant_count
-                # Upper confidence bound
-                ucb = success_rate + math.sqrt(2 * math.log(sum(v.participant_count for v in test.variants)) / variant.participant_count)
+            variant_stat = variant_stats.get(variant.id)
+            if variant_stat and variant_stat.n > 0:
+                ucb = variant_stat.success_rate + math.sqrt(2 * math.log(total_results) / variant_stat.n)
                 variant_scores.append((variant, ucb))
             else:
                 # Give untested variants high exploration value
-                variant_scores.append((variant, 1.0))
+                variant_scores.append((variant, float("inf")))
 
         # Select variant with highest UCB
         best_variant = max(variant_scores, key=lambda x: x[1])[0]
         return best_variant
 
-    # Database and helper methods would be implemented here...
-    # For brevity, including key method signatures
+    # Public read API
+
+    async def get_test(self, test_id: str) -> Optional[ABTest]:
+        """Get a test by ID."""
+        return await self._get_test(test_id)
+
+    async def get_all_tests(
+        self,
+        status: Optional[TestStatus] = None,
+        test_type: Optional[TestType] = None,
+        limit: int = 50,
+        created_by: Optional[str] = None
+    ) -> List[ABTest]:
+        """List tests, newest first, with participant and result counters filled in."""
+        query = "SELECT * FROM ab_tests WHERE 1 = 1"
+        params: List[Any] = []
+        for column, value in (("status", status), ("test_type", test_type), ("created_by", created_by)):
+            if value is not None:
+                query += f" AND {column} = ?"
+                params.append(value.value if isinstance(value, Enum) else value)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._connect() as conn:
+            tests = [self._row_to_test(row) for row in conn.execute(query, params)]
+            if not tests:
+                return []
+
+            placeholders = ",".join("?" * len(tests))
+            test_ids = [test.id for test in tests]
+            participants = {
+                (row["test_id"], row["variant_id"]): row["participants"]
+                for row in conn.execute(f"""
+                    SELECT test_id, variant_id, COUNT(*) AS participants FROM test_participants
+                    WHERE test_id IN ({placeholders}) GROUP BY test_id, variant_id
+                """, test_ids)
+            }
+            variant_stats = {
+                (row["test_id"], row["variant_id"]): self._row_to_statistics(row)
+                for row in conn.execute(
+                    f"SELECT * FROM variant_statistics WHERE test_id IN ({placeholders})", test_ids
+                )
+            }
+
+        for test in tests:
+            for variant in test.variants:
+                variant_stat = variant_stats.get((test.id, variant.id), VariantStatistics())
+                variant.participant_count = participants.get((test.id, variant.id), 0)
+                variant.success_count = variant_stat.successes
+                variant.total_response_time = variant_stat.response_time_sum
+        return tests
+
+    def flush_results(self) -> int:
+        """
+        Write buffered results in a single transaction, together with the running
+        sums of their variants and the participants' interaction counters.
+
+        Returns:
+            int: Number of results written
+        """
+        with self._lock:
+            if not self._pending_results:
+                self._last_flush = time.monotonic()
+                return 0
+
+            results = self._pending_results
+            deltas: Dict[Tuple[str, str], VariantStatistics] = {}
+            interactions: Dict[str, int] = {}
+            for result in results:
+                deltas.setdefault((result.test_id, result.variant_id), VariantStatistics()).add(result)
+                interactions[result.participant_id] = interactions.get(result.participant_id, 0) + 1
+
+            now = datetime.utcnow().isoformat()
+            with self._connect() as conn:
+                conn.executemany("""
+                    INSERT INTO test_results (
+                        id, test_id, variant_id, participant_id, timestamp, metric_values,
+                        success, response_time_ms, user_satisfaction, session_context,
+                        prompt_context, response_context, data_quality_flags, outlier_indicators
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [self._result_row(result) for result in results])
+                conn.executemany("""
+                    INSERT INTO variant_statistics (
+                        test_id, variant_id, n, successes, response_time_sum, response_time_sumsq,
+                        satisfaction_n, satisfaction_sum, satisfaction_sumsq, updated_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (test_id, variant_id) DO UPDATE SET
+                        n = n + excluded.n,
+                        successes = successes + excluded.successes,
+                        response_time_sum = response_time_sum + excluded.response_time_sum,
+                        response_time_sumsq = response_time_sumsq + excluded.response_time_sumsq,
+                        satisfaction_n = satisfaction_n + excluded.satisfaction_n,
+                        satisfaction_sum = satisfaction_sum + excluded.satisfaction_sum,
+                        satisfaction_sumsq = satisfaction_sumsq + excluded.satisfaction_sumsq,
+                        updated_at = excluded.updated_at
+                """, [
+                    (test_id, variant_id, delta.n, delta.successes, delta.response_time_sum,
+                     delta.response_time_sumsq, delta.satisfaction_n, delta.satisfaction_sum,
+                     delta.satisfaction_sumsq, now)
+                    for (test_id, variant_id), delta in deltas.items()
+                ])
+                conn.executemany(
+                    "UPDATE test_participants SET total_interactions = total_interactions + ? WHERE id = ?",
+                    [(count, participant_id) for participant_id, count in interactions.items()]
+                )
+
+            self._pending_results = []
+            self._last_flush = time.monotonic()
+            return len(results)
+
+    def close(self):
+        """Stop the background flush and write any buffered results."""
+        self._closed.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join(timeout=self.flush_interval + 5)
+            self._flush_thread = None
+        self.flush_results()
+
+    def _ensure_flush_thread(self):
+        """Start the periodic flush, so a quiet test does not hold its results indefinitely."""
+        if self._flush_thread is None and self.flush_interval > 0 and not self._closed.is_set():
+            self._flush_thread = threading.Thread(
+                target=self._flush_periodically, name="ab-testing-flush", daemon=True
+            )
+            self._flush_thread.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush_results()
+            except Exception as e:
+                logger.error(f"Periodic flush of A/B test results failed: {e}")
+
+    # Database and helper methods
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; the block runs in one transaction."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_json(value: Any) -> Optional[str]:
+        if value is None:
+            return None
+
+        def default(item):
+            if isinstance(item, datetime):
+                return item.isoformat()
+            if isinstance(item, Enum):
+                return item.value
+            if isinstance(item, set):
+                return sorted(item)
+            raise TypeError(f"Object of type {type(item).__name__} is not JSON serializable")
+
+        return json.dumps(value, default=default)
+
+    @staticmethod
+    def _from_json(value: Optional[str], default: Any = None) -> Any:
+        return json.loads(value) if value else default
+
+    @staticmethod
+    def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+        return datetime.fromisoformat(value) if value else None
+
+    def _test_row(self, test: ABTest) -> Tuple:
+        return (
+            test.id, test.name, test.description, test.test_type.value,
+            self._to_json([asdict(variant) for variant in test.variants]),
+            test.control_variant_id, TrafficAllocationMethod(test.traffic_allocation_method).value,
+            test.target_user_segment, self._to_json(test.target_course_ids), test.sample_size_required,
+            test.confidence_level, test.minimum_detectable_effect,
+            test.status.value,
+            test.start_date.isoformat() if test.start_date else None,
+            test.end_date.isoformat() if test.end_date else None,
+            test.duration_days,
+            StatisticalTest(test.statistical_test).value, test.is_significant, test.p_value,
+            self._to_json(test.confidence_interval), test.effect_size,
+            test.winner_variant_id, test.improvement_percentage, test.business_impact,
+            test.deployment_recommendation,
+            self._to_json(test.risk_assessment), self._to_json(test.bias_detection),
+            test.created_by, test.created_at.isoformat(), test.updated_at.isoformat()
+        )
+
+    def _row_to_test(self, row: sqlite3.Row) -> ABTest:
+        variants = []
+        for data in self._from_json(row["variants"], []):
+            data["confidence_interval"] = tuple(data.get("confidence_interval") or (0.0, 1.0))
+            data["created_at"] = self._parse_datetime(data.get("created_at")) or datetime.utcnow()
+            data["updated_at"] = self._parse_datetime(data.get("updated_at")) or datetime.utcnow()
+            variants.append(TestVariant(**data))
+
+        confidence_interval = self._from_json(row["confidence_interval"])
+        return ABTest(
+            id=row["id"],
+            name=row["name"],
+            description=row["description"],
+            test_type=TestType(row["test_type"]),
+            variants=variants,
+            control_variant_id=row["control_variant_id"],
+            created_by=row["created_by"],
+            traffic_allocation_method=TrafficAllocationMethod(row["traffic_allocation_method"]),
+            target_user_segment=row["target_user_segment"],
+            target_course_ids=self._from_json(row["target_course_ids"]),
+            sample_size_required=row["sample_size_required"],
+            confidence_level=row["confidence_level"],
+            minimum_detectable_effect=row["minimum_detectable_effect"],
+            status=TestStatus(row["status"]),
+            start_date=self._parse_datetime(row["start_date"]),
+            end_date=self._parse_datetime(row["end_date"]),
+            duration_days=row["duration_days"],
+            statistical_test=StatisticalTest(row["statistical_test"]),
+            is_significant=bool(row["is_significant"]),
+            p_value=row["p_value"],
+            confidence_interval=tuple(confidence_interval) if confidence_interval else None,
+            effect_size=row["effect_size"],
+            winner_variant_id=row["winner_variant_id"],
+            improvement_percentage=row["improvement_percentage"],
+            business_impact=row["business_impact"],
+            deployment_recommendation=row["deployment_recommendation"],
+            risk_assessment=self._from_json(row["risk_assessment"], {}),
+            bias_detection=self._from_json(row["bias_detection"], {}),
+            created_at=self._parse_datetime(row["created_at"]),
+            updated_at=self._parse_datetime(row["updated_at"])
+        )
+
+    def _row_to_participant(self, row: sqlite3.Row) -> TestParticipant:
+        return TestParticipant(
+            id=row["id"],
+            user_id=row["user_id"],
+            test_id=row["test_id"],
+            variant_id=row["variant_id"],
+            assignment_date=self._parse_datetime(row["assignment_date"]),
+            session_count=row["session_count"],
+            total_interactions=row["total_interactions"],
+            conversion_events=self._from_json(row["conversion_events"], []),
+            data_quality_score=row["data_quality_score"],
+            outlier_score=row["outlier_score"],
+            consistency_score=row["consistency_score"],
+            user_segment=row["user_segment"],
+            engagement_level=row["engagement_level"],
+            technical_profile=self._from_json(row["technical_profile"])
+        )
+
+    def _result_row(self, result: TestResult) -> Tuple:
+        return (
+            result.id, result.test_id, result.variant_id, result.participant_id,
+            result.timestamp.isoformat(),
+            self._to_json({MetricType(metric).value: value for metric, value in result.metric_values.items()}),
+            result.success, result.response_time_ms, result.user_satisfaction,
+            self._to_json(result.session_context), self._to_json(result.prompt_context),
+            self._to_json(result.response_context), self._to_json(result.data_quality_flags),
+            self._to_json(result.outlier_indicators)
+        )
+
+    def _row_to_result(self, row: sqlite3.Row) -> TestResult:
+        return TestResult(
+            id=row["id"],
+            test_id=row["test_id"],
+            variant_id=row["variant_id"],
+            participant_id=row["participant_id"],
+            timestamp=self._parse_datetime(row["timestamp"]),
+            metric_values={MetricType(k): v for k, v in self._from_json(row["metric_values"], {}).items()},
+            success=bool(row["success"]),
+            response_time_ms=row["response_time_ms"],
+            user_satisfaction=row["user_satisfaction"],
+            session_context=self._from_json(row["session_context"], {}),
+            prompt_context=self._from_json(row["prompt_context"], {}),
+            response_context=self._from_json(row["response_context"], {}),
+            data_quality_flags=self._from_json(row["data_quality_flags"], []),
+            outlier_indicators=self._from_json(row["outlier_indicators"], [])
+        )
+
+    @staticmethod
+    def _row_to_statistics(row: sqlite3.Row) -> VariantStatistics:
+        return VariantStatistics(
+            n=row["n"],
+            successes=row["successes"],
+            response_time_sum=row["response_time_sum"],
+            response_time_sumsq=row["response_time_sumsq"],
+            satisfaction_n=row["satisfaction_n"],
+            satisfaction_sum=row["satisfaction_sum"],
+            satisfaction_sumsq=row["satisfaction_sumsq"]
+        )
 
     async def _save_test(self, test: ABTest):
         """Save test to database."""
-        # Implementation would save test to database
-        pass
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO ab_tests VALUES ({','.join('?' * 30)})",
+                self._test_row(test)
+            )
+        self._tests.set(test.id, test)
 
     async def _get_test(self, test_id: str) -> Optional[ABTest]:
         """Get test by ID."""
-        # Implementation would retrieve test from database
-        return None
+        test = self._tests.get(test_id)
+        if test is not None:
+            return test
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM ab_tests WHERE id = ?", (test_id,)).fetchone()
+        if row is None:
+            return None
+
+        test = self._row_to_test(row)
+        self._tests.set(test_id, test)
+        return test
 
     async def _update_test(self, test: ABTest):
         """Update test in database."""
-        # Implementation would update test in database
-        pass
+        test.updated_at = datetime.utcnow()
+        await self._save_test(test)
 
-    async def _save_participant(self, participant: TestParticipant):
-        """Save participant to database."""
-        # Implementation would save participant to database
-        pass
+    async def _save_participant(self, participant: TestParticipant) -> TestParticipant:
+        """
+        Save participant to database.
+
+        Returns the stored assignment: if the user was already assigned (e.g. by
+        another worker), that assignment wins over the new one.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO test_participants (
+                    id, user_id, test_id, variant_id, assignment_date, session_count,
+                    total_interactions, conversion_events, data_quality_score, outlier_score,
+                    consistency_score, user_segment, engagement_level, technical_profile
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                participant.id, participant.user_id, participant.test_id, participant.variant_id,
+                participant.assignment_date.isoformat(), participant.session_count,
+                participant.total_interactions, self._to_json(participant.conversion_events),
+                participant.data_quality_score, participant.outlier_score,
+                participant.consistency_score, participant.user_segment,
+                participant.engagement_level, self._to_json(participant.technical_profile)
+            ))
+            if cursor.rowcount == 0:
+                row = conn.execute(
+                    "SELECT * FROM test_participants WHERE test_id = ? AND user_id = ?",
+                    (participant.test_id, participant.user_id)
+                ).fetchone()
+                participant = self._row_to_participant(row)
+
+        self._assignments.set(f"{participant.test_id}:{participant.user_id}", participant)
+        return participant
 
     async def _get_user_assignment(self, test_id: str, user_id: str) -> Optional[TestParticipant]:
         """Get user's variant assignment."""
-        # Implementation would retrieve assignment from database
-        return None
+        key = f"{test_id}:{user_id}"
+        participant = self._assignments.get(key)
+        if participant is not None:
+            return participant
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM test_participants WHERE test_id = ? AND user_id = ?", (test_id, user_id)
+            ).fetchone()
+        if row is None:
+            return None
+
+        participant = self._row_to_participant(row)
+        self._assignments.set(key, participant)
+        return participant
 
     async def _save_result(self, result: TestResult):
-        """Save result to database."""
-        # Implementation would save result to database
-        pass
+        """Buffer a result and fold it into the in-memory running sums."""
+        with self._lock:
+            self._pending_results.append(result)
+            self._update_variant_statistics(result)
+            self._ensure_flush_thread()
+            should_flush = (
+                len(self._pending_results) >= self.result_batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+        if should_flush:
+            await asyncio.to_thread(self.flush_results)
+
+    def _update_variant_statistics(self, result: TestResult):
+        """Update the running sums of the result's variant (if loaded; otherwise they are read on demand)."""
+        variant_stats = self._variant_stats.get(result.test_id)
+        if variant_stats is not None:
+            variant_stats.setdefault(result.variant_id, VariantStatistics()).add(result)
+
+    async def _update_participant_statistics(self, participant: TestParticipant, result: TestResult):
+        """Update participant statistics (the stored counter is incremented when the batch is written)."""
+        participant.total_interactions += 1
+
+    def _load_variant_statistics(self, test_id: str) -> Dict[str, VariantStatistics]:
+        """Stored running sums plus the results still waiting in the buffer."""
+        with self._lock:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT * FROM variant_statistics WHERE test_id = ?", (test_id,)).fetchall()
+            variant_stats = {row["variant_id"]: self._row_to_statistics(row) for row in rows}
+            for result in self._pending_results:
+                if result.test_id == test_id:
+                    variant_stats.setdefault(result.variant_id, VariantStatistics()).add(result)
+            self._variant_stats[test_id] = variant_stats
+            return variant_stats
+
+    async def _get_variant_statistics(self, test_id: str, refresh: bool = False) -> Dict[str, VariantStatistics]:
+        """
+        Snapshot of the per-variant running sums.
 
-    async def _update_variant_statistics(self, variant_id: str, result: TestResult):
-        """Update variant statistics."""
-        # Implementation would update variant statistics
-        pass
+        With `refresh` the sums are re-read from the database, picking up the
+        results written by other workers.
+        """
+        with self._lock:
+            variant_stats = None if refresh else self._variant_stats.get(test_id)
+            if variant_stats is None:
+                variant_stats = self._load_variant_statistics(test_id)
+            return {variant_id: replace(stat) for variant_id, stat in variant_stats.items()}
 
     async def _get_test_results(self, test_id: str) -> List[TestResult]:
         """Get all results for a test."""
-        # Implementation would retrieve results from database
-        return []
+        await asyncio.to_thread(self.flush_results)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM test_results WHERE test_id = ? ORDER BY timestamp", (test_id,)
+            ).fetchall()
+        return [self._row_to_result(row) for row in rows]
+
+    def _load_satisfaction_scores(self, test_id: str) -> Dict[str, List[float]]:
+        """User satisfaction scores per variant (the analysis flushes the buffer before reading)."""
+        scores: Dict[str, List[float]] = {}
+        with self._connect() as conn:
+            for row in conn.execute("""
+                SELECT variant_id, user_satisfaction FROM test_results
+                WHERE test_id = ? AND user_satisfaction IS NOT NULL
+            """, (test_id,)):
+                scores.setdefault(row["variant_id"], []).append(row["user_satisfaction"])
+        return scores
+
+    async def _get_variant_performance(self, test_id: str) -> List[Dict[str, Any]]:
+        """Per-variant performance from the running sums."""
+        test = await self._get_test(test_id)
+        variant_stats = await self._get_variant_statistics(test_id, refresh=True)
+        with self._connect() as conn:
+            participants = {
+                row["variant_id"]: row["participants"]
+                for row in conn.execute("""
+                    SELECT variant_id, COUNT(*) AS participants FROM test_participants
+                    WHERE test_id = ? GROUP BY variant_id
+                """, (test_id,))
+            }
+
+        return [
+            {
+                "variant_id": variant.id,
+                "name": variant.name,
+                "is_control": variant.id == test.control_variant_id,
+                "traffic_weight": variant.traffic_weight,
+                "participants": participants.get(variant.id, 0),
+                **variant_stats.get(variant.id, VariantStatistics()).summary()
+            }
+            for variant in test.variants
+        ]
+
+    async def _get_time_series_data(self, test_id: str) -> List[Dict[str, Any]]:
+        """Daily results per variant (the caller flushes the buffer before reading)."""
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT substr(timestamp, 1, 10) AS day, variant_id, COUNT(*) AS results,
+                       SUM(success) AS successes, AVG(response_time_ms) AS avg_response_time
+                FROM test_results
+                WHERE test_id = ?
+                GROUP BY day, variant_id
+                ORDER BY day
+            """, (test_id,)).fetchall()
+
+        return [
+            {
+                "date": row["day"],
+                "variant_id": row["variant_id"],
+                "results": row["results"],
+                "success_rate": row["successes"] / row["results"],
+                "avg_response_time": row["avg_response_time"]
+            }
+            for row in rows
+        ]
+
+    async def _get_segment_analysis(self, test_id: str) -> Dict[str, Dict[str, Any]]:
+        """Success rate per user segment and variant."""
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT COALESCE(p.user_segment, 'unknown') AS segment, r.variant_id,
+                       COUNT(*) AS results, SUM(r.success) AS successes
+                FROM test_results r
+                JOIN test_participants p ON p.id = r.participant_id
+                WHERE r.test_id = ?
+                GROUP BY segment, r.variant_id
+            """, (test_id,)).fetchall()
+
+        segments: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            segments.setdefault(row["segment"], {})[row["variant_id"]] = {
+                "results": row["results"],
+                "success_rate": row["successes"] / row["results"]
+            }
+        return segments
 
     def _validate_test_configuration(self, test: ABTest) -> List[str]:
         """Validate test configuration."""
@@ -1323,7 +1913,7 @@ class ABTestingFramework:
     async def _generate_insights(
         self,
         test: ABTest,
-        results: List[TestResult],
+        variant_stats: Dict[str, VariantStatistics],
         analysis: Dict[str, Any]
     ) -> List[str]:
         """Generate insights from test results."""
@@ -1340,7 +1930,7 @@ class ABTestingFramework:
     async def _assess_risks(
         self,
         test: ABTest,
-        results: List[TestResult],
+        variant_stats: Dict[str, VariantStatistics],
         analysis: Dict[str, Any]
     ) -> Dict[str, Any]:
         """Assess risks associated with test deployment."""
@@ -2,8 +2,16 @@
 Active Recall Engine
 Advanced adaptive question generation system for enhanced learning
 Based on latest cognitive science research (2024-2025)
+
+Generated question sets are cached in SQLite under a stable SHA-256 digest of the content
+and generation parameters, so the cache is shared across restarts and workers.
+
+Configuration:
+    ACTIVE_RECALL_CACHE_TTL_HOURS    validity of cached question sets (default: 168)
 """
 
+import asyncio
+import hashlib
 import os
 import json
 import uuid
@@ -13,6 +21,7 @@ from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 import sqlite3
 import random
+from services.service_container import service_container
 
 @dataclass
 class Question:
@@ -50,8 +59,13 @@ class QuestionGenerationRequest:
 class ActiveRecallEngine:
     """Enhanced Active Recall Engine with adaptive generation"""
 
+    CACHE_KEY_VERSION = 1
+
     def __init__(self, db_path: str = "data/active_recall.db"):
         self.db_path = db_path
+        self.cache_ttl = timedelta(hours=float(os.getenv("ACTIVE_RECALL_CACHE_TTL_HOURS", "168")))
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.ensure_database()
 
         # Question type configurations
@@ -148,12 +162,16 @@ class ActiveRecallEngine:
                 used_count INTEGER DEFAULT 0
             )
         """)
+        cache_columns = {row[1] for row in cursor.execute("PRAGMA table_info(question_cache)")}
+        if "last_used" not in cache_columns:
+            cursor.execute("ALTER TABLE question_cache ADD COLUMN last_used TEXT")
 
         # Indexes for performance
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_course_id ON questions(course_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_difficulty ON questions(difficulty)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_type ON questions(question_type)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_attempts_question_id ON question_attempts(question_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_cache_time ON question_cache(generation_time)")
 
         conn.commit()
         conn.close()
@@ -164,8 +182,8 @@ class ActiveRecallEngine:
         """
         try:
             # Check cache first
-            content_hash = self._hash_content(request.content)
-            cached_questions = self._get_cached_questions(content_hash)
+            cache_key = self._cache_key(request)
+            cached_questions = self._get_cached_questions(cache_key)
             if cached_questions:
                 return cached_questions
 
@@ -177,29 +195,23 @@ class ActiveRecallEngine:
                 request.difficulty_target, request.num_questions
             )
 
-            # Generate questions using LLM
             questions = []
-
-            for i in range(request.num_questions):
-                question_type = random.choice(question_types)
-                bloom_level = random.choice(bloom_levels)
-
-                # Generate specific question based on type and level
+            for _ in range(request.num_questions):
                 question = await self._generate_specific_question(
                     content=request.content,
-                    question_type=question_type,
-                    bloom_level=bloom_level,
+                    question_type=random.choice(question_types),
+                    bloom_level=random.choice(bloom_levels),
                     difficulty_target=request.difficulty_target,
                     course_id=request.course_id,
                     concept_id=request.concept_id,
                     context_tags=request.context_tags or []
                 )
-
                 if question:
                     questions.append(question)
 
-            # Cache the results
-            self._cache_questions(content_hash, questions)
+            # Save the whole set in one transaction, then cache it
+            await asyncio.to_thread(self._save_questions, questions)
+            self._cache_questions(cache_key, questions)
 
             return questions
 
@@ -221,30 +233,19 @@ class ActiveRecallEngine:
         try:
             # This is where we would integrate with LLM service
             # For now, implementing heuristics-based generation
-
-            if question_type == "multiple_choice":
-                return self._generate_multiple_choice_question(
-                    content, bloom_level, difficulty_target, course_id, concept_id, context_tags
-                )
-            elif question_type == "short_answer":
-                return self._generate_short_answer_question(
-                    content, bloom_level, difficulty_target, course_id, concept_id, context_tags
-                )
-            elif question_type == "fill_in_blank":
-                return self._generate_fill_in_blank_question(
-                    content, bloom_level, difficulty_target, course_id, concept_id, context_tags
-                )
-            elif question_type == "explanation":
-                return self._generate_explanation_question(
-                    content, bloom_level, difficulty_target, course_id, concept_id, context_tags
-                )
-            elif question_type == "application":
-                return self._generate_application_question(
-                    content, bloom_level, difficulty_target, course_id, concept_id, context_tags
-                )
-            else:
+            generators = {
+                "multiple_choice": self._generate_multiple_choice_question,
+                "short_answer": self._generate_short_answer_question,
+                "fill_in_blank": self._generate_fill_in_blank_question,
+                "explanation": self._generate_explanation_question,
+                "application": self._generate_application_question
+            }
+            generator = generators.get(question_type)
+            if generator is None:
                 return None
 
+            return generator(content, bloom_level, difficulty_target, course_id, concept_id, context_tags)
+
         except Exception as e:
             print(f"Error generating {question_type} question: {e}")
             return None
@@ -306,7 +307,6 @@ class ActiveRecallEngine:
             average_response_time=0.0
         )
 
-        self._save_question(question)
         return question
 
     def _generate_short_answer_question(
@@ -351,7 +351,6 @@ class ActiveRecallEngine:
             average_response_time=0.0
         )
 
-        self._save_question(question)
         return question
 
     def _generate_fill_in_blank_question(
@@ -405,7 +404,6 @@ class ActiveRecallEngine:
             average_response_time=0.0
         )
 
-        self._save_question(question)
         return question
 
     def _generate_explanation_question(
@@ -452,7 +450,6 @@ class ActiveRecallEngine:
             average_response_time=0.0
         )
 
-        self._save_question(question)
         return question
 
     def _generate_application_question(
@@ -501,7 +498,6 @@ class ActiveRecallEngine:
             average_response_time=0.0
         )
 
-        self._save_question(question)
         return question
 
     def _extract_key_concepts(self, content: str) -> List[str]:
@@ -625,26 +621,52 @@ class ActiveRecallEngine:
             return ["analyze", "evaluate", "create"] * (num_questions // 3 + 1)
 
     def _hash_content(self, content: str) -> str:
-        """Create hash of content for caching"""
-        return str(hash(content))
+        """Create a stable hash of content for caching (identical across processes and restarts)"""
+        normalized = " ".join((content or "").split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _cache_key(self, request: QuestionGenerationRequest) -> str:
+        """Stable digest of the content and of every parameter that changes the generated set"""
+        parameters = {
+            "version": self.CACHE_KEY_VERSION,
+            "content": self._hash_content(request.content),
+            "course_id": request.course_id,
+            "concept_id": request.concept_id,
+            "difficulty": round(float(request.difficulty_target), 3),
+            "question_types": sorted(request.question_types or []),
+            "bloom_levels": sorted(request.bloom_levels or []),
+            "num_questions": request.num_questions,
+            "context_tags": sorted(request.context_tags or [])
+        }
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode("utf-8")).hexdigest()
 
     def _get_cached_questions(self, content_hash: str) -> Optional[List[Question]]:
-        """Get cached questions if available"""
+        """Get cached questions if available and not expired, updating usage stats"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
+            now = datetime.now()
             cursor.execute(
-                "SELECT generated_questions FROM question_cache WHERE content_hash = ?",
-                (content_hash,)
+                "UPDATE question_cache SET used_count = used_count + 1, last_used = ? "
+                "WHERE content_hash = ? AND generation_time >= ?",
+                (now.isoformat(), content_hash, (now - self.cache_ttl).isoformat())
             )
-            row = cursor.fetchone()
+            row = None
+            if cursor.rowcount:
+                cursor.execute(
+                    "SELECT generated_questions FROM question_cache WHERE content_hash = ?",
+                    (content_hash,)
+                )
+                row = cursor.fetchone()
 
+            conn.commit()
             conn.close()
 
             if row:
-                questions_data = json.loads(row[0])
-                return [Question(**q_data) for q_data in questions_data]
+                self.cache_hits += 1
+                return [self._question_from_dict(q_data) for q_data in json.loads(row[0])]
+            self.cache_misses += 1
             return None
 
         except Exception as e:
@@ -652,23 +674,31 @@ class ActiveRecallEngine:
             return None
 
     def _cache_questions(self, content_hash: str, questions: List[Question]):
-        """Cache generated questions"""
+        """Cache generated questions and drop expired entries"""
+        if not questions:
+            return
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
             questions_data = [asdict(q) for q in questions]
+            now = datetime.now()
 
             cursor.execute(
-                "INSERT OR REPLACE INTO question_cache VALUES (?, ?, ?, ?, ?)",
+                "INSERT OR REPLACE INTO question_cache "
+                "(id, content_hash, generated_questions, generation_time, used_count, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
                 (
                     str(uuid.uuid4()),
                     content_hash,
-                    json.dumps(questions_data),
-                    datetime.now().isoformat(),
-                    0
+                    json.dumps(questions_data, default=str),
+                    now.isoformat(),
+                    0,
+                    None
                 )
             )
+            cursor.execute("DELETE FROM question_cache WHERE generation_time < ?",
+                           ((now - self.cache_ttl).isoformat(),))
 
             conn.commit()
             conn.close()
@@ -676,20 +706,63 @@ class ActiveRecallEngine:
         except Exception as e:
             print(f"Error caching questions: {e}")
 
+    @staticmethod
+    def _question_from_dict(data: Dict[str, Any]) -> Question:
+        for field in ("created_at", "last_used"):
+            if isinstance(data.get(field), str):
+                data[field] = datetime.fromisoformat(data[field])
+        return Question(**data)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Question cache usage statistics"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cutoff = (datetime.now() - self.cache_ttl).isoformat()
+            cursor.execute(
+                "SELECT COUNT(*), COALESCE(SUM(used_count), 0), "
+                "COALESCE(SUM(CASE WHEN generation_time < ? THEN 1 ELSE 0 END), 0) FROM question_cache",
+                (cutoff,)
+            )
+            entries, total_hits, expired = cursor.fetchone()
+            conn.close()
+
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "entries": entries,
+                "expired_entries": expired,
+                "total_hits": total_hits,
+                "ttl_hours": self.cache_ttl.total_seconds() / 3600,
+                "process_hits": self.cache_hits,
+                "process_misses": self.cache_misses,
+                "process_hit_rate": round(self.cache_hits / lookups, 3) if lookups else 0.0
+            }
+
+        except Exception as e:
+            print(f"Error getting cache stats: {e}")
+            return {}
+
     def _save_question(self, question: Question):
         """Save question to database"""
+        self._save_questions([question])
+
+    def _save_questions(self, questions: List[Question]):
+        """Save a set of questions in a single transaction"""
+        if not questions:
+            return
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
-            cursor.execute("""
+            cursor.executemany("""
                 INSERT INTO questions
                 (id, course_id, concept_id, question_type, question_text, correct_answer,
                  options, explanation, difficulty, bloom_level, context_tags,
                  source_material, created_at, last_used, usage_count,
                  success_rate, average_response_time)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            """, [(
                 question.id, question.course_id, question.concept_id, question.question_type,
                 question.question_text, str(question.correct_answer), json.dumps(question.options),
                 question.explanation, question.difficulty, question.bloom_level,
@@ -697,13 +770,13 @@ class ActiveRecallEngine:
                 question.created_at.isoformat(),
                 question.last_used.isoformat() if question.last_used else None,
                 question.usage_count, question.success_rate, question.average_response_time
-            ))
+            ) for question in questions])
 
             conn.commit()
             conn.close()
 
         except Exception as e:
-            print(f"Error saving question: {e}")
+            print(f"Error saving questions: {e}")
 
     def get_adaptive_questions(
         self,
@@ -889,4 +962,4 @@ class ActiveRecallEngine:
             return {}
 
 # Global instance
-active_recall_engine = ActiveRecallEngine()
\ No newline at end of file
+active_recall_engine = service_container.lazy("active_recall")
\ No newline at end of file
@@ -2,18 +2,30 @@
 """
 Advanced Search Service for PDF documents with filters and categories
 Supports full-text search, semantic search, and advanced filtering
+
+Text search runs on an on-disk inverted index (services/search_index_store.py) that is
+updated incrementally when annotations or OCR results are written, and reconciled with
+the files on disk by mtime at most every SEARCH_INDEX_SYNC_INTERVAL seconds.
+
+Configurazione:
+    SEARCH_INDEX_DB_PATH         index database (default: <data_dir>/search_index.db)
+    SEARCH_INDEX_SYNC_INTERVAL   seconds between mtime-based syncs (default: 300)
 """
 
 import os
 import re
 import json
 import asyncio
-from typing import List, Dict, Optional, Any, Union
+import threading
+import time
+from typing import Iterator, List, Dict, Optional, Any, Tuple, Union
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
 from dataclasses import dataclass, asdict
 from enum import Enum
+from services.service_container import service_container
+from services.search_index_store import IndexedDocument, SearchIndexStore, tokenize
 try:
     from services.rag_service import RAGService
 except Exception as import_error:
@@ -94,129 +106,182 @@ class SearchResponse:
 class AdvancedSearchService:
     """Advanced search service for PDF content and annotations"""
 
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", sync_interval: Optional[float] = None):
         self.data_dir = Path(data_dir)
         self.annotations_dir = self.data_dir / "annotations"
         self.courses_dir = self.data_dir / "courses"
         self.ocr_results_dir = self.data_dir / "ocr_results"
         self._rag_service: Optional["RAGService"] = None
-
-        # Initialize indexes for fast searching
-        self._build_indexes()
-
-    def _build_indexes(self):
-        """Build in-memory indexes for fast searching"""
-        self.annotations_index = {}
-        self.pdf_content_index = {}
-        self.ocr_results_index = {}
-        if self._rag_service is None and RAGService is None:
+        if RAGService is None:
             logger.warning("RAGService not available. Semantic search will fall back to text search.")
 
-        # Load annotations into index
-        self._load_annotations_index()
-
-        # Load OCR results into index
-        self._load_ocr_results_index()
-
-    def _load_annotations_index(self):
-        """Load annotations into search index"""
-        try:
-            if not self.annotations_dir.exists():
-                return
-
-            for user_dir in self.annotations_dir.iterdir():
-                if not user_dir.is_dir():
+        # On-disk inverted index: opening it does not depend on corpus size. Files are
+        # (re)indexed incrementally by the writers and by the mtime-based sync.
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.index_store = SearchIndexStore(os.getenv("SEARCH_INDEX_DB_PATH", str(self.data_dir / "search_index.db")))
+        self.sync_interval = float(os.getenv("SEARCH_INDEX_SYNC_INTERVAL", "300")) if sync_interval is None else sync_interval
+        self._last_sync: Optional[float] = None
+        self._sync_lock = threading.Lock()
+
+    def sync_indexes(self, force: bool = False) -> Dict[str, int]:
+        """
+        Align the index with the files on disk: only new or modified files (by mtime/size)
+        are parsed again, deleted files are dropped. With `force` every file is reindexed.
+        """
+        with self._sync_lock:
+            started = time.monotonic()
+            known = {} if force else self.index_store.source_signatures()
+            seen = set()
+            stats = {"indexed": 0, "removed": 0, "unchanged": 0}
+
+            for path, kind in self._iter_source_files():
+                key = self._source_key(path)
+                seen.add(key)
+                try:
+                    stat = path.stat()
+                except OSError:
                     continue
-
-                user_id = user_dir.name
-                self._process_user_annotations(user_id, user_dir)
-
-        except Exception as e:
-            logger.error(f"Error loading annotations index: {e}")
-
-    def _process_user_annotations(self, user_id: str, user_dir: Path):
-        """Process annotations for a user"""
-        try:
-            for course_dir in user_dir.iterdir():
-                if not course_dir.is_dir():
+                signature = known.get(key)
+                if signature and signature[1] == stat.st_mtime and signature[2] == stat.st_size:
+                    stats["unchanged"] += 1
                     continue
-
-                course_id = course_dir.name
-                self._process_course_annotations(user_id, course_id, course_dir)
-
-        except Exception as e:
-            logger.error(f"Error processing user {user_id} annotations: {e}")
-
-    def _process_course_annotations(self, user_id: str, course_id: str, course_dir: Path):
-        """Process annotations for a course"""
-        try:
-            for book_dir in course_dir.iterdir():
-                if not book_dir.is_dir():
+                if kind == "annotations":
+                    self._index_annotation_file(path)
+                else:
+                    self._index_ocr_result_file(path)
+                stats["indexed"] += 1
+
+            # Sources outside the scanned directories (e.g. OCR results saved next to the PDF)
+            for key, (kind, mtime, size) in self.index_store.source_signatures().items():
+                if key in seen:
                     continue
+                path = Path(key)
+                if not path.exists():
+                    self.index_store.remove_source(key)
+                    stats["removed"] += 1
+                elif force or path.stat().st_mtime != mtime:
+                    if kind == "annotations":
+                        self._index_annotation_file(path)
+                    else:
+                        self._index_ocr_result_file(path)
+                    stats["indexed"] += 1
+
+            self._last_sync = time.monotonic()
+            logger.info(f"Search index synced in {self._last_sync - started:.3f}s: {stats}")
+            return stats
+
+    def _ensure_synced(self):
+        if self._last_sync is None or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync_indexes()
+
+    def _iter_source_files(self) -> Iterator[Tuple[Path, str]]:
+        if self.annotations_dir.exists():
+            for annotation_file in self.annotations_dir.rglob("*.json"):
+                yield annotation_file, "annotations"
+        if self.ocr_results_dir.exists():
+            for ocr_file in self.ocr_results_dir.glob("*_ocr.txt"):
+                yield ocr_file, "ocr"
 
-                book_id = book_dir.name
-
-                # Process annotation files
-                for annotation_file in book_dir.glob("*.json"):
-                    self._index_annotation_file(user_id, course_id, book_id, annotation_file)
-
-        except Exception as e:
-            logger.error(f"Error processing course {course_id} annotations: {e}")
+    @staticmethod
+    def _source_key(path: Union[str, Path]) -> str:
+        return os.path.normpath(os.path.abspath(str(path)))
 
-    def _index_annotation_file(self, user_id: str, course_id: str, book_id: str, annotation_file: Path):
-        """Index a single annotation file"""
+    def _index_annotation_file(self, annotation_file: Union[str, Path],
+                               annotations: Optional[List[Dict[str, Any]]] = None):
+        """Index (or reindex) a single annotation file"""
+        annotation_file = Path(annotation_file)
+        key = self._source_key(annotation_file)
         try:
-            with open(annotation_file, 'r', encoding='utf-8') as f:
-                annotations = json.load(f)
-
+            if not annotation_file.exists():
+                self.index_store.remove_source(key)
+                return
+            stat = annotation_file.stat()
+            if annotations is None:
+                with open(annotation_file, 'r', encoding='utf-8') as f:
+                    annotations = json.load(f)
+
+            # Layout: annotations/<user_id>[/<course_id>[/<book_id>]]/<pdf_filename>.json
+            try:
+                parts = annotation_file.resolve().relative_to(self.annotations_dir.resolve()).parts
+            except ValueError:
+                parts = ()
+            user_id = parts[0] if len(parts) > 1 else ""
             pdf_filename = annotation_file.stem.replace('.json', '')
+            indexed_at = datetime.now().isoformat()
 
+            documents = []
             for annotation in annotations:
-                index_key = f"{user_id}:{course_id}:{book_id}:{annotation['id']}"
-                self.annotations_index[index_key] = {
-                    **annotation,
-                    'user_id': user_id,
-                    'course_id': course_id,
-                    'book_id': book_id,
-                    'pdf_filename': pdf_filename,
-                    'indexed_at': datetime.now()
-                }
+                course_id = annotation.get('course_id') or (parts[1] if len(parts) > 3 else "")
+                book_id = annotation.get('book_id') or (parts[2] if len(parts) > 3 else "")
+                owner = user_id or annotation.get('user_id', "")
+                tags = annotation.get('tags') or []
+                documents.append(IndexedDocument(
+                    doc_id=f"{owner}:{course_id}:{book_id}:{annotation['id']}",
+                    doc_type="annotation",
+                    user_id=owner,
+                    course_id=course_id,
+                    book_id=book_id,
+                    tags=tags,
+                    payload={
+                        **annotation,
+                        'user_id': owner,
+                        'course_id': course_id,
+                        'book_id': book_id,
+                        'pdf_filename': pdf_filename,
+                        'indexed_at': indexed_at
+                    },
+                    fields={
+                        'selected_text': annotation.get('selected_text') or "",
+                        'content': annotation.get('content') or "",
+                        'tags': " ".join(tags)
+                    }
+                ))
+
+            self.index_store.replace_source(key, "annotations", stat.st_mtime, stat.st_size, documents)
 
         except Exception as e:
             logger.error(f"Error indexing annotation file {annotation_file}: {e}")
 
-    def _load_ocr_results_index(self):
-        """Load OCR results into search index"""
+    def _index_ocr_result_file(self, ocr_file: Union[str, Path]):
+        """Index (or reindex) a single OCR result file"""
+        ocr_file = Path(ocr_file)
+        key = self._source_key(ocr_file)
         try:
-            if not self.ocr_results_dir.exists():
+            if not ocr_file.exists():
+                self.index_store.remove_source(key)
                 return
-
-            for ocr_file in self.ocr_results_dir.glob("*_ocr.txt"):
-                self._index_ocr_result_file(ocr_file)
-
-        except Exception as e:
-            logger.error(f"Error loading OCR results index: {e}")
-
-    def _index_ocr_result_file(self, ocr_file: Path):
-        """Index a single OCR result file"""
-        try:
+            stat = ocr_file.stat()
             with open(ocr_file, 'r', encoding='utf-8') as f:
                 content = f.read()
 
             # Extract metadata from the OCR file
             metadata = self._parse_ocr_metadata(content)
 
-            index_key = str(ocr_file)
-            self.ocr_results_index[index_key] = {
-                'filename': ocr_file.name,
-                'content': content,
-                'metadata': metadata,
-                'indexed_at': datetime.now()
-            }
+            document = IndexedDocument(
+                doc_id=key,
+                doc_type="ocr_result",
+                payload={
+                    'filename': ocr_file.name,
+                    'content': content,
+                    'metadata': metadata,
+                    'indexed_at': datetime.now().isoformat()
+                },
+                fields={'content': content}
+            )
+            self.index_store.replace_source(key, "ocr", stat.st_mtime, stat.st_size, [document])
 
         except Exception as e:
             logger.error(f"Error indexing OCR result file {ocr_file}: {e}")
 
+    def index_annotation_file(self, annotation_file: Union[str, Path],
+                              annotations: Optional[List[Dict[str, Any]]] = None):
+        """Incremental update hook called by AnnotationService after writing a file"""
+        self._index_annotation_file(annotation_file, annotations)
+
+    def index_ocr_result_file(self, ocr_file: Union[str, Path]):
+        """Incremental update hook called by OCRService after saving a result"""
+        self._index_ocr_result_file(ocr_file)
+
     def _parse_ocr_metadata(self, ocr_content: str) -> Dict[str, Any]:
         """Parse metadata from OCR content"""
         metadata = {}
@@ -243,7 +308,8 @@ class AdvancedSearchService:
             return None
 
         try:
-            self._rag_service = RAGService()
+            from services.service_container import get_rag_service
+            self._rag_service = get_rag_service()
             return self._rag_service
         except Exception as exc:
             logger.error(f"Failed to initialize RAGService for semantic search: {exc}")
@@ -280,8 +346,8 @@ class AdvancedSearchService:
             # Calculate search time
             search_time = (datetime.now() - start_time).total_seconds()
 
-            # Generate facets and suggestions
-            facets = self._generate_facets(paginated_results)
+            # Generate facets and suggestions (facets cover every match, not only the current page)
+            facets = self._generate_facets(sorted_results)
             suggestions = self._generate_suggestions(query.query, paginated_results)
 
             return SearchResponse(
@@ -306,16 +372,11 @@ class AdvancedSearchService:
 
     async def _text_search(self, query: SearchQuery) -> List[SearchResult]:
         """Perform text-based search"""
-        results = []
         search_terms = self._prepare_search_terms(query.query)
+        if not search_terms:
+            return []
 
-        # Search in annotations
-        annotation_results = self._search_annotations(search_terms)
-        results.extend(annotation_results)
-
-        # Search in OCR results
-        ocr_results = self._search_ocr_results(search_terms)
-        results.extend(ocr_results)
+        results = await asyncio.to_thread(self._search_index, search_terms, query.filters)
 
         # Calculate relevance scores
         results = self._calculate_text_relevance_scores(results, search_terms)
@@ -324,8 +385,8 @@ class AdvancedSearchService:
 
     def _prepare_search_terms(self, query: str) -> List[str]:
         """Prepare search terms for matching"""
-        # Convert to lowercase and split
-        terms = query.lower().strip().split()
+        # Convert to lowercase and split into index tokens
+        terms = tokenize(query)
 
         # Remove common stop words
         stop_words = {'il', 'lo', 'la', 'i', 'gli', 'le', 'un', 'una', 'dei', 'delle', 'del', 'della', 'in', 'con', 'su', 'per', 'tra', 'fra', 'a', 'da', 'di', 'che', 'e', 'è', 'non'}
@@ -333,98 +394,77 @@ class AdvancedSearchService:
 
         return terms
 
-    def _search_annotations(self, search_terms: List[str]) -> List[SearchResult]:
-        """Search in annotations index"""
-        results = []
-
-        for index_key, annotation in self.annotations_index.items():
-            score = 0.0
-            content_matches = []
-
-            # Search in selected_text
-            if 'selected_text' in annotation:
-                for term in search_terms:
-                    if term in annotation['selected_text'].lower():
-                        score += 1.0
-                        content_matches.append(term)
-
-            # Search in content/notes
-            if 'content' in annotation and annotation['content']:
-                for term in search_terms:
-                    if term in annotation['content'].lower():
-                        score += 0.8
-                        content_matches.append(term)
-
-            # Search in tags
-            if 'tags' in annotation:
-                for term in search_terms:
-                    for tag in annotation['tags']:
-                        if term in tag.lower():
-                            score += 0.5
-                            content_matches.append(term)
-
-            if score > 0:
-                result = SearchResult(
-                    id=annotation['id'],
-                    type="annotation",
-                    content=annotation.get('selected_text', ''),
-                    title=f"Annotation in {annotation.get('pdf_filename', 'Unknown')}",
-                    source=annotation['id'],
-                    course_id=annotation['course_id'],
-                    book_id=annotation['book_id'],
-                    page_number=annotation.get('page_number'),
-                    user_id=annotation['user_id'],
-                    score=score,
-                    tags=annotation.get('tags', []),
-                    created_at=datetime.fromisoformat(annotation['created_at']) if 'created_at' in annotation else None,
-                    metadata={
-                        'annotation_type': annotation.get('type'),
-                        'is_public': annotation.get('is_public', False),
-                        'is_favorite': annotation.get('is_favorite', False),
-                        'matched_terms': list(set(content_matches))
-                    }
-                )
-                results.append(result)
+    def _search_index(self, search_terms: List[str], filters: Optional[SearchFilter] = None) -> List[SearchResult]:
+        """Look up postings for the search terms; user/course/book filters are applied in the index"""
+        self._ensure_synced()
 
-        return results
+        facets = {}
+        if filters:
+            facets = {'user_id': filters.user_ids, 'course_id': filters.course_ids, 'book_id': filters.book_ids}
+        matches = self.index_store.match(search_terms, facets)
+        documents = self.index_store.get_documents(matches.keys())
 
-    def _search_ocr_results(self, search_terms: List[str]) -> List[SearchResult]:
-        """Search in OCR results index"""
         results = []
-
-        for index_key, ocr_result in self.ocr_results_index.items():
-            score = 0.0
-            content_matches = []
-
-            content_lower = ocr_result['content'].lower()
-
-            for term in search_terms:
-                occurrences = content_lower.count(term)
-                if occurrences > 0:
-                    score += occurrences * 0.1
-                    content_matches.append(term)
-
-            if score > 0:
-                metadata = ocr_result['metadata']
-                result = SearchResult(
-                    id=index_key,
-                    type="ocr_result",
-                    content=ocr_result['content'],
-                    title=f"OCR Result: {metadata.get('pdf_filename', 'Unknown')}",
-                    source=index_key,
-                    course_id="",  # OCR results don't have course context
-                    book_id="",   # OCR results don't have book context
-                    score=score,
-                    confidence=metadata.get('confidence'),
-                    metadata={
-                        'total_pages': metadata.get('total_pages'),
-                        'matched_terms': list(set(content_matches))
-                    }
-                )
-                results.append(result)
-
+        for doc_id, term_fields in matches.items():
+            document = documents.get(doc_id)
+            if document is None:
+                continue
+            if document['doc_type'] == "annotation":
+                results.append(self._annotation_result(document['payload'], term_fields))
+            else:
+                results.append(self._ocr_result(doc_id, document['payload'], term_fields))
         return results
 
+    def _annotation_result(self, annotation: Dict[str, Any], term_fields: Dict[str, Dict[str, int]]) -> SearchResult:
+        # Same weights as before: selected text 1.0, note 0.8, 0.5 per matching tag
+        score = 0.0
+        for fields in term_fields.values():
+            if 'selected_text' in fields:
+                score += 1.0
+            if 'content' in fields:
+                score += 0.8
+            score += 0.5 * fields.get('tags', 0)
+
+        return SearchResult(
+            id=annotation['id'],
+            type="annotation",
+            content=annotation.get('selected_text', ''),
+            title=f"Annotation in {annotation.get('pdf_filename', 'Unknown')}",
+            source=annotation['id'],
+            course_id=annotation['course_id'],
+            book_id=annotation['book_id'],
+            page_number=annotation.get('page_number'),
+            user_id=annotation['user_id'],
+            score=score,
+            tags=annotation.get('tags', []),
+            created_at=datetime.fromisoformat(annotation['created_at']) if 'created_at' in annotation else None,
+            metadata={
+                'annotation_type': annotation.get('type'),
+                'is_public': annotation.get('is_public', False),
+                'is_favorite': annotation.get('is_favorite', False),
+                'matched_terms': list(term_fields)
+            }
+        )
+
+    def _ocr_result(self, doc_id: str, ocr_result: Dict[str, Any], term_fields: Dict[str, Dict[str, int]]) -> SearchResult:
+        metadata = ocr_result['metadata']
+        occurrences = sum(fields.get('content', 0) for fields in term_fields.values())
+        return SearchResult(
+            id=doc_id,
+            type="ocr_result",
+            content=ocr_result['content'],
+            title=f"OCR Result: {metadata.get('pdf_filename', 'Unknown')}",
+            source=doc_id,
+            course_id="",  # OCR results don't have course context
+            book_id="",   # OCR results don't have book context
+            score=occurrences * 0.1,
+            confidence=metadata.get('confidence'),
+            metadata={
+                'total_pages': metadata.get('total_pages'),
+                'matched_terms': list(term_fields)
+            }
+        )
+
     def _calculate_text_relevance_scores(self, results: List[SearchResult], search_terms: List[str]) -> List[SearchResult]:
         """Calculate and normalize relevance scores"""
         if not results:
@@ -766,30 +806,27 @@ class AdvancedSearchService:
 
     def get_search_suggestions(self, partial_query: str, limit: int = 10) -> List[str]:
         """Get autocomplete suggestions"""
-        suggestions = []
-
-        # This is a simple implementation - in production, you'd use a proper autocomplete service
-        for index_key, annotation in self.annotations_index.items():
-            content = annotation.get('selected_text', '') + ' ' + annotation.get('content', '')
-            words = re.findall(r'\b\w+\b', content.lower())
-
-            for word in words:
-                if word.startswith(partial_query.lower()) and len(word) > len(partial_query):
-                    suggestions.append(word)
+        self._ensure_synced()
+        # Prefix range scan over the indexed vocabulary, most frequent terms first
+        return self.index_store.suggest(partial_query, limit)
 
-        # Remove duplicates and limit
-        suggestions = list(set(suggestions))[:limit]
-
-        return suggestions
+    def get_facets(self, filters: Optional[SearchFilter] = None) -> Dict[str, Dict[str, int]]:
+        """Facet counts over the whole index, read from the index tables"""
+        self._ensure_synced()
+        facets = {}
+        if filters:
+            facets = {'user_id': filters.user_ids, 'course_id': filters.course_ids, 'book_id': filters.book_ids}
+        return self.index_store.facet_counts(facets)
 
     def rebuild_indexes(self):
         """Rebuild search indexes"""
         logger.info("Rebuilding search indexes...")
-        self.annotations_index.clear()
-        self.pdf_content_index.clear()
-        self.ocr_results_index.clear()
-        self._build_indexes()
+        self.index_store.clear()
+        self.sync_indexes(force=True)
         logger.info("Search indexes rebuilt successfully")
 
+    def close(self):
+        self.index_store.close()
+
 # Global instance
-advanced_search_service = AdvancedSearchService()
+advanced_search_service = service_container.lazy("advanced_search")
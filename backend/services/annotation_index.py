@@ -0,0 +1,196 @@
+"""
+Annotation Index - Indice BM25 incrementale delle annotazioni, per utente
+
+Le annotazioni di un utente vengono lette dal disco una sola volta (al primo utilizzo) e poi
+mantenute in memoria: ogni salvataggio di un file di annotazioni (create/update/delete/import)
+sostituisce nell'indice soltanto le voci di quel file. Le query della chat non camminano più
+l'intero albero data/annotations: ricevono le annotazioni più pertinenti alla domanda,
+ordinate per punteggio BM25 su testo selezionato, note e tag.
+
+Con più worker ogni processo ha il proprio indice: dopo ANNOTATION_INDEX_TTL secondi l'indice
+di un utente viene ricaricato dal disco, così le modifiche fatte da altri processi compaiono
+con un ritardo limitato.
+
+Configurazione:
+    ANNOTATION_INDEX_TTL        secondi prima di ricaricare l'indice di un utente (default: 300)
+    ANNOTATION_INDEX_MAX_USERS  utenti mantenuti in memoria, politica LRU (default: 500)
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.nlp_utils import STOPWORDS_IT
+
+Annotation = Dict[str, Any]
+AnnotationLoader = Callable[[str], Iterable[Tuple[str, List[Annotation]]]]
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize_annotation_text(text: str) -> List[str]:
+    return [token for token in _TOKEN_PATTERN.findall((text or "").lower())
+            if len(token) > 1 and token not in STOPWORDS_IT]
+
+
+def annotation_search_text(annotation: Annotation) -> str:
+    """Testo indicizzato: selezione, testo della pagina, nota e tag."""
+    parts = [
+        annotation.get("selected_text") or "",
+        annotation.get("text") or "",
+        annotation.get("content") or "",
+        " ".join(annotation.get("tags") or [])
+    ]
+    return " ".join(part for part in parts if part)
+
+
+class _UserIndex:
+    """Posting list e statistiche BM25 delle annotazioni di un singolo utente."""
+
+    def __init__(self):
+        self.annotations: Dict[str, Annotation] = {}
+        self.term_freqs: Dict[str, Counter] = {}
+        self.lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Set[str]] = defaultdict(set)
+        self.files: Dict[str, Set[str]] = defaultdict(set)
+        self.file_of: Dict[str, str] = {}
+        self.total_length = 0
+        self.loaded_at = time.monotonic()
+
+    def add(self, file_key: str, annotation: Annotation):
+        annotation_id = annotation.get("id")
+        if not annotation_id:
+            return
+        if annotation_id in self.annotations:
+            self.remove(annotation_id)
+
+        terms = Counter(tokenize_annotation_text(annotation_search_text(annotation)))
+        self.annotations[annotation_id] = annotation
+        self.term_freqs[annotation_id] = terms
+        self.lengths[annotation_id] = sum(terms.values())
+        self.total_length += self.lengths[annotation_id]
+        for term in terms:
+            self.postings[term].add(annotation_id)
+        self.files[file_key].add(annotation_id)
+        self.file_of[annotation_id] = file_key
+
+    def remove(self, annotation_id: str):
+        if annotation_id not in self.annotations:
+            return
+        for term in self.term_freqs.pop(annotation_id):
+            postings = self.postings[term]
+            postings.discard(annotation_id)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(annotation_id)
+        del self.annotations[annotation_id]
+        file_key = self.file_of.pop(annotation_id)
+        self.files[file_key].discard(annotation_id)
+        if not self.files[file_key]:
+            del self.files[file_key]
+
+    def replace_file(self, file_key: str, annotations: List[Annotation]):
+        for annotation_id in list(self.files.get(file_key, ())):
+            self.remove(annotation_id)
+        for annotation in annotations:
+            self.add(file_key, annotation)
+
+    def score(self, query_terms: List[str], k1: float, b: float) -> Dict[str, float]:
+        doc_count = len(self.annotations)
+        if doc_count == 0:
+            return {}
+        avgdl = self.total_length / doc_count or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            # IDF non negativo: i corpus per utente sono piccoli e i termini comuni non devono penalizzare
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for annotation_id in postings:
+                tf = self.term_freqs[annotation_id][term]
+                norm = k1 * (1 - b + b * self.lengths[annotation_id] / avgdl)
+                scores[annotation_id] += idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+
+class AnnotationIndex:
+    def __init__(self, loader: AnnotationLoader, ttl: Optional[float] = None, max_users: Optional[int] = None,
+                 k1: float = 1.2, b: float = 0.75):
+        self._loader = loader
+        self.ttl = float(os.getenv("ANNOTATION_INDEX_TTL", "300")) if ttl is None else ttl
+        self.max_users = int(os.getenv("ANNOTATION_INDEX_MAX_USERS", "500")) if max_users is None else max_users
+        self.k1 = k1
+        self.b = b
+        self._users: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _user_index(self, user_id: str) -> _UserIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None and time.monotonic() - index.loaded_at < self.ttl:
+                self._users.move_to_end(user_id)
+                return index
+
+            index = _UserIndex()
+            for file_key, annotations in self._loader(user_id):
+                index.replace_file(file_key, annotations)
+            self._users[user_id] = index
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            return index
+
+    def replace_file(self, user_id: str, file_key: str, annotations: List[Annotation]):
+        """Aggiorna le voci di un file di annotazioni; utenti non ancora indicizzati vengono ignorati."""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                index.replace_file(file_key, annotations)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    def search(self, user_id: str, query: str, limit: int,
+               predicate: Optional[Callable[[Annotation], bool]] = None) -> List[Tuple[Annotation, float]]:
+        """
+        (annotazione, punteggio) delle annotazioni pertinenti alla query, in ordine decrescente.
+        Senza termini utili nella query restituisce le più recenti con punteggio 0.
+        """
+        if limit <= 0:
+            return []
+
+        with self._lock:
+            index = self._user_index(user_id)
+            query_terms = tokenize_annotation_text(query)
+            if query_terms:
+                scored = index.score(query_terms, self.k1, self.b)
+                candidates = [(index.annotations[annotation_id], score) for annotation_id, score in scored.items()]
+                candidates.sort(key=lambda item: (item[1], item[0].get("updated_at") or ""), reverse=True)
+            else:
+                candidates = sorted(((annotation, 0.0) for annotation in index.annotations.values()),
+                                    key=lambda item: item[0].get("created_at") or "", reverse=True)
+
+        results: List[Tuple[Annotation, float]] = []
+        for annotation, score in candidates:
+            if predicate is not None and not predicate(annotation):
+                continue
+            results.append((annotation, score))
+            if len(results) >= limit:
+                break
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "annotations": sum(len(index.annotations) for index in self._users.values())
+            }
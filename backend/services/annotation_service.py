@@ -2,12 +2,17 @@ import os
 import json
 import uuid
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Union
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple, Union
+
+from services.annotation_index import AnnotationIndex
+from services.service_container import service_container
 
 class AnnotationService:
     def __init__(self):
         self.annotations_dir = "data/annotations"
         self.ensure_annotations_directory()
+        # Indice per utente usato dal RAG: caricato al primo uso, aggiornato a ogni salvataggio
+        self.index = AnnotationIndex(loader=self._iter_user_annotation_files)
 
     def ensure_annotations_directory(self):
         """Ensure the annotations directory structure exists"""
@@ -379,32 +384,47 @@ class AnnotationService:
         except Exception as e:
             raise Exception(f"Error getting user annotations: {e}")
 
+    def find_relevant_annotations(self, user_id: str, query: str, limit: int = 8,
+                                  predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """Get the user's annotations most relevant to a query, as (annotation, score) pairs"""
+        try:
+            return self.index.search(user_id, query, limit, predicate)
+
+        except Exception as e:
+            raise Exception(f"Error searching relevant annotations: {e}")
+
     def _get_all_user_annotations(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all annotations for a user across all PDFs"""
         try:
             all_annotations = []
-            user_dir = os.path.join(self.annotations_dir, user_id)
-
-            if not os.path.exists(user_dir):
-                return all_annotations
-
-            # Walk through all subdirectories
-            for root, dirs, files in os.walk(user_dir):
-                for file in files:
-                    if file.endswith('.json'):
-                        file_path = os.path.join(root, file)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                annotations = json.load(f)
-                                all_annotations.extend(annotations)
-                        except Exception as e:
-                            print(f"Error reading annotations file {file_path}: {e}")
+            for _, annotations in self._iter_user_annotation_files(user_id):
+                all_annotations.extend(annotations)
 
             return all_annotations
 
         except Exception as e:
             raise Exception(f"Error getting all user annotations: {e}")
 
+    def _iter_user_annotation_files(self, user_id: str) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Yield (file path, annotations) for every annotations file of a user"""
+        user_dir = os.path.join(self.annotations_dir, user_id)
+
+        if not os.path.exists(user_dir):
+            return
+
+        # Walk through all subdirectories
+        for root, dirs, files in os.walk(user_dir):
+            for file in files:
+                if file.endswith('.json'):
+                    file_path = os.path.join(root, file)
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            annotations = json.load(f)
+                    except Exception as e:
+                        print(f"Error reading annotations file {file_path}: {e}")
+                        continue
+                    yield os.path.normpath(file_path), annotations
+
     def _get_annotations_file_path(self, user_id: str, pdf_filename: str, course_id: str = "", book_id: str = "") -> str:
         """Get the file path for annotations of a specific PDF"""
         # Create directory structure: data/annotations/user_id/course_id/book_id/filename.json
@@ -433,9 +453,22 @@ class AnnotationService:
             with open(annotations_file, 'w', encoding='utf-8') as f:
                 json.dump(annotations, f, indent=2, ensure_ascii=False)
 
+            self.index.replace_file(user_id, os.path.normpath(annotations_file), annotations)
+            self._update_search_index(annotations_file, annotations)
+
         except Exception as e:
             raise Exception(f"Error saving annotations: {e}")
 
+    def _update_search_index(self, annotations_file: str, annotations: List[Dict[str, Any]]):
+        """Push the saved file to the advanced search index, if that service is running in this process"""
+        # Otherwise the index picks the change up at its next mtime-based sync
+        if not service_container.is_initialized("advanced_search"):
+            return
+        try:
+            service_container.get("advanced_search").index_annotation_file(annotations_file, annotations)
+        except Exception as e:
+            print(f"Error updating search index for {annotations_file}: {e}")
+
     def _annotations_to_markdown(self, annotations: List[Dict[str, Any]]) -> str:
         """Convert annotations to Markdown format"""
         markdown_lines = [
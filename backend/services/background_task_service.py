@@ -7,6 +7,9 @@ import json
 import structlog
 from pydantic import BaseModel
 
+from services.entity_store import EntityStore
+from services.service_container import service_container
+
 logger = structlog.get_logger()
 
 class TaskStatus(str, Enum):
@@ -37,46 +40,42 @@ class BackgroundTask(BaseModel):
     metadata: Dict[str, Any] = {}
 
 class BackgroundTaskService:
-    def __init__(self):
+    def __init__(self, store: Optional[EntityStore] = None):
         self.tasks: Dict[str, BackgroundTask] = {}
         self.running_tasks: Dict[str, asyncio.Task] = {}
+        # File JSON legacy, importato una sola volta nell'entity store
         self.tasks_file = "data/background_tasks.json"
+        if store is None:
+            from services.service_container import get_entity_store
+            store = get_entity_store()
+        self.task_records = store.collection("background_tasks", sort_field="created_at")
+        store.migrate_json(self.tasks_file, self._import_legacy_tasks)
         self._load_tasks()
         logger.info("Background Task Service initialized")
 
+    def _import_legacy_tasks(self, data: Dict[str, Any]) -> int:
+        tasks = (data or {}).get('tasks', [])
+        for task_data in tasks:
+            self.task_records.put(task_data['id'], task_data)
+        return len(tasks)
+
     def _load_tasks(self):
-        """Load existing tasks from file"""
+        """Load existing tasks from the entity store"""
         try:
-            import os
-            if os.path.exists(self.tasks_file):
-                with open(self.tasks_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for task_data in data.get('tasks', []):
-                        task = BackgroundTask(**task_data)
-                        # Convert completed tasks back from string if needed
-                        if isinstance(task.created_at, str):
-                            task.created_at = datetime.fromisoformat(task.created_at)
-                        if task.started_at and isinstance(task.started_at, str):
-                            task.started_at = datetime.fromisoformat(task.started_at)
-                        if task.completed_at and isinstance(task.completed_at, str):
-                            task.completed_at = datetime.fromisoformat(task.completed_at)
-                        self.tasks[task.id] = task
-                logger.info(f"Loaded {len(self.tasks)} existing tasks")
+            for task_data in self.task_records.all():
+                task = BackgroundTask(**task_data)
+                self.tasks[task.id] = task
+            logger.info(f"Loaded {len(self.tasks)} existing tasks")
         except Exception as e:
             logger.error(f"Error loading tasks: {e}")
 
-    def _save_tasks(self):
-        """Save tasks to file"""
+    def _save_task(self, task: BackgroundTask):
+        """Persist a single task (one row per task, the other tasks are untouched)"""
         try:
-            import os
-            os.makedirs("data", exist_ok=True)
-            data = {
-                'tasks': [task.dict() for task in self.tasks.values()]
-            }
-            with open(self.tasks_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+            data = json.loads(json.dumps(task.dict(), ensure_ascii=False, default=str))
+            self.task_records.put(task.id, data)
         except Exception as e:
-            logger.error(f"Error saving tasks: {e}")
+            logger.error(f"Error saving task {task.id}: {e}")
 
     def create_task(self, task_type: TaskType, course_id: Optional[str] = None,
                    user_id: Optional[str] = None, metadata: Dict[str, Any] = None) -> str:
@@ -92,7 +91,7 @@ class BackgroundTaskService:
             metadata=metadata or {}
         )
         self.tasks[task_id] = task
-        self._save_tasks()
+        self._save_task(task)
         logger.info(f"Created background task {task_id} of type {task_type}")
         return task_id
 
@@ -124,10 +123,21 @@ class BackgroundTaskService:
         elif status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
             task.completed_at = datetime.now()
 
-        self._save_tasks()
+        self._save_task(task)
         logger.info(f"Updated task {task_id}: status={status}, progress={task.progress}%")
         return True
 
+    def update_task_progress(self, task_id: str, progress: float, message: str = "") -> bool:
+        """Update progress of a running task in memory (persisted on the next status change)"""
+        task = self.tasks.get(task_id)
+        if task is None or task.status != TaskStatus.RUNNING:
+            return False
+
+        task.progress = min(100.0, max(0.0, progress))
+        if message:
+            task.message = message
+        return True
+
     def get_task(self, task_id: str) -> Optional[BackgroundTask]:
         """Get task by ID"""
         return self.tasks.get(task_id)
@@ -172,11 +182,11 @@ class BackgroundTaskService:
 
         for task_id in tasks_to_remove:
             del self.tasks[task_id]
+            self.task_records.delete(task_id)
             if task_id in self.running_tasks:
                 del self.running_tasks[task_id]
 
         if tasks_to_remove:
-            self._save_tasks()
             logger.info(f"Cleaned up {len(tasks_to_remove)} old tasks")
 
     async def run_background_task(self, task_id: str, coro):
@@ -231,4 +241,4 @@ class BackgroundTaskService:
         return True
 
 # Global instance
-background_task_service = BackgroundTaskService()
\ No newline at end of file
+background_task_service = service_container.lazy("background_tasks")
@@ -4,6 +4,7 @@ Servizio di cache ottimizzato per book concept maps RAG-based
 """
 
 import json
+import os
 import time
 import hashlib
 from datetime import datetime, timedelta
@@ -11,6 +12,8 @@ from typing import Dict, Any, Optional, List
 from pathlib import Path
 import structlog
 
+from services.tiered_cache import LRUCache
+
 logger = structlog.get_logger()
 
 
@@ -21,6 +24,10 @@ class BookConceptCache:
     - TTL configurabile
     - Background refresh
     - Metrics tracking
+
+    Le letture passano da un L1 LRU in memoria (scadenza già calcolata, niente parsing
+    delle date); le metrics vengono scritte su disco al massimo ogni
+    BOOK_CONCEPT_METRICS_FLUSH_SECONDS invece che a ogni hit/miss.
     """
 
     def __init__(self, cache_path: str = "data/book_concept_cache.json"):
@@ -28,6 +35,11 @@ class BookConceptCache:
         self.cache_data = {}
         self.metrics_path = Path("data/cache_metrics.json")
         self.metrics = {}
+        # clock=time.time: le scadenze persistite sono orari assoluti
+        self._entries = LRUCache(max_size=int(os.getenv("BOOK_CONCEPT_CACHE_L1_SIZE", "128")), clock=time.time)
+        self.metrics_flush_interval = float(os.getenv("BOOK_CONCEPT_METRICS_FLUSH_SECONDS", "5"))
+        self._metrics_dirty = False
+        self._metrics_saved_at = 0.0
         self._ensure_cache_structure()
         self._load_cache()
 
@@ -82,14 +94,39 @@ class BookConceptCache:
         except Exception as e:
             logger.error(f"Error saving cache: {e}")
 
-    def _save_metrics(self):
-        """Salva le metrics"""
+    def _save_metrics(self, force: bool = False):
+        """Salva le metrics (debounced: al massimo una scrittura per intervallo)"""
+        now = time.time()
+        if not force and now - self._metrics_saved_at < self.metrics_flush_interval:
+            self._metrics_dirty = True
+            return
         try:
             with open(self.metrics_path, 'w', encoding='utf-8') as f:
                 json.dump(self.metrics, f, indent=2, ensure_ascii=False)
+            self._metrics_dirty = False
+            self._metrics_saved_at = now
         except Exception as e:
             logger.error(f"Error saving metrics: {e}")
 
+    def flush_metrics(self):
+        """Scrive le metrics in sospeso (hook di shutdown del service container e prima delle statistiche)"""
+        if self._metrics_dirty:
+            self._save_metrics(force=True)
+
+    @staticmethod
+    def _book_tag(course_id: str, book_id: str) -> str:
+        return f"book:{course_id}:{book_id}"
+
+    def _remember(self, cache_key: str, cache_entry: Dict[str, Any]):
+        """Porta una voce valida in L1 con TTL pari al tempo residuo"""
+        try:
+            ttl = datetime.fromisoformat(cache_entry.get("expires_at", "")).timestamp() - time.time()
+        except Exception:
+            return
+        if ttl > 0:
+            self._entries.set(cache_key, cache_entry, ttl=ttl,
+                              tags=[self._book_tag(cache_entry.get("course_id"), cache_entry.get("book_id"))])
+
     def _get_cache_key(self, course_id: str, book_id: str, quality_threshold: float = 0.6) -> str:
         """Genera chiave di cache univoca"""
         key_data = f"{course_id}_{book_id}_{quality_threshold}"
@@ -103,18 +140,21 @@ class BookConceptCache:
             start_time = time.time()
             cache_key = self._get_cache_key(course_id, book_id, quality_threshold)
 
-            # Check if exists in cache
-            if cache_key not in self.cache_data.get("book_concepts", {}):
-                self._record_miss()
-                return None
+            cached_entry = self._entries.get(cache_key)
+            if cached_entry is None:
+                # Check if exists in cache
+                cached_entry = self.cache_data.get("book_concepts", {}).get(cache_key)
+                if cached_entry is None:
+                    self._record_miss()
+                    return None
 
-            cached_entry = self.cache_data["book_concepts"][cache_key]
+                # Check TTL
+                if self._is_expired(cached_entry):
+                    self._record_miss()
+                    self._schedule_background_refresh(course_id, book_id, quality_threshold)
+                    return None
 
-            # Check TTL
-            if self._is_expired(cached_entry):
-                self._record_miss()
-                self._schedule_background_refresh(course_id, book_id, quality_threshold)
-                return None
+                self._remember(cache_key, cached_entry)
 
             # Check quality threshold
             cached_quality = cached_entry.get("rag_analysis_quality_score", 0.0)
@@ -168,6 +208,7 @@ class BookConceptCache:
                 self.cache_data["book_concepts"] = {}
 
             self.cache_data["book_concepts"][cache_key] = cache_entry
+            self._remember(cache_key, cache_entry)
 
             # Update stats
             self._update_cache_stats()
@@ -244,6 +285,7 @@ class BookConceptCache:
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get comprehensive cache statistics"""
         try:
+            self.flush_metrics()
             hit_rate = 0.0
             hits = self.metrics.get("cache_hits", 0)
             misses = self.metrics.get("cache_misses", 0)
@@ -269,6 +311,7 @@ class BookConceptCache:
                 },
                 "cache_content": {
                     "total_entries": len(entries),
+                    "memory_entries": len(self._entries),
                     "avg_quality_score": avg_quality,
                     "rag_enhanced_entries": self.metrics.get("rag_saves", 0),
                     "fallback_entries": self.metrics.get("fallback_saves", 0),
@@ -301,6 +344,7 @@ class BookConceptCache:
 
             self.cache_data["book_concepts"] = cleaned_entries
             self.cache_data["last_cleanup"] = datetime.now().isoformat()
+            self._entries.purge_expired()
             self._save_cache()
 
             return {
@@ -328,6 +372,7 @@ class BookConceptCache:
                     logger.info(f"Invalidated cache entry for book {book_id}: {cache_key}")
 
             self.cache_data["book_concepts"] = cleaned_entries
+            self._entries.invalidate_tags([self._book_tag(course_id, book_id)])
             self._save_cache()
 
             return removed_count > 0
@@ -364,7 +409,7 @@ class BookConceptCache:
             del self.cache_data[refresh_key]
             self.metrics["background_refreshes"] = self.metrics.get("background_refreshes", 0) + 1
             self._save_cache()
-            self._save_metrics()
+            self._save_metrics(force=True)
 
     def optimize_cache_size(self, max_entries: int = 100) -> Dict[str, int]:
         """
@@ -387,6 +432,8 @@ class BookConceptCache:
             entries_removed = len(current_entries) - len(entries_to_keep)
 
             self.cache_data["book_concepts"] = entries_to_keep
+            for cache_key in current_entries.keys() - entries_to_keep.keys():
+                self._entries.delete(cache_key)
             self._save_cache()
 
             logger.info(f"Cache optimization: removed {entries_removed} low-quality entries")
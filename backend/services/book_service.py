@@ -1,14 +1,21 @@
 import os
-import json
 import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
+from services.course_service import open_course_collections
+from services.entity_store import EntityStore
+
 class BookService:
-    def __init__(self):
+    def __init__(self, store: Optional[EntityStore] = None):
         self.courses_dir = "data/courses"
+        # File JSON legacy, importato una sola volta nell'entity store
         self.courses_file = os.path.join(self.courses_dir, "courses.json")
         self.ensure_courses_directory()
+        if store is None:
+            from services.service_container import get_entity_store
+            store = get_entity_store()
+        self.courses, self.books = open_course_collections(store, self.courses_file)
 
     def _normalize_chapters(self, chapters: List[Any]) -> List[Dict[str, Any]]:
         """Normalize chapter representations into a consistent structure."""
@@ -46,27 +53,30 @@ class BookService:
         return normalized
 
     def ensure_courses_directory(self):
-        """Ensure the courses directory and file exist"""
+        """Ensure the courses directory exists"""
         os.makedirs(self.courses_dir, exist_ok=True)
 
-        if not os.path.exists(self.courses_file):
-            with open(self.courses_file, 'w') as f:
-                json.dump([], f)
+    def _touch_course(self, course_id: str):
+        def apply(course: Dict[str, Any]):
+            course["updated_at"] = datetime.now().isoformat()
+
+        self.courses.update(course_id, apply)
+
+    def _get_course_book(self, course_id: str, book_id: str) -> Optional[Dict[str, Any]]:
+        book = self.books.get(book_id)
+        if not book or book.get("course_id") != course_id:
+            return None
+        return book
 
     def create_book(self, course_id: str, book_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new book within a course"""
         try:
-            courses_data = self._get_courses_data()
-            course = next((c for c in courses_data if c["id"] == course_id), None)
-
-            if not course:
+            if self.courses.get(course_id) is None:
                 raise Exception(f"Course {course_id} not found")
 
-            if "books" not in course:
-                course["books"] = []
-
             new_book = {
                 "id": str(uuid.uuid4()),
+                "course_id": course_id,
                 "title": book_data["title"],
                 "author": book_data.get("author", ""),
                 "isbn": book_data.get("isbn", ""),
@@ -82,15 +92,12 @@ class BookService:
                 "tags": book_data.get("tags", [])
             }
 
-            course["books"].append(new_book)
-            course["updated_at"] = datetime.now().isoformat()
-
             # Create book directory for materials
             book_dir = os.path.join(self.courses_dir, course_id, "books", new_book["id"])
             os.makedirs(book_dir, exist_ok=True)
 
-            # Save updated courses data
-            self._save_courses_data(courses_data)
+            self.books.put(new_book["id"], new_book)
+            self._touch_course(course_id)
 
             return new_book
 
@@ -100,11 +107,7 @@ class BookService:
     def get_books_by_course(self, course_id: str) -> List[Dict[str, Any]]:
         """Get all books for a specific course"""
         try:
-            course = self._get_course_by_id(course_id)
-            if not course:
-                return []
-
-            books = course.get("books", [])
+            books = self.books.find(course_id=course_id)
 
             # Add materials count for each book
             for book in books:
@@ -155,36 +158,25 @@ class BookService:
     def update_book(self, course_id: str, book_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Update book information"""
         try:
-            courses_data = self._get_courses_data()
-            course = next((c for c in courses_data if c["id"] == course_id), None)
-
-            if not course:
+            if self._get_course_book(course_id, book_id) is None:
                 return None
 
-            if "books" not in course:
-                return None
+            def apply(book: Dict[str, Any]):
+                # Update allowed fields
+                allowed_fields = ["title", "author", "isbn", "description", "year", "publisher", "chapters", "tags"]
+                for field in allowed_fields:
+                    if field in update_data:
+                        if field == "chapters":
+                            book[field] = self._normalize_chapters(update_data[field])
+                        else:
+                            book[field] = update_data[field]
 
-            book_index = next((i for i, b in enumerate(course["books"]) if b["id"] == book_id), None)
+                book["updated_at"] = datetime.now().isoformat()
 
-            if book_index is None:
-                return None
+            updated_book = self.books.update(book_id, apply)
+            self._touch_course(course_id)
 
-            # Update allowed fields
-            allowed_fields = ["title", "author", "isbn", "description", "year", "publisher", "chapters", "tags"]
-            for field in allowed_fields:
-                if field in update_data:
-                    if field == "chapters":
-                        course["books"][book_index][field] = self._normalize_chapters(update_data[field])
-                    else:
-                        course["books"][book_index][field] = update_data[field]
-
-            course["books"][book_index]["updated_at"] = datetime.now().isoformat()
-            course["updated_at"] = datetime.now().isoformat()
-
-            # Save updated courses data
-            self._save_courses_data(courses_data)
-
-            return course["books"][book_index]
+            return updated_book
 
         except Exception as e:
             raise Exception(f"Error updating book: {e}")
@@ -192,21 +184,13 @@ class BookService:
     def delete_book(self, course_id: str, book_id: str) -> bool:
         """Delete a book and all its materials"""
         try:
-            courses_data = self._get_courses_data()
-            course = next((c for c in courses_data if c["id"] == course_id), None)
-
-            if not course:
-                return False
-
-            if "books" not in course:
+            if self.courses.get(course_id) is None:
                 return False
 
             # Remove book from course
-            course["books"] = [b for b in course["books"] if b["id"] != book_id]
-            course["updated_at"] = datetime.now().isoformat()
-
-            # Save updated courses data
-            self._save_courses_data(courses_data)
+            if self._get_course_book(course_id, book_id) is not None:
+                self.books.delete(book_id)
+            self._touch_course(course_id)
 
             # Delete book directory
             book_dir = os.path.join(self.courses_dir, course_id, "books", book_id)
@@ -222,20 +206,14 @@ class BookService:
     def update_book_stats(self, course_id: str, book_id: str, study_session_duration: int):
         """Update book statistics after a study session"""
         try:
-            courses_data = self._get_courses_data()
-            course = next((c for c in courses_data if c["id"] == course_id), None)
-
-            if course and "books" in course:
-                book_index = next((i for i, b in enumerate(course["books"]) if b["id"] == book_id), None)
+            if self._get_course_book(course_id, book_id) is not None:
+                def apply(book: Dict[str, Any]):
+                    book["study_sessions"] = book.get("study_sessions", 0) + 1
+                    book["total_study_time"] = book.get("total_study_time", 0) + study_session_duration
+                    book["updated_at"] = datetime.now().isoformat()
 
-                if book_index is not None:
-                    course["books"][book_index]["study_sessions"] += 1
-                    course["books"][book_index]["total_study_time"] += study_session_duration
-                    course["books"][book_index]["updated_at"] = datetime.now().isoformat()
-                    course["updated_at"] = datetime.now().isoformat()
-
-                    # Save updated courses data
-                    self._save_courses_data(courses_data)
+                self.books.update(book_id, apply)
+                self._touch_course(course_id)
 
         except Exception as e:
             print(f"Error updating book stats: {e}")
@@ -258,21 +236,3 @@ class BookService:
 
         except Exception as e:
             raise Exception(f"Error searching books: {e}")
-
-    def _get_courses_data(self) -> List[Dict[str, Any]]:
-        """Get courses data from file"""
-        try:
-            with open(self.courses_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-
-    def _save_courses_data(self, data: List[Dict[str, Any]]):
-        """Save courses data to file"""
-        with open(self.courses_file, 'w') as f:
-            json.dump(data, f, indent=2)
-
-    def _get_course_by_id(self, course_id: str) -> Optional[Dict[str, Any]]:
-        """Get course by ID"""
-        courses_data = self._get_courses_data()
-        return next((c for c in courses_data if c["id"] == course_id), None)
@@ -1,13 +1,19 @@
 """
 Redis Cache Service - Sistema di Caching Distribuito per Tutor AI
 Implementazione completa con cache layering, invalidazione intelligente e monitoring
+
+Configurazione:
+    REDIS_URL                       URL del server Redis (redis://localhost:6379)
+    REDIS_CACHE_MAX_CONNECTIONS     connessioni massime del pool (20)
+    REDIS_CACHE_COMPRESS_MIN_BYTES  soglia oltre la quale i payload vengono compressi (1024)
 """
 
-import redis
+import os
 import json
 import pickle
 import hashlib
 import time
+import zlib
 from typing import Any, Optional, Dict, List, Union
 from datetime import datetime, timedelta
 import structlog
@@ -16,6 +22,7 @@ from enum import Enum
 import asyncio
 from functools import wraps
 import numpy as np
+import redis.asyncio as aioredis
 
 logger = structlog.get_logger()
 
@@ -40,18 +47,37 @@ class CacheConfig:
 class RedisCacheService:
     """
     Servizio di caching Redis con funzionalità avanzate:
-    - Cache layering (multi-level)
-    - Intelligent invalidation
-    - Compression and serialization
+    - Client asyncio con connection pool (nessuna chiamata bloccante nell'event loop)
+    - Intelligent invalidation (tag set per corso/libro, SCAN incrementale invece di KEYS)
+    - Compression (zlib sopra una soglia di dimensione) and serialization
+    - Multi-get in pipeline
     - Metrics and monitoring
     - Fallback strategies
     """
 
-    def __init__(self, redis_url: str = "redis://localhost:6379", db: int = 0):
-        self.redis_url = redis_url
+    KEY_PREFIX = "tutor_ai"
+    SCAN_BATCH_SIZE = 500
+    RECONNECT_INTERVAL = 30.0
+
+    # Primo byte del payload: formato + compressione (maiuscolo = zlib)
+    _FORMAT_JSON = b"j"
+    _FORMAT_PICKLE = b"p"
+    _FORMAT_JSON_Z = b"J"
+    _FORMAT_PICKLE_Z = b"P"
+
+    def __init__(self, redis_url: Optional[str] = None, db: int = 0, max_connections: Optional[int] = None,
+                 compression_threshold: Optional[int] = None):
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
         self.db = db
+        self.max_connections = max_connections or int(os.getenv("REDIS_CACHE_MAX_CONNECTIONS", "20"))
+        self.compression_threshold = (
+            compression_threshold if compression_threshold is not None
+            else int(os.getenv("REDIS_CACHE_COMPRESS_MIN_BYTES", "1024"))
+        )
         self.redis_client = None
         self.connection_pool = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._retry_after = 0.0
 
         # Configurazioni TTL per tipo di cache (in secondi)
         self.cache_configs = {
@@ -64,6 +90,8 @@ class RedisCacheService:
             CacheType.LLM_RESPONSE: CacheConfig(ttl=900),   # 15 minuti
         }
 
+        self._max_ttl = max(config.ttl for config in self.cache_configs.values())
+
         # Metrics tracking
         self.metrics = {
             "hits": 0,
@@ -75,36 +103,57 @@ class RedisCacheService:
             "avg_response_time": 0.0
         }
 
-        self._initialize_connection()
+    def _build_client(self):
+        """Crea client e connection pool asyncio (le connessioni sono aperte on demand)."""
+        self.connection_pool = aioredis.ConnectionPool.from_url(
+            self.redis_url,
+            db=self.db,
+            max_connections=self.max_connections,
+            socket_timeout=5,
+            socket_connect_timeout=5
+        )
+        return aioredis.Redis(connection_pool=self.connection_pool)
+
+    async def _get_client(self):
+        """
+        Client Redis legato all'event loop corrente; dopo un errore di connessione
+        ritenta solo ogni RECONNECT_INTERVAL secondi (nel frattempo: cache miss).
+        """
+        loop = asyncio.get_running_loop()
+        if self.redis_client is not None and self._client_loop is loop:
+            return self.redis_client
+        if time.monotonic() < self._retry_after:
+            return None
 
-    def _initialize_connection(self):
-        """Inizializza la connessione Redis con retry logic"""
+        client = self._build_client()
         try:
-            self.connection_pool = redis.ConnectionPool.from_url(
-                self.redis_url,
-                db=self.db,
-                max_connections=20,
-                retry_on_timeout=True,
-                socket_timeout=5,
-                socket_connect_timeout=5
-            )
-            self.redis_client = redis.Redis(connection_pool=self.connection_pool)
-
-            # Test connection
-            self.redis_client.ping()
-            logger.info("Redis connection established successfully",
-                       redis_url=self.redis_url, db=self.db)
-
+            await client.ping()
         except Exception as e:
             logger.error("Failed to connect to Redis", error=str(e))
+            self._retry_after = time.monotonic() + self.RECONNECT_INTERVAL
             self.redis_client = None
+            await self._close_client(client)
+            return None
+
+        self.redis_client = client
+        self._client_loop = loop
+        logger.info("Redis connection established successfully",
+                    redis_url=self.redis_url, db=self.db)
+        return client
+
+    @staticmethod
+    async def _close_client(client):
+        try:
+            await client.aclose()
+        except Exception:
+            pass
 
     def _generate_cache_key(self, cache_type: CacheType, identifier: str,
                           additional_params: Optional[Dict] = None) -> str:
         """
         Genera cache key con hashing per consistenza
         """
-        base_key = f"tutor_ai:{cache_type.value}:{identifier}"
+        base_key = f"{self.KEY_PREFIX}:{cache_type.value}:{identifier}"
 
         if additional_params:
             # Sort params for consistent hashing
@@ -114,22 +163,32 @@ class RedisCacheService:
 
         return base_key
 
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.KEY_PREFIX}:tag:{tag}"
+
     def _serialize_data(self, data: Any, config: CacheConfig) -> bytes:
         """
-        Serializza i dati con compressione opzionale
+        Serializza i dati (JSON per strutture semplici, altrimenti pickle) e li comprime
+        con zlib quando superano `compression_threshold` byte
         """
         try:
-            if config.compression:
-                # Use pickle for numpy arrays and complex objects
-                serialized = pickle.dumps(data)
-                # Could add compression here if needed
-                return serialized
+            if not config.compression and isinstance(data, (dict, list, str, int, float, bool)):
+                try:
+                    fmt, serialized = self._FORMAT_JSON, json.dumps(data).encode('utf-8')
+                except (TypeError, ValueError):
+                    fmt, serialized = self._FORMAT_PICKLE, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
             else:
-                # Use JSON for simple data structures
-                if isinstance(data, (dict, list, str, int, float, bool)):
-                    return json.dumps(data).encode('utf-8')
-                else:
-                    return pickle.dumps(data)
+                # Use pickle for numpy arrays and complex objects
+                fmt, serialized = self._FORMAT_PICKLE, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+            if config.compression and len(serialized) >= self.compression_threshold:
+                compressed = zlib.compress(serialized, 6)
+                self._update_compression_ratio(len(compressed) / len(serialized))
+                if len(compressed) < len(serialized):
+                    fmt = self._FORMAT_JSON_Z if fmt == self._FORMAT_JSON else self._FORMAT_PICKLE_Z
+                    serialized = compressed
+
+            return fmt + serialized
         except Exception as e:
             logger.error("Error serializing cache data", error=str(e))
             raise
@@ -139,10 +198,18 @@ class RedisCacheService:
         Deserializza i dati dal formato cache
         """
         try:
-            if config.compression or not isinstance(data, (str, bytes)):
+            fmt, payload = data[:1], data[1:]
+            if fmt in (self._FORMAT_JSON_Z, self._FORMAT_PICKLE_Z):
+                payload = zlib.decompress(payload)
+            if fmt in (self._FORMAT_JSON, self._FORMAT_JSON_Z):
+                return json.loads(payload.decode('utf-8'))
+            if fmt in (self._FORMAT_PICKLE, self._FORMAT_PICKLE_Z):
+                return pickle.loads(payload)
+
+            # Entry scritte prima dell'header di formato
+            if config.compression:
                 return pickle.loads(data)
-            else:
-                return json.loads(data.decode('utf-8'))
+            return json.loads(data.decode('utf-8'))
         except Exception as e:
             logger.error("Error deserializing cache data", error=str(e))
             raise
@@ -152,8 +219,9 @@ class RedisCacheService:
         """
         Recupera dati dalla cache con metrics tracking
         """
-        if not self.redis_client:
-            logger.warning("Redis client not available, cache miss")
+        client = await self._get_client()
+        if not client:
+            logger.debug("Redis client not available, cache miss")
             self.metrics["misses"] += 1
             return None
 
@@ -163,7 +231,7 @@ class RedisCacheService:
         start_time = time.time()
 
         try:
-            cached_data = self.redis_client.get(cache_key)
+            cached_data = await client.get(cache_key)
 
             if cached_data is not None:
                 # Cache hit
@@ -187,14 +255,57 @@ class RedisCacheService:
             self.metrics["errors"] += 1
             return None
 
+    async def mget(self, cache_type: CacheType, identifiers: List[str],
+                   additional_params: Optional[Dict] = None) -> List[Optional[Any]]:
+        """
+        Recupera più entries con un solo round-trip (MGET); l'ordine segue `identifiers`
+        """
+        if not identifiers:
+            return []
+
+        client = await self._get_client()
+        if not client:
+            self.metrics["misses"] += len(identifiers)
+            return [None] * len(identifiers)
+
+        config = self.cache_configs[cache_type]
+        keys = [self._generate_cache_key(cache_type, identifier, additional_params) for identifier in identifiers]
+        start_time = time.time()
+
+        try:
+            raw_values = await client.mget(keys)
+        except Exception as e:
+            logger.error("Error retrieving multiple keys from cache", count=len(keys), error=str(e))
+            self.metrics["errors"] += 1
+            return [None] * len(identifiers)
+
+        results: List[Optional[Any]] = []
+        for key, raw in zip(keys, raw_values):
+            if raw is None:
+                self.metrics["misses"] += 1
+                results.append(None)
+                continue
+            try:
+                results.append(self._deserialize_data(raw, config))
+                self.metrics["hits"] += 1
+            except Exception:
+                self.metrics["errors"] += 1
+                results.append(None)
+
+        self._update_avg_response_time(time.time() - start_time)
+        return results
+
     async def set(self, cache_type: CacheType, identifier: str, data: Any,
                  additional_params: Optional[Dict] = None,
-                 custom_ttl: Optional[int] = None) -> bool:
+                 custom_ttl: Optional[int] = None,
+                 tags: Optional[List[str]] = None) -> bool:
         """
-        Salva dati nella cache con TTL automatico
+        Salva dati nella cache con TTL automatico.
+        I `tags` (es. "course:<id>") permettono di invalidare le entry senza scansionare le chiavi.
         """
-        if not self.redis_client:
-            logger.warning("Redis client not available, skipping cache set")
+        client = await self._get_client()
+        if not client:
+            logger.debug("Redis client not available, skipping cache set")
             return False
 
         cache_key = self._generate_cache_key(cache_type, identifier, additional_params)
@@ -204,19 +315,19 @@ class RedisCacheService:
         try:
             serialized_data = self._serialize_data(data, config)
 
-            # Set cache with TTL
-            success = self.redis_client.setex(cache_key, ttl, serialized_data)
-
-            if success:
+            # Set cache with TTL (+ registrazione nei tag set) in un'unica pipeline
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.setex(cache_key, ttl, serialized_data)
+                for tag in tags or []:
+                    tag_key = self._tag_key(tag)
+                    pipe.sadd(tag_key, cache_key)
+                    # Il tag set vive almeno quanto la entry più longeva; i membri già scaduti sono innocui
+                    pipe.expire(tag_key, max(ttl, self._max_ttl))
+                results = await pipe.execute()
+
+            if results and results[0]:
                 self.metrics["sets"] += 1
-
-                # Track compression ratio
-                original_size = len(pickle.dumps(data))
-                cached_size = len(serialized_data)
-                compression_ratio = cached_size / original_size if original_size > 0 else 1.0
-                self._update_compression_ratio(compression_ratio)
-
-                logger.debug("Cache set", key=cache_key, ttl=ttl, size=cached_size)
+                logger.debug("Cache set", key=cache_key, ttl=ttl, size=len(serialized_data))
                 return True
             else:
                 logger.error("Failed to set cache", key=cache_key)
@@ -232,13 +343,14 @@ class RedisCacheService:
         """
         Elimina entry dalla cache
         """
-        if not self.redis_client:
+        client = await self._get_client()
+        if not client:
             return False
 
         cache_key = self._generate_cache_key(cache_type, identifier, additional_params)
 
         try:
-            result = self.redis_client.delete(cache_key)
+            result = await client.unlink(cache_key)
             if result > 0:
                 self.metrics["deletes"] += 1
                 logger.debug("Cache deleted", key=cache_key)
@@ -252,20 +364,42 @@ class RedisCacheService:
             self.metrics["errors"] += 1
             return False
 
+    async def _unlink_keys(self, client, keys: List[Any]) -> int:
+        deleted = 0
+        for start in range(0, len(keys), self.SCAN_BATCH_SIZE):
+            deleted += await client.unlink(*keys[start:start + self.SCAN_BATCH_SIZE])
+        return deleted
+
+    async def _delete_matching(self, client, pattern: str) -> int:
+        """
+        Elimina le chiavi che corrispondono a `pattern` con SCAN incrementale e UNLINK
+        a blocchi: Redis non resta mai bloccato su una scansione dell'intero keyspace
+        """
+        deleted_count = 0
+        batch: List[Any] = []
+        async for key in client.scan_iter(match=pattern, count=self.SCAN_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= self.SCAN_BATCH_SIZE:
+                deleted_count += await self._unlink_keys(client, batch)
+                batch = []
+        if batch:
+            deleted_count += await self._unlink_keys(client, batch)
+        return deleted_count
+
     async def clear_by_type(self, cache_type: CacheType) -> int:
         """
         Elimina tutte le entries di un tipo specifico
         """
-        if not self.redis_client:
+        client = await self._get_client()
+        if not client:
             return 0
 
-        pattern = f"tutor_ai:{cache_type.value}:*"
+        pattern = f"{self.KEY_PREFIX}:{cache_type.value}:*"
         deleted_count = 0
 
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                deleted_count = self.redis_client.delete(*keys)
+            deleted_count = await self._delete_matching(client, pattern)
+            if deleted_count:
                 self.metrics["deletes"] += deleted_count
                 logger.info(f"Cleared {deleted_count} entries for type {cache_type.value}")
 
@@ -279,23 +413,54 @@ class RedisCacheService:
         """
         Elimina entries basandosi su pattern
         """
-        if not self.redis_client:
+        client = await self._get_client()
+        if not client:
             return 0
 
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                deleted_count = self.redis_client.delete(*keys)
+            deleted_count = await self._delete_matching(client, pattern)
+            if deleted_count:
                 self.metrics["deletes"] += deleted_count
                 logger.info(f"Invalidated {deleted_count} entries with pattern: {pattern}")
-                return deleted_count
-            return 0
+            return deleted_count
 
         except Exception as e:
             logger.error("Error invalidating cache by pattern", pattern=pattern, error=str(e))
             self.metrics["errors"] += 1
             return 0
 
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        """
+        Elimina tutte le entries registrate sotto i tag indicati (SSCAN + UNLINK a blocchi)
+        """
+        client = await self._get_client()
+        if not client or not tags:
+            return 0
+
+        deleted_count = 0
+        try:
+            for tag in tags:
+                tag_key = self._tag_key(tag)
+                batch: List[Any] = []
+                async for key in client.sscan_iter(tag_key, count=self.SCAN_BATCH_SIZE):
+                    batch.append(key)
+                    if len(batch) >= self.SCAN_BATCH_SIZE:
+                        deleted_count += await self._unlink_keys(client, batch)
+                        batch = []
+                if batch:
+                    deleted_count += await self._unlink_keys(client, batch)
+                await client.unlink(tag_key)
+
+            if deleted_count:
+                self.metrics["deletes"] += deleted_count
+                logger.info(f"Invalidated {deleted_count} entries for tags: {tags}")
+            return deleted_count
+
+        except Exception as e:
+            logger.error("Error invalidating cache by tags", tags=tags, error=str(e))
+            self.metrics["errors"] += 1
+            return deleted_count
+
     def _update_avg_response_time(self, response_time: float):
         """Aggiorna metrica di tempo di risposta medio"""
         current_avg = self.metrics["avg_response_time"]
@@ -323,19 +488,21 @@ class RedisCacheService:
             "deletes": self.metrics["deletes"],
             "errors": self.metrics["errors"],
             "compression_ratio": self.metrics["compression_ratio"],
+            "compression_threshold_bytes": self.compression_threshold,
             "avg_response_time_ms": self.metrics["avg_response_time"] * 1000,
             "redis_connected": self.redis_client is not None
         }
 
-    def get_redis_info(self) -> Dict[str, Any]:
+    async def get_redis_info(self) -> Dict[str, Any]:
         """
         Restituisce informazioni sul server Redis
         """
-        if not self.redis_client:
+        client = await self._get_client()
+        if not client:
             return {"connected": False}
 
         try:
-            info = self.redis_client.info()
+            info = await client.info()
             return {
                 "connected": True,
                 "used_memory": info.get("used_memory_human", "N/A"),
@@ -357,10 +524,11 @@ class RedisCacheService:
         redis_healthy = False
         redis_latency = None
 
-        if self.redis_client:
+        client = await self._get_client()
+        if client:
             try:
                 start_time = time.time()
-                self.redis_client.ping()
+                await client.ping()
                 redis_latency = (time.time() - start_time) * 1000  # ms
                 redis_healthy = True
             except Exception as e:
@@ -374,14 +542,31 @@ class RedisCacheService:
             "timestamp": datetime.now().isoformat()
         }
 
-    def close(self):
+    async def aclose(self):
         """
         Chiude le connessioni Redis
         """
-        if self.redis_client:
-            self.redis_client.close()
-        if self.connection_pool:
-            self.connection_pool.disconnect()
+        client, self.redis_client = self.redis_client, None
+        self._client_loop = None
+        if client is not None:
+            await self._close_client(client)
+        self.connection_pool = None
+
+def scope_cache_tags(course_id: str, book_id: Optional[str] = None) -> List[str]:
+    """Tag con cui registrare una entry legata a un corso (e opzionalmente a un libro)."""
+    tags = [f"course:{course_id}"]
+    tags.append(f"book:{course_id}:{book_id}" if book_id else f"course:{course_id}:all")
+    return tags
+
+
+def scope_invalidation_tags(course_id: str, book_id: Optional[str] = None) -> List[str]:
+    """
+    Tag da invalidare quando cambiano i materiali: un libro invalida le proprie entry e
+    quelle a livello di corso (che ne includono i contenuti), non gli altri libri.
+    """
+    if book_id:
+        return [f"book:{course_id}:{book_id}", f"course:{course_id}:all"]
+    return [f"course:{course_id}"]
 
 # Decorators for easy caching
 def cache_result(cache_type: CacheType, ttl: Optional[int] = None,
@@ -402,7 +587,7 @@ def cache_result(cache_type: CacheType, ttl: Optional[int] = None,
                 cache_key = hashlib.md5((func_name + args_str).encode()).hexdigest()
 
             # Try to get from cache
-            cache_service = RedisCacheService()
+            cache_service = get_cache_service()
             cached_result = await cache_service.get(cache_type, cache_key)
 
             if cached_result is not None:
@@ -0,0 +1,188 @@
+"""
+Concept Dedup - Raggruppamento dei concetti quasi duplicati (Jaro-Winkler) con indice
+
+Usato da `ConceptMapService.aggregate_book_concepts`. Un concetto confluisce nel primo gruppo
+(in ordine di creazione) il cui nome normalizzato ha similarità Jaro-Winkler almeno pari alla
+soglia dinamica del nome entrante; altrimenti apre un nuovo gruppo.
+
+I nomi vengono normalizzati una sola volta. Per ogni gruppo l'indice conserva la lunghezza,
+il profilo dei caratteri e i primi quattro caratteri in array NumPy, così il confronto di un
+nome con tutti i gruppi si riduce a un limite superiore vettoriale della similarità:
+
+    jaro <= (c/len1 + c/len2 + 1) / 3    con c = caratteri in comune (multinsieme)
+
+più il bonus Winkler calcolato sul prefisso comune esatto. Solo i gruppi il cui limite supera
+la soglia vengono valutati con Jaro-Winkler, in ordine, fermandosi al primo che la raggiunge:
+il risultato è identico al confronto esaustivo. Le similarità calcolate sono memorizzate per
+coppia e la risoluzione è memorizzata per nome normalizzato, perché lo stesso concetto ricorre
+di solito in più libri dello stesso corso.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789 "
+_CHAR_INDEX = {char: index for index, char in enumerate(_ALPHABET)}
+# Caratteri fuori alfabeto (non prodotti da normalize_concept_name) condividono l'ultima colonna:
+# il conteggio in comune viene sovrastimato, quindi il limite resta valido
+_OTHER = len(_ALPHABET)
+_PREFIX = 4
+_WINKLER_SCALE = 0.1
+# Margine sul limite superiore contro gli arrotondamenti in virgola mobile
+_EPSILON = 1e-9
+
+
+def normalize_concept_name(name: str) -> str:
+    normalized = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode("ascii")
+    normalized = re.sub(r"[^a-z0-9\s]", " ", normalized.lower())
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+def jaro(s1: str, s2: str) -> float:
+    if s1 == s2:
+        return 1.0
+    len1, len2 = len(s1), len(s2)
+    if len1 == 0 or len2 == 0:
+        return 0.0
+    max_dist = max(len1, len2) // 2 - 1
+    match1 = [False] * len1
+    match2 = [False] * len2
+    matches = 0
+    transpositions = 0
+    for i in range(len1):
+        start = max(0, i - max_dist)
+        end = min(i + max_dist + 1, len2)
+        for j in range(start, end):
+            if match2[j]:
+                continue
+            if s1[i] != s2[j]:
+                continue
+            match1[i] = True
+            match2[j] = True
+            matches += 1
+            break
+    if matches == 0:
+        return 0.0
+    k = 0
+    for i in range(len1):
+        if not match1[i]:
+            continue
+        while not match2[k]:
+            k += 1
+        if s1[i] != s2[k]:
+            transpositions += 1
+        k += 1
+    transpositions /= 2
+    return (matches / len1 + matches / len2 + (matches - transpositions) / matches) / 3.0
+
+
+def _common_prefix(a: str, b: str) -> int:
+    length = 0
+    for i in range(min(_PREFIX, len(a), len(b))):
+        if a[i] != b[i]:
+            break
+        length += 1
+    return length
+
+
+@lru_cache(maxsize=65536)
+def jaro_winkler(a: str, b: str) -> float:
+    j = jaro(a, b)
+    return j + _common_prefix(a, b) * _WINKLER_SCALE * (1 - j)
+
+
+def dedup_threshold(name: str) -> float:
+    """Soglia dinamica: i nomi brevi richiedono una similarità più alta."""
+    length = len(name)
+    if length < 10:
+        return 0.88
+    if length < 20:
+        return 0.82
+    return 0.75
+
+
+def _char_profile(name: str) -> np.ndarray:
+    profile = np.zeros(len(_ALPHABET) + 1, dtype=np.int32)
+    for char in name:
+        profile[_CHAR_INDEX.get(char, _OTHER)] += 1
+    return profile
+
+
+def _prefix_codes(name: str, padding: int) -> np.ndarray:
+    codes = [ord(char) for char in name[:_PREFIX]]
+    return np.asarray(codes + [padding] * (_PREFIX - len(codes)), dtype=np.int32)
+
+
+class ConceptDeduplicator:
+    """Indice dei gruppi di concetti: `resolve(nome)` restituisce l'indice del gruppo."""
+
+    def __init__(self, initial_capacity: int = 64):
+        self.keys: List[str] = []
+        self._lengths = np.zeros(initial_capacity, dtype=np.int32)
+        self._profiles = np.zeros((initial_capacity, len(_ALPHABET) + 1), dtype=np.int32)
+        self._prefixes = np.full((initial_capacity, _PREFIX), -1, dtype=np.int32)
+        self._resolved: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def find(self, key: str) -> Optional[int]:
+        """Primo gruppo (in ordine di creazione) abbastanza simile a `key` già normalizzato."""
+        if key in self._resolved:
+            return self._resolved[key]
+
+        count = len(self.keys)
+        if count == 0:
+            return None
+        threshold = dedup_threshold(key)
+        for index in np.flatnonzero(self._upper_bounds(key, count) + _EPSILON >= threshold).tolist():
+            if jaro_winkler(key, self.keys[index]) >= threshold:
+                # I gruppi vengono solo aggiunti in coda: il primo gruppo simile non cambia più
+                self._resolved[key] = index
+                return index
+        return None
+
+    def add(self, key: str) -> int:
+        index = len(self.keys)
+        if index == len(self._lengths):
+            self._grow()
+        self.keys.append(key)
+        self._lengths[index] = len(key)
+        self._profiles[index] = _char_profile(key)
+        self._prefixes[index] = _prefix_codes(key, padding=-1)
+        self._resolved.setdefault(key, index)
+        return index
+
+    def resolve(self, key: str) -> int:
+        index = self.find(key)
+        return self.add(key) if index is None else index
+
+    def _upper_bounds(self, key: str, count: int) -> np.ndarray:
+        """Limite superiore di Jaro-Winkler tra `key` e ciascun gruppo."""
+        lengths = self._lengths[:count].astype(np.float64)
+        if not key:
+            # jaro("", "") = 1, jaro("", x) = 0
+            return (lengths == 0).astype(np.float64)
+
+        common = np.minimum(self._profiles[:count], _char_profile(key)).sum(axis=1).astype(np.float64)
+        jaro_bound = np.zeros(count, dtype=np.float64)
+        np.divide(common / len(key) + common / np.maximum(lengths, 1) + 1.0, 3.0,
+                  out=jaro_bound, where=common > 0)
+
+        same_prefix = self._prefixes[:count] == _prefix_codes(key, padding=-2)
+        prefix = np.cumprod(same_prefix, axis=1).sum(axis=1)
+        return jaro_bound + prefix * _WINKLER_SCALE * (1.0 - jaro_bound)
+
+    def _grow(self):
+        capacity = len(self._lengths) * 2
+        self._lengths = np.resize(self._lengths, capacity)
+        profiles = np.zeros((capacity, self._profiles.shape[1]), dtype=np.int32)
+        profiles[:len(self._profiles)] = self._profiles
+        self._profiles = profiles
+        prefixes = np.full((capacity, _PREFIX), -1, dtype=np.int32)
+        prefixes[:len(self._prefixes)] = self._prefixes
+        self._prefixes = prefixes
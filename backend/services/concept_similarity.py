@@ -0,0 +1,163 @@
+"""
+Concept Similarity - Similarità a coppie tra concetti, calcolata in forma matriciale
+
+I concetti vengono codificati una sola volta (multi-hot di tag, parole del nome e parole
+chiave di dominio, codici di categoria, difficoltà/padronanza ed eventuali embedding) e le
+misure a coppie diventano operazioni su matrici NumPy: Jaccard come prodotto tra matrici
+multi-hot, prossimità come differenza in broadcasting, coseno come prodotto scalare tra
+embedding normalizzati. Usato dallo scheduler di interleaving e dalla rete di elaborazione
+al posto dei doppi cicli Python sulle coppie di concetti.
+"""
+
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def multi_hot(token_sets: Sequence[Iterable[Hashable]]) -> np.ndarray:
+    """Matrice (concetti x vocabolario) con 1 dove il concetto contiene il token."""
+    vocabulary: Dict[Hashable, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    for row, tokens in enumerate(token_sets):
+        for token in set(tokens):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+    matrix = np.zeros((len(token_sets), len(vocabulary)), dtype=np.float64)
+    if rows:
+        matrix[rows, cols] = 1.0
+    return matrix
+
+
+def jaccard_matrix(token_sets: Sequence[Iterable[Hashable]]) -> np.ndarray:
+    """Jaccard tra tutte le coppie di insiemi; 0 se uno dei due insiemi è vuoto."""
+    hot = multi_hot(token_sets)
+    intersection = hot @ hot.T
+    sizes = hot.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - intersection
+    result = np.zeros_like(intersection)
+    np.divide(intersection, union, out=result, where=union > 0)
+    return result
+
+
+def equality_matrix(values: Sequence[Hashable]) -> np.ndarray:
+    """1.0 dove i due concetti hanno lo stesso valore (es. stessa categoria)."""
+    _, codes = np.unique(np.asarray([str(value) for value in values], dtype=object), return_inverse=True)
+    return (codes[:, None] == codes[None, :]).astype(np.float64)
+
+
+def abs_difference_matrix(values: Sequence[float]) -> np.ndarray:
+    array = np.asarray(values, dtype=np.float64)
+    return np.abs(array[:, None] - array[None, :])
+
+
+def proximity_matrix(values: Sequence[float]) -> np.ndarray:
+    """1 - |a - b|, limitato a [0, 1]: valori vicini = concetti vicini."""
+    return 1.0 - np.minimum(abs_difference_matrix(values), 1.0)
+
+
+def cosine_matrix(embeddings: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+    return normalized @ normalized.T
+
+
+def shared_keyword_matrix(texts: Sequence[str], keywords: Sequence[str]) -> np.ndarray:
+    """1.0 dove entrambi i testi contengono (come sottostringa) almeno una stessa parola chiave."""
+    lowered = [(text or "").lower() for text in texts]
+    hits = np.asarray([[keyword in text for keyword in keywords] for text in lowered], dtype=np.float64)
+    if hits.size == 0:
+        return np.zeros((len(texts), len(texts)), dtype=np.float64)
+    return ((hits @ hits.T) > 0).astype(np.float64)
+
+
+def name_tokens(name: str) -> List[str]:
+    return (name or "").lower().split()
+
+
+class ConceptSimilarityEngine:
+    """
+    Similarità pesata tra concetti:
+
+        sim = w_category * [stessa categoria] + w_tags * Jaccard(tag) + w_difficulty * prossimità(difficoltà)
+              + w_name * Jaccard(parole del nome) + w_embedding * coseno(embedding)
+
+    limitata a 1.0. I pesi a zero saltano il calcolo della relativa matrice.
+    """
+
+    def __init__(self, category_weight: float = 0.3, tag_weight: float = 0.4, difficulty_weight: float = 0.3,
+                 name_weight: float = 0.2, embedding_weight: float = 0.0):
+        self.category_weight = category_weight
+        self.tag_weight = tag_weight
+        self.difficulty_weight = difficulty_weight
+        self.name_weight = name_weight
+        self.embedding_weight = embedding_weight
+
+    def similarity_matrix(self, concepts: Sequence[Dict[str, Any]], name_key: str = "name",
+                          tags_key: str = "tags", category_key: str = "category",
+                          difficulty_key: str = "difficulty",
+                          embeddings: Optional[np.ndarray] = None) -> np.ndarray:
+        count = len(concepts)
+        similarity = np.zeros((count, count), dtype=np.float64)
+        if count == 0:
+            return similarity
+
+        # Stesso ordine di somma della versione scalare: punteggi identici
+        if self.category_weight:
+            similarity += self.category_weight * equality_matrix([c.get(category_key) for c in concepts])
+        if self.tag_weight:
+            similarity += self.tag_weight * jaccard_matrix([c.get(tags_key) or [] for c in concepts])
+        if self.difficulty_weight:
+            similarity += self.difficulty_weight * proximity_matrix([c.get(difficulty_key, 0.5) for c in concepts])
+        if self.name_weight:
+            similarity += self.name_weight * jaccard_matrix([name_tokens(c.get(name_key, "")) for c in concepts])
+        if self.embedding_weight and embeddings is not None:
+            similarity += self.embedding_weight * np.clip(cosine_matrix(embeddings), 0.0, 1.0)
+
+        np.minimum(similarity, 1.0, out=similarity)
+        np.fill_diagonal(similarity, 0.0)
+        return similarity
+
+
+def upper_pairs(matrix: np.ndarray, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Indici (i, j) con i < j, in ordine di riga, eventualmente filtrati da `mask`."""
+    rows, cols = np.triu_indices(matrix.shape[0], k=1)
+    if mask is not None:
+        keep = mask[rows, cols]
+        rows, cols = rows[keep], cols[keep]
+    return rows, cols
+
+
+def pair_dict(ids: Sequence[str], matrix: np.ndarray) -> Dict[str, float]:
+    """Rappresentazione `"id1-id2" -> valore` (solo i < j) usata nelle risposte delle API."""
+    rows, cols = upper_pairs(matrix)
+    values = matrix[rows, cols].tolist()
+    return {f"{ids[i]}-{ids[j]}": value for i, j, value in zip(rows.tolist(), cols.tolist(), values)}
+
+
+def top_k_neighbors(ids: Sequence[str], matrix: np.ndarray, k: int,
+                    min_similarity: float = 0.0) -> Dict[str, List[Tuple[str, float]]]:
+    """I k concetti più simili a ciascun concetto (escluso se stesso), in ordine decrescente."""
+    count = len(ids)
+    neighbors: Dict[str, List[Tuple[str, float]]] = {concept_id: [] for concept_id in ids}
+    if count < 2 or k <= 0:
+        return neighbors
+
+    scores = matrix.astype(np.float64, copy=True)
+    np.fill_diagonal(scores, -np.inf)
+    k = min(k, count - 1)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    for row, concept_id in enumerate(ids):
+        neighbors[concept_id] = [
+            (ids[col], float(score))
+            for col, score in zip(candidates[row].tolist(), candidate_scores[row].tolist())
+            if score >= min_similarity
+        ]
+    return neighbors
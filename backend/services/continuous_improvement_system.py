@@ -47,9 +47,8 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 
 # Import AI services
-from services.llm_service import LLMService
+from services.service_container import get_ab_testing_framework, get_llm_service
 from services.prompt_analytics_service import prompt_analytics_service
-from services.ab_testing_framework import ABTestingFramework
 from services.advanced_model_selector import AdvancedModelSelector
 
 logger = logging.getLogger(__name__)
@@ -216,9 +215,9 @@ class ContinuousImprovementSystem:
         self._ensure_database()
 
         # Initialize services
-        self.llm_service = LLMService()
+        self.llm_service = get_llm_service()
         self.analytics_service = prompt_analytics_service
-        self.ab_framework = ABTestingFramework()
+        self.ab_framework = get_ab_testing_framework()
         self.model_selector = AdvancedModelSelector()
 
         # ML models for different optimization strategies
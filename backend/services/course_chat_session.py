@@ -3,14 +3,15 @@ Course Chat Session Management
 Advanced session management for course-specific chatbot with persistent context
 """
 
-import json
 import uuid
 import os
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Any, Optional, Union, Literal
 from dataclasses import dataclass, asdict
 from enum import Enum
-import pickle
+
+from services.entity_store import EntityStore
+from services.service_container import service_container
 
 class SessionContextType(Enum):
     """Types of context that can be stored in a session"""
@@ -53,9 +54,13 @@ class CourseSession:
 class CourseChatSessionManager:
     """Advanced session manager for course-specific chatbots"""
 
-    def __init__(self):
+    # Statistiche di sessione gestite come insiemi in memoria
+    _STATISTIC_SETS = ("topics_discussed", "concepts_covered", "sources_used")
+
+    def __init__(self, store: Optional[EntityStore] = None):
         self.session_dir = "data/chat_sessions"
         self.context_dir = "data/session_contexts"
+        # File JSON legacy, importato una sola volta nell'entity store
         self.sessions_file = os.path.join(self.session_dir, "course_sessions.json")
         self.ensure_directories()
 
@@ -64,14 +69,27 @@ class CourseChatSessionManager:
         self.session_timeout_hours = 48
         self.max_context_memory = 50  # max context items to store
 
+        # Una riga per sessione e una per messaggio: aggiungere un messaggio non riscrive lo storico
+        if store is None:
+            from services.service_container import get_entity_store
+            store = get_entity_store()
+        self.sessions = store.collection("chat_sessions", sort_field="last_activity")
+        self.messages = store.collection("chat_messages", sort_field="timestamp")
+        store.migrate_json(self.sessions_file, self._import_legacy_sessions)
+
     def ensure_directories(self):
         """Ensure required directories exist"""
         os.makedirs(self.session_dir, exist_ok=True)
         os.makedirs(self.context_dir, exist_ok=True)
 
-        if not os.path.exists(self.sessions_file):
-            with open(self.sessions_file, 'w') as f:
-                json.dump({}, f)
+    def _import_legacy_sessions(self, sessions_data: Dict[str, Any]) -> int:
+        for session_id, session_data in (sessions_data or {}).items():
+            session_data = dict(session_data)
+            for message in session_data.pop("messages", None) or []:
+                self.messages.put(message["id"], message, session_id=session_id,
+                                  course_id=session_data.get("course_id"))
+            self.sessions.put(session_id, session_data)
+        return len(sessions_data or {})
 
     def get_or_create_session(self, course_id: str, session_id: Optional[str] = None) -> CourseSession:
         """Get existing session or create new one"""
@@ -116,10 +134,6 @@ class CourseChatSessionManager:
                    topic_tags: List[str] = None, is_followup: bool = False,
                    parent_message_id: Optional[str] = None) -> ChatMessage:
         """Add a message to the session and update context"""
-        session = self.load_session(session_id)
-        if not session:
-            raise ValueError(f"Session {session_id} not found")
-
         message = ChatMessage(
             id=str(uuid.uuid4()),
             timestamp=datetime.now(timezone.utc),
@@ -134,32 +148,40 @@ class CourseChatSessionManager:
             parent_message_id=parent_message_id
         )
 
-        session.messages.append(message)
-        session.last_activity = datetime.now(timezone.utc)
+        def apply(session_data: Dict[str, Any]) -> Dict[str, Any]:
+            # Read-modify-write nella transazione della riga: messaggi concorrenti sulla stessa
+            # sessione non perdono statistiche né aggiornamenti di contesto
+            session = self._session_from_data(session_id, session_data)
+            session.messages.append(message)
+            session.last_activity = datetime.now(timezone.utc)
+            self._save_message(session, message)
 
-        # Update statistics
-        session.statistics["total_messages"] += 1
-        session.statistics[f"{role}_messages"] += 1
-        session.statistics["total_response_time_ms"] += response_time_ms
+            # Update statistics
+            session.statistics["total_messages"] += 1
+            session.statistics[f"{role}_messages"] += 1
+            session.statistics["total_response_time_ms"] += response_time_ms
 
-        if topic_tags:
-            session.statistics["topics_discussed"].update(topic_tags)
+            if topic_tags:
+                session.statistics["topics_discussed"].update(topic_tags)
 
-        if sources:
-            for source in sources:
-                session.statistics["sources_used"].add(source.get("book_title", ""))
+            if sources:
+                for source in sources:
+                    session.statistics["sources_used"].add(source.get("book_title", ""))
 
-        # Update session context based on message
-        self._update_session_context(session, message)
+            # Update session context based on message
+            self._update_session_context(session, message)
 
-        # Save session
-        self.save_session(session)
+            # Il messaggio è già salvato nella propria riga: qui solo metadati, contesto e statistiche
+            return self._session_to_data(session)
+
+        if self.sessions.update(session_id, apply) is None:
+            raise ValueError(f"Session {session_id} not found")
 
         return message
 
     def get_session_context(self, session_id: str, context_type: Optional[SessionContextType] = None) -> Any:
         """Get session context, optionally filtered by type"""
-        session = self.load_session(session_id)
+        session = self.load_session(session_id, include_messages=False)
         if not session:
             return None
 
@@ -170,36 +192,28 @@ class CourseChatSessionManager:
     def update_session_context(self, session_id: str, context_type: SessionContextType,
                               context_data: Any):
         """Update specific context type in session"""
-        session = self.load_session(session_id)
-        if session:
-            session.context[context_type.value] = context_data
-            session.last_activity = datetime.now(timezone.utc)
-            self.save_session(session)
+        def apply(session_data: Dict[str, Any]):
+            session_data.setdefault("context", {})[context_type.value] = context_data
+            session_data["last_activity"] = datetime.now(timezone.utc).isoformat()
+
+        self.sessions.update(session_id, apply)
 
     def get_conversation_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get formatted conversation history for context"""
-        session = self.load_session(session_id)
-        if not session:
-            return []
-
-        messages = session.messages[-limit:]
+        messages = self.messages.find(session_id=session_id, limit=limit, descending=True)
         return [
             {
-                "role": msg.role,
-                "content": msg.content,
-                "timestamp": msg.timestamp.isoformat(),
-                "sources": msg.sources
+                "role": msg["role"],
+                "content": msg["content"],
+                "timestamp": msg["timestamp"],
+                "sources": msg.get("sources", [])
             }
-            for msg in messages
+            for msg in reversed(messages)
         ]
 
     def get_course_analytics(self, course_id: str) -> Dict[str, Any]:
         """Get analytics for all sessions in a course"""
-        sessions_data = self._load_sessions_dict()
-        course_sessions = [
-            session for session in sessions_data.values()
-            if session.get("course_id") == course_id
-        ]
+        course_sessions = self.sessions.find(course_id=course_id)
 
         if not course_sessions:
             return {}
@@ -232,21 +246,23 @@ class CourseChatSessionManager:
 
     def cleanup_expired_sessions(self):
         """Clean up sessions older than timeout"""
-        sessions_data = self._load_sessions_dict()
         cutoff_time = datetime.now(timezone.utc) - timedelta(hours=self.session_timeout_hours)
 
-        active_sessions = {}
-        for session_id, session_data in sessions_data.items():
+        expired = 0
+        for session_data in self.sessions.all():
             last_activity = datetime.fromisoformat(
                 session_data.get("last_activity", session_data.get("created_at", datetime.now(timezone.utc).isoformat()))
             )
-            if last_activity > cutoff_time:
-                active_sessions[session_id] = session_data
+            if last_activity <= cutoff_time and self.delete_session(session_data["id"]):
+                expired += 1
 
-        with open(self.sessions_file, 'w') as f:
-            json.dump(active_sessions, f, indent=2)
+        return expired
 
-        return len(sessions_data) - len(active_sessions)
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session and its messages"""
+        deleted = self.sessions.delete(session_id)
+        self.messages.delete_where(session_id=session_id)
+        return deleted
 
     def _initialize_context(self, course_id: str) -> Dict[str, Any]:
         """Initialize context for a new course session"""
@@ -322,61 +338,54 @@ class CourseChatSessionManager:
             session.messages = session.messages[-self.max_messages_per_session:]
         return session
 
-    def load_session(self, session_id: str) -> Optional[CourseSession]:
-        """Load session from storage"""
-        sessions_data = self._load_sessions_dict()
-        session_data = sessions_data.get(session_id)
+    def load_session(self, session_id: str, include_messages: bool = True) -> Optional[CourseSession]:
+        """Load session from storage (with its most recent messages)"""
+        session_data = self.sessions.get(session_id)
 
         if not session_data:
             return None
+        return self._session_from_data(session_id, session_data, include_messages)
 
+    def _session_from_data(self, session_id: str, session_data: Dict[str, Any],
+                           include_messages: bool = True) -> CourseSession:
         # Convert datetime strings back to datetime objects
         session_data["created_at"] = datetime.fromisoformat(session_data["created_at"])
         session_data["last_activity"] = datetime.fromisoformat(session_data["last_activity"])
 
+        statistics = session_data.setdefault("statistics", {})
+        for key in self._STATISTIC_SETS:
+            statistics[key] = set(statistics.get(key) or [])
+
         # Convert messages
         messages = []
-        for msg_data in session_data.get("messages", []):
-            msg_data["timestamp"] = datetime.fromisoformat(msg_data["timestamp"])
-            messages.append(ChatMessage(**msg_data))
+        if include_messages:
+            recent = self.messages.find(session_id=session_id, limit=self.max_messages_per_session, descending=True)
+            for msg_data in reversed(recent):
+                msg_data["timestamp"] = datetime.fromisoformat(msg_data["timestamp"])
+                messages.append(ChatMessage(**msg_data))
         session_data["messages"] = messages
 
         return CourseSession(**session_data)
 
     def save_session(self, session: CourseSession):
-        """Save session to storage"""
-        # Convert session to dict for JSON serialization
-        session_dict = asdict(session)
-
-        # Convert datetime objects to strings
-        session_dict["created_at"] = session.created_at.isoformat()
-        session_dict["last_activity"] = session.last_activity.isoformat()
-
-        # Convert messages to dict
-        session_dict["messages"] = [asdict(msg) for msg in session.messages]
-        for msg_dict in session_dict["messages"]:
-            msg_dict["timestamp"] = msg_dict["timestamp"].replace("Z", "+00:00")
-
-        # Handle non-serializable objects in statistics
-        session_dict["statistics"]["topics_discussed"] = list(session.statistics["topics_discussed"])
-        session_dict["statistics"]["concepts_covered"] = list(session.statistics["concepts_covered"])
-        session_dict["statistics"]["sources_used"] = list(session.statistics["sources_used"])
-
-        # Load existing sessions
-        sessions_data = self._load_sessions_dict()
-        sessions_data[session.id] = session_dict
-
-        # Save to file
-        with open(self.sessions_file, 'w') as f:
-            json.dump(sessions_data, f, indent=2)
-
-    def _load_sessions_dict(self) -> Dict[str, Any]:
-        """Load all sessions as dict"""
-        try:
-            with open(self.sessions_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        """Save session metadata, context and statistics (messages are stored per row)"""
+        self.sessions.put(session.id, self._session_to_data(session))
+
+    def _session_to_data(self, session: CourseSession) -> Dict[str, Any]:
+        return {
+            "id": session.id,
+            "course_id": session.course_id,
+            "created_at": session.created_at.isoformat(),
+            "last_activity": session.last_activity.isoformat(),
+            "context": session.context,
+            "metadata": session.metadata,
+            "statistics": session.statistics
+        }
+
+    def _save_message(self, session: CourseSession, message: ChatMessage):
+        message_dict = asdict(message)
+        message_dict["timestamp"] = message.timestamp.isoformat()
+        self.messages.put(message.id, message_dict, session_id=session.id, course_id=session.course_id)
 
     def _get_most_active_day(self, sessions: List[Dict]) -> Optional[str]:
         """Find the most active day from session data"""
@@ -391,4 +400,4 @@ class CourseChatSessionManager:
         return None
 
 # Global instance
-course_chat_session_manager = CourseChatSessionManager()
\ No newline at end of file
+course_chat_session_manager = service_container.lazy("course_chat_sessions")
@@ -371,6 +371,8 @@ class CourseRAGService:
             "retrieval_method": "enhanced_course_rag",
             "personalization_applied": len(personalized_sources) > 0,
             "session_context_used": len(session_sources) > 0,
+            # Scope del retrieval di base (libro, note personali usate)
+            "scope": base_context.get("scope") or {},
             "total_sources_considered": len(sources),
             "context_metadata": {
                 "course_id": course_id,
@@ -1,14 +1,41 @@
 import os
-import json
 import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
 
+from services.entity_store import EntityCollection, EntityStore
+
+
+def open_course_collections(store: EntityStore, courses_file: str) -> Tuple[EntityCollection, EntityCollection]:
+    """
+    Collezioni di corsi e libri (una riga per entità, libri indicizzati per course_id);
+    al primo avvio importa il vecchio courses.json con i libri annidati nei corsi.
+    """
+    courses = store.collection("courses", sort_field="created_at")
+    books = store.collection("books", sort_field="created_at")
+
+    def import_courses(payload: List[Dict[str, Any]]) -> int:
+        for course in payload or []:
+            course = dict(course)
+            for book in course.pop("books", None) or []:
+                books.put(book["id"], {**book, "course_id": course["id"]})
+            courses.put(course["id"], course)
+        return len(payload or [])
+
+    store.migrate_json(courses_file, import_courses)
+    return courses, books
+
+
 class CourseService:
-    def __init__(self):
+    def __init__(self, store: Optional[EntityStore] = None):
         self.courses_dir = "data/courses"
+        # File JSON legacy, importato una sola volta nell'entity store
         self.courses_file = os.path.join(self.courses_dir, "courses.json")
         self.ensure_courses_directory()
+        if store is None:
+            from services.service_container import get_entity_store
+            store = get_entity_store()
+        self.courses, self.books = open_course_collections(store, self.courses_file)
 
     def _collect_course_materials(self, course_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
         """Collect PDF materials for a course and map them to books when possible."""
@@ -112,18 +139,12 @@ class CourseService:
         return enriched_books
 
     def ensure_courses_directory(self):
-        """Ensure the courses directory and file exist"""
+        """Ensure the courses directory exists"""
         os.makedirs(self.courses_dir, exist_ok=True)
 
-        if not os.path.exists(self.courses_file):
-            with open(self.courses_file, 'w') as f:
-                json.dump([], f)
-
     def create_course(self, course_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new course"""
         try:
-            courses = self.get_all_courses_raw()
-
             new_course = {
                 "id": str(uuid.uuid4()),
                 "name": course_data["name"],
@@ -136,15 +157,11 @@ class CourseService:
                 "total_study_time": 0
             }
 
-            courses.append(new_course)
-
             # Create course directory
             course_dir = os.path.join(self.courses_dir, new_course["id"])
             os.makedirs(course_dir, exist_ok=True)
 
-            # Save courses data
-            with open(self.courses_file, 'w') as f:
-                json.dump(courses, f, indent=2)
+            self.courses.put(new_course["id"], new_course)
 
             return new_course
 
@@ -168,21 +185,34 @@ class CourseService:
             raise Exception(f"Error getting courses: {e}")
 
     def get_all_courses_raw(self) -> List[Dict[str, Any]]:
-        """Get raw courses data from file"""
-        try:
-            with open(self.courses_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        """Get raw courses data (with their books) from the store"""
+        books_by_course: Dict[str, List[Dict[str, Any]]] = {}
+        for book in self.books.all():
+            books_by_course.setdefault(book.get("course_id"), []).append(book)
+
+        courses = self.courses.all()
+        for course in courses:
+            if course["id"] in books_by_course:
+                course["books"] = books_by_course[course["id"]]
+        return courses
+
+    def get_course_raw(self, course_id: str) -> Optional[Dict[str, Any]]:
+        """Get raw data (with books) of a single course"""
+        course = self.courses.get(course_id)
+        if course:
+            books = self.books.find(course_id=course_id)
+            if books:
+                course["books"] = books
+        return course
 
     def get_course(self, course_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific course by ID"""
         try:
-            courses = self.get_all_courses()
-            course = next((c for c in courses if c["id"] == course_id), None)
+            course = self.get_course_raw(course_id)
 
             if course:
                 materials, book_materials_map = self._collect_course_materials(course_id)
+                course["materials_count"] = len(materials)
                 course["materials"] = materials
                 course["books"] = self._enrich_books_with_materials(course, course_id, materials, book_materials_map)
 
@@ -194,25 +224,19 @@ class CourseService:
     def update_course(self, course_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Update course information"""
         try:
-            courses = self.get_all_courses_raw()
-            course_index = next((i for i, c in enumerate(courses) if c["id"] == course_id), None)
-
-            if course_index is None:
-                return None
-
-            # Update allowed fields
-            allowed_fields = ["name", "description", "subject"]
-            for field in allowed_fields:
-                if field in update_data:
-                    courses[course_index][field] = update_data[field]
+            def apply(course: Dict[str, Any]):
+                # Update allowed fields
+                allowed_fields = ["name", "description", "subject"]
+                for field in allowed_fields:
+                    if field in update_data:
+                        course[field] = update_data[field]
 
-            courses[course_index]["updated_at"] = datetime.now().isoformat()
+                course["updated_at"] = datetime.now().isoformat()
 
-            # Save updated courses
-            with open(self.courses_file, 'w') as f:
-                json.dump(courses, f, indent=2)
+            if self.courses.update(course_id, apply) is None:
+                return None
 
-            return courses[course_index]
+            return self.get_course_raw(course_id)
 
         except Exception as e:
             raise Exception(f"Error updating course: {e}")
@@ -220,12 +244,8 @@ class CourseService:
     def delete_course(self, course_id: str) -> bool:
         """Delete a course and all its materials"""
         try:
-            courses = self.get_all_courses_raw()
-            courses = [c for c in courses if c["id"] != course_id]
-
-            # Save updated courses
-            with open(self.courses_file, 'w') as f:
-                json.dump(courses, f, indent=2)
+            self.courses.delete(course_id)
+            self.books.delete_where(course_id=course_id)
 
             # Delete course directory
             course_dir = os.path.join(self.courses_dir, course_id)
@@ -241,17 +261,12 @@ class CourseService:
     def update_course_stats(self, course_id: str, study_session_duration: int):
         """Update course statistics after a study session"""
         try:
-            courses = self.get_all_courses_raw()
-            course_index = next((i for i, c in enumerate(courses) if c["id"] == course_id), None)
-
-            if course_index is not None:
-                courses[course_index]["study_sessions"] += 1
-                courses[course_index]["total_study_time"] += study_session_duration
-                courses[course_index]["updated_at"] = datetime.now().isoformat()
+            def apply(course: Dict[str, Any]):
+                course["study_sessions"] = course.get("study_sessions", 0) + 1
+                course["total_study_time"] = course.get("total_study_time", 0) + study_session_duration
+                course["updated_at"] = datetime.now().isoformat()
 
-                # Save updated courses
-                with open(self.courses_file, 'w') as f:
-                    json.dump(courses, f, indent=2)
+            self.courses.update(course_id, apply)
 
         except Exception as e:
             print(f"Error updating course stats: {e}")
@@ -16,6 +16,7 @@ import uuid
 
 from services.llm_service import LLMService
 from services.rag_service import RAGService
+from services.service_container import service_container
 
 class DualCodingEngine:
     """
@@ -1087,4 +1088,4 @@ class DualCodingEngine:
             return {"success": False, "error": str(e)}
 
 # Initialize the dual coding service
-dual_coding_service = DualCodingEngine(None, None)  # Will be initialized with proper services
\ No newline at end of file
+dual_coding_service = service_container.lazy("dual_coding")
\ No newline at end of file
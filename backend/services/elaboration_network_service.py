@@ -14,6 +14,10 @@ import numpy as np
 from collections import defaultdict, Counter
 from enum import Enum
 import networkx as nx
+from services.concept_similarity import (
+    abs_difference_matrix, jaccard_matrix, name_tokens, shared_keyword_matrix, upper_pairs
+)
+from services.service_container import service_container
 
 class ElaborationNetworkService:
     """
@@ -811,15 +815,15 @@ class ElaborationNetworkService:
                                          knowledge_analysis: Dict[str, Any]) -> Dict[str, Any]:
         """Build the conceptual connection matrix"""
         try:
-            connections = []
             concepts = knowledge_analysis.get("knowledge_gaps", []) + knowledge_analysis.get("strength_areas", [])
 
-            # Generate connections based on relationships
-            for i, concept1 in enumerate(concepts):
-                for j, concept2 in enumerate(concepts[i+1:], i+1):
-                    connection = await self._create_connection(concept1, concept2, knowledge_analysis)
-                    if connection:
-                        connections.append(connection)
+            # Score every pair at once, then materialize only meaningful connections
+            strength = self._calculate_connection_strengths(concepts)
+            rows, cols = upper_pairs(strength, strength >= 0.3)  # Threshold for meaningful connections
+            connections = [
+                self._create_connection(concepts[i], concepts[j], float(strength[i, j]))
+                for i, j in zip(rows.tolist(), cols.tolist())
+            ]
 
             # Enhance with CLE data
             enhanced_connections = await self._enhance_connections_with_cle(
@@ -838,109 +842,60 @@ class ElaborationNetworkService:
             print(f"Error building conceptual connections: {e}")
             return {"connections": [], "total_connections": 0}
 
-    async def _create_connection(self, concept1: Dict[str, Any], concept2: Dict[str, Any],
-                              knowledge_analysis: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def _create_connection(self, concept1: Dict[str, Any], concept2: Dict[str, Any],
+                           connection_strength: float) -> Dict[str, Any]:
         """Create a connection between two concepts"""
-        try:
-            # Calculate connection strength
-            connection_strength = await self._calculate_connection_strength(concept1, concept2)
-
-            if connection_strength < 0.3:  # Threshold for meaningful connections
-                return None
-
-            # Determine connection type
-            connection_type = await self._determine_connection_type(concept1, concept2)
-
-            return {
-                "source_id": concept1["concept_id"],
-                "target_id": concept2["concept_id"],
-                "type": connection_type,
-                "strength": connection_strength,
-                "bidirectional": await self._is_bidirectional(connection_type),
-                "cle_enhancement": await self._determine_cle_enhancement(concept1, concept2),
-                "transfer_potential": connection_strength * self.connection_types[connection_type]["transfer_potential"]
-            }
-
-        except Exception as e:
-            print(f"Error creating connection: {e}")
-            return None
-
-    async def _calculate_connection_strength(self, concept1: Dict[str, Any], concept2: Dict[str, Any]) -> float:
-        """Calculate the strength of connection between two concepts"""
-        try:
-            base_strength = 0.0
-
-            # Semantic similarity (simplified)
-            name1 = concept1.get("concept_name", "").lower()
-            name2 = concept2.get("concept_name", "").lower()
-
-            words1 = set(name1.split())
-            words2 = set(name2.split())
-
-            if words1 and words2:
-                overlap = len(words1 & words2) / len(words1 | words2)
-                base_strength += overlap * 0.3
+        # Determine connection type (simplified - would be more sophisticated in real implementation)
+        connection_type = random.choice(list(self.connection_types.keys()))
+
+        return {
+            "source_id": concept1["concept_id"],
+            "target_id": concept2["concept_id"],
+            "type": connection_type,
+            "strength": connection_strength,
+            "bidirectional": self._is_bidirectional(connection_type),
+            "cle_enhancement": self._determine_cle_enhancement(concept1, concept2),
+            "transfer_potential": connection_strength * self.connection_types[connection_type]["transfer_potential"]
+        }
 
-            # Category similarity
-            cat1 = concept1.get("concept_name", "").lower()
-            cat2 = concept2.get("concept_name", "").lower()
+    def _calculate_connection_strengths(self, concepts: List[Dict[str, Any]]) -> np.ndarray:
+        """Calculate the strength of connection between every pair of concepts (n x n)"""
+        names = [concept.get("concept_name", "") for concept in concepts]
 
-            # Simplified category matching
-            if any(word in cat2 for word in ["math", "science", "theory", "principle"] if word in cat1):
-                base_strength += 0.2
+        # Semantic similarity (simplified): overlap of name words
+        strength = 0.3 * jaccard_matrix([name_tokens(name) for name in names])
 
-            # Complexity proximity
-            mastery1 = concept1.get("mastery_level", 0.5)
-            mastery2 = concept2.get("mastery_level", 0.5)
-            complexity_proximity = 1.0 - abs(mastery1 - mastery2)
-            base_strength += complexity_proximity * 0.2
+        # Simplified category matching: both names mention the same domain keyword
+        strength += 0.2 * shared_keyword_matrix(names, ["math", "science", "theory", "principle"])
 
-            # Random factor for diversity
-            base_strength += random.uniform(0, 0.1)
+        # Complexity proximity
+        mastery = [concept.get("mastery_level", 0.5) for concept in concepts]
+        strength += 0.2 * (1.0 - abs_difference_matrix(mastery))
 
-            return min(base_strength, 1.0)
+        # Random factor for diversity
+        strength += np.random.uniform(0, 0.1, size=strength.shape)
 
-        except Exception as e:
-            print(f"Error calculating connection strength: {e}")
-            return random.uniform(0.3, 0.7)
+        return np.minimum(strength, 1.0)
 
-    async def _determine_connection_type(self, concept1: Dict[str, Any], concept2: Dict[str, Any]) -> str:
-        """Determine the type of connection"""
-        try:
-            # Simplified logic - would be more sophisticated in real implementation
-            connection_types = list(self.connection_types.keys())
-            return random.choice(connection_types)
-
-        except Exception as e:
-            print(f"Error determining connection type: {e}")
-            return "causal"
-
-    async def _is_bidirectional(self, connection_type: str) -> bool:
+    def _is_bidirectional(self, connection_type: str) -> bool:
         """Check if connection should be bidirectional"""
         return connection_type in ["comparative", "integrative", "analogical"]
 
-    async def _determine_cle_enhancement(self, concept1: Dict[str, Any], concept2: Dict[str, Any]) -> List[str]:
+    def _determine_cle_enhancement(self, concept1: Dict[str, Any], concept2: Dict[str, Any]) -> List[str]:
         """Determine which CLE phases enhance this connection"""
-        try:
-            enhancements = []
-
-            # All connections benefit from metacognitive awareness
-            enhancements.append("metacognition")
+        # All connections benefit from metacognitive awareness
+        enhancements = ["metacognition"]
 
-            # Visual-verbal connections benefit from dual coding
-            if random.random() > 0.5:
-                enhancements.append("dual_coding")
+        # Visual-verbal connections benefit from dual coding
+        if random.random() > 0.5:
+            enhancements.append("dual_coding")
 
-            # Similar concepts benefit from interleaved practice
-            mastery_diff = abs(concept1.get("mastery_level", 0.5) - concept2.get("mastery_level", 0.5))
-            if mastery_diff < 0.3:
-                enhancements.append("interleaved_practice")
+        # Similar concepts benefit from interleaved practice
+        mastery_diff = abs(concept1.get("mastery_level", 0.5) - concept2.get("mastery_level", 0.5))
+        if mastery_diff < 0.3:
+            enhancements.append("interleaved_practice")
 
-            return enhancements
-
-        except Exception as e:
-            print(f"Error determining CLE enhancement: {e}")
-            return []
+        return enhancements
 
     async def _enhance_connections_with_cle(self, connections: List[Dict[str, Any]],
                                              user_state: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -1585,4 +1540,4 @@ class ElaborationNetworkService:
             return {"success": False, "error": str(e)}
 
 # Initialize the elaboration network service
-elaboration_network_service = ElaborationNetworkService()
\ No newline at end of file
+elaboration_network_service = service_container.lazy("elaboration_network")
\ No newline at end of file
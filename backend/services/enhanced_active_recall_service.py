@@ -40,8 +40,7 @@ import random
 import logging
 
 # Import AI services
-from services.llm_service import LLMService
-from services.rag_service import RAGService
+from services.service_container import get_llm_service, get_rag_service
 from services.advanced_model_selector import AdvancedModelSelector2
 from services.prompt_analytics_service import analytics_service
 
@@ -303,8 +302,8 @@ class EnhancedActiveRecallService:
         self._ensure_database()
 
         # Initialize AI services
-        self.llm_service = LLMService()
-        self.rag_service = RAGService()
+        self.llm_service = get_llm_service()
+        self.rag_service = get_rag_service()
         self.model_selector = AdvancedModelSelector2()
 
         # Enhanced question generation
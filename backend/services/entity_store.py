@@ -0,0 +1,206 @@
+"""
+Entity Store - Persistenza transazionale su SQLite per corsi, libri, sessioni, piani e task
+
+Ogni entità è una riga (id, colonne indicizzate course_id/session_id/user_id, chiave di
+ordinamento, documento JSON): una modifica riscrive solo la riga interessata, con un costo
+che non cresce con lo storico complessivo. Il database è in WAL mode (letture concorrenti
+alle scritture), ogni thread usa la propria connessione e le read-modify-write avvengono in
+transazioni `BEGIN IMMEDIATE`, così le richieste concorrenti non perdono aggiornamenti.
+
+I vecchi file JSON vengono importati una sola volta (`migrate_json`): la migrazione è
+registrata nella tabella `_migrations` e il file originale resta su disco come backup.
+
+Configurazione:
+    TUTOR_AI_DB_PATH   percorso del database (default: data/tutor_ai.db)
+"""
+
+import json
+import os
+import re
+import threading
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+from services.sqlite_connections import ThreadLocalSQLite
+
+logger = structlog.get_logger()
+
+INDEXED_FIELDS = ("course_id", "session_id", "user_id")
+_COLLECTION_NAME = re.compile(r"^[a-z][a-z0-9_]*$")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+def dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+class EntityCollection:
+    """Insieme di entità dello stesso tipo in una tabella dedicata."""
+
+    def __init__(self, store: "EntityStore", name: str, sort_field: Optional[str] = None):
+        if not _COLLECTION_NAME.match(name):
+            raise ValueError(f"Invalid collection name: {name}")
+        self._store = store
+        self.name = name
+        self.sort_field = sort_field
+
+    def _row_values(self, entity_id: str, data: Dict[str, Any], index: Dict[str, Any]) -> tuple:
+        values = [entity_id]
+        for field in INDEXED_FIELDS:
+            value = index.get(field, data.get(field))
+            values.append(str(value) if value is not None else None)
+        # Chiave di ordinamento testuale: i timestamp ISO si ordinano cronologicamente
+        sort_key = data.get(self.sort_field) if self.sort_field else None
+        if sort_key is not None and not isinstance(sort_key, str):
+            sort_key = _json_default(sort_key)
+        values.append(sort_key)
+        values.append(dumps(data))
+        return tuple(values)
+
+    def get(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        row = self._store.connection().execute(
+            f"SELECT data FROM {self.name} WHERE id = ?", (entity_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, entity_id: str, data: Dict[str, Any], **index: Any) -> Dict[str, Any]:
+        """
+        Inserisce o sostituisce un'entità. Le colonne indicizzate sono lette dal documento
+        o passate esplicitamente (es. `session_id=...` per i messaggi).
+        """
+        with self._store.transaction() as conn:
+            conn.execute(
+                f"INSERT INTO {self.name} (id, course_id, session_id, user_id, sort_key, data) "
+                f"VALUES (?, ?, ?, ?, ?, ?) "
+                f"ON CONFLICT(id) DO UPDATE SET course_id = excluded.course_id, "
+                f"session_id = excluded.session_id, user_id = excluded.user_id, "
+                f"sort_key = excluded.sort_key, data = excluded.data",
+                self._row_values(entity_id, data, index)
+            )
+        return data
+
+    def update(self, entity_id: str, mutate: Callable[[Dict[str, Any]], Any], **index: Any) -> Optional[Dict[str, Any]]:
+        """
+        Read-modify-write atomico: `mutate` modifica il documento in place (o ne restituisce
+        uno nuovo). Restituisce il documento salvato, o None se l'entità non esiste.
+        """
+        with self._store.transaction() as conn:
+            row = conn.execute(f"SELECT data FROM {self.name} WHERE id = ?", (entity_id,)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            result = mutate(data)
+            if isinstance(result, dict):
+                data = result
+            self.put(entity_id, data, **index)
+            return data
+
+    def delete(self, entity_id: str) -> bool:
+        with self._store.transaction() as conn:
+            return conn.execute(f"DELETE FROM {self.name} WHERE id = ?", (entity_id,)).rowcount > 0
+
+    def delete_where(self, **filters: Any) -> int:
+        clause, params = self._where(filters)
+        with self._store.transaction() as conn:
+            return conn.execute(f"DELETE FROM {self.name}{clause}", params).rowcount
+
+    def find(self, limit: Optional[int] = None, descending: bool = False,
+             since: Optional[str] = None, **filters: Any) -> List[Dict[str, Any]]:
+        """Entità filtrate sulle colonne indicizzate, in ordine di `sort_field` (poi di inserimento)."""
+        clause, params = self._where(filters, since)
+        order = "DESC" if descending else "ASC"
+        sql = f"SELECT data FROM {self.name}{clause} ORDER BY sort_key {order}, rowid {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        rows = self._store.connection().execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self.find()
+
+    def count(self, **filters: Any) -> int:
+        clause, params = self._where(filters)
+        return self._store.connection().execute(f"SELECT COUNT(*) FROM {self.name}{clause}", params).fetchone()[0]
+
+    def _where(self, filters: Dict[str, Any], since: Optional[str] = None):
+        conditions, params = [], []
+        for field, value in filters.items():
+            if field not in INDEXED_FIELDS:
+                raise ValueError(f"Field {field} is not indexed in {self.name}")
+            conditions.append(f"{field} = ?")
+            params.append(str(value))
+        if since is not None:
+            conditions.append("sort_key >= ?")
+            params.append(since)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+class EntityStore(ThreadLocalSQLite):
+    def __init__(self, db_path: Optional[str] = None):
+        super().__init__(db_path or os.getenv("TUTOR_AI_DB_PATH", "data/tutor_ai.db"))
+        self._collections: Dict[str, EntityCollection] = {}
+        self._lock = threading.Lock()
+        with self.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _migrations ("
+                "source TEXT PRIMARY KEY, migrated_at TEXT NOT NULL, records INTEGER NOT NULL)"
+            )
+
+    def collection(self, name: str, sort_field: Optional[str] = None) -> EntityCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is not None:
+                return collection
+            collection = EntityCollection(self, name, sort_field)
+            self._collections[name] = collection
+
+        with self.transaction() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} ("
+                "id TEXT PRIMARY KEY, course_id TEXT, session_id TEXT, user_id TEXT, "
+                "sort_key TEXT, data TEXT NOT NULL)"
+            )
+            for field in INDEXED_FIELDS:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_{field} ON {name} ({field}, sort_key)")
+        return collection
+
+    def migrate_json(self, json_path: str, importer: Callable[[Any], int]) -> int:
+        """
+        Importa una sola volta un file JSON legacy: `importer` riceve il contenuto e scrive
+        le entità (nella stessa transazione); restituisce il numero di record importati.
+        """
+        source = os.path.normpath(json_path)
+        if not os.path.exists(json_path):
+            return 0
+
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM _migrations WHERE source = ?", (source,)).fetchone():
+                return 0
+            try:
+                with open(json_path, "r", encoding="utf-8") as handle:
+                    payload = json.load(handle)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Legacy JSON not migrated", source=source, error=str(e))
+                return 0
+
+            records = importer(payload) or 0
+            conn.execute(
+                "INSERT INTO _migrations (source, migrated_at, records) VALUES (?, ?, ?)",
+                (source, datetime.now().isoformat(), records)
+            )
+
+        logger.info("Migrated legacy JSON into entity store", source=source, records=records)
+        return records
@@ -0,0 +1,144 @@
+"""
+Segmented Event Log - Log append-only di eventi JSONL con rotazione dei segmenti
+
+Ogni evento è una riga JSON aggiunta in coda al segmento del giorno (`YYYY-MM-DD.jsonl`);
+oltre la dimensione massima il giorno prosegue in segmenti numerati (`YYYY-MM-DD.1.jsonl`).
+Scrivere un evento costa una sola append, indipendentemente dallo storico, e le query su
+una finestra temporale leggono solo i segmenti dei giorni interessati.
+
+Configurazione:
+    EVENT_LOG_SEGMENT_MAX_BYTES   dimensione massima di un segmento (default: 16 MB)
+"""
+
+import json
+import os
+import re
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+_SEGMENT_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.jsonl$")
+
+
+class SegmentedEventLog:
+    """Log append-only su file JSONL, un segmento per giorno (più i segmenti di overflow)."""
+
+    def __init__(self, directory: str, max_segment_bytes: Optional[int] = None,
+                 timestamp_field: str = "timestamp"):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes or int(
+            os.getenv("EVENT_LOG_SEGMENT_MAX_BYTES", str(16 * 1024 * 1024))
+        )
+        self.timestamp_field = timestamp_field
+        self._lock = threading.Lock()
+        self._handle: Optional[IO[str]] = None
+        self._handle_segment: Optional[Tuple[str, int]] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self, since: Optional[date] = None) -> List[Tuple[str, int, str]]:
+        """Segmenti (giorno, sequenza, percorso) in ordine cronologico, dal giorno `since` in poi."""
+        found = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.match(name)
+            if not match:
+                continue
+            day, sequence = match.group(1), int(match.group(2) or 0)
+            if since is not None and day < since.isoformat():
+                continue
+            found.append((day, sequence, os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def _segment_path(self, day: str, sequence: int) -> str:
+        name = f"{day}.jsonl" if sequence == 0 else f"{day}.{sequence}.jsonl"
+        return os.path.join(self.directory, name)
+
+    def _open_segment(self, day: str) -> IO[str]:
+        """Handle del segmento corrente per `day`, ruotando quando supera la dimensione massima."""
+        if self._handle_segment is None or self._handle_segment[0] != day:
+            existing = [sequence for seg_day, sequence, _ in self.segments() if seg_day == day]
+            self._switch_segment(day, max(existing) if existing else 0)
+
+        if self._handle.tell() >= self.max_segment_bytes:
+            self._switch_segment(day, self._handle_segment[1] + 1)
+        return self._handle
+
+    def _switch_segment(self, day: str, sequence: int):
+        if self._handle is not None:
+            self._handle.close()
+        self._handle = open(self._segment_path(day, sequence), "a", encoding="utf-8")
+        self._handle_segment = (day, sequence)
+
+    def _event_day(self, event: Dict[str, Any]) -> str:
+        timestamp = event.get(self.timestamp_field)
+        if isinstance(timestamp, datetime):
+            return timestamp.date().isoformat()
+        if isinstance(timestamp, str) and len(timestamp) >= 10:
+            return timestamp[:10]
+        return date.today().isoformat()
+
+    def append(self, event: Dict[str, Any]):
+        """Aggiunge un evento in coda al segmento del suo giorno."""
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            handle = self._open_segment(self._event_day(event))
+            handle.write(line)
+            handle.flush()
+
+    def append_many(self, events: List[Dict[str, Any]]):
+        with self._lock:
+            for event in events:
+                handle = self._open_segment(self._event_day(event))
+                handle.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+            if self._handle is not None:
+                self._handle.flush()
+
+    def read(self, since: Optional[datetime] = None, newest_first: bool = False,
+             predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Eventi con timestamp >= `since` (letti solo dai segmenti dei giorni nella finestra),
+        opzionalmente filtrati da `predicate`.
+        """
+        with self._lock:
+            if self._handle is not None:
+                self._handle.flush()
+        segments = self.segments(since.date() if since else None)
+        if newest_first:
+            segments = list(reversed(segments))
+        cutoff = since.isoformat() if since else None
+
+        for _, _, path in segments:
+            events = self._read_segment(path)
+            if newest_first:
+                events.reverse()
+            for event in events:
+                if cutoff is not None and str(event.get(self.timestamp_field, "")) < cutoff:
+                    continue
+                if predicate is None or predicate(event):
+                    yield event
+
+    def _read_segment(self, path: str) -> List[Dict[str, Any]]:
+        events = []
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    if not line.strip():
+                        continue
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Riga troncata da una scrittura interrotta: la saltiamo
+                        logger.warning("Skipping corrupted event log line", segment=path)
+        except FileNotFoundError:
+            pass
+        return events
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+            self._handle = None
+            self._handle_segment = None
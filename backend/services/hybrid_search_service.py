@@ -3,80 +3,20 @@ Hybrid Search Service - Combina Semantic Search con Keyword Search (BM25)
 Implementazione ottimizzata per testo accademico italiano
 """
 
-import math
+import asyncio
+import hashlib
+import os
 import re
 from typing import List, Dict, Any, Tuple, Optional
-from collections import Counter, defaultdict
+from collections import defaultdict
 import structlog
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 from services.rag_service import RAGService
+from services.bm25_index import BM25Index, BM25IndexRegistry
 
 logger = structlog.get_logger()
 
-class SimpleBM25:
-    """
-    Implementazione semplificata di BM25 senza dipendenze esterne
-    """
-
-    def __init__(self, corpus: List[List[str]], k1: float = 1.2, b: float = 0.75, epsilon: float = 0.25):
-        """
-        Inizializza BM25
-        k1: parametro di saturation del termine frequency
-        b: parametro di normalizzazione della lunghezza del documento
-        epsilon: parametro per smoothing IDF
-        """
-        self.k1 = k1
-        self.b = b
-        self.epsilon = epsilon
-        self.corpus = corpus
-        self.corpus_size = len(corpus)
-        self.avgdl = sum(len(doc) for doc in corpus) / self.corpus_size if self.corpus_size > 0 else 0
-
-        # Calcola IDF scores
-        self.idf = {}
-        self._build_idf()
-
-    def _build_idf(self):
-        """Calcola Inverse Document Frequency scores"""
-        # Conta document frequency per ogni termine
-        df = Counter()
-        for doc in self.corpus:
-            unique_terms = set(doc)
-            df.update(unique_terms)
-
-        # Calcola IDF scores
-        for term in df:
-            idf = math.log((self.corpus_size - df[term] + 0.5) / (df[term] + 0.5))
-            self.idf[term] = idf
-
-        # Applica epsilon smoothing per termini non visti
-        max_idf = max(self.idf.values()) if self.idf else 0.0
-        self.idf["<UNK>"] = math.log(self.corpus_size + 1) - max_idf - self.epsilon
-
-    def get_scores(self, query: List[str]) -> List[float]:
-        """
-        Calcola BM25 scores per la query contro tutti i documenti
-        """
-        scores = []
-
-        for i, doc in enumerate(self.corpus):
-            score = 0.0
-            doc_len = len(doc)
-
-            for term in query:
-                if term in doc:
-                    # Term frequency in document
-                    tf = doc.count(term)
-                    # IDF del termine
-                    idf = self.idf.get(term, self.idf["<UNK>"])
-                    # BM25 formula
-                    score += idf * (tf * (self.k1 + 1)) / (tf + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl))
-
-            scores.append(score)
-
-        return scores
-
 class HybridSearchService:
     """
     Servizio di Hybrid Search che combina:
@@ -87,6 +27,13 @@ class HybridSearchService:
 
     def __init__(self, rag_service: RAGService):
         self.rag_service = rag_service
+        # Indici BM25 per scope (course_id, book_id) con eviction LRU per budget di memoria
+        self.bm25_registry = BM25IndexRegistry(
+            memory_budget_bytes=int(os.getenv("BM25_MEMORY_BUDGET_MB", "256")) * 1024 * 1024
+        )
+        # Chunk letti da ChromaDB per ogni pagina durante la costruzione di un indice
+        self.fetch_page_size = int(os.getenv("BM25_FETCH_PAGE_SIZE", "1000"))
+        # Ultimo scope costruito (compatibilità con il vecchio indice singolo)
         self.bm25_index = None
         self.documents_corpus = []
         self.metadata_mapping = []
@@ -202,53 +149,147 @@ class HybridSearchService:
 
         return final_tokens
 
+    def _fetch_scope_documents(self, course_id: str, book_id: Optional[str] = None) -> Dict[str, List[Any]]:
+        """Tutti i chunk dello scope, letti a pagine (nessun limite fisso sul numero di chunk)"""
+        where = self.rag_service._build_where_filter(course_id, book_id)
+        results: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+        offset = 0
+        while True:
+            page = self.rag_service.collection.get(
+                where=where, limit=self.fetch_page_size, offset=offset,
+                include=["documents", "metadatas"]
+            )
+            page_ids = page.get('ids') or []
+            results["ids"].extend(page_ids)
+            results["documents"].extend(page.get('documents') or [])
+            results["metadatas"].extend(page.get('metadatas') or [])
+            if len(page_ids) < self.fetch_page_size:
+                return results
+            offset += len(page_ids)
+
     def build_bm25_index(self, course_id: str, book_id: Optional[str] = None) -> bool:
         """
-        Costruisce l'indice BM25 per i documenti di un corso
+        Costruisce l'indice BM25 per i documenti di un corso (o di un libro)
+        e lo registra nel registry per-scope
         """
         try:
             logger.info(f"Building BM25 index for course {course_id}")
+            generation = self.bm25_registry.generation(course_id, book_id)
 
             # Recupera tutti i documenti del corso
-            results = self.rag_service.collection.get(
-                where={"course_id": course_id, **({"book_id": book_id} if book_id else {})},
-                limit=10000
-            )
+            results = self._fetch_scope_documents(course_id, book_id)
 
             if not results['documents']:
                 logger.warning(f"No documents found for course {course_id}")
                 return False
 
-            # Preprocessa tutti i documenti per BM25
-            self.documents_corpus = []
-            self.metadata_mapping = []
+            # Preprocessa tutti i documenti per BM25 (con id stabili dei chunk per l'hydration)
+            documents_corpus = []
+            metadata_mapping = []
+            result_ids = results.get('ids') or []
 
-            for doc, metadata in zip(results['documents'], results['metadatas']):
+            for i, (doc, metadata) in enumerate(zip(results['documents'], results['metadatas'])):
                 # Preprocessing specifico per BM25
                 tokens = self.preprocess_italian_text(doc)
                 if tokens:  # Solo documenti con contenuti significativi
-                    self.documents_corpus.append(tokens)
-                    self.metadata_mapping.append(metadata)
+                    documents_corpus.append(tokens)
+                    metadata_mapping.append(self._with_chunk_id(metadata, result_ids, i))
 
-            if not self.documents_corpus:
+            if not documents_corpus:
                 logger.warning(f"No valid documents after preprocessing for course {course_id}")
                 return False
 
             # Crea indice BM25 con parametri ottimizzati per italiano
-            self.bm25_index = SimpleBM25(
-                self.documents_corpus,
+            bm25_index = BM25Index(
+                documents_corpus,
                 k1=1.2,  # Parametri ottimizzati per testo italiano
                 b=0.75,
                 epsilon=0.25
             )
 
-            logger.info(f"BM25 index built successfully with {len(self.documents_corpus)} documents")
+            registered = self.bm25_registry.put(course_id, book_id, {
+                "index": bm25_index,
+                "metadata": metadata_mapping
+            }, generation=generation)
+            if not registered:
+                logger.info("Discarded stale BM25 index (scope invalidated during build)",
+                            course_id=course_id, book_id=book_id)
+                return False
+
+            self.bm25_index = bm25_index
+            self.documents_corpus = documents_corpus
+            self.metadata_mapping = metadata_mapping
+
+            logger.info(f"BM25 index built successfully with {len(documents_corpus)} documents")
             return True
 
         except Exception as e:
             logger.error(f"Error building BM25 index: {e}")
             return False
 
+    def _get_scope_index(self, course_id: str, book_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Restituisce l'indice BM25 dello scope, costruendolo se non è in memoria"""
+        entry = self.bm25_registry.get(course_id, book_id)
+        if entry is None and self.build_bm25_index(course_id, book_id):
+            entry = self.bm25_registry.get(course_id, book_id)
+        return entry
+
+    def invalidate_bm25_scope(self, course_id: str, book_id: Optional[str] = None, rebuild: bool = True):
+        """
+        Invalida gli indici BM25 toccati da indicizzazione/cancellazione di materiali.
+        Gli scope che erano in memoria vengono ricostruiti in background.
+        """
+        removed = self.bm25_registry.invalidate(course_id, book_id)
+        logger.info("Invalidated BM25 scopes", course_id=course_id, book_id=book_id,
+                    scopes=len(removed), rebuild=rebuild)
+        if rebuild:
+            for key in removed:
+                self.bm25_registry.schedule_rebuild(key, self.build_bm25_index)
+
+    @staticmethod
+    def _with_chunk_id(metadata: Dict[str, Any], ids: List[str], position: int) -> Dict[str, Any]:
+        """Copia dei metadati con l'id ChromaDB del chunk (se disponibile)"""
+        enriched = dict(metadata or {})
+        if position < len(ids) and ids[position]:
+            enriched['chunk_id'] = ids[position]
+        return enriched
+
+    @staticmethod
+    def _result_key(metadata: Dict[str, Any]) -> str:
+        """Chiave di identità di un risultato: id del chunk, altrimenti source + chunk_index"""
+        return metadata.get('chunk_id') or (metadata.get('source', '') + str(metadata.get('chunk_index', '')))
+
+    def _hydrate_chunks(self, course_id: str, book_id: Optional[str],
+                        results: List[Tuple[Dict, float]]) -> Dict[str, str]:
+        """
+        Recupera il testo dei chunk con una singola get(ids=...) batch.
+        I risultati senza id (es. cache precedenti) vengono risolti per source/chunk_index.
+        """
+        texts: Dict[str, str] = {}
+        collection = self.rag_service.collection
+        chunk_ids = list(dict.fromkeys(m['chunk_id'] for m, _ in results if m.get('chunk_id')))
+
+        if chunk_ids:
+            fetched = collection.get(ids=chunk_ids, include=["documents"])
+            for chunk_id, document in zip(fetched.get('ids') or [], fetched.get('documents') or []):
+                if document is not None:
+                    texts[chunk_id] = document
+
+        for metadata, _ in results:
+            key = self._result_key(metadata)
+            if metadata.get('chunk_id') or key in texts:
+                continue
+            conditions = [{"course_id": course_id}, {"source": metadata.get('source')},
+                          {"chunk_index": metadata.get('chunk_index')}]
+            if book_id:
+                conditions.append({"book_id": book_id})
+            fetched = collection.get(where={"$and": conditions}, limit=1)
+            documents = fetched.get('documents') or []
+            if documents:
+                texts[key] = documents[0]
+
+        return texts
+
     def semantic_search(self, query: str, course_id: str, book_id: Optional[str] = None, k: int = 10) -> List[Tuple[Dict, float]]:
         """
         Esegue ricerca semantica usando ChromaDB
@@ -257,14 +298,15 @@ class HybridSearchService:
             results = self.rag_service.collection.query(
                 query_embeddings=self.rag_service.embedding_model.encode([query]).tolist(),
                 n_results=k,
-                where={"course_id": course_id, **({"book_id": book_id} if book_id else {})}
+                where=self.rag_service._build_where_filter(course_id, book_id)
             )
 
+            result_ids = (results.get('ids') or [[]])[0] or []
             semantic_results = []
             for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
                 # Calcola score semantico normalizzato (inverso della distanza)
                 semantic_score = 1.0 - (i * 0.1)  # Semplice normalizzazione
-                semantic_results.append((metadata, semantic_score))
+                semantic_results.append((self._with_chunk_id(metadata, result_ids, i), semantic_score))
 
             return semantic_results
 
@@ -272,33 +314,41 @@ class HybridSearchService:
             logger.error(f"Error in semantic search: {e}")
             return []
 
-    def keyword_search(self, query: str, k: int = 10) -> List[Tuple[Dict, float]]:
+    def keyword_search(self, query: str, k: int = 10, course_id: Optional[str] = None,
+                       book_id: Optional[str] = None) -> List[Tuple[Dict, float]]:
         """
-        Esegue ricerca keyword usando BM25
+        Esegue ricerca keyword usando BM25 sull'indice dello scope indicato
+        (senza scope usa l'ultimo indice costruito)
         """
         try:
-            if not self.bm25_index:
+            if course_id:
+                entry = self._get_scope_index(course_id, book_id)
+                bm25_index = entry["index"] if entry else None
+                metadata_mapping = entry["metadata"] if entry else []
+            else:
+                bm25_index = self.bm25_index
+                metadata_mapping = self.metadata_mapping
+
+            if not bm25_index:
                 logger.warning("BM25 index not built")
                 return []
 
             # Espandi query per migliori risultati in italiano
             expanded_query = self.expand_query_italian(query)
 
-            # Esegue ricerca BM25
-            bm25_scores = self.bm25_index.get_scores(expanded_query)
+            # Esegue ricerca BM25 sull'indice invertito (solo documenti con termini della query)
+            top_docs = bm25_index.top_k(expanded_query, k)
+            if not top_docs:
+                return []
 
-            # Normalizza scores e crea risultati
+            # Normalizza scores rispetto al migliore (già ordinati per score decrescente)
+            max_score = top_docs[0][1]
             keyword_results = []
-            max_score = max(bm25_scores) if max(bm25_scores) > 0 else 1
-
-            for idx, score in enumerate(bm25_scores):
-                if score > 0 and idx < len(self.metadata_mapping):
-                    normalized_score = score / max_score
-                    keyword_results.append((self.metadata_mapping[idx], normalized_score))
+            for idx, score in top_docs:
+                if idx < len(metadata_mapping):
+                    keyword_results.append((metadata_mapping[idx], score / max_score))
 
-            # Ordina per score e prendi top k
-            keyword_results.sort(key=lambda x: x[1], reverse=True)
-            return keyword_results[:k]
+            return keyword_results
 
         except Exception as e:
             logger.error(f"Error in keyword search: {e}")
@@ -310,26 +360,22 @@ class HybridSearchService:
         Reciprocal Rank Fusion (RRF) per combinare risultati
         """
         fused_results = defaultdict(float)
+        metadata_by_id: Dict[str, Dict] = {}
 
         # Aggiungi risultati semantici
         for rank, (metadata, score) in enumerate(semantic_results):
-            doc_id = metadata.get('source', '') + str(metadata.get('chunk_index', ''))
+            doc_id = self._result_key(metadata)
             fused_results[doc_id] += 1.0 / (k + rank + 1)
+            metadata_by_id.setdefault(doc_id, metadata)
 
         # Aggiungi risultati keyword
         for rank, (metadata, score) in enumerate(keyword_results):
-            doc_id = metadata.get('source', '') + str(metadata.get('chunk_index', ''))
+            doc_id = self._result_key(metadata)
             fused_results[doc_id] += 1.0 / (k + rank + 1)
+            metadata_by_id.setdefault(doc_id, metadata)
 
         # Converti in lista di risultati
-        final_results = []
-        for doc_id, rrf_score in fused_results.items():
-            # Trova i metadati corrispondenti
-            for metadata, _ in semantic_results + keyword_results:
-                current_id = metadata.get('source', '') + str(metadata.get('chunk_index', ''))
-                if current_id == doc_id:
-                    final_results.append((metadata, rrf_score))
-                    break
+        final_results = [(metadata_by_id[doc_id], rrf_score) for doc_id, rrf_score in fused_results.items()]
 
         # Ordina per RRF score
         final_results.sort(key=lambda x: x[1], reverse=True)
@@ -345,7 +391,7 @@ class HybridSearchService:
 
         # Aggiungi risultati semantici
         for metadata, semantic_score in semantic_results:
-            doc_id = metadata.get('source', '') + str(metadata.get('chunk_index', ''))
+            doc_id = self._result_key(metadata)
             results_map[doc_id] = {
                 'metadata': metadata,
                 'semantic_score': semantic_score,
@@ -354,7 +400,7 @@ class HybridSearchService:
 
         # Aggiungi/aggiorna risultati keyword
         for metadata, keyword_score in keyword_results:
-            doc_id = metadata.get('source', '') + str(metadata.get('chunk_index', ''))
+            doc_id = self._result_key(metadata)
             if doc_id in results_map:
                 results_map[doc_id]['keyword_score'] = keyword_score
             else:
@@ -383,12 +429,11 @@ class HybridSearchService:
         Esegue ricerca hybrid combinando semantic e keyword search
         """
         try:
-            # Verifica che l'indice BM25 sia costruito
-            if not self.bm25_index:
-                if not self.build_bm25_index(course_id, book_id):
-                    # Fallback a solo semantic search
-                    logger.warning("BM25 index failed, falling back to semantic search only")
-                    return await self.rag_service.retrieve_context(query, course_id, book_id, k)
+            # Verifica che l'indice BM25 dello scope sia disponibile
+            if self._get_scope_index(course_id, book_id) is None:
+                # Fallback a solo semantic search
+                logger.warning("BM25 index failed, falling back to semantic search only")
+                return await self.rag_service.retrieve_context(query, course_id, book_id, k)
 
             logger.info(f"Executing hybrid search for query: '{query}'")
 
@@ -398,7 +443,7 @@ class HybridSearchService:
                     self.semantic_search, query, course_id, book_id, k * 2
                 )
                 keyword_future = executor.submit(
-                    self.keyword_search, query, k * 2
+                    self.keyword_search, query, k * 2, course_id, book_id
                 )
 
                 semantic_results = semantic_future.result()
@@ -417,31 +462,21 @@ class HybridSearchService:
             context_texts = []
             sources = []
 
-            # Recupera i documenti originali
-            doc_ids = []
-            for metadata, score in final_results:
-                doc_id = metadata.get('source', '') + str(metadata.get('chunk_index', ''))
-                doc_ids.append(doc_id)
-
-            if doc_ids:
+            # Recupera i testi originali per id con una sola chiamata batch
+            if final_results:
                 try:
-                    original_results = self.rag_service.collection.get(
-                        where={"course_id": course_id, **({"book_id": book_id} if book_id else {})},
-                        limit=1000
-                    )
-
+                    chunk_texts = self._hydrate_chunks(course_id, book_id, final_results)
                     for metadata, score in final_results:
-                        for i, (orig_doc, orig_metadata) in enumerate(zip(original_results['documents'], original_results['metadatas'])):
-                            if (orig_metadata.get('source') == metadata.get('source') and
-                                orig_metadata.get('chunk_index') == metadata.get('chunk_index')):
-                                context_texts.append(orig_doc)
-                                sources.append({
-                                    "source": metadata.get('source', 'Unknown'),
-                                    "chunk_index": metadata.get('chunk_index', 0),
-                                    "relevance_score": score,
-                                    "search_type": "hybrid"
-                                })
-                                break
+                        text = chunk_texts.get(self._result_key(metadata))
+                        if text is None:
+                            continue
+                        context_texts.append(text)
+                        sources.append({
+                            "source": metadata.get('source', 'Unknown'),
+                            "chunk_index": metadata.get('chunk_index', 0),
+                            "relevance_score": score,
+                            "search_type": "hybrid"
+                        })
                 except Exception as e:
                     logger.error(f"Error retrieving original documents: {e}")
 
@@ -491,11 +526,11 @@ class HybridSearchService:
             logger.warning(f"Invalid fusion method: {method}")
 
     def _init_cache_service(self):
-        """Inizializza il servizio di cache"""
+        """Inizializza il servizio di cache (istanza condivisa con RAGService)"""
         if self.cache_service is None:
             try:
-                from services.cache_service import RedisCacheService
-                self.cache_service = RedisCacheService()
+                from services.service_container import get_cache
+                self.cache_service = get_cache()
                 logger.info("HybridSearch cache service initialized")
             except Exception as e:
                 logger.error(f"Failed to initialize HybridSearch cache service: {e}")
@@ -507,7 +542,6 @@ class HybridSearchService:
         """
         Genera cache key per risultati hybrid search
         """
-        import hashlib
         key_components = [
             f"hybrid:{hashlib.md5(query.encode()).hexdigest()[:16]}",
             f"course:{course_id}",
@@ -521,16 +555,38 @@ class HybridSearchService:
 
         return ":".join(key_components)
 
-    async def keyword_search_cached(self, query: str, k: int = 10) -> List[Tuple[Dict, float]]:
+    @staticmethod
+    def _semantic_cache_key(query: str, course_id: str, book_id: Optional[str], k: int) -> str:
+        cache_key = f"semantic:{hashlib.md5(query.encode()).hexdigest()[:16]}:course:{course_id}:k:{k}"
+        if book_id:
+            cache_key += f":book:{book_id}"
+        return cache_key
+
+    @staticmethod
+    def _keyword_cache_key(query: str, course_id: Optional[str], book_id: Optional[str], k: int) -> str:
+        cache_key = f"bm25:{hashlib.md5(query.encode()).hexdigest()[:16]}:course:{course_id}:k:{k}"
+        if book_id:
+            cache_key += f":book:{book_id}"
+        return cache_key
+
+    async def _cache_search_result(self, cache_key: str, result: Any, course_id: Optional[str],
+                                   book_id: Optional[str]):
+        from services.cache_service import CacheType, scope_cache_tags
+
+        tags = scope_cache_tags(course_id, book_id) if course_id else None
+        await self.cache_service.set(CacheType.HYBRAR_SEARCH, cache_key, result,
+                                     custom_ttl=1800, tags=tags)  # 30 min
+
+    async def keyword_search_cached(self, query: str, k: int = 10, course_id: Optional[str] = None,
+                                    book_id: Optional[str] = None) -> List[Tuple[Dict, float]]:
         """
         Esegue ricerca keyword BM25 con cache
         """
         try:
             self._init_cache_service()
+            cache_key = self._keyword_cache_key(query, course_id, book_id, k)
 
             if self.cache_service:
-                cache_key = f"bm25:{hashlib.md5(query.encode()).hexdigest()[:16]}:k:{k}"
-
                 # Tenta cache
                 from services.cache_service import CacheType
                 cached_result = await self.cache_service.get(CacheType.HYBRAR_SEARCH, cache_key)
@@ -539,12 +595,12 @@ class HybridSearchService:
                     logger.debug("BM25 cache hit", query=query[:30])
                     return cached_result
 
-            # Cache miss - esegui ricerca
-            result = self.keyword_search(query, k)
+            # Cache miss - esegui ricerca fuori dall'event loop
+            result = await asyncio.to_thread(self.keyword_search, query, k, course_id, book_id)
 
             # Salva in cache
             if self.cache_service and result:
-                await self.cache_service.set(CacheType.HYBRAR_SEARCH, cache_key, result, ttl=1800)  # 30 min
+                await self._cache_search_result(cache_key, result, course_id, book_id)
                 logger.debug("BM25 result cached", query=query[:30])
 
             return result
@@ -552,7 +608,7 @@ class HybridSearchService:
         except Exception as e:
             logger.error(f"Error in cached keyword search: {e}")
             # Fallback a ricerca diretta
-            return self.keyword_search(query, k)
+            return self.keyword_search(query, k, course_id, book_id)
 
     async def semantic_search_cached(self, query: str, course_id: str, book_id: Optional[str] = None,
                                   k: int = 10) -> List[Tuple[Dict, float]]:
@@ -561,12 +617,9 @@ class HybridSearchService:
         """
         try:
             self._init_cache_service()
+            cache_key = self._semantic_cache_key(query, course_id, book_id, k)
 
             if self.cache_service:
-                cache_key = self._generate_hybrid_cache_key(
-                    query, course_id, book_id, k, self.semantic_weight, self.keyword_weight, self.fusion_method
-                )
-
                 # Tenta cache
                 from services.cache_service import CacheType
                 cached_result = await self.cache_service.get(CacheType.HYBRAR_SEARCH, cache_key)
@@ -575,12 +628,12 @@ class HybridSearchService:
                     logger.debug("Semantic search cache hit", query=query[:30])
                     return cached_result
 
-            # Cache miss - esegui ricerca
-            result = self.semantic_search(query, course_id, book_id, k)
+            # Cache miss - esegui ricerca fuori dall'event loop
+            result = await asyncio.to_thread(self.semantic_search, query, course_id, book_id, k)
 
             # Salva in cache
             if self.cache_service and result:
-                await self.cache_service.set(CacheType.HYBRAR_SEARCH, cache_key, result, ttl=1800)  # 30 min
+                await self._cache_search_result(cache_key, result, course_id, book_id)
                 logger.debug("Semantic search result cached", query=query[:30])
 
             return result
@@ -603,33 +656,41 @@ class HybridSearchService:
             key_weight = keyword_weight or self.keyword_weight
             fusion_meth = fusion_method or self.fusion_method
 
+            self._init_cache_service()
+
             # Genera cache key completo
-            if self.cache_service:
-                cache_key = self._generate_hybrid_cache_key(
-                    query, course_id, book_id, k, sem_weight, key_weight, fusion_meth
-                )
+            cache_key = self._generate_hybrid_cache_key(
+                query, course_id, book_id, k, sem_weight, key_weight, fusion_meth
+            )
+            semantic_results = keyword_results = None
 
-                # Tenta cache completo
+            if self.cache_service:
+                # Risultato completo e componenti intermedi in un solo round-trip
                 from services.cache_service import CacheType
-                cached_result = await self.cache_service.get(CacheType.HYBRAR_SEARCH, cache_key)
+                cached_result, semantic_results, keyword_results = await self.cache_service.mget(
+                    CacheType.HYBRAR_SEARCH,
+                    [
+                        cache_key,
+                        self._semantic_cache_key(query, course_id, book_id, k * 2),
+                        self._keyword_cache_key(query, course_id, book_id, k * 2)
+                    ]
+                )
 
                 if cached_result is not None:
                     logger.info("Hybrid search cache hit", query=query[:30], cache_key=cache_key[:32])
                     cached_result["cached"] = True
                     return cached_result
 
-            # Cache miss - esegui ricerca completa con caching intermedio
-            with ThreadPoolExecutor(max_workers=2) as executor:
-                # Esegue ricerche con caching
-                semantic_future = executor.submit(
-                    lambda: asyncio.run(self.semantic_search_cached(query, course_id, book_id, k * 2))
-                )
-                keyword_future = executor.submit(
-                    lambda: asyncio.run(self.keyword_search_cached(query, k * 2))
+            # Cache miss - esegue in parallelo solo le ricerche non già in cache
+            if semantic_results is None and keyword_results is None:
+                semantic_results, keyword_results = await asyncio.gather(
+                    self.semantic_search_cached(query, course_id, book_id, k * 2),
+                    self.keyword_search_cached(query, k * 2, course_id, book_id)
                 )
-
-                semantic_results = semantic_future.result()
-                keyword_results = keyword_future.result()
+            elif semantic_results is None:
+                semantic_results = await self.semantic_search_cached(query, course_id, book_id, k * 2)
+            elif keyword_results is None:
+                keyword_results = await self.keyword_search_cached(query, k * 2, course_id, book_id)
 
             # Fusion dei risultati
             if fusion_meth == "rrf":
@@ -644,7 +705,7 @@ class HybridSearchService:
 
             # Salva in cache
             if self.cache_service and final_result.get("text"):
-                await self.cache_service.set(CacheType.HYBRAR_SEARCH, cache_key, final_result, ttl=1800)  # 30 min
+                await self._cache_search_result(cache_key, final_result, course_id, book_id)
                 logger.info("Hybrid search result cached", query=query[:30], cache_key=cache_key[:32])
 
             final_result["cached"] = False
@@ -665,42 +726,31 @@ class HybridSearchService:
         context_texts = []
         sources = []
 
-        # Recupera i documenti originali
+        # Recupera i testi originali per id con una sola chiamata batch
         if hybrid_results:
-            doc_ids = []
-            for metadata, score in hybrid_results:
-                doc_id = metadata.get('source', '') + str(metadata.get('chunk_index', ''))
-                doc_ids.append(doc_id)
-
-            if doc_ids:
-                try:
-                    original_results = self.rag_service.collection.get(
-                        where={"course_id": course_id, **({"book_id": book_id} if book_id else {})},
-                        limit=1000
-                    )
-
-                    for metadata, score in hybrid_results:
-                        for i, (orig_doc, orig_metadata) in enumerate(zip(original_results['documents'], original_results['metadatas'])):
-                            if (orig_metadata.get('source') == metadata.get('source') and
-                                orig_metadata.get('chunk_index') == metadata.get('chunk_index')):
-                                context_texts.append(orig_doc)
-                                sources.append({
-                                    "source": metadata.get('source', 'Unknown'),
-                                    "chunk_index": metadata.get('chunk_index', 0),
-                                    "relevance_score": score,
-                                    "search_type": "hybrid",
-                                    "hybrid_components": {
-                                        "semantic_available": any(orig_metadata.get('source') == metadata.get('source') and
-                                                             orig_metadata.get('chunk_index') == metadata.get('chunk_index')
-                                                             for metadata, _ in semantic_results),
-                                        "keyword_available": any(orig_metadata.get('source') == metadata.get('source') and
-                                                             orig_metadata.get('chunk_index') == metadata.get('chunk_index')
-                                                             for metadata, _ in keyword_results)
-                                    }
-                                })
-                                break
-                except Exception as e:
-                    logger.error(f"Error retrieving original documents: {e}")
+            try:
+                chunk_texts = self._hydrate_chunks(course_id, book_id, hybrid_results)
+                semantic_keys = {self._result_key(metadata) for metadata, _ in semantic_results}
+                keyword_keys = {self._result_key(metadata) for metadata, _ in keyword_results}
+
+                for metadata, score in hybrid_results:
+                    key = self._result_key(metadata)
+                    text = chunk_texts.get(key)
+                    if text is None:
+                        continue
+                    context_texts.append(text)
+                    sources.append({
+                        "source": metadata.get('source', 'Unknown'),
+                        "chunk_index": metadata.get('chunk_index', 0),
+                        "relevance_score": score,
+                        "search_type": "hybrid",
+                        "hybrid_components": {
+                            "semantic_available": key in semantic_keys,
+                            "keyword_available": key in keyword_keys
+                        }
+                    })
+            except Exception as e:
+                logger.error(f"Error retrieving original documents: {e}")
 
         if not context_texts:
             return {
@@ -730,6 +780,7 @@ class HybridSearchService:
         base_stats = {
             "bm25_index_built": self.bm25_index is not None,
             "indexed_documents": len(self.documents_corpus),
+            "bm25_registry": self.bm25_registry.stats(),
             "semantic_weight": self.semantic_weight,
             "keyword_weight": self.keyword_weight,
             "fusion_method": self.fusion_method,
@@ -743,27 +794,20 @@ class HybridSearchService:
 
         return base_stats
 
-    async def invalidate_hybrid_cache(self, course_id: str, book_id: Optional[str] = None):
+    async def invalidate_hybrid_cache(self, course_id: str, book_id: Optional[str] = None) -> int:
         """
-        Invalida cache hybrid per corso specifico
+        Invalida cache hybrid per corso specifico (tag set, nessuna scansione del keyspace)
         """
         try:
             self._init_cache_service()
 
             if self.cache_service:
-                # Pattern per invalidazione cache hybrid
-                pattern = f"tutor_ai:hybrid_search:*:course:{course_id}:*"
-                if book_id:
-                    pattern = f"tutor_ai:hybrid_search:*:course:{course_id}:*:book:{book_id}:*"
-
-                # Includi anche BM25 cache
-                bm25_pattern = "tutor_ai:hybrid_search:bm25:*"
-
-                # Esegui invalidazione
-                await self.cache_service.invalidate_by_pattern(pattern)
-                await self.cache_service.invalidate_by_pattern(bm25_pattern)
+                from services.cache_service import scope_invalidation_tags
 
-                logger.info("Invalidated hybrid search cache", course_id=course_id, book_id=book_id)
+                deleted = await self.cache_service.invalidate_tags(scope_invalidation_tags(course_id, book_id))
+                logger.info("Invalidated hybrid search cache", course_id=course_id, book_id=book_id, deleted=deleted)
+                return deleted
 
         except Exception as e:
-            logger.error(f"Error invalidating hybrid search cache: {e}")
\ No newline at end of file
+            logger.error(f"Error invalidating hybrid search cache: {e}")
+        return 0
\ No newline at end of file
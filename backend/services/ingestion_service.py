@@ -0,0 +1,86 @@
+"""
+Ingestion Service - Indicizzazione dei PDF caricati in background
+
+Gli upload vengono salvati su disco e restituiscono subito un task PDF_INDEXING
+(consultabile via /tasks/{task_id}); estrazione del testo, chunking ed embedding
+girano in un pool di worker limitato (INGESTION_MAX_WORKERS), fuori dall'event loop.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import structlog
+
+from services.background_task_service import BackgroundTaskService, TaskType, background_task_service
+
+logger = structlog.get_logger()
+
+
+class IngestionService:
+    def __init__(self, task_service: BackgroundTaskService = None, max_workers: Optional[int] = None):
+        self.task_service = task_service or background_task_service
+        self.max_workers = max_workers or int(os.getenv("INGESTION_MAX_WORKERS", "2"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf-ingestion")
+
+    def enqueue_pdf_indexing(self, rag_service, file_path: str, course_id: str, book_id: Optional[str] = None,
+                             user_id: Optional[str] = None, remove_on_failure: bool = False,
+                             metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Crea un task PDF_INDEXING e lo accoda al pool di worker.
+        Con `remove_on_failure` il file caricato viene eliminato se l'indicizzazione fallisce.
+        """
+        task_metadata = {
+            "file_path": file_path,
+            "filename": os.path.basename(file_path),
+            "book_id": book_id,
+            **(metadata or {})
+        }
+        task_id = self.task_service.create_task(
+            TaskType.PDF_INDEXING,
+            course_id=course_id,
+            user_id=user_id,
+            metadata=task_metadata
+        )
+        self.task_service.submit_task(
+            task_id,
+            self._run_indexing(task_id, rag_service, file_path, course_id, book_id, remove_on_failure)
+        )
+        return task_id
+
+    async def _run_indexing(self, task_id: str, rag_service, file_path: str, course_id: str,
+                            book_id: Optional[str], remove_on_failure: bool) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        self.task_service.update_task_progress(task_id, 0.0, "In attesa di un worker di indicizzazione")
+
+        def report(progress: float, message: str):
+            # Chiamato dal thread worker: l'aggiornamento avviene sull'event loop
+            loop.call_soon_threadsafe(self.task_service.update_task_progress, task_id, progress, message)
+
+        try:
+            result = await loop.run_in_executor(
+                self._executor,
+                lambda: rag_service.index_pdf_sync(file_path, course_id, book_id, progress_callback=report)
+            )
+        except Exception as e:
+            logger.error("PDF indexing task failed", task_id=task_id, file_path=file_path, error=str(e))
+            if remove_on_failure and os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        # Le risposte in cache per questo corso/libro non riflettono il nuovo materiale
+        invalidate_cache = getattr(rag_service, "invalidate_course_cache", None)
+        if invalidate_cache is not None:
+            await invalidate_cache(course_id, book_id)
+
+        logger.info("PDF indexing task completed", task_id=task_id, file_path=file_path,
+                    chunks=result.get("chunks_indexed") if result else None)
+        return result or {}
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait)
+
+
+# Global instance
+ingestion_service = IngestionService()
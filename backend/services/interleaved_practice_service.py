@@ -12,6 +12,10 @@ from datetime import datetime, timezone, timedelta
 import uuid
 import numpy as np
 from collections import defaultdict, Counter
+from services.concept_similarity import (
+    ConceptSimilarityEngine, abs_difference_matrix, pair_dict, top_k_neighbors, upper_pairs
+)
+from services.service_container import service_container
 
 class InterleavedPracticeScheduler:
     """
@@ -40,6 +44,12 @@ class InterleavedPracticeScheduler:
             "sequential": 0.4
         }
 
+        # Shared vectorized similarity: category, tags, difficulty, name words (+ embeddings)
+        self.similarity_engine = ConceptSimilarityEngine(
+            category_weight=0.3, tag_weight=0.4, difficulty_weight=0.3, name_weight=0.2, embedding_weight=0.2
+        )
+        self.nearest_concepts_count = 3
+
         # Learning effectiveness factors
         self.interleaving_benefits = {
             "concept_discrimination": 0.25,
@@ -112,8 +122,10 @@ class InterleavedPracticeScheduler:
         try:
             # Extract concept metadata
             concept_data = {}
+            concept_embeddings = {}
             for concept in concepts:
                 concept_id = concept.get("id", str(uuid.uuid4()))
+                concept_embeddings[concept_id] = concept.get("embedding")
                 concept_data[concept_id] = {
                     "name": concept.get("name", ""),
                     "difficulty": concept.get("difficulty", 0.5),
@@ -124,20 +136,20 @@ class InterleavedPracticeScheduler:
                     "tags": concept.get("tags", [])
                 }
 
-            # Calculate concept similarities
-            similarity_matrix = await self._calculate_concept_similarities(concept_data)
+            # Encode concepts once and compute all pairwise similarities as a matrix
+            concept_ids = list(concept_data.keys())
+            similarity = await self._calculate_concept_similarities(concept_data, concept_embeddings)
 
             # Identify optimal interleaving pairs
-            interleaving_pairs = await self._identify_interleaving_pairs(
-                concept_data, similarity_matrix
-            )
+            interleaving_pairs = await self._identify_interleaving_pairs(concept_data, similarity)
 
             # Determine concept groupings
-            concept_groups = await self._group_concepts(concept_data, similarity_matrix)
+            concept_groups = await self._group_concepts(concept_data, similarity)
 
             return {
                 "concepts": concept_data,
-                "similarity_matrix": similarity_matrix,
+                "similarity_matrix": pair_dict(concept_ids, similarity),
+                "nearest_concepts": top_k_neighbors(concept_ids, similarity, self.nearest_concepts_count),
                 "interleaving_pairs": interleaving_pairs,
                 "concept_groups": concept_groups,
                 "total_concepts": len(concepts),
@@ -149,84 +161,58 @@ class InterleavedPracticeScheduler:
             print(f"Error analyzing concepts: {e}")
             return {"concepts": {}, "similarity_matrix": {}, "interleaving_pairs": [], "concept_groups": []}
 
-    async def _calculate_concept_similarities(self, concepts: Dict[str, Any]) -> Dict[str, float]:
-        """Calculate similarity scores between concepts"""
+    async def _calculate_concept_similarities(self, concepts: Dict[str, Any],
+                                            embeddings: Optional[Dict[str, List[float]]] = None) -> np.ndarray:
+        """
+        Calculate the (n x n) similarity matrix between concepts, in `concepts` order.
+
+        Category match, tag and name-word Jaccard overlap and difficulty proximity are
+        combined with the same weights as the pairwise formula; embeddings contribute
+        only when every concept provides one.
+        """
         try:
-            similarities = {}
             concept_ids = list(concepts.keys())
-
-            for i, concept1_id in enumerate(concept_ids):
-                for j, concept2_id in enumerate(concept_ids[i+1:], i+1):
-                    concept1 = concepts[concept1_id]
-                    concept2 = concepts[concept2_id]
-
-                    # Calculate similarity based on multiple factors
-                    similarity = 0.0
-
-                    # Category similarity
-                    if concept1["category"] == concept2["category"]:
-                        similarity += 0.3
-
-                    # Tag overlap
-                    tags1 = set(concept1["tags"])
-                    tags2 = set(concept2["tags"])
-                    if tags1 and tags2:
-                        jaccard_similarity = len(tags1 & tags2) / len(tags1 | tags2)
-                        similarity += 0.4 * jaccard_similarity
-
-                    # Difficulty similarity (close difficulty = more interleavable)
-                    difficulty_diff = abs(concept1["difficulty"] - concept2["difficulty"])
-                    difficulty_similarity = 1.0 - min(difficulty_diff, 1.0)
-                    similarity += 0.3 * difficulty_similarity
-
-                    # Concept name similarity (simple heuristic)
-                    name1_words = set(concept1["name"].lower().split())
-                    name2_words = set(concept2["name"].lower().split())
-                    if name1_words and name2_words:
-                        name_similarity = len(name1_words & name2_words) / len(name1_words | name2_words)
-                        similarity += 0.2 * name_similarity
-
-                    similarities[f"{concept1_id}-{concept2_id}"] = min(similarity, 1.0)
-
-            return similarities
+            embedding_matrix = None
+            if embeddings and all(embeddings.get(concept_id) is not None for concept_id in concept_ids):
+                vectors = [embeddings[concept_id] for concept_id in concept_ids]
+                if len({len(vector) for vector in vectors}) == 1:
+                    embedding_matrix = np.asarray(vectors, dtype=np.float64)
+
+            return self.similarity_engine.similarity_matrix(
+                [concepts[concept_id] for concept_id in concept_ids], embeddings=embedding_matrix
+            )
 
         except Exception as e:
             print(f"Error calculating similarities: {e}")
-            return {}
+            return np.zeros((len(concepts), len(concepts)))
 
     async def _identify_interleaving_pairs(self, concepts: Dict[str, Any],
-                                        similarities: Dict[str, float]) -> List[Dict[str, Any]]:
+                                        similarity: np.ndarray) -> List[Dict[str, Any]]:
         """Identify optimal concept pairs for interleaving"""
         try:
-            pairs = []
             concept_ids = list(concepts.keys())
+            difficulty = [concepts[concept_id]["difficulty"] for concept_id in concept_ids]
+            mastery = [concepts[concept_id]["mastery_level"] for concept_id in concept_ids]
+            suitability = self._calculate_interleaving_suitability(similarity, difficulty, mastery)
 
-            for i, concept1_id in enumerate(concept_ids):
-                for j, concept2_id in enumerate(concept_ids[i+1:], i+1):
-                    similarity_key = f"{concept1_id}-{concept2_id}"
-                    reverse_key = f"{concept2_id}-{concept1_id}"
+            rows, cols = upper_pairs(similarity, suitability > 0.5)  # Threshold for good interleaving
 
-                    similarity = similarities.get(similarity_key, similarities.get(reverse_key, 0.0))
+            # Sort by suitability score (stable: ties keep concept order)
+            order = np.argsort(-suitability[rows, cols], kind="stable")
 
-                    # Determine interleaving suitability
-                    suitability = await self._calculate_interleaving_suitability(
-                        concepts[concept1_id], concepts[concept2_id], similarity
-                    )
-
-                    if suitability > 0.5:  # Threshold for good interleaving
-                        pairs.append({
-                            "concept1_id": concept1_id,
-                            "concept2_id": concept2_id,
-                            "similarity": similarity,
-                            "suitability": suitability,
-                            "interleaving_type": self._determine_interleaving_type(similarity),
-                            "recommended_spacing": self._calculate_recommended_spacing(
-                                concepts[concept1_id], concepts[concept2_id]
-                            )
-                        })
-
-            # Sort by suitability score
-            pairs.sort(key=lambda x: x["suitability"], reverse=True)
+            pairs = []
+            for i, j in zip(rows[order].tolist(), cols[order].tolist()):
+                concept1 = concepts[concept_ids[i]]
+                concept2 = concepts[concept_ids[j]]
+                pair_similarity = float(similarity[i, j])
+                pairs.append({
+                    "concept1_id": concept_ids[i],
+                    "concept2_id": concept_ids[j],
+                    "similarity": pair_similarity,
+                    "suitability": float(suitability[i, j]),
+                    "interleaving_type": self._determine_interleaving_type(pair_similarity),
+                    "recommended_spacing": self._calculate_recommended_spacing(concept1, concept2)
+                })
 
             return pairs
 
@@ -234,42 +220,28 @@ class InterleavedPracticeScheduler:
             print(f"Error identifying interleaving pairs: {e}")
             return []
 
-    async def _calculate_interleaving_suitability(self, concept1: Dict[str, Any],
-                                                concept2: Dict[str, Any],
-                                                similarity: float) -> float:
-        """Calculate how suitable two concepts are for interleaving"""
-        try:
-            suitability = 0.0
-
-            # Similarity factor (moderate similarity is best for interleaving)
-            if 0.3 <= similarity <= 0.7:  # Sweet spot for interleaving
-                suitability += 0.4
-            elif similarity > 0.7:
-                suitability += 0.2  # Too similar might cause confusion
-            else:
-                suitability += 0.1  # Too different might not benefit from interleaving
-
-            # Difficulty difference (moderate difference is beneficial)
-            difficulty_diff = abs(concept1["difficulty"] - concept2["difficulty"])
-            if 0.2 <= difficulty_diff <= 0.5:
-                suitability += 0.3
-            elif difficulty_diff > 0.5:
-                suitability += 0.2
-            else:
-                suitability += 0.1
-
-            # Mastery level difference (interleave practiced with less practiced)
-            mastery_diff = abs(concept1["mastery_level"] - concept2["mastery_level"])
-            if 0.2 <= mastery_diff <= 0.6:
-                suitability += 0.3
-            elif mastery_diff > 0.6:
-                suitability += 0.2
-
-            return min(suitability, 1.0)
-
-        except Exception as e:
-            print(f"Error calculating suitability: {e}")
-            return 0.0
+    def _calculate_interleaving_suitability(self, similarity: np.ndarray, difficulty: List[float],
+                                            mastery: List[float]) -> np.ndarray:
+        """Calculate how suitable each pair of concepts is for interleaving"""
+        # Similarity factor (moderate similarity is best for interleaving; too similar
+        # might cause confusion, too different might not benefit from interleaving)
+        suitability = np.select(
+            [(similarity >= 0.3) & (similarity <= 0.7), similarity > 0.7], [0.4, 0.2], default=0.1
+        )
+
+        # Difficulty difference (moderate difference is beneficial)
+        difficulty_diff = abs_difference_matrix(difficulty)
+        suitability = suitability + np.select(
+            [(difficulty_diff >= 0.2) & (difficulty_diff <= 0.5), difficulty_diff > 0.5], [0.3, 0.2], default=0.1
+        )
+
+        # Mastery level difference (interleave practiced with less practiced)
+        mastery_diff = abs_difference_matrix(mastery)
+        suitability = suitability + np.select(
+            [(mastery_diff >= 0.2) & (mastery_diff <= 0.6), mastery_diff > 0.6], [0.3, 0.2], default=0.0
+        )
+
+        return np.minimum(suitability, 1.0)
 
     def _determine_interleaving_type(self, similarity: float) -> str:
         """Determine the type of interleaving based on similarity"""
@@ -293,34 +265,34 @@ class InterleavedPracticeScheduler:
         return int(spacing)
 
     async def _group_concepts(self, concepts: Dict[str, Any],
-                            similarities: Dict[str, float]) -> List[List[str]]:
+                            similarity: np.ndarray) -> List[List[str]]:
         """Group concepts for optimal interleaving"""
         try:
-            # Simple clustering based on similarities
+            # Greedy clustering: each group grows with the next ungrouped concept that is
+            # similar to any of its members, up to the maximum group size
+            concept_ids = list(concepts.keys())
+            linked = similarity >= 0.4  # Similarity threshold for grouping
+            grouped = np.zeros(len(concept_ids), dtype=bool)
             groups = []
-            ungrouped = set(concepts.keys())
-
-            while ungrouped:
-                current_group = [ungrouped.pop()]
 
-                # Find similar concepts to add to current group
-                for concept_id in list(ungrouped):
-                    is_similar = False
+            for seed in range(len(concept_ids)):
+                if grouped[seed]:
+                    continue
+                grouped[seed] = True
+                members = [seed]
+                position = seed
 
-                    for group_concept in current_group:
-                        similarity_key = f"{concept_id}-{group_concept}"
-                        reverse_key = f"{group_concept}-{concept_id}"
-                        similarity = similarities.get(similarity_key, similarities.get(reverse_key, 0.0))
-
-                        if similarity >= 0.4:  # Similarity threshold for grouping
-                            is_similar = True
-                            break
-
-                    if is_similar and len(current_group) < 3:  # Max group size
-                        current_group.append(concept_id)
-                        ungrouped.remove(concept_id)
+                while len(members) < 3:  # Max group size
+                    candidates = np.flatnonzero(
+                        ~grouped[position + 1:] & linked[members, position + 1:].any(axis=0)
+                    )
+                    if candidates.size == 0:
+                        break
+                    position += 1 + int(candidates[0])
+                    grouped[position] = True
+                    members.append(position)
 
-                groups.append(current_group)
+                groups.append([concept_ids[index] for index in members])
 
             return groups
 
@@ -746,4 +718,4 @@ class InterleavedPracticeScheduler:
             return {"success": False, "error": str(e)}
 
 # Initialize the interleaved practice service
-interleaved_practice_service = InterleavedPracticeScheduler()
\ No newline at end of file
+interleaved_practice_service = service_container.lazy("interleaved_practice")
\ No newline at end of file
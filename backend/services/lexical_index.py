@@ -0,0 +1,92 @@
+"""
+Lexical Index - Matrice sparsa termine/chunk per lo scoring lessicale vettorializzato
+
+Sostituisce il calcolo per-chunk basato su Counter: i vettori di frequenza dei chunk
+vengono calcolati una sola volta e memorizzati in formato sparso (CSC, colonna = termine),
+così lo scoring coseno di una query contro tutti i chunk diventa un singolo prodotto
+matrice sparsa-vettore. I punteggi sono identici a quelli del coseno su Counter.
+"""
+
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class LexicalIndex:
+    """Matrice sparsa (chunk x vocabolario) con norme precalcolate."""
+
+    def __init__(self, documents: Iterable[str], tokenizer: Callable[[str], List[str]]):
+        self.tokenizer = tokenizer
+        self.vocabulary: Dict[str, int] = {}
+
+        doc_ids: List[int] = []
+        term_ids: List[int] = []
+        counts: List[float] = []
+        doc_count = 0
+
+        for doc_id, text in enumerate(documents):
+            doc_count += 1
+            for term, count in Counter(tokenizer(text or "")).items():
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                doc_ids.append(doc_id)
+                term_ids.append(term_id)
+                counts.append(float(count))
+
+        self.num_documents = doc_count
+        rows = np.asarray(doc_ids, dtype=np.int32)
+        cols = np.asarray(term_ids, dtype=np.int32)
+        data = np.asarray(counts, dtype=np.float32)
+
+        # Layout CSC: per ogni termine, righe (chunk) e conteggi contigui
+        order = np.argsort(cols, kind="stable")
+        self.indices = rows[order]
+        self.data = data[order]
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        if len(cols):
+            np.cumsum(np.bincount(cols, minlength=len(self.vocabulary)), out=self.indptr[1:])
+
+        self.doc_norms = np.sqrt(np.bincount(rows, weights=data.astype(np.float64) ** 2,
+                                             minlength=doc_count)) if doc_count else np.zeros(0)
+
+    def __len__(self) -> int:
+        return self.num_documents
+
+    def scores(self, query: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Coseno tra la query e tutti i chunk (o solo `rows`, se indicato).
+        """
+        query_vector = Counter(self.tokenizer(query or ""))
+        size = self.num_documents if rows is None else len(rows)
+        if not query_vector or self.num_documents == 0:
+            return np.zeros(size, dtype=np.float64)
+
+        query_norm = float(np.sqrt(sum(value * value for value in query_vector.values())))
+        dots = np.zeros(self.num_documents, dtype=np.float64)
+        for term, weight in query_vector.items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # Le righe di una colonna sono uniche: l'assegnazione indicizzata è sicura
+            dots[self.indices[start:end]] += weight * self.data[start:end]
+
+        norms = self.doc_norms
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            dots = dots[rows]
+            norms = norms[rows]
+
+        denominator = norms * query_norm
+        out = np.zeros(size, dtype=np.float64)
+        np.divide(dots, denominator, out=out, where=denominator > 0)
+        return out
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """(indice, punteggio) dei k chunk più simili, in ordine decrescente di punteggio."""
+        scores = self.scores(query)
+        if k <= 0 or scores.size == 0:
+            return []
+        # Ordinamento stabile: a parità di punteggio conserva l'ordine originale dei chunk
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(idx), float(scores[idx])) for idx in top]
@@ -1,16 +1,22 @@
 import openai
 import os
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import json
 from dotenv import load_dotenv
 from datetime import datetime
 import logging
 import requests
 import re
+import httpx
+
+from services.llm_transport import LLMTransportError, get_openai_client, get_transport, provider_slot
 
 load_dotenv()
 
+# Risposta segnaposto quando il provider non restituisce contenuto (mai memorizzata in cache)
+NO_RESPONSE_TEXT = "Risposta non disponibile"
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -522,73 +528,40 @@ class ZAIModelManager:
         self.config = ZAI_CONFIG
         self.timeout = self.config.get("timeout", 60.0)
         self.max_retries = self.config.get("max_retries", 3)
+        self.transport = get_transport(
+            "zai",
+            self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
 
     async def check_connection(self) -> bool:
         """Verifica se l'API ZAI è accessibile"""
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            # Usa un endpoint semplice per verificare la connessione
-            test_url = f"{self.base_url}/models"
-            response = requests.get(test_url, headers=headers, timeout=10)
-            return response.status_code == 200
-        except Exception as e:
-            logger.error(f"ZAI connection check failed: {e}")
-            return False
+        # Usa un endpoint semplice per verificare la connessione
+        return await self.transport.is_ok("GET", "/models")
 
     async def list_available_models(self) -> List[str]:
         """Elenca i modelli ZAI disponibili"""
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            response = requests.get(f"{self.base_url}/models", headers=headers, timeout=10)
-
-            if response.status_code == 200:
-                data = response.json()
-                # Estrai i nomi dei modelli dalla risposta
-                return list(ZAI_MODELS.keys())
-            return []
-        except Exception as e:
-            logger.error(f"Failed to list ZAI models: {e}")
-            return []
+        if await self.transport.is_ok("GET", "/models"):
+            return list(ZAI_MODELS.keys())
+        return []
 
     async def test_model(self, model_name: str) -> bool:
         """Testa se un modello specifico ZAI funziona correttamente"""
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": model_name,
-                "messages": [{"role": "user", "content": "Test"}],
-                "max_tokens": 10,
-                "stream": False
-            }
-            response = requests.post(
-                f"{self.base_url}{self.config['chat_endpoint']}",
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
-            )
-            return response.status_code == 200
-        except Exception as e:
-            logger.error(f"ZAI model test failed for {model_name}: {e}")
-            return False
-
-    async def chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
-        """Esegue una chat completion con i modelli ZAI con retry logic"""
-        import time
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
+        payload = {
+            "model": model_name,
+            "messages": [{"role": "user", "content": "Test"}],
+            "max_tokens": 10,
+            "stream": False
         }
+        return await self.transport.is_ok("POST", self.config["chat_endpoint"], timeout=self.timeout, json=payload)
 
+    async def chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
+        """Esegue una chat completion con i modelli ZAI (retry e backoff nel trasporto)"""
         payload = {
             "model": model_name,
             "messages": messages,
@@ -600,70 +573,32 @@ class ZAIModelManager:
         # Aggiungi parametri specifici per ZAI
         # Note: thinking parameter not supported in current API version
 
-        max_retries = self.config.get("max_retries", 3)
-        base_delay = 1.0  # Base delay in seconds
-
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.post(
-                    f"{self.base_url}{self.config['chat_endpoint']}",
-                    headers=headers,
-                    json=payload,
-                    timeout=self.timeout
-                )
-
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"ZAI API error: {response.status_code} - {response.text}")
-                    # Don't retry on client errors (4xx)
-                    if 400 <= response.status_code < 500:
-                        raise Exception(f"ZAI API client error: {response.status_code} - {response.text}")
-
-                    # For server errors, retry with backoff
-                    if attempt < max_retries:
-                        delay = base_delay * (2 ** attempt)  # Exponential backoff
-                        logger.warning(f"ZAI API request failed (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        raise Exception(f"ZAI API request failed after {max_retries + 1} attempts: {response.status_code}")
-
-            except requests.exceptions.Timeout as e:
-                logger.warning(f"ZAI API timeout (attempt {attempt + 1}/{max_retries + 1}): {e}")
-                if attempt < max_retries:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Retrying in {delay}s...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    logger.error(f"ZAI API timed out after {max_retries + 1} attempts")
-                    raise Exception(f"ZAI API timeout after {max_retries + 1} attempts: {e}")
-
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"ZAI API connection error (attempt {attempt + 1}/{max_retries + 1}): {e}")
-                if attempt < max_retries:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Retrying in {delay}s...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    logger.error(f"ZAI API connection failed after {max_retries + 1} attempts")
-                    raise Exception(f"ZAI API connection failed after {max_retries + 1} attempts: {e}")
-
-            except Exception as e:
-                logger.error(f"ZAI chat completion failed: {e}")
-                if attempt < max_retries and not isinstance(e, requests.exceptions.RequestException):
-                    # Retry for non-request exceptions
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Unexpected error (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    raise
-
-        # This should never be reached, but just in case
-        raise Exception("ZAI chat completion failed: Maximum retries exceeded")
+        try:
+            return await self.transport.post_json(self.config["chat_endpoint"], payload)
+        except LLMTransportError as e:
+            logger.error(f"ZAI API error: {e}")
+            raise Exception(f"ZAI API error: {e}") from e
+        except httpx.TimeoutException as e:
+            logger.error(f"ZAI API timed out after {self.max_retries + 1} attempts")
+            raise Exception(f"ZAI API timeout after {self.max_retries + 1} attempts: {e}") from e
+        except httpx.TransportError as e:
+            logger.error(f"ZAI API connection failed after {self.max_retries + 1} attempts")
+            raise Exception(f"ZAI API connection failed after {self.max_retries + 1} attempts: {e}") from e
+
+    async def stream_chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> AsyncIterator[str]:
+        """Chat completion ZAI in streaming: restituisce i frammenti di testo man mano che arrivano"""
+        payload = {
+            "model": model_name,
+            "messages": messages,
+            "max_tokens": kwargs.get("max_tokens", 1500),
+            "temperature": kwargs.get("temperature", 0.7)
+        }
+        try:
+            async for delta in self.transport.stream_chat(self.config["chat_endpoint"], payload):
+                yield delta
+        except LLMTransportError as e:
+            logger.error(f"ZAI API error: {e}")
+            raise Exception(f"ZAI API error: {e}") from e
 
 class OpenRouterModelManager:
     """Gestisce l'interazione con OpenRouter API per multi-provider LLM access"""
@@ -675,35 +610,34 @@ class OpenRouterModelManager:
         self.timeout = self.config.get("timeout", 60.0)
         self.max_retries = self.config.get("max_retries", 3)
         self.default_headers = self.config.get("headers", {}).copy()
-
-    async def check_connection(self) -> bool:
-        """Verifica se l'API OpenRouter è accessibile"""
-        try:
-            headers = {
+        self.transport = get_transport(
+            "openrouter",
+            self.base_url,
+            headers={
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json",
                 **self.default_headers
-            }
-            # Usa un endpoint semplice per verificare la connessione
-            test_url = f"{self.base_url}/models"
-            response = requests.get(test_url, headers=headers, timeout=10)
-            return response.status_code == 200
-        except Exception as e:
-            logger.error(f"OpenRouter connection check failed: {e}")
-            return False
+            },
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+
+    async def _fetch_models(self) -> Optional[Dict[str, Any]]:
+        response = await self.transport.request("GET", "/models", timeout=10.0, retries=0)
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    async def check_connection(self) -> bool:
+        """Verifica se l'API OpenRouter è accessibile"""
+        # Usa un endpoint semplice per verificare la connessione
+        return await self.transport.is_ok("GET", "/models")
 
     async def list_available_models(self) -> List[str]:
         """Elenca i modelli OpenRouter disponibili"""
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                **self.default_headers
-            }
-            response = requests.get(f"{self.base_url}/models", headers=headers, timeout=10)
-
-            if response.status_code == 200:
-                data = response.json()
+            data = await self._fetch_models()
+            if data is not None:
                 # Estrai i nomi dei modelli dalla risposta API
                 api_models = [model["id"] for model in data.get("data", [])]
                 # Combina con i modelli preconfigurati
@@ -716,39 +650,16 @@ class OpenRouterModelManager:
 
     async def test_model(self, model_name: str) -> bool:
         """Testa se un modello specifico OpenRouter funziona correttamente"""
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                **self.default_headers
-            }
-            payload = {
-                "model": model_name,
-                "messages": [{"role": "user", "content": "Test"}],
-                "max_tokens": 10,
-                "stream": False
-            }
-            response = requests.post(
-                f"{self.base_url}{self.config['chat_endpoint']}",
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
-            )
-            return response.status_code == 200
-        except Exception as e:
-            logger.error(f"OpenRouter model test failed for {model_name}: {e}")
-            return False
-
-    async def chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
-        """Esegue una chat completion con i modelli OpenRouter con retry logic"""
-        import time
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            **self.default_headers
+        payload = {
+            "model": model_name,
+            "messages": [{"role": "user", "content": "Test"}],
+            "max_tokens": 10,
+            "stream": False
         }
+        return await self.transport.is_ok("POST", self.config["chat_endpoint"], timeout=self.timeout, json=payload)
 
+    async def chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
+        """Esegue una chat completion con i modelli OpenRouter (retry e backoff nel trasporto)"""
         payload = {
             "model": model_name,
             "messages": messages,
@@ -767,70 +678,35 @@ class OpenRouterModelManager:
         if "response_format" in kwargs:
             payload["response_format"] = kwargs["response_format"]
 
-        max_retries = self.config.get("max_retries", 3)
-        base_delay = 1.0  # Base delay in seconds
-
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.post(
-                    f"{self.base_url}{self.config['chat_endpoint']}",
-                    headers=headers,
-                    json=payload,
-                    timeout=self.timeout
-                )
-
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-                    # Don't retry on client errors (4xx)
-                    if 400 <= response.status_code < 500:
-                        raise Exception(f"OpenRouter API client error: {response.status_code} - {response.text}")
-
-                    # For server errors, retry with backoff
-                    if attempt < max_retries:
-                        delay = base_delay * (2 ** attempt)  # Exponential backoff
-                        logger.warning(f"OpenRouter API request failed (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        raise Exception(f"OpenRouter API request failed after {max_retries + 1} attempts: {response.status_code}")
-
-            except requests.exceptions.Timeout as e:
-                logger.warning(f"OpenRouter API timeout (attempt {attempt + 1}/{max_retries + 1}): {e}")
-                if attempt < max_retries:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Retrying in {delay}s...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    logger.error(f"OpenRouter API timed out after {max_retries + 1} attempts")
-                    raise Exception(f"OpenRouter API timeout after {max_retries + 1} attempts: {e}")
-
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"OpenRouter API connection error (attempt {attempt + 1}/{max_retries + 1}): {e}")
-                if attempt < max_retries:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Retrying in {delay}s...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    logger.error(f"OpenRouter API connection failed after {max_retries + 1} attempts")
-                    raise Exception(f"OpenRouter API connection failed after {max_retries + 1} attempts: {e}")
-
-            except Exception as e:
-                logger.error(f"OpenRouter chat completion failed: {e}")
-                if attempt < max_retries and not isinstance(e, requests.exceptions.RequestException):
-                    # Retry for non-request exceptions
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Unexpected error (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    raise
-
-        # This should never be reached, but just in case
-        raise Exception("OpenRouter chat completion failed: Maximum retries exceeded")
+        try:
+            return await self.transport.post_json(self.config["chat_endpoint"], payload)
+        except LLMTransportError as e:
+            logger.error(f"OpenRouter API error: {e}")
+            raise Exception(f"OpenRouter API error: {e}") from e
+        except httpx.TimeoutException as e:
+            logger.error(f"OpenRouter API timed out after {self.max_retries + 1} attempts")
+            raise Exception(f"OpenRouter API timeout after {self.max_retries + 1} attempts: {e}") from e
+        except httpx.TransportError as e:
+            logger.error(f"OpenRouter API connection failed after {self.max_retries + 1} attempts")
+            raise Exception(f"OpenRouter API connection failed after {self.max_retries + 1} attempts: {e}") from e
+
+    async def stream_chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> AsyncIterator[str]:
+        """Chat completion OpenRouter in streaming: restituisce i frammenti di testo man mano che arrivano"""
+        payload = {
+            "model": model_name,
+            "messages": messages,
+            "max_tokens": kwargs.get("max_tokens", 1500),
+            "temperature": kwargs.get("temperature", 0.7)
+        }
+        for key in ("top_p", "frequency_penalty", "presence_penalty"):
+            if key in kwargs:
+                payload[key] = kwargs[key]
+        try:
+            async for delta in self.transport.stream_chat(self.config["chat_endpoint"], payload):
+                yield delta
+        except LLMTransportError as e:
+            logger.error(f"OpenRouter API error: {e}")
+            raise Exception(f"OpenRouter API error: {e}") from e
 
     async def get_model_info(self, model_name: str) -> Dict[str, Any]:
         """Ottiene informazioni dettagliate su un modello specifico"""
@@ -840,14 +716,8 @@ class OpenRouterModelManager:
 
         # Se non è preconfigurato, prova a ottenerlo dall'API
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                **self.default_headers
-            }
-            response = requests.get(f"{self.base_url}/models", headers=headers, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
+            data = await self._fetch_models()
+            if data is not None:
                 for model in data.get("data", []):
                     if model["id"] == model_name:
                         return {
@@ -884,24 +754,18 @@ class LocalModelManager:
         self.base_url = base_url.rstrip('/')
         self.config = LOCAL_PROVIDER_CONFIGS.get(self.provider, {})
         self.timeout = self.config.get("timeout", 60.0)
+        self.transport = get_transport(self.provider, self.base_url, timeout=self.timeout, max_retries=1)
 
     async def check_connection(self) -> bool:
         """Verifica se il provider locale è accessibile"""
-        try:
-            import requests
-            health_url = f"{self.base_url}{self.config.get('health_endpoint', '/health')}"
-            response = requests.get(health_url, timeout=5)
-            return response.status_code == 200
-        except Exception as e:
-            logger.error(f"Connection check failed for {self.provider}: {e}")
-            return False
+        return await self.transport.is_ok("GET", self.config.get('health_endpoint', '/health'), timeout=5.0)
 
     async def list_available_models(self) -> List[str]:
         """Elenca i modelli disponibili dal provider locale"""
         try:
-            import requests
-            list_url = f"{self.base_url}{self.config.get('list_models_endpoint', '/api/tags')}"
-            response = requests.get(list_url, timeout=10)
+            response = await self.transport.request(
+                "GET", self.config.get('list_models_endpoint', '/api/tags'), timeout=10.0, retries=0
+            )
 
             if response.status_code == 200:
                 data = response.json()
@@ -916,20 +780,37 @@ class LocalModelManager:
 
     async def test_model(self, model_name: str) -> bool:
         """Testa se un modello specifico funziona correttamente"""
-        try:
-            import requests
-            chat_url = f"{self.base_url}{self.config.get('chat_endpoint', '/v1/chat/completions')}"
-            payload = {
-                "model": model_name,
-                "messages": [{"role": "user", "content": "Test"}],
-                "max_tokens": 10,
-                "stream": False
-            }
-            response = requests.post(chat_url, json=payload, timeout=self.timeout)
-            return response.status_code == 200
-        except Exception as e:
-            logger.error(f"Model test failed for {model_name}: {e}")
-            return False
+        payload = {
+            "model": model_name,
+            "messages": [{"role": "user", "content": "Test"}],
+            "max_tokens": 10,
+            "stream": False
+        }
+        return await self.transport.is_ok(
+            "POST", self.config.get('chat_endpoint', '/v1/chat/completions'), timeout=self.timeout, json=payload
+        )
+
+    async def chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
+        """Chat completion sull'endpoint OpenAI-compatibile del provider locale"""
+        payload = {
+            "model": model_name,
+            "messages": messages,
+            "max_tokens": kwargs.get("max_tokens", 1500),
+            "temperature": kwargs.get("temperature", 0.7),
+            "stream": False
+        }
+        return await self.transport.post_json("/chat/completions", payload)
+
+    async def stream_chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> AsyncIterator[str]:
+        """Chat completion locale in streaming"""
+        payload = {
+            "model": model_name,
+            "messages": messages,
+            "max_tokens": kwargs.get("max_tokens", 1500),
+            "temperature": kwargs.get("temperature", 0.7)
+        }
+        async for delta in self.transport.stream_chat("/chat/completions", payload):
+            yield delta
 
 class MegaLLMModelManager:
     def __init__(self, api_key: str, base_url: str = None):
@@ -938,26 +819,23 @@ class MegaLLMModelManager:
         self.config = MEGALLM_CONFIG
         self.timeout = self.config.get("timeout", 60.0)
         self.max_retries = self.config.get("max_retries", 3)
-
-    async def check_connection(self) -> bool:
-        try:
-            headers = {
+        self.transport = get_transport(
+            "megallm",
+            self.base_url,
+            headers={
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
-            }
-            test_url = f"{self.base_url}{self.config['models_endpoint']}"
-            response = requests.get(test_url, headers=headers, timeout=10)
-            return response.status_code == 200
-        except Exception:
-            return False
+            },
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+
+    async def check_connection(self) -> bool:
+        return await self.transport.is_ok("GET", self.config['models_endpoint'])
 
     async def list_available_models(self) -> List[str]:
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            response = requests.get(f"{self.base_url}{self.config['models_endpoint']}", headers=headers, timeout=10)
+            response = await self.transport.request("GET", self.config['models_endpoint'], timeout=10.0, retries=0)
             if response.status_code == 200:
                 data = response.json()
                 return [m.get("id") or m.get("name") for m in data.get("data", []) if isinstance(m, dict)]
@@ -966,33 +844,15 @@ class MegaLLMModelManager:
             return []
 
     async def test_model(self, model_name: str) -> bool:
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": model_name,
-                "messages": [{"role": "user", "content": "Test"}],
-                "max_tokens": 10,
-                "stream": False
-            }
-            response = requests.post(
-                f"{self.base_url}{self.config['chat_endpoint']}",
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
-            )
-            return response.status_code == 200
-        except Exception:
-            return False
+        payload = {
+            "model": model_name,
+            "messages": [{"role": "user", "content": "Test"}],
+            "max_tokens": 10,
+            "stream": False
+        }
+        return await self.transport.is_ok("POST", self.config['chat_endpoint'], timeout=self.timeout, json=payload)
 
     async def chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
-        import time
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
         payload = {
             "model": model_name,
             "messages": messages,
@@ -1000,35 +860,23 @@ class MegaLLMModelManager:
             "temperature": kwargs.get("temperature", 0.7),
             "stream": kwargs.get("stream", False)
         }
-        max_retries = self.config.get("max_retries", 3)
-        base_delay = 1.0
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.post(
-                    f"{self.base_url}{self.config['chat_endpoint']}",
-                    headers=headers,
-                    json=payload,
-                    timeout=self.timeout
-                )
-                if response.status_code == 200:
-                    return response.json()
-                if 400 <= response.status_code < 500:
-                    raise Exception(str(response.text))
-                if attempt < max_retries:
-                    time.sleep(base_delay * (2 ** attempt))
-                    continue
-                raise Exception(str(response.status_code))
-            except requests.exceptions.Timeout:
-                if attempt < max_retries:
-                    time.sleep(base_delay * (2 ** attempt))
-                    continue
-                raise
-            except requests.exceptions.ConnectionError:
-                if attempt < max_retries:
-                    time.sleep(base_delay * (2 ** attempt))
-                    continue
-                raise
-        raise Exception("MegaLLM chat completion failed")
+        try:
+            return await self.transport.post_json(self.config['chat_endpoint'], payload)
+        except LLMTransportError as e:
+            raise Exception(e.body or str(e.status_code)) from e
+
+    async def stream_chat_completion(self, model_name: str, messages: List[Dict], **kwargs) -> AsyncIterator[str]:
+        payload = {
+            "model": model_name,
+            "messages": messages,
+            "max_tokens": kwargs.get("max_tokens", 1500),
+            "temperature": kwargs.get("temperature", 0.7)
+        }
+        try:
+            async for delta in self.transport.stream_chat(self.config['chat_endpoint'], payload):
+                yield delta
+        except LLMTransportError as e:
+            raise Exception(e.body or str(e.status_code)) from e
 
 class ModelSelector:
     """Helper class per selezionare il modello migliore in base al task e al budget"""
@@ -1217,7 +1065,8 @@ class LLMService:
                 raise ValueError("Chiave API OpenAI non trovata nelle variabili d'ambiente")
 
             try:
-                self.client = openai.OpenAI(
+                # Client asincrono condiviso: non blocca l'event loop e riusa il pool di connessioni
+                self.client = get_openai_client(
                     api_key=api_key,
                     base_url=base_url,
                     timeout=30.0,  # Timeout di 30 secondi
@@ -1355,7 +1204,7 @@ class LLMService:
             if provider == "openai":
                 if not base_url:
                     base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-                self.client = openai.OpenAI(api_key=api_key, base_url=base_url, timeout=30.0, max_retries=3)
+                self.client = get_openai_client(api_key=api_key, base_url=base_url, timeout=30.0, max_retries=3)
                 os.environ["OPENAI_API_KEY"] = api_key
                 os.environ["OPENAI_BASE_URL"] = base_url
                 return True
@@ -1384,6 +1233,16 @@ class LLMService:
         except Exception:
             return False
 
+    def _local_transport(self):
+        """Trasporto del provider locale (Ollama/LM Studio o configurazione legacy)."""
+        if self.local_manager:
+            return self.local_manager.transport
+        return get_transport("local", self.base_url, timeout=LOCAL_PROVIDER_CONFIGS["ollama"]["timeout"], max_retries=1)
+
+    async def _local_chat_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat completion OpenAI-compatibile sul provider locale."""
+        return await self._local_transport().post_json("/chat/completions", payload)
+
     async def get_available_models(self) -> Dict[str, Any]:
         """Restituisce la lista dei modelli disponibili con le loro caratteristiche"""
         result = {
@@ -1630,25 +1489,8 @@ class LLMService:
                 "available_models": []
             }
 
-    async def generate_response(self, query: str, context: Dict[str, Any], course_id: str) -> str:
-        """Generate a tutoring response based on query and context"""
-
-        context_text = context.get("text", "")
-        sources = context.get("sources", [])
-        context_size = len(context_text)
-        scope = context.get("scope", {}) or {}
-        scope_lines = []
-        if scope.get("course_name"):
-            scope_lines.append(f"Corso: {scope['course_name']}")
-        if scope.get("book_title"):
-            scope_lines.append(f"Libro in uso: {scope['book_title']}")
-        if scope.get("materials_used"):
-            joined_sources = ", ".join(scope.get("materials_used"))
-            if joined_sources:
-                scope_lines.append(f"Estratti da: {joined_sources}")
-        scope_hint = "\n".join(scope_lines)
-
-        # Seleziona il modello migliore in base al contesto
+    async def _select_chat_model(self, context_size: int) -> str:
+        """Modello da usare per la chat in base al provider e alla dimensione del contesto"""
         if self.model_type == "openai":
             model_to_use = ModelSelector.select_model(
                 task_type="chat",
@@ -1703,7 +1545,23 @@ class LLMService:
         else:
             model_to_use = self.model
 
-        system_prompt = f"""
+        return model_to_use
+
+    def _build_tutor_system_prompt(self, context: Dict[str, Any], context_text: str) -> str:
+        """System prompt del tutor con contesto recuperato e ambito (corso/libro)"""
+        scope = context.get("scope", {}) or {}
+        scope_lines = []
+        if scope.get("course_name"):
+            scope_lines.append(f"Corso: {scope['course_name']}")
+        if scope.get("book_title"):
+            scope_lines.append(f"Libro in uso: {scope['book_title']}")
+        if scope.get("materials_used"):
+            joined_sources = ", ".join(scope.get("materials_used"))
+            if joined_sources:
+                scope_lines.append(f"Estratti da: {joined_sources}")
+        scope_hint = "\n".join(scope_lines)
+
+        return f"""
         Sei un tutor universitario esperto e paziente. Il tuo ruolo è aiutare gli studenti a comprendere gli argomenti in modo chiaro e approfondito.
 
         Linee guida:
@@ -1722,22 +1580,79 @@ class LLMService:
         {context_text}
         """
 
+    async def generate_response(self, query: str, context: Dict[str, Any], course_id: str,
+                                cache_query: Optional[str] = None, cache_variant: str = "") -> str:
+        """
+        Generate a tutoring response based on query and context.
+
+        Con `cache_query` (la domanda dello studente, senza le istruzioni di sessione) la risposta
+        è cercata e salvata nella cache semantica dello scope corso/libro/modello; `cache_variant`
+        distingue le preferenze che cambiano la risposta (lunghezza, livello, esempi).
+        """
+        context_size = len(context.get("text", ""))
+
+        # Seleziona il modello migliore in base al contesto
+        model_to_use = await self._select_chat_model(context_size)
+
+        cache_scope = self._answer_cache_scope(context, course_id, model_to_use, cache_variant) if cache_query else None
+        if cache_scope is not None:
+            cached = await self._lookup_cached_answer(cache_query, cache_scope)
+            if cached is not None:
+                return cached
+
         try:
-            if self.model_type == "openai":
-                # Verifica se il modello ha abbastanza contesto
-                model_info = OPENAI_MODELS.get(model_to_use)
-                if model_info and context_size > model_info["context_window"] * 0.8:
-                    logger.warning(f"Context size ({context_size}) close to model limit ({model_info['context_window']})")
-                    # Tronca il contesto se necessario
-                    max_context = int(model_info["context_window"] * 0.7)
-                    context_text = context_text[-max_context:]
-                    system_prompt = system_prompt.replace(
-                        f"{context.get('text', '')}",
-                        context_text
-                    )
+            response = await self._generate_chat_completion(query, context, model_to_use)
+        except openai.RateLimitError as e:
+            logger.error(f"Rate limit exceeded: {e}")
+            return "Mi dispiace, ho raggiunto il limite di richieste. Riprova tra qualche istante."
+        except openai.APIError as e:
+            logger.error(f"OpenAI API error: {e}")
+            return "Mi dispiace, c'è stato un problema con il servizio. Riprova più tardi."
+        except Exception as e:
+            # Handle ZAI API errors
+            if "ZAI" in str(e) or (self.model_type == "zai" and "429" in str(e)):
+                logger.error(f"ZAI API error: {e}")
+                if "429" in str(e):
+                    return "Mi dispiace, ho raggiunto il limite di richieste ZAI. Riprova tra qualche istante."
+                else:
+                    return "Mi dispiace, c'è stato un problema con il servizio ZAI. Riprova più tardi."
+            # Handle OpenRouter API errors
+            elif "OpenRouter" in str(e) or (self.model_type == "openrouter" and ("429" in str(e) or "rate" in str(e).lower())):
+                logger.error(f"OpenRouter API error: {e}")
+                if "429" in str(e) or "rate" in str(e).lower():
+                    return "Mi dispiace, ho raggiunto il limite di richieste OpenRouter. Riprova tra qualche istante."
+                else:
+                    return "Mi dispiace, c'è stato un problema con il servizio OpenRouter. Riprova più tardi."
+            else:
+                logger.error(f"Errore nella generazione della risposta: {e}")
+                return "Mi dispiace, ho riscontrato un problema nell'elaborare la tua domanda. Riprova più tardi."
+
+        if cache_scope is not None and response and response != NO_RESPONSE_TEXT:
+            await self._store_cached_answer(cache_query, response, cache_scope)
+        return response
+
+    async def _generate_chat_completion(self, query: str, context: Dict[str, Any], model_to_use: str) -> str:
+        """Chiamata al provider configurato; gli errori del provider sono gestiti da generate_response"""
+        context_text = context.get("text", "")
+        context_size = len(context_text)
+        system_prompt = self._build_tutor_system_prompt(context, context_text)
 
-                # API OpenAI più recente con parametri avanzati
-                response = self.client.chat.completions.create(
+        if self.model_type == "openai":
+            # Verifica se il modello ha abbastanza contesto
+            model_info = OPENAI_MODELS.get(model_to_use)
+            if model_info and context_size > model_info["context_window"] * 0.8:
+                logger.warning(f"Context size ({context_size}) close to model limit ({model_info['context_window']})")
+                # Tronca il contesto se necessario
+                max_context = int(model_info["context_window"] * 0.7)
+                context_text = context_text[-max_context:]
+                system_prompt = system_prompt.replace(
+                    f"{context.get('text', '')}",
+                    context_text
+                )
+
+            # API OpenAI più recente con parametri avanzati
+            async with provider_slot("openai"):
+                response = await self.client.chat.completions.create(
                     model=model_to_use,
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -1751,153 +1666,286 @@ class LLMService:
                     response_format={"type": "text"}
                 )
 
-                # Log per monitoraggio costi
-                usage = response.usage
-                if usage:
-                    model_info = OPENAI_MODELS.get(model_to_use)
-                    if model_info:
-                        cost = (usage.prompt_tokens * model_info["cost_per_1k_tokens"]["input"] / 1000 +
-                               usage.completion_tokens * model_info["cost_per_1k_tokens"]["output"] / 1000)
-                        logger.info(f"API call - Model: {model_to_use}, Tokens: {usage.total_tokens}, Cost: ${cost:.4f}")
+            # Log per monitoraggio costi
+            usage = response.usage
+            if usage:
+                model_info = OPENAI_MODELS.get(model_to_use)
+                if model_info:
+                    cost = (usage.prompt_tokens * model_info["cost_per_1k_tokens"]["input"] / 1000 +
+                           usage.completion_tokens * model_info["cost_per_1k_tokens"]["output"] / 1000)
+                    logger.info(f"API call - Model: {model_to_use}, Tokens: {usage.total_tokens}, Cost: ${cost:.4f}")
 
-                return response.choices[0].message.content
-            elif self.model_type == "zai" and self.zai_manager:
-                # Verifica se il modello ZAI ha abbastanza contesto
-                model_info = ZAI_MODELS.get(model_to_use)
-                if model_info and context_size > model_info["context_window"] * 0.8:
-                    logger.warning(f"Context size ({context_size}) close to ZAI model limit ({model_info['context_window']})")
-                    # Tronca il contesto se necessario
-                    max_context = int(model_info["context_window"] * 0.7)
-                    context_text = context_text[-max_context:]
-                    system_prompt = system_prompt.replace(
-                        f"{context.get('text', '')}",
-                        context_text
-                    )
+            return response.choices[0].message.content
+        elif self.model_type == "zai" and self.zai_manager:
+            # Verifica se il modello ZAI ha abbastanza contesto
+            model_info = ZAI_MODELS.get(model_to_use)
+            if model_info and context_size > model_info["context_window"] * 0.8:
+                logger.warning(f"Context size ({context_size}) close to ZAI model limit ({model_info['context_window']})")
+                # Tronca il contesto se necessario
+                max_context = int(model_info["context_window"] * 0.7)
+                context_text = context_text[-max_context:]
+                system_prompt = system_prompt.replace(
+                    f"{context.get('text', '')}",
+                    context_text
+                )
 
-                # API ZAI
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ]
+            # API ZAI
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query}
+            ]
 
-                response = await self.zai_manager.chat_completion(
-                    model_name=model_to_use,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=min(1500, model_info["max_tokens"] if model_info else 1500)
-                )
+            response = await self.zai_manager.chat_completion(
+                model_name=model_to_use,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=min(1500, model_info["max_tokens"] if model_info else 1500)
+            )
 
-                # Log per monitoraggio costi (stimato)
-                if response and "choices" in response:
-                    logger.info(f"ZAI API call - Model: {model_to_use}, Response received")
-                    # Log dei costi per ZAI
-                    if model_info:
-                        logger.info(f"ZAI Model: {model_to_use}, Estimated cost: Low (ZAI pricing)")
-
-                return response["choices"][0]["message"]["content"] if response and "choices" in response else "Risposta non disponibile"
-            elif self.model_type == "megallm" and self.megallm_manager:
-                model_info = self.model_info if isinstance(self.model_info, dict) else {}
-                if model_info and context_size > model_info.get("context_window", 128000) * 0.8:
-                    max_context = int(model_info.get("context_window", 128000) * 0.7)
-                    context_text = context_text[-max_context:]
-                    system_prompt = system_prompt.replace(f"{context.get('text', '')}", context_text)
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ]
-                response = await self.megallm_manager.chat_completion(
-                    model_name=self.default_model,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=min(1500, model_info.get("max_tokens", 1500))
+            # Log per monitoraggio costi (stimato)
+            if response and "choices" in response:
+                logger.info(f"ZAI API call - Model: {model_to_use}, Response received")
+                # Log dei costi per ZAI
+                if model_info:
+                    logger.info(f"ZAI Model: {model_to_use}, Estimated cost: Low (ZAI pricing)")
+
+            return response["choices"][0]["message"]["content"] if response and "choices" in response else NO_RESPONSE_TEXT
+        elif self.model_type == "megallm" and self.megallm_manager:
+            model_info = self.model_info if isinstance(self.model_info, dict) else {}
+            if model_info and context_size > model_info.get("context_window", 128000) * 0.8:
+                max_context = int(model_info.get("context_window", 128000) * 0.7)
+                context_text = context_text[-max_context:]
+                system_prompt = system_prompt.replace(f"{context.get('text', '')}", context_text)
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query}
+            ]
+            response = await self.megallm_manager.chat_completion(
+                model_name=self.default_model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=min(1500, model_info.get("max_tokens", 1500))
+            )
+            return response["choices"][0]["message"]["content"] if response and "choices" in response else NO_RESPONSE_TEXT
+        elif self.model_type == "openrouter" and self.openrouter_manager:
+            # Verifica se il modello OpenRouter ha abbastanza contesto
+            model_info = OPENROUTER_MODELS.get(model_to_use)
+            if model_info and context_size > model_info["context_window"] * 0.8:
+                logger.warning(f"Context size ({context_size}) close to OpenRouter model limit ({model_info['context_window']})")
+                # Tronca il contesto se necessario
+                max_context = int(model_info["context_window"] * 0.7)
+                context_text = context_text[-max_context:]
+                system_prompt = system_prompt.replace(
+                    f"{context.get('text', '')}",
+                    context_text
                 )
-                return response["choices"][0]["message"]["content"] if response and "choices" in response else "Risposta non disponibile"
-            elif self.model_type == "openrouter" and self.openrouter_manager:
-                # Verifica se il modello OpenRouter ha abbastanza contesto
-                model_info = OPENROUTER_MODELS.get(model_to_use)
-                if model_info and context_size > model_info["context_window"] * 0.8:
-                    logger.warning(f"Context size ({context_size}) close to OpenRouter model limit ({model_info['context_window']})")
-                    # Tronca il contesto se necessario
-                    max_context = int(model_info["context_window"] * 0.7)
-                    context_text = context_text[-max_context:]
-                    system_prompt = system_prompt.replace(
-                        f"{context.get('text', '')}",
-                        context_text
-                    )
 
-                # API OpenRouter
-                messages = [
+            # API OpenRouter
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query}
+            ]
+
+            response = await self.openrouter_manager.chat_completion(
+                model_name=model_to_use,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=min(1500, model_info["max_tokens"] if model_info else 1500),
+                top_p=0.9,
+                frequency_penalty=0.2,
+                presence_penalty=0.1
+            )
+
+            # Log per monitoraggio costi
+            if response and "choices" in response:
+                logger.info(f"OpenRouter API call - Model: {model_to_use}, Response received")
+                # Log dei costi per OpenRouter
+                if model_info:
+                    usage = response.get("usage", {})
+                    if usage:
+                        input_tokens = usage.get("prompt_tokens", 0)
+                        output_tokens = usage.get("completion_tokens", 0)
+                        cost = (input_tokens * model_info["cost_per_1k_tokens"]["input"] / 1000 +
+                               output_tokens * model_info["cost_per_1k_tokens"]["output"] / 1000)
+                        logger.info(f"OpenRouter Model: {model_to_use}, Tokens: {input_tokens + output_tokens}, Cost: ${cost:.4f}")
+                    else:
+                        logger.info(f"OpenRouter Model: {model_to_use}, No usage info available")
+
+            return response["choices"][0]["message"]["content"] if response and "choices" in response else NO_RESPONSE_TEXT
+        else:
+            # LLM Locale (Ollama/LM Studio)
+            payload = {
+                "model": self.model,
+                "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": query}
-                ]
+                ],
+                "temperature": 0.7,
+                "max_tokens": 1500,
+                "stream": False
+            }
+            result = await self._local_chat_completion(payload)
+            return result["choices"][0]["message"]["content"]
+
+    def _get_answer_cache(self):
+        try:
+            from services.service_container import get_answer_cache
+            return get_answer_cache()
+        except Exception as e:
+            logger.warning(f"Semantic answer cache unavailable: {e}")
+            return None
+
+    @staticmethod
+    def _is_personal_context(context: Dict[str, Any]) -> bool:
+        """Contesto costruito con dati dello studente (note private, sessione, progressi): la risposta non va condivisa"""
+        if (context.get("scope") or {}).get("user_annotations_used"):
+            return True
+        if context.get("personalization_applied") or context.get("session_context_used"):
+            return True
+        return any(source.get("type") == "user_annotation" for source in context.get("sources") or [])
+
+    def _answer_cache_scope(self, context: Dict[str, Any], course_id: str, model: str,
+                            variant: str = "") -> Optional[Dict[str, Any]]:
+        """Scope della cache semantica per la risposta, o None se la cache è disabilitata o il contesto è personale"""
+        answer_cache = self._get_answer_cache()
+        if answer_cache is None or not answer_cache.enabled or not course_id:
+            return None
+        if self._is_personal_context(context):
+            return None
+        if self.model_type == "megallm":
+            model = self.default_model
+        return {
+            "course_id": course_id,
+            "book_id": (context.get("scope") or {}).get("book_id"),
+            "model": f"{self.model_type}:{model}",
+            "variant": variant
+        }
+
+    async def _lookup_cached_answer(self, cache_query: str, cache_scope: Dict[str, Any]) -> Optional[str]:
+        answer_cache = self._get_answer_cache()
+        try:
+            # L'embedding della domanda è CPU-bound: fuori dall'event loop
+            hit = await asyncio.to_thread(answer_cache.lookup, cache_query, **cache_scope)
+        except Exception as e:
+            logger.warning(f"Semantic answer cache lookup failed: {e}")
+            return None
+        if hit is None:
+            return None
+        logger.info(f"Semantic cache hit - course: {cache_scope['course_id']}, similarity: {hit['similarity']}")
+        return hit["response"]
+
+    async def _store_cached_answer(self, cache_query: str, response: str, cache_scope: Dict[str, Any]):
+        answer_cache = self._get_answer_cache()
+        try:
+            await asyncio.to_thread(answer_cache.store, cache_query, response, **cache_scope)
+        except Exception as e:
+            logger.warning(f"Semantic answer cache store failed: {e}")
+
+    def _chat_model_info(self, model_name: str) -> Dict[str, Any]:
+        if self.model_type == "openai":
+            return OPENAI_MODELS.get(model_name) or {}
+        if self.model_type == "zai":
+            return ZAI_MODELS.get(model_name) or {}
+        if self.model_type == "openrouter":
+            return OPENROUTER_MODELS.get(model_name) or {}
+        if self.model_type == "megallm":
+            return self.model_info if isinstance(self.model_info, dict) else {}
+        return LOCAL_MODELS.get(model_name) or {}
+
+    async def generate_response_stream(self, query: str, context: Dict[str, Any], course_id: str,
+                                       cache_query: Optional[str] = None,
+                                       cache_variant: str = "") -> AsyncIterator[str]:
+        """
+        Come generate_response, ma restituisce la risposta a frammenti man mano che il
+        provider li genera (time-to-first-token ridotto). I provider senza supporto allo
+        streaming producono un unico frammento con la risposta completa, così come i
+        hit della cache semantica.
+        """
+        context_size = len(context.get("text", ""))
+        model_to_use = await self._select_chat_model(context_size)
+        if self.model_type == "megallm":
+            model_to_use = self.default_model
+
+        cache_scope = self._answer_cache_scope(context, course_id, model_to_use, cache_variant) if cache_query else None
+        if cache_scope is not None:
+            cached = await self._lookup_cached_answer(cache_query, cache_scope)
+            if cached is not None:
+                yield cached
+                return
+
+        parts: List[str] = []
+        async for delta in self._stream_chat_completion(query, context, model_to_use):
+            parts.append(delta)
+            yield delta
 
-                response = await self.openrouter_manager.chat_completion(
-                    model_name=model_to_use,
+        response = "".join(parts)
+        if cache_scope is not None and response and response != NO_RESPONSE_TEXT:
+            await self._store_cached_answer(cache_query, response, cache_scope)
+
+    async def _stream_chat_completion(self, query: str, context: Dict[str, Any],
+                                      model_to_use: str) -> AsyncIterator[str]:
+        context_text = context.get("text", "")
+        context_size = len(context_text)
+
+        # Tronca il contesto se vicino al limite del modello
+        model_info = self._chat_model_info(model_to_use)
+        context_window = model_info.get("context_window")
+        if context_window and context_size > context_window * 0.8:
+            logger.warning(f"Context size ({context_size}) close to model limit ({context_window})")
+            context_text = context_text[-int(context_window * 0.7):]
+
+        messages = [
+            {"role": "system", "content": self._build_tutor_system_prompt(context, context_text)},
+            {"role": "user", "content": query}
+        ]
+        max_tokens = min(1500, model_info.get("max_tokens", 1500))
+
+        if self.model_type == "openai":
+            async with provider_slot("openai"):
+                stream = await self.client.chat.completions.create(
+                    model=model_to_use,
                     messages=messages,
                     temperature=0.7,
-                    max_tokens=min(1500, model_info["max_tokens"] if model_info else 1500),
+                    max_tokens=max_tokens,
                     top_p=0.9,
                     frequency_penalty=0.2,
-                    presence_penalty=0.1
+                    presence_penalty=0.1,
+                    stream=True
                 )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            return
 
-                # Log per monitoraggio costi
-                if response and "choices" in response:
-                    logger.info(f"OpenRouter API call - Model: {model_to_use}, Response received")
-                    # Log dei costi per OpenRouter
-                    if model_info:
-                        usage = response.get("usage", {})
-                        if usage:
-                            input_tokens = usage.get("prompt_tokens", 0)
-                            output_tokens = usage.get("completion_tokens", 0)
-                            cost = (input_tokens * model_info["cost_per_1k_tokens"]["input"] / 1000 +
-                                   output_tokens * model_info["cost_per_1k_tokens"]["output"] / 1000)
-                            logger.info(f"OpenRouter Model: {model_to_use}, Tokens: {input_tokens + output_tokens}, Cost: ${cost:.4f}")
-                        else:
-                            logger.info(f"OpenRouter Model: {model_to_use}, No usage info available")
-
-                return response["choices"][0]["message"]["content"] if response and "choices" in response else "Risposta non disponibile"
-            else:
-                # LLM Locale (Ollama/LM Studio)
-                import requests
-                payload = {
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": query}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 1500,
-                    "stream": False
-                }
-                response = requests.post(f"{self.base_url}/chat/completions", json=payload)
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
-
-        except openai.RateLimitError as e:
-            logger.error(f"Rate limit exceeded: {e}")
-            return "Mi dispiace, ho raggiunto il limite di richieste. Riprova tra qualche istante."
-        except openai.APIError as e:
-            logger.error(f"OpenAI API error: {e}")
-            return "Mi dispiace, c'è stato un problema con il servizio. Riprova più tardi."
-        except Exception as e:
-            # Handle ZAI API errors
-            if "ZAI" in str(e) or (self.model_type == "zai" and "429" in str(e)):
-                logger.error(f"ZAI API error: {e}")
-                if "429" in str(e):
-                    return "Mi dispiace, ho raggiunto il limite di richieste ZAI. Riprova tra qualche istante."
-                else:
-                    return "Mi dispiace, c'è stato un problema con il servizio ZAI. Riprova più tardi."
-            # Handle OpenRouter API errors
-            elif "OpenRouter" in str(e) or (self.model_type == "openrouter" and ("429" in str(e) or "rate" in str(e).lower())):
-                logger.error(f"OpenRouter API error: {e}")
-                if "429" in str(e) or "rate" in str(e).lower():
-                    return "Mi dispiace, ho raggiunto il limite di richieste OpenRouter. Riprova tra qualche istante."
-                else:
-                    return "Mi dispiace, c'è stato un problema con il servizio OpenRouter. Riprova più tardi."
-            else:
-                logger.error(f"Errore nella generazione della risposta: {e}")
-                return "Mi dispiace, ho riscontrato un problema nell'elaborare la tua domanda. Riprova più tardi."
+        manager = None
+        extra: Dict[str, Any] = {}
+        if self.model_type == "zai":
+            manager = self.zai_manager
+        elif self.model_type == "openrouter":
+            manager = self.openrouter_manager
+            extra = {"top_p": 0.9, "frequency_penalty": 0.2, "presence_penalty": 0.1}
+        elif self.model_type == "megallm":
+            manager = self.megallm_manager
+        elif self.model_type in ["ollama", "lmstudio"]:
+            manager = self.local_manager
+
+        if manager is not None:
+            async for delta in manager.stream_chat_completion(
+                model_to_use, messages, temperature=0.7, max_tokens=max_tokens, **extra
+            ):
+                yield delta
+            return
+
+        if self.model_type == "local":
+            async for delta in self._local_transport().stream_chat(
+                "/chat/completions",
+                {"model": self.model, "messages": messages, "temperature": 0.7, "max_tokens": 1500}
+            ):
+                yield delta
+            return
+
+        # Nessun client in streaming disponibile: risposta completa in un solo frammento
+        yield await self._generate_chat_completion(query, context, model_to_use)
 
     async def generate_quiz(self, course_id: str, topic: str = None, difficulty: str = "medium", num_questions: int = 5) -> Dict[str, Any]:
         """Generate quiz questions based on course material"""
@@ -1947,16 +1995,17 @@ class LLMService:
 
         try:
             if self.model_type == "openai":
-                response = self.client.chat.completions.create(
-                    model=model_to_use,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Crea un quiz per il corso {course_id}"}
-                    ],
-                    temperature=0.7,
-                    max_tokens=2500,
-                    response_format={"type": "json_object"}
-                )
+                async with provider_slot("openai"):
+                    response = await self.client.chat.completions.create(
+                        model=model_to_use,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": f"Crea un quiz per il corso {course_id}"}
+                        ],
+                        temperature=0.7,
+                        max_tokens=2500,
+                        response_format={"type": "json_object"}
+                    )
                 content = response.choices[0].message.content
 
                 # Log per monitoraggio costi
@@ -1968,7 +2017,6 @@ class LLMService:
                                usage.completion_tokens * model_info["cost_per_1k_tokens"]["output"] / 1000)
                         logger.info(f"Quiz generation - Model: {model_to_use}, Tokens: {usage.total_tokens}, Cost: ${cost:.4f}")
             else:
-                import requests
                 payload = {
                     "model": self.model,
                     "messages": [
@@ -1979,8 +2027,8 @@ class LLMService:
                     "max_tokens": 2500,
                     "stream": False
                 }
-                response = requests.post(f"{self.base_url}/v1/chat/completions", json=payload)
-                content = response.json()["choices"][0]["message"]["content"]
+                result = await self._local_chat_completion(payload)
+                content = result["choices"][0]["message"]["content"]
 
             # Parse JSON response
             try:
@@ -2124,22 +2172,22 @@ class LLMService:
             """
 
             if self.model_type == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model,  # Usa il modello configurato (GPT-4, GPT-4o, etc.)
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.8,  # Creativity leggermente più alta per piani di studio
-                    max_tokens=3000,  # Aumentato per piani più dettagliati
-                    top_p=0.9,
-                    frequency_penalty=0.1,
-                    presence_penalty=0.1,
-                    response_format={"type": "text"}
-                )
+                async with provider_slot("openai"):
+                    response = await self.client.chat.completions.create(
+                        model=self.model,  # Usa il modello configurato (GPT-4, GPT-4o, etc.)
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=0.8,  # Creativity leggermente più alta per piani di studio
+                        max_tokens=3000,  # Aumentato per piani più dettagliati
+                        top_p=0.9,
+                        frequency_penalty=0.1,
+                        presence_penalty=0.1,
+                        response_format={"type": "text"}
+                    )
                 return response.choices[0].message.content
             else:
-                import requests
                 payload = {
                     "model": self.model,
                     "messages": [
@@ -2150,8 +2198,8 @@ class LLMService:
                     "max_tokens": 3000,
                     "stream": False
                 }
-                response = requests.post(f"{self.base_url}/chat/completions", json=payload)
-                return response.json()["choices"][0]["message"]["content"]
+                result = await self._local_chat_completion(payload)
+                return result["choices"][0]["message"]["content"]
 
         except Exception as e:
             print(f"Error generating study plan: {e}")
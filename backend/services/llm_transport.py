@@ -0,0 +1,306 @@
+"""
+LLM Transport - Trasporto HTTP asincrono condiviso dai provider LLM
+
+Un `httpx.AsyncClient` con connection pooling per provider/endpoint, limiti di
+concorrenza per provider (asyncio.Semaphore), timeout configurabili e retry con
+backoff esponenziale non bloccante (`await asyncio.sleep`). Le chiamate LLM non
+congelano più l'event loop di FastAPI.
+
+Configurazione:
+    LLM_MAX_CONCURRENCY            limite di default per provider (8)
+    <PROVIDER>_MAX_CONCURRENCY     override per provider (es. ZAI_MAX_CONCURRENCY)
+    LLM_MAX_CONNECTIONS            connessioni massime del pool per client (20)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 8
+RETRYABLE_EXCEPTIONS = (httpx.TimeoutException, httpx.TransportError)
+
+
+class LLMTransportError(Exception):
+    """Errore HTTP restituito da un provider LLM."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+def provider_concurrency(provider: str) -> int:
+    """Limite di richieste contemporanee per un provider."""
+    default = int(os.getenv("LLM_MAX_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY)))
+    value = os.getenv(f"{provider.upper()}_MAX_CONCURRENCY")
+    try:
+        return max(1, int(value)) if value else max(1, default)
+    except ValueError:
+        return max(1, default)
+
+
+class _ProviderLimiter:
+    """Semaforo per provider, ricreato se cambia l'event loop in esecuzione."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.limit = provider_concurrency(provider)
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+
+    def semaphore(self) -> asyncio.Semaphore:
+        loop_id = id(asyncio.get_running_loop())
+        semaphore = self._semaphores.get(loop_id)
+        if semaphore is None:
+            # Un solo loop attivo nel caso normale: scarta i semafori di loop chiusi
+            self._semaphores = {loop_id: asyncio.Semaphore(self.limit)}
+            semaphore = self._semaphores[loop_id]
+        return semaphore
+
+
+_limiters: Dict[str, _ProviderLimiter] = {}
+
+
+def get_limiter(provider: str) -> _ProviderLimiter:
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        limiter = _limiters[provider] = _ProviderLimiter(provider)
+    return limiter
+
+
+@asynccontextmanager
+async def provider_slot(provider: str):
+    """Occupa uno slot di concorrenza del provider (usato anche dagli SDK esterni)."""
+    async with get_limiter(provider).semaphore():
+        yield
+
+
+class AsyncLLMTransport:
+    """Client HTTP asincrono per un singolo provider/endpoint."""
+
+    def __init__(
+        self,
+        provider: str,
+        base_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        connect_timeout: float = 10.0
+    ):
+        self.provider = provider
+        self.base_url = base_url.rstrip("/")
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.connect_timeout = connect_timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def limiter(self) -> _ProviderLimiter:
+        return get_limiter(self.provider)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=httpx.Timeout(self.timeout, connect=min(self.connect_timeout, self.timeout)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max(1, max_connections // 2)
+            )
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Client con pool di connessioni legato all'event loop corrente."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = self._build_client()
+            self._client_loop = loop
+        return self._client
+
+    def slot(self):
+        return provider_slot(self.provider)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        json: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None
+    ) -> httpx.Response:
+        """
+        Esegue una richiesta con retry su errori 5xx, timeout ed errori di connessione.
+        Le risposte 4xx vengono restituite subito al chiamante senza retry.
+        """
+        max_retries = self.max_retries if retries is None else retries
+        request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+
+        for attempt in range(max_retries + 1):
+            try:
+                async with self.slot():
+                    response = await self.client.request(method, path, json=json, timeout=request_timeout)
+            except RETRYABLE_EXCEPTIONS as exc:
+                if attempt >= max_retries:
+                    raise
+                delay = self.base_delay * (2 ** attempt)
+                logger.warning(
+                    f"{self.provider} request error (attempt {attempt + 1}/{max_retries + 1}): "
+                    f"{type(exc).__name__}, retrying in {delay}s..."
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code >= 500 and attempt < max_retries:
+                delay = self.base_delay * (2 ** attempt)
+                logger.warning(
+                    f"{self.provider} API request failed with {response.status_code} "
+                    f"(attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s..."
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            return response
+
+        raise LLMTransportError(f"{self.provider} request failed: maximum retries exceeded")
+
+    async def post_json(self, path: str, payload: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        """POST JSON con retry; solleva LLMTransportError se la risposta non è 200."""
+        response = await self.request("POST", path, json=payload, **kwargs)
+        if response.status_code != 200:
+            kind = "client error" if 400 <= response.status_code < 500 else "request failed"
+            raise LLMTransportError(
+                f"{self.provider} API {kind}: {response.status_code} - {response.text}",
+                status_code=response.status_code,
+                body=response.text
+            )
+        return response.json()
+
+    async def stream_events(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        POST in streaming (Server-Sent Events, formato OpenAI): restituisce gli eventi JSON
+        man mano che arrivano, fino a `[DONE]`. Lo slot di concorrenza resta occupato per
+        tutta la durata dello stream; non ci sono retry una volta iniziata la risposta.
+        """
+        async with self.slot():
+            async with self.client.stream("POST", path, json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    kind = "client error" if 400 <= response.status_code < 500 else "request failed"
+                    raise LLMTransportError(
+                        f"{self.provider} API {kind}: {response.status_code} - {body}",
+                        status_code=response.status_code,
+                        body=body
+                    )
+
+                async for raw_line in response.aiter_lines():
+                    line = raw_line.strip()
+                    if not line or line.startswith(":"):
+                        continue
+                    if line.startswith("data:"):
+                        line = line[5:].strip()
+                    if line == "[DONE]":
+                        break
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+    async def stream_chat(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Frammenti di testo (`choices[0].delta.content`) di una chat completion in streaming."""
+        async for event in self.stream_events(path, {**payload, "stream": True}):
+            for choice in event.get("choices") or []:
+                delta = choice.get("delta") or {}
+                content = delta.get("content")
+                if content is None:
+                    # Alcuni server locali restituiscono il messaggio completo anche in streaming
+                    content = (choice.get("message") or {}).get("content")
+                if content:
+                    yield content
+
+    async def is_ok(self, method: str, path: str, timeout: float = 10.0, **kwargs) -> bool:
+        """True se l'endpoint risponde 200 (senza retry, per health check)."""
+        try:
+            response = await self.request(method, path, timeout=timeout, retries=0, **kwargs)
+            return response.status_code == 200
+        except Exception as exc:
+            logger.error(f"{self.provider} check failed on {path}: {exc}")
+            return False
+
+    async def aclose(self):
+        client, self._client = self._client, None
+        if client is not None and not client.is_closed:
+            try:
+                await client.aclose()
+            except RuntimeError:
+                # Client creato su un event loop ormai chiuso
+                pass
+
+
+_transports: Dict[Tuple[str, str, str], AsyncLLMTransport] = {}
+_openai_clients: Dict[Tuple[str, str], Any] = {}
+
+
+def _credentials_fingerprint(headers: Optional[Dict[str, str]]) -> str:
+    raw = "|".join(f"{key}={value}" for key, value in sorted((headers or {}).items()))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def get_transport(
+    provider: str,
+    base_url: str,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 60.0,
+    max_retries: int = 3
+) -> AsyncLLMTransport:
+    """
+    Restituisce il trasporto condiviso per (provider, base_url, credenziali), così
+    i manager ricreati ad ogni richiesta riusano lo stesso pool di connessioni.
+    """
+    key = (provider, base_url.rstrip("/"), _credentials_fingerprint(headers))
+    transport = _transports.get(key)
+    if transport is None:
+        transport = AsyncLLMTransport(provider, base_url, headers=headers, timeout=timeout, max_retries=max_retries)
+        _transports[key] = transport
+    return transport
+
+
+def get_openai_client(api_key: str, base_url: str, timeout: float = 30.0, max_retries: int = 3):
+    """Client `openai.AsyncOpenAI` condiviso per (chiave, base_url)."""
+    import openai
+
+    key = (hashlib.sha1(api_key.encode("utf-8")).hexdigest(), base_url.rstrip("/"))
+    client = _openai_clients.get(key)
+    if client is None:
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=max_retries)
+        _openai_clients[key] = client
+    return client
+
+
+async def close_transports():
+    """Chiude tutti i pool di connessioni (da chiamare allo shutdown dell'app)."""
+    transports = list(_transports.values())
+    _transports.clear()
+    for transport in transports:
+        await transport.aclose()
+
+    clients = list(_openai_clients.values())
+    _openai_clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as exc:
+            logger.warning(f"Failed to close OpenAI client: {exc}")
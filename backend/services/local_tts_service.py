@@ -1,21 +1,39 @@
 import os
+import re
 import uuid
 import json
+import asyncio
+import hashlib
+import threading
 import unicodedata
-from typing import List, Dict, Any, Optional
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
-from TTS.api import TTS
 from pydub import AudioSegment
 from services.audio_library_service import get_voice_samples
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 AUDIO_DIR = os.path.join(ROOT_DIR, "data", "audio")
+SEGMENTS_DIR = os.path.join(AUDIO_DIR, "segments")
 METADATA_PATH = os.path.join(AUDIO_DIR, "recordings.json")
 
 MODEL_NAME = os.getenv("LOCAL_TTS_MODEL", "tts_models/multilingual/multi-dataset/xtts_v2")
+# Processi che sintetizzano i segmenti in parallelo (0 = nel processo corrente)
+WORKERS = int(os.getenv("LOCAL_TTS_WORKERS", "2"))
+# Lunghezza massima di un segmento: i testi lunghi vengono divisi per frasi
+MAX_SEGMENT_CHARS = int(os.getenv("LOCAL_TTS_MAX_SEGMENT_CHARS", "200"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…;:])\s+")
+_CLAUSE_END = re.compile(r"(?<=[,])\s+")
 
 _tts = None
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_metadata_lock = threading.RLock()
+# Indice delle registrazioni, ricaricato solo se recordings.json cambia su disco
+_metadata_cache: Dict[str, Any] = {"stamp": None, "items": [], "by_id": {}}
 
 def _ensure_dirs():
     os.makedirs(AUDIO_DIR, exist_ok=True)
@@ -26,6 +44,8 @@ def _normalize_text(text: str) -> str:
 def _get_tts():
     global _tts
     if _tts is None:
+        # Import pigro: i cache hit e il processo principale non caricano il modello
+        from TTS.api import TTS
         _tts = TTS(MODEL_NAME)
         try:
             _tts.to("cuda")
@@ -33,25 +53,64 @@ def _get_tts():
             pass
     return _tts
 
-def _save_metadata(entry: Dict[str, Any]) -> Dict[str, Any]:
-    _ensure_dirs()
-    data: List[Dict[str, Any]] = []
-    if os.path.exists(METADATA_PATH):
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # spawn: ogni worker inizializza il proprio modello (e CUDA) da zero
+            _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def shutdown_workers():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def _load_metadata() -> List[Dict[str, Any]]:
+    with _metadata_lock:
         try:
-            with open(METADATA_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            data = []
-    data.append(entry)
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return entry
+            stat = os.stat(METADATA_PATH)
+        except FileNotFoundError:
+            _metadata_cache.update(stamp=None, items=[], by_id={})
+            return []
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != _metadata_cache["stamp"]:
+            try:
+                with open(METADATA_PATH, "r", encoding="utf-8") as f:
+                    items = json.load(f)
+            except Exception:
+                items = []
+            _metadata_cache.update(stamp=stamp, items=items, by_id={item.get("id"): item for item in items})
+        return _metadata_cache["items"]
+
+def _save_metadata(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    _ensure_dirs()
+    with _metadata_lock:
+        data = list(_load_metadata())
+        known = {item.get("id") for item in data}
+        data.extend(entry for entry in entries if entry["id"] not in known)
+        # Scrittura atomica: i lettori non vedono mai un file a metà
+        tmp_path = f"{METADATA_PATH}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, METADATA_PATH)
+        _metadata_cache["stamp"] = None
+    return entries
+
+def _cached_recording(rec_id: str) -> Optional[Dict[str, Any]]:
+    with _metadata_lock:
+        _load_metadata()
+        entry = _metadata_cache["by_id"].get(rec_id)
+    if entry and os.path.exists(entry.get("file_path", "")):
+        return entry
+    return None
 
 def list_recordings(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-    if not os.path.exists(METADATA_PATH):
-        return []
-    with open(METADATA_PATH, "r", encoding="utf-8") as f:
-        items = json.load(f)
+    items = list(_load_metadata())
     if not filters:
         return items
     def match(item: Dict[str, Any]) -> bool:
@@ -67,25 +126,101 @@ def list_recordings(filters: Optional[Dict[str, Any]] = None) -> List[Dict[str,
         return True
     return [i for i in items if match(i)]
 
-def synthesize_local(text: str, title: Optional[str] = None, language: str = "it", voice: str = "default", speed: float = 1.0, tone: str = "neutral", speaker_id: Optional[str] = None) -> Dict[str, Any]:
-    _ensure_dirs()
-    normalized = _normalize_text(text)
-    rec_id = str(uuid.uuid4())
-    wav_path = os.path.join(AUDIO_DIR, f"{rec_id}.wav")
-    mp3_path = os.path.join(AUDIO_DIR, f"{rec_id}.mp3")
+def split_segments(text: str, max_chars: int = MAX_SEGMENT_CHARS) -> List[str]:
+    """Divide il testo in segmenti di frasi intere lunghi al più `max_chars` (se possibile)."""
+    pieces: List[str] = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        # Frase troppo lunga: si spezza sulle virgole, poi sugli spazi
+        for clause in _CLAUSE_END.split(sentence):
+            while len(clause) > max_chars:
+                cut = clause.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append(clause[:cut])
+                clause = clause[cut:].lstrip()
+            pieces.append(clause)
+
+    segments: List[str] = []
+    for piece in (p.strip() for p in pieces):
+        if not piece:
+            continue
+        if segments and len(segments[-1]) + 1 + len(piece) <= max_chars:
+            segments[-1] = f"{segments[-1]} {piece}"
+        else:
+            segments.append(piece)
+    return segments
+
+def recording_key(text: str, language: str = "it", speaker_id: Optional[str] = None, speed: float = 1.0,
+                  tone: str = "neutral", speaker_wavs: Optional[List[str]] = None) -> str:
+    """Chiave di contenuto di una sintesi: stesso testo e stessi parametri, stesso MP3."""
+    payload = json.dumps({
+        "text": _normalize_text(text),
+        "language": language,
+        "speaker_id": speaker_id,
+        "speaker_wavs": sorted(speaker_wavs or []),
+        "speed": round(float(speed or 1.0), 3),
+        "tone": tone,
+        "model": MODEL_NAME
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
+def _synthesize_segment(text: str, language: str, speaker_wavs: Optional[List[str]], wav_path: str) -> str:
+    # Eseguita nei processi worker: ognuno carica il modello alla prima chiamata
     tts = _get_tts()
-    speaker_wavs: Optional[List[str]] = None
-    if speaker_id:
-        samples = get_voice_samples(speaker_id)
-        if samples:
-            speaker_wavs = samples
     if speaker_wavs:
-        tts.tts_to_file(text=normalized, file_path=wav_path, language=language, speaker_wav=speaker_wavs)
+        tts.tts_to_file(text=text, file_path=wav_path, language=language, speaker_wav=speaker_wavs)
     else:
-        tts.tts_to_file(text=normalized, file_path=wav_path, language=language)
+        tts.tts_to_file(text=text, file_path=wav_path, language=language)
+    return wav_path
+
+def _run_segments(jobs: List[Tuple[str, str, Optional[List[str]], str]]) -> List[str]:
+    executor = _get_executor()
+    if executor is None or not jobs:
+        return [_synthesize_segment(*job) for job in jobs]
+    return list(executor.map(_synthesize_segment, *zip(*jobs)))
+
+async def _run_segments_async(jobs: List[Tuple[str, str, Optional[List[str]], str]]) -> List[str]:
+    executor = _get_executor()
+    if executor is None or not jobs:
+        return await asyncio.to_thread(_run_segments, jobs)
+    loop = asyncio.get_running_loop()
+    return list(await asyncio.gather(*(loop.run_in_executor(executor, _synthesize_segment, *job) for job in jobs)))
+
+def _prepare(text: str, language: str, speed: float, tone: str, speaker_id: Optional[str]) -> Dict[str, Any]:
+    normalized = _normalize_text(text)
+    speaker_wavs = (get_voice_samples(speaker_id) or None) if speaker_id else None
+    key = recording_key(normalized, language, speaker_id, speed, tone, speaker_wavs)
+    return {
+        "id": key[:32],
+        "text": normalized,
+        "language": language,
+        "speed": speed,
+        "tone": tone,
+        "speaker_id": speaker_id,
+        "speaker_wavs": speaker_wavs,
+        "segments": split_segments(normalized) or [normalized]
+    }
+
+def _segment_jobs(request: Dict[str, Any]) -> List[Tuple[str, str, Optional[List[str]], str]]:
+    os.makedirs(SEGMENTS_DIR, exist_ok=True)
+    return [
+        (segment, request["language"], request["speaker_wavs"],
+         os.path.join(SEGMENTS_DIR, f"{request['id']}.{index}.{uuid.uuid4().hex[:8]}.wav"))
+        for index, segment in enumerate(request["segments"])
+    ]
 
-    audio = AudioSegment.from_wav(wav_path)
+def _assemble(request: Dict[str, Any], wav_paths: List[str], title: Optional[str], voice: str) -> Dict[str, Any]:
+    _ensure_dirs()
+    rec_id = request["id"]
+    mp3_path = os.path.join(AUDIO_DIR, f"{rec_id}.mp3")
+    normalized = request["text"]
+    speed = request["speed"]
+
+    audio = AudioSegment.empty()
+    for wav_path in wav_paths:
+        audio += AudioSegment.from_wav(wav_path)
     if speed and abs(speed - 1.0) > 1e-3:
         audio = audio.speedup(playback_speed=max(0.5, min(2.0, speed)))
     def pitch_semitones_for_tone(t: str) -> float:
@@ -94,24 +229,28 @@ def synthesize_local(text: str, title: Optional[str] = None, language: str = "it
         if t == "formal":
             return 1.0
         return 0.0
-    ps = pitch_semitones_for_tone(tone)
+    ps = pitch_semitones_for_tone(request["tone"])
     if abs(ps) > 1e-3:
         new_frame_rate = int(audio.frame_rate * (2.0 ** (ps / 12.0)))
         audio = audio._spawn(audio.raw_data, overrides={"frame_rate": new_frame_rate}).set_frame_rate(audio.frame_rate)
-    audio.export(mp3_path, format="mp3", bitrate="128k")
-    try:
-        os.remove(wav_path)
-    except Exception:
-        pass
+    # Export su file temporaneo e rename: una richiesta concorrente non legge un MP3 a metà
+    tmp_path = f"{mp3_path}.{uuid.uuid4().hex[:8]}.tmp"
+    audio.export(tmp_path, format="mp3", bitrate="128k")
+    os.replace(tmp_path, mp3_path)
+    for wav_path in wav_paths:
+        try:
+            os.remove(wav_path)
+        except Exception:
+            pass
 
-    entry = {
+    return {
         "id": rec_id,
         "title": title or (normalized[:60] + ("..." if len(normalized) > 60 else "")),
-        "language": language,
+        "language": request["language"],
         "voice": voice,
-        "speaker_id": speaker_id,
+        "speaker_id": request["speaker_id"],
         "speed": speed,
-        "tone": tone,
+        "tone": request["tone"],
         "filename": f"{rec_id}.mp3",
         "file_path": mp3_path,
         "url": f"/audio/{rec_id}.mp3",
@@ -119,21 +258,64 @@ def synthesize_local(text: str, title: Optional[str] = None, language: str = "it
         "bitrate": "128k",
         "sample_rate": audio.frame_rate,
         "text_preview": normalized[:200],
+        "segments": len(wav_paths),
         "categories": [],
         "created_at": datetime.utcnow().isoformat()
     }
-    return _save_metadata(entry)
 
-def synthesize_batch_local(items: List[Dict[str, Any]], language: str = "it", voice: str = "default") -> List[Dict[str, Any]]:
-    results: List[Dict[str, Any]] = []
+def synthesize_local(text: str, title: Optional[str] = None, language: str = "it", voice: str = "default", speed: float = 1.0, tone: str = "neutral", speaker_id: Optional[str] = None) -> Dict[str, Any]:
+    request = _prepare(text, language, speed, tone, speaker_id)
+    cached = _cached_recording(request["id"])
+    if cached:
+        return cached
+    wav_paths = _run_segments(_segment_jobs(request))
+    return _save_metadata([_assemble(request, wav_paths, title, voice)])[0]
+
+async def synthesize_local_async(text: str, title: Optional[str] = None, language: str = "it", voice: str = "default", speed: float = 1.0, tone: str = "neutral", speaker_id: Optional[str] = None) -> Dict[str, Any]:
+    request = await asyncio.to_thread(_prepare, text, language, speed, tone, speaker_id)
+    cached = await asyncio.to_thread(_cached_recording, request["id"])
+    if cached:
+        return cached
+    wav_paths = await _run_segments_async(_segment_jobs(request))
+    entry = await asyncio.to_thread(_assemble, request, wav_paths, title, voice)
+    return (await asyncio.to_thread(_save_metadata, [entry]))[0]
+
+def _prepare_batch(items: List[Dict[str, Any]], language: str, voice: str):
+    requests, pending = [], {}
     for item in items:
-        res = synthesize_local(
-            text=item.get("text", ""),
-            title=item.get("title"),
-            language=item.get("language", language),
-            voice=item.get("voice", voice),
-            speed=float(item.get("speed", 1.0)),
-            tone=item.get("tone", "neutral")
+        request = _prepare(
+            item.get("text", ""),
+            item.get("language") or language,
+            float(item.get("speed") or 1.0),
+            item.get("tone") or "neutral",
+            item.get("speaker_id")
         )
-        results.append(res)
-    return results
+        requests.append((request, item.get("title"), item.get("voice") or voice))
+        if request["id"] not in pending and not _cached_recording(request["id"]):
+            pending[request["id"]] = (request, _segment_jobs(request))
+    return requests, pending
+
+def _finish_batch(requests, pending, wav_paths: List[str]) -> List[Dict[str, Any]]:
+    # I segmenti di tutti gli elementi sono stati sintetizzati insieme: si riassegnano in ordine
+    created: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for request, title, voice in requests:
+        rec_id = request["id"]
+        if rec_id in pending and rec_id not in created:
+            count = len(pending[rec_id][1])
+            created[rec_id] = _assemble(request, wav_paths[offset:offset + count], title, voice)
+            offset += count
+    if created:
+        _save_metadata(list(created.values()))
+    return [created.get(request["id"]) or _cached_recording(request["id"]) for request, _, _ in requests]
+
+def synthesize_batch_local(items: List[Dict[str, Any]], language: str = "it", voice: str = "default") -> List[Dict[str, Any]]:
+    requests, pending = _prepare_batch(items, language, voice)
+    jobs = [job for _, request_jobs in pending.values() for job in request_jobs]
+    return _finish_batch(requests, pending, _run_segments(jobs))
+
+async def synthesize_batch_local_async(items: List[Dict[str, Any]], language: str = "it", voice: str = "default") -> List[Dict[str, Any]]:
+    requests, pending = await asyncio.to_thread(_prepare_batch, items, language, voice)
+    jobs = [job for _, request_jobs in pending.values() for job in request_jobs]
+    wav_paths = await _run_segments_async(jobs)
+    return await asyncio.to_thread(_finish_batch, requests, pending, wav_paths)
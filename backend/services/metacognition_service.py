@@ -13,6 +13,7 @@ import uuid
 import numpy as np
 from collections import defaultdict, Counter
 from enum import Enum
+from services.service_container import service_container
 
 class MetacognitionFramework:
     """
@@ -1133,4 +1134,4 @@ class MetacognitionFramework:
             return {"success": False, "error": str(e)}
 
 # Initialize the metacognition service
-metacognition_service = MetacognitionFramework()
\ No newline at end of file
+metacognition_service = service_container.lazy("metacognition")
\ No newline at end of file
@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 from typing import List
 
 def _safe_import_spacy():
@@ -22,8 +23,15 @@ def _safe_import_nltk():
     except Exception:
         return None, None
 
-_NLP = _safe_import_spacy()
-_NLTK, _STEMMER = _safe_import_nltk()
+# spaCy e NLTK vengono caricati al primo utilizzo: importare il modulo (es. dal router
+# mindmap_expand) non deve costare il caricamento del modello a ogni worker
+@lru_cache(maxsize=1)
+def _get_nlp():
+    return _safe_import_spacy()
+
+@lru_cache(maxsize=1)
+def _get_stemmer():
+    return _safe_import_nltk()[1]
 
 STOPWORDS_IT = {
     "di","del","della","dei","delle","da","dal","dalla","su","sul","sulla","per","tra","fra",
@@ -34,9 +42,10 @@ def extract_nouns(text: str, max_terms: int = 6) -> List[str]:
     if not text:
         return []
     terms: List[str] = []
-    if _NLP is not None:
+    nlp = _get_nlp()
+    if nlp is not None:
         try:
-            doc = _NLP(text)
+            doc = nlp(text)
             for token in doc:
                 if token.pos_ in {"NOUN","PROPN"}:
                     t = token.lemma_.lower().strip()
@@ -56,11 +65,12 @@ def extract_nouns(text: str, max_terms: int = 6) -> List[str]:
 
 def normalize_terms(terms: List[str]) -> List[str]:
     out: List[str] = []
+    stemmer = _get_stemmer() if terms else None
     for t in terms:
         tt = t.lower().strip()
-        if _STEMMER is not None:
+        if stemmer is not None:
             try:
-                tt = _STEMMER.stem(tt)
+                tt = stemmer.stem(tt)
             except Exception:
                 pass
         out.append(tt)
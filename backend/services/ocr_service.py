@@ -14,33 +14,95 @@ import pytesseract
 import easyocr
 import tempfile
 import logging
-from typing import List, Dict, Optional, Tuple, Any
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
 import asyncio
 import aiofiles
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from services.pdf_text_cache import pdf_text_cache
+from services.service_container import service_container
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+RENDER_ZOOM = 2.0  # 2x zoom for better OCR
+
+# Stato dei processi worker OCR: un servizio e un documento aperto per processo
+_worker_service = None
+_worker_doc = None
+
+
+def _render_page(doc, page_num: int, zoom: float = RENDER_ZOOM) -> Image.Image:
+    """Rasterizza una singola pagina (1-based) come immagine PIL."""
+    page = doc.load_page(page_num - 1)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    return Image.open(io.BytesIO(pix.tobytes("png")))
+
+
+def _page_entry(page_num: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "page": page_num,
+        "text": result.get("text", ""),
+        "confidence": result.get("confidence", 0),
+        "engine": result.get("engine", "unknown")
+    }
+
+
+def _ocr_page_worker(pdf_path: str, page_num: int, language: str, prefer_engine: str) -> Dict[str, Any]:
+    """
+    OCR di una pagina in un processo del pool: la pagina viene rasterizzata nel worker,
+    così tra i processi viaggiano solo path e testo, non le immagini. I worker non usano
+    EasyOCR (un modello per processo): le pagine a bassa confidenza vengono ripassate
+    con EasyOCR nel processo principale.
+    """
+    global _worker_service, _worker_doc
+
+    if _worker_service is None or _worker_service.prefer_engine != prefer_engine:
+        _worker_service = OCRService(prefer_engine=prefer_engine, enable_easyocr=False)
+    # Chiave con mtime e dimensione: un file sostituito allo stesso path viene riaperto
+    stat = os.stat(pdf_path)
+    doc_key = (pdf_path, stat.st_mtime_ns, stat.st_size)
+    if _worker_doc is None or _worker_doc[0] != doc_key:
+        if _worker_doc is not None:
+            _worker_doc[1].close()
+        _worker_doc = (doc_key, fitz.open(pdf_path))
+
+    image = _render_page(_worker_doc[1], page_num)
+    try:
+        return _page_entry(page_num, _worker_service.ocr_image(image, language))
+    finally:
+        image.close()
+
+
 class OCRService:
     """Service for OCR processing of PDFs and images"""
 
-    def __init__(self, prefer_engine: str = "tesseract"):
+    def __init__(self, prefer_engine: str = "tesseract", enable_easyocr: bool = True):
         """
         Initialize OCR service
 
         Args:
             prefer_engine: Preferred OCR engine ("tesseract" or "easyocr")
+            enable_easyocr: Allow EasyOCR as engine or low-confidence fallback
         """
         self.prefer_engine = prefer_engine
         self.easyocr_reader = None
 
+        # Pipeline OCR per pagina: pool di processi limitato + checkpoint per riprendere
+        self.max_workers = int(os.getenv("OCR_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.checkpoint_dir = os.getenv("OCR_CHECKPOINT_DIR", "data/ocr_checkpoints")
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
         # Configure Tesseract
         self.tesseract_available = self._check_tesseract()
 
         # Initialize EasyOCR on first use
-        self.easyocr_available = True
+        self.easyocr_available = enable_easyocr
 
         logger.info(f"OCR Service initialized with preferred engine: {prefer_engine}")
         logger.info(f"Tesseract available: {self.tesseract_available}")
@@ -65,6 +127,23 @@ class OCRService:
                 logger.error(f"Failed to initialize EasyOCR: {e}")
                 self.easyocr_available = False
 
+    def iter_page_images(self, pdf_path: str) -> Iterator[Tuple[int, Image.Image]]:
+        """
+        Rasterize PDF pages lazily, one at a time
+
+        Args:
+            pdf_path: Path to PDF file
+
+        Yields:
+            (page_number, image) tuples; the caller owns (and closes) each image
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            for page_num in range(1, len(doc) + 1):
+                yield page_num, _render_page(doc, page_num)
+        finally:
+            doc.close()
+
     def extract_images_from_pdf(self, pdf_path: str) -> List[Tuple[int, Image.Image]]:
         """
         Extract images from PDF pages
@@ -75,28 +154,11 @@ class OCRService:
         Returns:
             List of (page_number, image) tuples
         """
-        images = []
-
         try:
-            doc = fitz.open(pdf_path)
-
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-
-                # Get page as image
-                mat = fitz.Matrix(2.0, 2.0)  # 2x zoom for better OCR
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("png")
-                img = Image.open(io.BytesIO(img_data))
-
-                images.append((page_num + 1, img))
-
-            doc.close()
-
+            return list(self.iter_page_images(pdf_path))
         except Exception as e:
             logger.error(f"Error extracting images from PDF {pdf_path}: {e}")
-
-        return images
+            return []
 
     def preprocess_image(self, image: Image.Image) -> np.ndarray:
         """
@@ -234,7 +296,7 @@ class OCRService:
             results.append(result)
 
         # Try fallback engine if preferred failed or had low confidence
-        if len(results) == 0 or (results[0].get("confidence", 0) < 50 and results[0].get("text", "").strip()):
+        if len(results) == 0 or self._is_low_confidence(results[0]):
             if self.prefer_engine != "tesseract" and self.tesseract_available:
                 fallback_result = self.ocr_with_tesseract(image, language)
                 if fallback_result.get("text", "").strip():
@@ -253,13 +315,140 @@ class OCRService:
 
         return best_result
 
-    def ocr_pdf(self, pdf_path: str, language: str = 'ita') -> Dict[str, Any]:
+    @staticmethod
+    def _is_low_confidence(result: Dict[str, Any]) -> bool:
+        return result.get("confidence", 0) < 50 and bool(result.get("text", "").strip())
+
+    def _easyocr_fallback(self, doc, page_num: int, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Ripassa con EasyOCR, nel processo corrente, una pagina OCR'd a bassa confidenza dal pool"""
+        if not (self.easyocr_available and self._is_low_confidence(entry)):
+            return entry
+        image = _render_page(doc, page_num)
+        try:
+            fallback = self.ocr_with_easyocr(image)
+        finally:
+            image.close()
+        if fallback.get("text", "").strip() and fallback.get("confidence", 0) > entry.get("confidence", 0):
+            return _page_entry(page_num, fallback)
+        return entry
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _use_process_pool(self) -> bool:
+        # EasyOCR carica un modello per processo ed è già multi-thread: resta nel processo corrente
+        return self.max_workers > 1 and self.prefer_engine == "tesseract" and self.tesseract_available
+
+    def _checkpoint_path(self, pdf_path: str, language: str) -> str:
+        file_hash = pdf_text_cache.file_hash(pdf_path)
+        return os.path.join(self.checkpoint_dir, f"{file_hash}_{language}_{self.prefer_engine}.jsonl")
+
+    def _load_checkpoint(self, checkpoint_path: str) -> Dict[int, Dict[str, Any]]:
+        done = {}
+        if not os.path.exists(checkpoint_path):
+            return done
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    done[int(entry["page"])] = entry
+                except (ValueError, KeyError):
+                    # Ultima riga troncata da un crash: la pagina verrà rielaborata
+                    continue
+        return done
+
+    def iter_ocr_pdf(self, pdf_path: str, language: str = 'ita', resume: bool = True,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream OCR results page by page, in page order
+
+        Pages are rasterized inside the workers and OCR'd in a bounded process pool
+        (at most 2 x OCR_MAX_WORKERS pages in flight). Every completed page is appended
+        to a checkpoint keyed by file hash, language and engine, so an interrupted run
+        resumes from the first missing page.
+
+        Args:
+            pdf_path: Path to PDF file
+            language: Language code for Tesseract
+            resume: Reuse pages already stored in the checkpoint
+            progress_callback: Called with (pages_done, total_pages) after each page
+
+        Yields:
+            Page dictionaries with page, text, confidence and engine
+        """
+        doc = fitz.open(pdf_path)
+        total_pages = len(doc)
+
+        checkpoint_path = self._checkpoint_path(pdf_path, language)
+        done = self._load_checkpoint(checkpoint_path) if resume else {}
+        if done:
+            logger.info(f"Resuming OCR for {pdf_path}: {len(done)}/{total_pages} pages from checkpoint")
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        checkpoint = open(checkpoint_path, 'a' if resume else 'w', encoding='utf-8')
+
+        use_pool = self._use_process_pool()
+        executor = self._get_executor() if use_pool else None
+        window = self.max_workers * 2
+        todo = iter([page_num for page_num in range(1, total_pages + 1) if page_num not in done])
+        in_flight = {}
+
+        def fill():
+            while use_pool and len(in_flight) < window:
+                page_num = next(todo, None)
+                if page_num is None:
+                    break
+                in_flight[page_num] = executor.submit(
+                    _ocr_page_worker, pdf_path, page_num, language, self.prefer_engine
+                )
+
+        try:
+            for page_num in range(1, total_pages + 1):
+                entry = done.get(page_num)
+                if entry is None:
+                    try:
+                        if use_pool:
+                            fill()
+                            entry = in_flight.pop(page_num).result()
+                            entry = self._easyocr_fallback(doc, page_num, entry)
+                        else:
+                            image = _render_page(doc, page_num)
+                            try:
+                                entry = _page_entry(page_num, self.ocr_image(image, language))
+                            finally:
+                                image.close()
+                    except Exception as e:
+                        # Non salvata nel checkpoint: verrà ritentata alla prossima esecuzione
+                        logger.error(f"OCR failed for page {page_num} of {pdf_path}: {e}")
+                        entry = {"page": page_num, "text": "", "confidence": 0, "engine": "none", "error": str(e)}
+                    else:
+                        checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                        checkpoint.flush()
+
+                fill()
+                logger.info(f"Processed page {page_num}/{total_pages}")
+                if progress_callback:
+                    progress_callback(page_num, total_pages)
+                yield entry
+        finally:
+            for future in in_flight.values():
+                future.cancel()
+            checkpoint.close()
+            doc.close()
+
+    def ocr_pdf(self, pdf_path: str, language: str = 'ita', resume: bool = True,
+                progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
         """
         Perform OCR on entire PDF document
 
         Args:
             pdf_path: Path to PDF file
             language: Language code for Tesseract
+            resume: Continue from the last checkpoint of an interrupted run
+            progress_callback: Called with (pages_done, total_pages) after each page
 
         Returns:
             OCR result dictionary with page-by-page text
@@ -269,46 +458,38 @@ class OCRService:
 
         logger.info(f"Starting OCR for PDF: {pdf_path}")
 
-        # Extract images from PDF
-        page_images = self.extract_images_from_pdf(pdf_path)
-
-        if not page_images:
-            return {"error": "No images could be extracted from PDF"}
-
-        full_text = ""
+        text_parts = []
         pages_data = []
         total_confidence = 0
-        processed_pages = 0
-
-        for page_num, image in page_images:
-            logger.info(f"Processing page {page_num}/{len(page_images)}")
-
-            # Perform OCR on page image
-            page_result = self.ocr_image(image, language)
+        total_pages = 0
 
-            if page_result.get("text", "").strip():
-                page_text = f"--- Page {page_num} ---\n{page_result['text']}\n\n"
-                full_text += page_text
+        try:
+            for page_result in self.iter_ocr_pdf(pdf_path, language, resume=resume,
+                                                 progress_callback=progress_callback):
+                total_pages += 1
+                if page_result.get("text", "").strip():
+                    text_parts.append(f"--- Page {page_result['page']} ---\n{page_result['text']}\n\n")
+                    pages_data.append({
+                        "page": page_result["page"],
+                        "text": page_result["text"],
+                        "confidence": page_result.get("confidence", 0),
+                        "engine": page_result.get("engine", "unknown")
+                    })
+                    total_confidence += page_result.get("confidence", 0)
+        except Exception as e:
+            logger.error(f"Error during OCR of PDF {pdf_path}: {e}")
 
-                pages_data.append({
-                    "page": page_num,
-                    "text": page_result["text"],
-                    "confidence": page_result.get("confidence", 0),
-                    "engine": page_result.get("engine", "unknown")
-                })
+        if total_pages == 0:
+            return {"error": "No images could be extracted from PDF"}
 
-                total_confidence += page_result.get("confidence", 0)
-                processed_pages += 1
-
-            # Clean up
-            image.close()
+        processed_pages = len(pages_data)
 
         # Calculate overall confidence
         avg_confidence = total_confidence / processed_pages if processed_pages > 0 else 0
 
         result = {
-            "text": full_text.strip(),
-            "total_pages": len(page_images),
+            "text": "".join(text_parts).strip(),
+            "total_pages": total_pages,
             "processed_pages": processed_pages,
             "average_confidence": avg_confidence,
             "pages_data": pages_data,
@@ -316,24 +497,31 @@ class OCRService:
             "engines_used": list(set(page.get("engine", "unknown") for page in pages_data))
         }
 
-        logger.info(f"OCR completed for {pdf_path}: {processed_pages}/{len(page_images)} pages processed")
+        logger.info(f"OCR completed for {pdf_path}: {processed_pages}/{total_pages} pages processed")
 
         return result
 
-    async def async_ocr_pdf(self, pdf_path: str, language: str = 'ita') -> Dict[str, Any]:
+    async def async_ocr_pdf(self, pdf_path: str, language: str = 'ita',
+                            progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
         """
         Asynchronous OCR processing for PDF
 
         Args:
             pdf_path: Path to PDF file
             language: Language code for Tesseract
+            progress_callback: Called on the event loop with (pages_done, total_pages)
 
         Returns:
             OCR result dictionary
         """
-        # Run OCR in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.ocr_pdf, pdf_path, language)
+        # Orchestration in a thread, OCR in the process pool: the event loop stays free
+        loop = asyncio.get_running_loop()
+
+        def report(done: int, total: int):
+            loop.call_soon_threadsafe(progress_callback, done, total)
+
+        return await asyncio.to_thread(self.ocr_pdf, pdf_path, language, True,
+                                       report if progress_callback else None)
 
     def detect_scanned_pdf(self, pdf_path: str) -> Dict[str, Any]:
         """
@@ -415,11 +603,27 @@ class OCRService:
                 f.write(ocr_result.get('text', ''))
 
             logger.info(f"OCR result saved to: {output_file}")
+            self._update_search_index(output_file)
             return str(output_file)
 
         except Exception as e:
             logger.error(f"Error saving OCR result: {e}")
             return ""
 
+    def _update_search_index(self, output_file: Path):
+        # Solo se la ricerca avanzata è attiva in questo processo; altrimenti la allinea il suo sync
+        if not service_container.is_initialized("advanced_search"):
+            return
+        try:
+            service_container.get("advanced_search").index_ocr_result_file(output_file)
+        except Exception as e:
+            logger.error(f"Error updating search index for {output_file}: {e}")
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
 # Global instance
-ocr_service = OCRService()
\ No newline at end of file
+ocr_service = service_container.lazy("ocr")
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+PDF Text Cache - Estrazione del testo per pagina, parallela e persistente
+
+Il testo di ogni pagina (più il sommario/TOC) viene estratto una sola volta e salvato
+in una cache indirizzata per contenuto (sha256 del file): indicizzazione, analisi della
+struttura, chunking locale e generazione dei concetti leggono tutti da qui invece di
+ri-parsare lo stesso PDF. I PDF lunghi vengono estratti in parallelo su intervalli di
+pagine con un pool di processi.
+
+Configurazione:
+    PDF_TEXT_CACHE_DIR               directory della cache (data/pdf_text_cache)
+    PDF_EXTRACT_WORKERS              processi per l'estrazione (default: min(4, cpu))
+    PDF_EXTRACT_PARALLEL_MIN_PAGES   pagine minime per usare il pool (32)
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+CACHE_FORMAT_VERSION = 1
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Estrae il testo delle pagine [start, end) con PyMuPDF (eseguito nei processi worker)."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(file_path)
+    try:
+        return [doc.load_page(page_num).get_text() for page_num in range(start, min(end, len(doc)))]
+    finally:
+        doc.close()
+
+
+class PDFTextCache:
+    def __init__(self, base_dir: Optional[str] = None, max_workers: Optional[int] = None,
+                 parallel_min_pages: Optional[int] = None):
+        self.base_dir = base_dir or os.getenv("PDF_TEXT_CACHE_DIR", "data/pdf_text_cache")
+        self.max_workers = max_workers or int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.parallel_min_pages = parallel_min_pages or int(os.getenv("PDF_EXTRACT_PARALLEL_MIN_PAGES", "32"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._memory_lock = threading.Lock()
+        # (path, mtime, size) -> sha256, per non ricalcolare l'hash dei file non modificati
+        self._hash_memo: Dict[Tuple[str, int, int], str] = {}
+        # Cache in memoria dell'ultimo documento letto (consumer successivi sullo stesso file)
+        self._recent: Dict[str, Dict[str, Any]] = {}
+        self._max_recent = 4
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+
+    def file_hash(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        cached = self._hash_memo.get(memo_key)
+        if cached:
+            return cached
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as handle:
+            for block in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(block)
+        file_hash = digest.hexdigest()
+        self._hash_memo[memo_key] = file_hash
+        return file_hash
+
+    def _cache_path(self, file_hash: str) -> str:
+        return os.path.join(self.base_dir, file_hash[:2], f"{file_hash}.json")
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get_document(self, file_path: str) -> Dict[str, Any]:
+        """
+        Restituisce {"hash", "pages": [testo per pagina], "toc": [[livello, titolo, pagina], ...]},
+        estraendo il PDF solo se non è già in cache.
+        """
+        file_hash = self.file_hash(file_path)
+        with self._memory_lock:
+            document = self._recent.get(file_hash)
+        if document is None:
+            document = self._load(file_hash)
+        if document is None:
+            pages, toc = self._extract(file_path)
+            document = {"hash": file_hash, "pages": pages, "toc": toc}
+            self._save(file_hash, document)
+
+        self._remember(file_hash, document)
+        return document
+
+    def get_pages(self, file_path: str) -> List[str]:
+        return self.get_document(file_path)["pages"]
+
+    def get_text(self, file_path: str) -> str:
+        return "".join(self.get_pages(file_path))
+
+    def get_toc(self, file_path: str) -> List[List[Any]]:
+        return self.get_document(file_path)["toc"]
+
+    def invalidate(self, file_path: str):
+        try:
+            file_hash = self.file_hash(file_path)
+        except OSError:
+            return
+        with self._memory_lock:
+            self._recent.pop(file_hash, None)
+        try:
+            os.remove(self._cache_path(file_hash))
+        except FileNotFoundError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _remember(self, file_hash: str, document: Dict[str, Any]):
+        with self._memory_lock:
+            self._recent.pop(file_hash, None)
+            self._recent[file_hash] = document
+            while len(self._recent) > self._max_recent:
+                self._recent.pop(next(iter(self._recent)))
+
+    def _load(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        path = self._cache_path(file_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+            if data.get("version") != CACHE_FORMAT_VERSION:
+                return None
+            return {"hash": file_hash, "pages": data["pages"], "toc": data.get("toc", [])}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Corrupted PDF text cache entry", path=path, error=str(e))
+            return None
+
+    def _save(self, file_hash: str, document: Dict[str, Any]):
+        path = self._cache_path(file_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        payload = {
+            "version": CACHE_FORMAT_VERSION,
+            "page_count": len(document["pages"]),
+            "pages": document["pages"],
+            "toc": document["toc"]
+        }
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(payload, handle, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to write PDF text cache", path=path, error=str(e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # ------------------------------------------------------------------
+    # Extraction
+    # ------------------------------------------------------------------
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _extract(self, file_path: str) -> Tuple[List[str], List[List[Any]]]:
+        try:
+            import fitz  # PyMuPDF
+
+            doc = fitz.open(file_path)
+            try:
+                page_count = len(doc)
+                toc = [list(entry[:3]) for entry in doc.get_toc()]
+                if page_count < self.parallel_min_pages or self.max_workers <= 1:
+                    return [doc.load_page(page_num).get_text() for page_num in range(page_count)], toc
+            finally:
+                doc.close()
+
+            return self._extract_parallel(file_path, page_count), toc
+
+        except Exception as e:
+            logger.warning("PyMuPDF extraction failed, falling back to PyPDF2", file_path=file_path, error=str(e))
+            return self._extract_with_pypdf2(file_path), []
+
+    def _extract_parallel(self, file_path: str, page_count: int) -> List[str]:
+        # Intervalli contigui, qualche intervallo in più dei worker per bilanciare pagine pesanti
+        range_size = max(8, -(-page_count // (self.max_workers * 4)))
+        ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+        try:
+            executor = self._get_executor()
+            results = executor.map(
+                _extract_page_range,
+                [file_path] * len(ranges),
+                [start for start, _ in ranges],
+                [end for _, end in ranges]
+            )
+            return [page for block in results for page in block]
+        except Exception as e:
+            logger.warning("Parallel PDF extraction failed, extracting sequentially", file_path=file_path, error=str(e))
+            return _extract_page_range(file_path, 0, page_count)
+
+    @staticmethod
+    def _extract_with_pypdf2(file_path: str) -> List[str]:
+        import PyPDF2
+
+        try:
+            with open(file_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                return [page.extract_text() or "" for page in pdf_reader.pages]
+        except Exception as e:
+            logger.error("Error extracting text with PyPDF2", file_path=file_path, error=str(e))
+            raise Exception("Could not extract text from PDF")
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+# Global instance, condivisa da tutti i consumer
+pdf_text_cache = PDFTextCache()
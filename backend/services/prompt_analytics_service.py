@@ -4,6 +4,8 @@ Monitor, analyze, and optimize prompt performance across different AI models
 """
 
 import json
+import os
+import threading
 import time
 import uuid
 from datetime import datetime, timedelta
@@ -15,6 +17,8 @@ import statistics
 import structlog
 from pydantic import BaseModel
 
+from services.event_log import SegmentedEventLog
+
 logger = structlog.get_logger()
 
 class PromptType(str, Enum):
@@ -63,54 +67,149 @@ class PromptPerformance:
         if self.timestamp is None:
             self.timestamp = datetime.now()
 
+def _enum_value(value: Any) -> str:
+    return value.value if isinstance(value, Enum) else str(value)
+
 class PromptAnalyticsService:
-    """Service for monitoring and analyzing prompt performance"""
+    """
+    Service for monitoring and analyzing prompt performance.
+
+    Le esecuzioni sono aggiunte a un event log append-only (`events/`, un segmento JSONL per
+    giorno) e aggregate incrementalmente: metriche globali e rollup orari per tipo di prompt e
+    provider. Registrare un'esecuzione costa una append e qualche somma; metrics.json e
+    rollups.json vengono riscritti al più ogni `flush_interval` secondi o `flush_every` eventi.
+
+    Configurazione:
+        PROMPT_ANALYTICS_FLUSH_INTERVAL    secondi tra due salvataggi degli aggregati (default: 30)
+        PROMPT_ANALYTICS_FLUSH_EVERY       eventi tra due salvataggi degli aggregati (default: 100)
+        PROMPT_ANALYTICS_ROLLUP_DAYS       giorni di rollup orari conservati (default: 90)
+    """
 
     def __init__(self, storage_path: str = "data/prompt_analytics"):
         self.storage_path = storage_path
+        # performances.json è il vecchio archivio: viene importato nell'event log una sola volta
         self.performances_file = f"{storage_path}/performances.json"
         self.metrics_file = f"{storage_path}/metrics.json"
+        self.rollups_file = f"{storage_path}/rollups.json"
         self.experiments_file = f"{storage_path}/experiments.json"
 
+        self.flush_interval = float(os.getenv("PROMPT_ANALYTICS_FLUSH_INTERVAL", "30"))
+        self.flush_every = int(os.getenv("PROMPT_ANALYTICS_FLUSH_EVERY", "100"))
+        self.rollup_retention_days = int(os.getenv("PROMPT_ANALYTICS_ROLLUP_DAYS", "90"))
+        self._lock = threading.RLock()
+        self._pending_events = 0
+        self._last_flush = time.monotonic()
+        self.recent_performances: Dict[str, Dict[str, Any]] = {}
+
         self._ensure_storage()
+        self.event_log = SegmentedEventLog(os.path.join(storage_path, "events"))
         self._load_metrics()
+        self._load_rollups()
+        self._migrate_legacy_performances()
 
     def _ensure_storage(self):
         """Create storage directories and files"""
-        import os
         os.makedirs(self.storage_path, exist_ok=True)
 
         # Initialize files if they don't exist
-        for file_path in [self.performances_file, self.metrics_file, self.experiments_file]:
-            if not os.path.exists(file_path):
-                with open(file_path, 'w') as f:
-                    json.dump({}, f, indent=2, default=str)
+        if not os.path.exists(self.experiments_file):
+            with open(self.experiments_file, 'w') as f:
+                json.dump({}, f, indent=2, default=str)
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, Any]:
+        return {
+            "total_prompts": 0,
+            "successful_prompts": 0,
+            "failed_prompts": 0,
+            "average_execution_time": 0.0,
+            "total_cost": 0.0,
+            "prompt_types": {},
+            "model_providers": {},
+            "cognitive_loads": {}
+        }
 
     def _load_metrics(self):
         """Load existing metrics from storage"""
+        self.metrics = self._empty_metrics()
         try:
             with open(self.metrics_file, 'r') as f:
-                self.metrics = json.load(f)
+                self.metrics.update(json.load(f))
         except (FileNotFoundError, json.JSONDecodeError):
-            self.metrics = {
-                "total_prompts": 0,
-                "successful_prompts": 0,
-                "failed_prompts": 0,
-                "average_execution_time": 0.0,
-                "total_cost": 0.0,
-                "prompt_types": {},
-                "model_providers": {},
-                "cognitive_loads": {}
-            }
+            pass
+
+    def _load_rollups(self):
+        """Load hourly rollups, rebuilding them from the event log if missing"""
+        try:
+            with open(self.rollups_file, 'r') as f:
+                self.rollups: Dict[str, Dict[str, float]] = json.load(f)
+            return
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.rollups = {}
+
+        cutoff = datetime.now() - timedelta(days=self.rollup_retention_days)
+        for event in self.event_log.read(since=cutoff):
+            self._update_rollup(event)
+        if self.rollups:
+            self._write_json(self.rollups_file, self.rollups)
+
+    def _migrate_legacy_performances(self):
+        """Import the legacy performances.json into the event log (once, the file is kept as backup)"""
+        if self.event_log.segments() or not os.path.exists(self.performances_file):
+            return
+        try:
+            with open(self.performances_file, 'r') as f:
+                performances = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Legacy performances not migrated: {e}")
+            return
+        if not performances:
+            return
+
+        events = sorted(performances.values(), key=lambda perf: perf.get("timestamp", ""))
+        self.event_log.append_many(events)
+        self.rollups = {}
+        for event in events:
+            self._update_rollup(event)
+        self.flush()
+        logger.info("Migrated legacy prompt performances to event log", records=len(events))
+
+    @staticmethod
+    def _write_json(path: str, data: Any):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(tmp_path, path)
 
     def _save_metrics(self):
         """Save metrics to storage"""
         try:
-            with open(self.metrics_file, 'w') as f:
-                json.dump(self.metrics, f, indent=2, default=str)
+            self._write_json(self.metrics_file, self.metrics)
         except Exception as e:
             logger.error(f"Failed to save metrics: {e}")
 
+    def flush(self):
+        """Persist aggregated metrics and rollups"""
+        with self._lock:
+            self._prune_rollups()
+            self._save_metrics()
+            try:
+                self._write_json(self.rollups_file, self.rollups)
+            except Exception as e:
+                logger.error(f"Failed to save rollups: {e}")
+            self._pending_events = 0
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.event_log.close()
+
+    def _maybe_flush(self):
+        self._pending_events += 1
+        if (self._pending_events >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
     def record_prompt_execution(self, performance: PromptPerformance) -> str:
         """Record a prompt execution for analytics"""
         try:
@@ -118,25 +217,19 @@ class PromptAnalyticsService:
             if not performance.id:
                 performance.id = str(uuid.uuid4())
 
-            # Load existing performances
-            try:
-                with open(self.performances_file, 'r') as f:
-                    performances = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                performances = {}
-
-            # Add new performance
-            performances[performance.id] = {
+            event = {
                 **asdict(performance),
                 "timestamp": performance.timestamp.isoformat()
             }
 
-            # Save updated performances
-            with open(self.performances_file, 'w') as f:
-                json.dump(performances, f, indent=2, default=str)
+            # Append-only: il costo non dipende dallo storico
+            self.event_log.append(event)
 
             # Update aggregated metrics
-            self._update_metrics(performance)
+            with self._lock:
+                self._update_metrics(performance)
+                self._update_rollup(event)
+                self._maybe_flush()
 
             logger.info(
                 "Recorded prompt execution",
@@ -153,6 +246,58 @@ class PromptAnalyticsService:
             logger.error(f"Failed to record prompt execution: {e}")
             return ""
 
+    @staticmethod
+    def _rollup_key(bucket: str, prompt_type: str, provider: str) -> str:
+        return f"{bucket}|{prompt_type}|{provider}"
+
+    def _update_rollup(self, event: Dict[str, Any]):
+        """Add an event to its hourly bucket for (prompt type, provider)"""
+        bucket = str(event.get("timestamp", ""))[:13]
+        key = self._rollup_key(bucket, _enum_value(event.get("prompt_type")), _enum_value(event.get("model_provider")))
+        rollup = self.rollups.setdefault(key, {"count": 0, "successful": 0, "total_time": 0.0, "total_cost": 0.0})
+        rollup["count"] += 1
+        rollup["successful"] += 1 if event.get("success") else 0
+        rollup["total_time"] += event.get("execution_time_ms") or 0.0
+        rollup["total_cost"] += event.get("cost_estimate") or 0.0
+
+    def _prune_rollups(self):
+        cutoff = (datetime.now() - timedelta(days=self.rollup_retention_days)).isoformat()[:13]
+        for key in [key for key in self.rollups if key.split("|", 1)[0] < cutoff]:
+            del self.rollups[key]
+
+    def get_rollup_stats(self,
+                         prompt_type: Optional[PromptType] = None,
+                         model_provider: Optional[ModelProvider] = None,
+                         hours_back: int = 24) -> Dict[str, Any]:
+        """Aggregate statistics from hourly rollups (no event log scan, hour granularity)"""
+        cutoff = (datetime.now() - timedelta(hours=hours_back)).isoformat()[:13]
+        count = successful = 0
+        total_time = total_cost = 0.0
+
+        with self._lock:
+            for key, rollup in self.rollups.items():
+                bucket, rollup_type, provider = key.split("|")
+                if bucket < cutoff:
+                    continue
+                if prompt_type and rollup_type != prompt_type.value:
+                    continue
+                if model_provider and provider != model_provider.value:
+                    continue
+                count += rollup["count"]
+                successful += rollup["successful"]
+                total_time += rollup["total_time"]
+                total_cost += rollup["total_cost"]
+
+        success_rate = successful / count if count else 0.0
+        return {
+            "count": count,
+            "success_rate": success_rate,
+            "avg_execution_time": total_time / count if count else 0.0,
+            "avg_cost": total_cost / count if count else 0.0,
+            "error_rate": 1.0 - success_rate if count else 0.0,
+            "total_cost": total_cost
+        }
+
     def _update_metrics(self, performance: PromptPerformance):
         """Update aggregated metrics with new performance data"""
         self.metrics["total_prompts"] += 1
@@ -163,8 +308,7 @@ class PromptAnalyticsService:
             self.metrics["failed_prompts"] += 1
 
         # Update average execution time
-        total_time = self.metrics.get("total_execution_time", 0) * (self.metrics["total_prompts"] - 1)
-        total_time += performance.execution_time_ms
+        total_time = self.metrics.get("total_execution_time", 0) + performance.execution_time_ms
         self.metrics["average_execution_time"] = total_time / self.metrics["total_prompts"]
         self.metrics["total_execution_time"] = total_time
 
@@ -192,13 +336,11 @@ class PromptAnalyticsService:
         pt_metrics["success_rate"] = successful_count / pt_metrics["count"]
 
         # Update averages for prompt type
-        pt_total_time = pt_metrics.get("total_time", 0) * (pt_metrics["count"] - 1)
-        pt_total_time += performance.execution_time_ms
+        pt_total_time = pt_metrics.get("total_time", 0) + performance.execution_time_ms
         pt_metrics["avg_execution_time"] = pt_total_time / pt_metrics["count"]
         pt_metrics["total_time"] = pt_total_time
 
-        pt_total_cost = pt_metrics.get("total_cost", 0) * (pt_metrics["count"] - 1)
-        pt_total_cost += performance.cost_estimate
+        pt_total_cost = pt_metrics.get("total_cost", 0) + performance.cost_estimate
         pt_metrics["avg_cost"] = pt_total_cost / pt_metrics["count"]
         pt_metrics["total_cost"] = pt_total_cost
 
@@ -239,30 +381,23 @@ class PromptAnalyticsService:
         cl_metrics["successful_count"] = cl_successful
         cl_metrics["success_rate"] = cl_successful / cl_metrics["count"]
 
-        self._save_metrics()
-
     def get_prompt_performance_stats(self,
                                     prompt_type: Optional[PromptType] = None,
                                     model_provider: Optional[ModelProvider] = None,
                                     hours_back: int = 24) -> Dict[str, Any]:
         """Get performance statistics for prompts"""
         try:
-            # Load recent performances
+            # Load recent performances (solo i segmenti della finestra)
             cutoff_time = datetime.now() - timedelta(hours=hours_back)
 
-            with open(self.performances_file, 'r') as f:
-                performances = json.load(f)
+            def matches(perf_data: Dict[str, Any]) -> bool:
+                if prompt_type and perf_data["prompt_type"] != prompt_type.value:
+                    return False
+                if model_provider and perf_data["model_provider"] != model_provider.value:
+                    return False
+                return True
 
-            # Filter performances
-            filtered_performances = []
-            for perf_data in performances.values():
-                perf_time = datetime.fromisoformat(perf_data["timestamp"])
-                if perf_time >= cutoff_time:
-                    if prompt_type and perf_data["prompt_type"] != prompt_type.value:
-                        continue
-                    if model_provider and perf_data["model_provider"] != model_provider.value:
-                        continue
-                    filtered_performances.append(perf_data)
+            filtered_performances = list(self.event_log.read(since=cutoff_time, predicate=matches))
 
             if not filtered_performances:
                 return {
@@ -305,23 +440,24 @@ class PromptAnalyticsService:
                                sample_size: int = 100) -> Dict[str, Any]:
         """Compare performance of two prompt variants (A/B testing)"""
         try:
-            # Get performances for both variants
-            with open(self.performances_file, 'r') as f:
-                performances = json.load(f)
-
+            # Get the most recent performances for both variants, stopping once both samples are full
             variant_a_perfs = []
             variant_b_perfs = []
 
-            for perf_data in performances.values():
-                if perf_data["prompt_type"] == prompt_type.value:
-                    if perf_data.get("prompt_template", "").startswith(variant_a_template[:50]):
+            events = self.event_log.read(
+                newest_first=True,
+                predicate=lambda perf: perf["prompt_type"] == prompt_type.value
+            )
+            for perf_data in events:
+                template = perf_data.get("prompt_template", "")
+                if template.startswith(variant_a_template[:50]):
+                    if len(variant_a_perfs) < sample_size:
                         variant_a_perfs.append(perf_data)
-                    elif perf_data.get("prompt_template", "").startswith(variant_b_template[:50]):
+                elif template.startswith(variant_b_template[:50]):
+                    if len(variant_b_perfs) < sample_size:
                         variant_b_perfs.append(perf_data)
-
-            # Limit to sample size
-            variant_a_perfs = variant_a_perfs[:sample_size]
-            variant_b_perfs = variant_b_perfs[:sample_size]
+                if len(variant_a_perfs) >= sample_size and len(variant_b_perfs) >= sample_size:
+                    break
 
             if len(variant_a_perfs) < 10 or len(variant_b_perfs) < 10:
                 return {
@@ -432,7 +568,7 @@ class PromptAnalyticsService:
 
             # Analyze each prompt type
             for prompt_type in PromptType:
-                stats = self.get_prompt_performance_stats(prompt_type=prompt_type, hours_back=168)  # Last week
+                stats = self.get_rollup_stats(prompt_type=prompt_type, hours_back=168)  # Last week
 
                 if stats["count"] < 10:
                     continue
@@ -482,13 +618,9 @@ class PromptAnalyticsService:
         try:
             cutoff_time = datetime.now() - timedelta(hours=hours_back)
 
-            with open(self.performances_file, 'r') as f:
-                performances = json.load(f)
-
             # Filter recent performances
             recent_performances = {
-                pid: perf for pid, perf in performances.items()
-                if datetime.fromisoformat(perf["timestamp"]) >= cutoff_time
+                perf["id"]: perf for perf in self.event_log.read(since=cutoff_time)
             }
 
             if format.lower() == "json":
@@ -1128,4 +1260,5 @@ class PromptAnalyticsService:
         return recommendations
 
 # Global instance
-prompt_analytics_service = PromptAnalyticsService()
\ No newline at end of file
+prompt_analytics_service = PromptAnalyticsService()
+analytics_service = prompt_analytics_service
\ No newline at end of file
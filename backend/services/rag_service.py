@@ -1,32 +1,28 @@
+import asyncio
 import chromadb
 import os
-import torch
 import time
 import copy
 import math
 import re
 import socket
 from collections import Counter
-from typing import List, Dict, Any, Optional, Tuple
-from sentence_transformers import SentenceTransformer
-import PyPDF2
-import fitz  # PyMuPDF
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import pdfplumber
 from io import BytesIO
 import uuid
 import json
 import structlog
-from pathlib import Path
 from services.metrics import metrics
 import hashlib
 import numpy as np
-try:
-    import faiss as _faiss
-except Exception:
-    _faiss = None
 
-from services.course_service import CourseService
-from services.annotation_service import AnnotationService
+from services.service_container import get_annotation_service, get_answer_cache, get_course_service, get_llm_service
+from services.scope_index_store import ScopeIndexStore
+from services.lexical_index import LexicalIndex
+from services.pdf_text_cache import pdf_text_cache
+from services.cache_service import CacheType, scope_cache_tags, scope_invalidation_tags
+from services.tiered_cache import LRUCache, TieredCache
 try:
     from logging_config import get_logger, get_structlog_logger, LoggedTimer, PerformanceLogger
 except ImportError:
@@ -66,6 +62,8 @@ class RAGService:
 
         # Inizializza HybridSearchService
         self.hybrid_search = None
+        # Invalidazioni delle cache avviate dai metodi sincroni di cancellazione
+        self._invalidation_tasks = set()
 
         # Inizializza Cache Service (lazy loading)
         self.cache_service = None
@@ -101,17 +99,28 @@ class RAGService:
         )
 
         # Course/material helpers
-        self.course_service = CourseService()
-        self.book_chunk_cache: Dict[str, Dict[str, Any]] = {}
+        self.course_service = get_course_service()
         self.max_cached_chunk_sets = 8
+        self.book_chunk_cache = LRUCache(max_size=self.max_cached_chunk_sets)
         self.max_cached_chunks = 1200
-        self.annotation_service = AnnotationService()
+        # Indici per-scope persistenti: sopravvivono a riavvii ed eviction della cache in memoria
+        self.scope_index_store = ScopeIndexStore(model_name=self.model_name)
+        self.embedding_batch_size = int(os.getenv("RAG_EMBEDDING_BATCH_SIZE", "64"))
+        self.pdf_text_cache = pdf_text_cache
+        self.annotation_service = get_annotation_service()
+        self.annotation_context_limit = int(os.getenv("RAG_ANNOTATION_LIMIT", "8"))
+        self.annotation_context_tokens = int(os.getenv("RAG_ANNOTATION_TOKEN_BUDGET", "600"))
         self.embedding_fallback_enabled = False
         self._tokenizer_pattern = re.compile(r"\w+", re.UNICODE)
         self._hf_available: Optional[bool] = None
-        self.query_cache: Dict[str, Dict[str, Any]] = {}
-        self.query_cache_ttl = 600
-        self.query_cache_max = 128
+        self.query_cache = LRUCache(max_size=128, default_ttl=600)
+        # Contesti RAG: L1 in processo + Redis L2, con coalescing delle query identiche concorrenti
+        self.context_cache = TieredCache(
+            "rag_context",
+            cache_type=CacheType.QUERY_RESULT,
+            max_size=int(os.getenv("RAG_CONTEXT_CACHE_SIZE", "256")),
+            l2_provider=self._get_l2_cache
+        )
 
         logger.info("RAG Service initialized with Italian-optimized settings",
                    model=self.model_name,
@@ -129,44 +138,6 @@ class RAGService:
 
         return {"$and": conditions}
 
-    def _trim_chunk_cache(self):
-        if len(self.book_chunk_cache) <= self.max_cached_chunk_sets:
-            return
-
-        oldest_key = None
-        oldest_ts = time.time()
-        for key, entry in self.book_chunk_cache.items():
-            entry_ts = entry.get("updated_at", 0)
-            if entry_ts <= oldest_ts:
-                oldest_key = key
-                oldest_ts = entry_ts
-
-        if oldest_key is not None:
-            self.book_chunk_cache.pop(oldest_key, None)
-
-    def _get_query_cache(self, key: str) -> Optional[Dict[str, Any]]:
-        entry = self.query_cache.get(key)
-        if not entry:
-            return None
-        ts = entry.get("ts")
-        if not ts or (time.time() - ts) > self.query_cache_ttl:
-            self.query_cache.pop(key, None)
-            return None
-        return entry.get("data")
-
-    def _set_query_cache(self, key: str, data: Dict[str, Any]):
-        if len(self.query_cache) >= self.query_cache_max:
-            oldest_k = None
-            oldest_ts = time.time()
-            for k, v in self.query_cache.items():
-                t = v.get("ts", 0)
-                if t <= oldest_ts:
-                    oldest_k = k
-                    oldest_ts = t
-            if oldest_k:
-                self.query_cache.pop(oldest_k, None)
-        self.query_cache[key] = {"ts": time.time(), "data": data}
-
     def _resolve_scope_entities(self, course_id: str, book_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
         try:
             course = self.course_service.get_course(course_id)
@@ -233,37 +204,33 @@ class RAGService:
 
         return metadata
 
-    def _fetch_user_annotations(self, user_id: Optional[str], course_id: str,
-                                book_id: Optional[str], limit: int = 8) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _annotation_in_scope(annotation: Dict[str, Any], course_id: str, book_id: Optional[str]) -> bool:
+        if not annotation.get("share_with_ai") and not annotation.get("is_public"):
+            return False
+
+        annotation_book_id = annotation.get("book_id") or None
+        annotation_course_id = annotation.get("course_id") or None
+
+        if book_id:
+            return annotation_book_id == book_id
+        return not annotation_book_id and (annotation_course_id == course_id or not annotation_course_id)
+
+    def _fetch_user_annotations(self, user_id: Optional[str], course_id: str, book_id: Optional[str],
+                                query: str = "", limit: int = 8) -> List[Tuple[Dict[str, Any], float]]:
         if not user_id:
             return []
 
         try:
-            annotations = self.annotation_service.get_user_annotations(user_id, limit=500)
+            # Indice per utente in memoria: nessuna lettura da disco sul percorso della chat
+            return self.annotation_service.find_relevant_annotations(
+                user_id, query, limit=limit,
+                predicate=lambda annotation: self._annotation_in_scope(annotation, course_id, book_id)
+            )
         except Exception as exc:
             logger.error("Failed to load user annotations", user_id=user_id, error=str(exc))
             return []
 
-        filtered: List[Dict[str, Any]] = []
-        for annotation in annotations:
-            if not annotation.get("share_with_ai") and not annotation.get("is_public"):
-                continue
-
-            annotation_book_id = annotation.get("book_id") or None
-            annotation_course_id = annotation.get("course_id") or None
-
-            if book_id:
-                if annotation_book_id == book_id:
-                    filtered.append(annotation)
-            else:
-                if not annotation_book_id and (annotation_course_id == course_id or not annotation_course_id):
-                    filtered.append(annotation)
-
-            if len(filtered) >= limit:
-                break
-
-        return filtered
-
     def _format_annotation_snippet(self, annotation: Dict[str, Any]) -> str:
         selection = (annotation.get("selected_text") or annotation.get("text") or "").strip()
         note = (annotation.get("content") or "").strip()
@@ -283,27 +250,32 @@ class RAGService:
         return f"{header}: {snippet_body}" if snippet_body else header
 
     def _merge_user_annotations(self, context_result: Dict[str, Any], course_id: str,
-                                book_id: Optional[str], user_id: Optional[str]) -> Dict[str, Any]:
+                                book_id: Optional[str], user_id: Optional[str], query: str = "") -> Dict[str, Any]:
         if not user_id:
             return context_result
 
-        annotations = self._fetch_user_annotations(user_id, course_id, book_id)
-        if not annotations:
+        ranked = self._fetch_user_annotations(user_id, course_id, book_id, query,
+                                              limit=self.annotation_context_limit)
+        if not ranked:
             return context_result
 
         annotation_sections: List[str] = []
         annotation_sources: List[Dict[str, Any]] = []
+        top_score = ranked[0][1] or 1.0
+        # Budget approssimato a ~4 caratteri per token: le note meno pertinenti che non ci stanno restano fuori
+        remaining_chars = self.annotation_context_tokens * 4
 
-        for idx, annotation in enumerate(annotations):
+        for idx, (annotation, score) in enumerate(ranked):
             snippet = self._format_annotation_snippet(annotation)
-            if not snippet:
+            if not snippet or len(snippet) > remaining_chars:
                 continue
+            remaining_chars -= len(snippet)
 
             annotation_sections.append(snippet)
             annotation_sources.append({
                 "source": f"Nota personale pagina {annotation.get('page_number', '?')}",
                 "chunk_index": idx,
-                "relevance_score": 1.0,
+                "relevance_score": round(score / top_score, 4) if score else 0.0,
                 "type": "user_annotation",
                 "annotation_id": annotation.get("id"),
                 "page_number": annotation.get("page_number"),
@@ -326,7 +298,7 @@ class RAGService:
 
         scope = dict(context_result.get("scope") or {})
         scope["user_annotations_used"] = scope.get("user_annotations_used", 0) + len(annotation_sources)
-        scope["annotations_strategy"] = "prepended"
+        scope["annotations_strategy"] = "relevance_ranked" if query else "recent"
         merged_result["scope"] = scope
 
         return merged_result
@@ -345,9 +317,31 @@ class RAGService:
 
         return "|".join(sorted(signatures))
 
+    def _load_or_build_material_chunks(self, file_path: str) -> Tuple[List[str], Optional[np.ndarray]]:
+        """Chunk ed embedding di un singolo materiale, riusando lo store su disco quando possibile."""
+        material_key = self.scope_index_store.material_key(file_path)
+        stored = self.scope_index_store.load_material(material_key) if material_key else None
+
+        if stored is not None:
+            texts, embeddings = stored
+            if embeddings is not None or not texts:
+                return texts, embeddings
+        else:
+            text = self.extract_text_from_pdf(file_path)
+            # Un PDF senza testo estraibile (es. scansionato) non produce chunk
+            texts = [chunk for chunk in self.split_text_into_chunks(text) if chunk.strip()]
+
+        # Testi già disponibili ma embedding mancanti (es. modello caricato dopo un fallback)
+        embeddings = self._embed_texts(texts)
+        if material_key and (stored is None or embeddings is not None):
+            self.scope_index_store.save_material(material_key, texts, embeddings)
+        return texts, embeddings
+
     def _build_chunks_from_materials(self, materials: List[Dict[str, Any]], course_id: str,
-                                     book_id: Optional[str]) -> List[Dict[str, Any]]:
+                                     book_id: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
         chunks: List[Dict[str, Any]] = []
+        embedding_blocks: List[np.ndarray] = []
+        embeddings_complete = True
         chunk_index = 0
 
         for material in materials:
@@ -359,12 +353,20 @@ class RAGService:
                 continue
 
             try:
-                text = self.extract_text_from_pdf(file_path)
+                text_chunks, material_embeddings = self._load_or_build_material_chunks(file_path)
             except Exception as exc:
                 logger.error("Failed to extract text for material", path=file_path, error=str(exc))
                 continue
 
-            text_chunks = self.split_text_into_chunks(text)
+            remaining = self.max_cached_chunks - chunk_index
+            text_chunks = text_chunks[:remaining]
+            if not text_chunks:
+                # Materiale senza testo estraibile (es. PDF scansionato): non rende incompleto lo scope
+                continue
+            if material_embeddings is None:
+                embeddings_complete = False
+            else:
+                embedding_blocks.append(np.asarray(material_embeddings[:len(text_chunks)], dtype="float32"))
 
             for chunk in text_chunks:
                 chunks.append({
@@ -380,23 +382,30 @@ class RAGService:
                 })
                 chunk_index += 1
 
-                if chunk_index >= self.max_cached_chunks:
-                    break
+        embeddings = None
+        if chunks and embeddings_complete and embedding_blocks:
+            embeddings = np.vstack(embedding_blocks)
 
-        return chunks
+        return chunks, embeddings
 
-    def _embed_chunks(self, chunks: List[Dict[str, Any]]) -> List[List[float]]:
-        if not chunks:
-            return []
+    def _embed_texts(self, texts: List[str]) -> Optional[np.ndarray]:
+        if not texts:
+            return None
 
-        texts = [chunk["text"] for chunk in chunks]
         self._load_embedding_model()
         if self.embedding_model is None:
             # Fallback: no embeddings to pre-compute
-            return []
+            return None
 
         embeddings = self.embedding_model.encode(texts, normalize_embeddings=True)
-        return embeddings.tolist() if hasattr(embeddings, "tolist") else embeddings
+        return np.asarray(embeddings, dtype="float32")
+
+    def _embed_chunks(self, chunks: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        return self._embed_texts([chunk["text"] for chunk in chunks])
+
+    def _missing_scope_embeddings(self, entry: Dict[str, Any]) -> bool:
+        """Scope salvato senza embedding (fallback lessicale) ma ora il modello è caricato: va ricostruito."""
+        return bool(entry.get("chunks")) and entry.get("embeddings") is None and self.embedding_model is not None
 
     def _get_or_build_chunk_entry(self, course_id: str, book_id: Optional[str],
                                   materials: List[Dict[str, Any]], scope_meta: Dict[str, Any]) -> Dict[str, Any]:
@@ -404,62 +413,80 @@ class RAGService:
         signature = self._build_material_signature(materials)
         cache_entry = self.book_chunk_cache.get(cache_key)
 
-        if cache_entry and cache_entry.get("signature") == signature:
+        if (cache_entry and cache_entry.get("signature") == signature
+                and not self._missing_scope_embeddings(cache_entry)):
             cache_entry["scope"] = scope_meta
             return cache_entry
 
-        chunks = self._build_chunks_from_materials(materials, course_id, book_id)
-        embeddings = self._embed_chunks(chunks)
+        persisted = self.scope_index_store.load_scope(cache_key, signature)
+        if persisted and persisted.get("chunks") and not self._missing_scope_embeddings(persisted):
+            chunks = persisted["chunks"]
+            embeddings = persisted.get("embeddings")
+            ann_index = persisted.get("ann_index")
+            logger.info("Loaded persisted scope index", scope=cache_key, chunks=len(chunks))
+        else:
+            chunks, embeddings = self._build_chunks_from_materials(materials, course_id, book_id)
+            ann_index = self.scope_index_store.save_scope(cache_key, signature, chunks, embeddings)
 
         cache_entry = {
             "chunks": chunks,
             "embeddings": embeddings,
+            "ann_index": ann_index,
             "signature": signature,
             "scope": scope_meta,
             "updated_at": time.time()
         }
 
-        self.book_chunk_cache[cache_key] = cache_entry
-        self._trim_chunk_cache()
+        self.book_chunk_cache.set(cache_key, cache_entry)
         return cache_entry
 
     def _rank_chunks_by_similarity(self, query: str, cache_entry: Dict[str, Any], k: int) -> List[Dict[str, Any]]:
         chunks = cache_entry.get("chunks") or []
-        embeddings = cache_entry.get("embeddings") or []
+        embeddings = cache_entry.get("embeddings")
 
-        if not chunks or not embeddings:
-            return [] if not self.embedding_fallback_enabled else self._rank_with_lexical_similarity(query, chunks, k)
+        if not chunks or embeddings is None or len(embeddings) == 0:
+            if not self.embedding_fallback_enabled:
+                return []
+            return self._rank_with_lexical_similarity(query, chunks, k, self._get_lexical_index(cache_entry))
 
         if self.embedding_model is None:
-            return self._rank_with_lexical_similarity(query, chunks, k)
-
-        query_embedding = self.embedding_model.encode([query], normalize_embeddings=True)[0]
-        chunk_embeddings = np.array(embeddings)
+            self._load_embedding_model()
+        if self.embedding_model is None:
+            return self._rank_with_lexical_similarity(query, chunks, k, self._get_lexical_index(cache_entry))
 
-        if chunk_embeddings.size == 0:
-            return self._rank_with_lexical_similarity(query, chunks, k)
+        query_embedding = np.asarray(
+            self.embedding_model.encode([query], normalize_embeddings=True)[0], dtype="float32"
+        )
+        candidate_count = int(min(len(chunks), max(k * 4, 50)))
 
-        if _faiss is not None:
+        pre_idx = None
+        pre_scores: Dict[int, float] = {}
+        ann_index = cache_entry.get("ann_index")
+        if ann_index is not None:
             try:
-                index = _faiss.IndexFlatIP(chunk_embeddings.shape[1])
-                index.add(chunk_embeddings.astype('float32'))
-                distances, indices = index.search(query_embedding.reshape(1, -1).astype('float32'), min(len(chunks), max(k * 4, 50)))
-                pre_idx = indices.ravel()
+                distances, indices = ann_index.search(query_embedding.reshape(1, -1), candidate_count)
+                pre_idx = [int(i) for i in indices.ravel() if i >= 0]
+                pre_scores = {int(i): float(d) for i, d in zip(indices.ravel(), distances.ravel()) if i >= 0}
             except Exception:
-                scores = np.dot(chunk_embeddings, query_embedding)
-                pre_idx = np.argsort(scores)[::-1][:int(min(len(chunks), max(k * 4, 50)))]
-        else:
-            scores = np.dot(chunk_embeddings, query_embedding)
-            pre_idx = np.argsort(scores)[::-1][:int(min(len(chunks), max(k * 4, 50)))]
+                pre_idx = None
+
+        if pre_idx is None:
+            scores = np.asarray(embeddings, dtype="float32") @ query_embedding
+            if candidate_count < len(scores):
+                top = np.argpartition(-scores, candidate_count - 1)[:candidate_count]
+                pre_idx = top[np.argsort(-scores[top])].tolist()
+            else:
+                pre_idx = np.argsort(-scores).tolist()
+            pre_scores = {idx: float(scores[idx]) for idx in pre_idx}
+
         alpha = 0.7
+        pre_idx = [idx for idx in pre_idx if idx < len(chunks)]
+        lexical_scores = self._get_lexical_index(cache_entry).scores(query, np.asarray(pre_idx, dtype=np.int64))
         combined: List[Tuple[int, float]] = []
-        for idx in pre_idx:
-            if idx >= len(chunks):
-                continue
-            sem = float(scores[idx])
+        for idx, lex in zip(pre_idx, lexical_scores):
+            sem = pre_scores.get(idx, 0.0)
             sem_n = (sem + 1.0) / 2.0
-            lex = self._simple_similarity(query, chunks[idx].get("text", ""))
-            sc = alpha * sem_n + (1.0 - alpha) * lex
+            sc = alpha * sem_n + (1.0 - alpha) * float(lex)
             combined.append((idx, sc))
         combined.sort(key=lambda x: x[1], reverse=True)
         out: List[Dict[str, Any]] = []
@@ -489,14 +516,21 @@ class RAGService:
 
         return dot / (norm_a * norm_b)
 
-    def _rank_with_lexical_similarity(self, query: str, chunks: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
-        scored = []
-        for chunk in chunks:
-            score = self._simple_similarity(query, chunk.get("text", ""))
-            scored.append({"chunk": chunk, "score": score})
+    def _get_lexical_index(self, cache_entry: Dict[str, Any]) -> LexicalIndex:
+        """Matrice lessicale sparsa dei chunk, costruita una sola volta per cache entry."""
+        lexical_index = cache_entry.get("lexical_index")
+        chunks = cache_entry.get("chunks") or []
+        if lexical_index is None or len(lexical_index) != len(chunks):
+            lexical_index = LexicalIndex((chunk.get("text", "") for chunk in chunks), self._tokenize_for_similarity)
+            cache_entry["lexical_index"] = lexical_index
+        return lexical_index
+
+    def _rank_with_lexical_similarity(self, query: str, chunks: List[Dict[str, Any]], k: int,
+                                      lexical_index: Optional[LexicalIndex] = None) -> List[Dict[str, Any]]:
+        if lexical_index is None or len(lexical_index) != len(chunks):
+            lexical_index = LexicalIndex((chunk.get("text", "") for chunk in chunks), self._tokenize_for_similarity)
 
-        scored.sort(key=lambda item: item["score"], reverse=True)
-        return scored[:k]
+        return [{"chunk": chunks[idx], "score": score} for idx, score in lexical_index.top_k(query, k)]
 
     def _attach_scope_usage(self, scope_meta: Dict[str, Any], sources: List[Dict[str, Any]],
                              strategy: str) -> Dict[str, Any]:
@@ -524,7 +558,7 @@ class RAGService:
                                       book_id: Optional[str], k: int) -> Dict[str, Any]:
         start_t = time.perf_counter()
         cache_key = f"local:{course_id}:{book_id or 'all'}:{k}:{hash(query)}"
-        cached = self._get_query_cache(cache_key)
+        cached = self.query_cache.get(cache_key)
         if cached:
             return cached
         materials, scope_meta = self._get_scope_materials_and_meta(course_id, book_id)
@@ -572,7 +606,7 @@ class RAGService:
             "book_id": book_id,
             "scope": scope
         }
-        self._set_query_cache(cache_key, result)
+        self.query_cache.set(cache_key, result, tags=scope_cache_tags(course_id, book_id))
         dur_ms = int((time.perf_counter() - start_t) * 1000)
         try:
             self.retrieval_count += 1
@@ -651,6 +685,11 @@ class RAGService:
                 self.embedding_model = None
                 return
             try:
+                # torch e sentence-transformers sono importati solo qui: pesano secondi
+                # all'import e servono soltanto quando il modello viene davvero caricato
+                import torch
+                from sentence_transformers import SentenceTransformer
+
                 # Detecta automaticamente GPU/CUDA
                 device = 'cuda' if torch.cuda.is_available() else 'cpu'
                 logger.info(f"Using device: {device}")
@@ -692,15 +731,30 @@ class RAGService:
             )
 
     async def index_pdf(self, file_path: str, course_id: str, book_id: Optional[str] = None):
-        """Extract text from PDF and index it in the vector database"""
+        """Extract text from PDF and index it in the vector database (off the event loop)"""
+        return await asyncio.to_thread(self.index_pdf_sync, file_path, course_id, book_id)
+
+    def index_pdf_sync(self, file_path: str, course_id: str, book_id: Optional[str] = None,
+                       progress_callback: Optional[Callable[[float, str], None]] = None) -> Dict[str, Any]:
+        """
+        Versione bloccante di index_pdf, da eseguire in un thread worker.
+        `progress_callback(percentuale, messaggio)` riceve l'avanzamento di
+        estrazione, chunking, embedding (a batch) e salvataggio.
+        """
+        def report(progress: float, message: str):
+            if progress_callback:
+                progress_callback(progress, message)
+
         try:
             # Extract text from PDF
+            report(5.0, "Estrazione del testo dal PDF")
             text_content = self.extract_text_from_pdf(file_path)
 
             if not text_content.strip():
                 raise ValueError("No text content found in PDF")
 
             # Split text into chunks
+            report(20.0, "Suddivisione del testo in chunk")
             chunks = self.split_text_into_chunks(text_content)
 
             # Generate embeddings and store in ChromaDB
@@ -722,11 +776,18 @@ class RAGService:
                 metadatas.append(metadata)
                 ids.append(doc_id)
 
-            # Generate embeddings
+            # Generate embeddings (a batch, per riportare l'avanzamento)
             self._load_embedding_model()
-            embeddings = self.embedding_model.encode(documents).tolist()
+            embeddings = []
+            batch_size = max(1, self.embedding_batch_size)
+            for start in range(0, len(documents), batch_size):
+                batch = documents[start:start + batch_size]
+                embeddings.extend(self.embedding_model.encode(batch).tolist())
+                done = min(len(documents), start + batch_size)
+                report(25.0 + 65.0 * done / len(documents), f"Embedding {done}/{len(documents)} chunk")
 
             # Add to ChromaDB
+            report(92.0, "Salvataggio nell'indice vettoriale")
             self.collection.add(
                 documents=documents,
                 metadatas=metadatas,
@@ -735,45 +796,37 @@ class RAGService:
             )
 
             print(f"Successfully indexed {len(chunks)} chunks from {file_path}")
+            self._invalidate_keyword_indexes(course_id, book_id)
+
+            return {
+                "file_path": file_path,
+                "source": os.path.basename(file_path),
+                "course_id": course_id,
+                "book_id": book_id,
+                "chunks_indexed": len(chunks)
+            }
 
         except Exception as e:
             print(f"Error indexing PDF: {e}")
             raise e
 
     def extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF using PyMuPDF (more reliable than PyPDF2)"""
+        """Extract text from PDF (per-page text from the shared content-addressed cache)"""
         try:
-            doc = fitz.open(file_path)
-            text = ""
-
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text()
-
-            doc.close()
-            return text
-
+            return self.pdf_text_cache.get_text(file_path)
         except Exception as e:
-            print(f"Error extracting text with PyMuPDF: {e}")
-            # Fallback to PyPDF2
-            try:
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text()
-                return text
-            except Exception as e2:
-                print(f"Error extracting text with PyPDF2: {e2}")
-                raise Exception("Could not extract text from PDF")
+            print(f"Error extracting text from PDF: {e}")
+            raise Exception("Could not extract text from PDF")
 
     def analyze_pdf_structure(self, file_path: str) -> Dict[str, Any]:
         """Analyze PDF structure to extract chapters, sections and hierarchical content"""
         try:
-            doc = fitz.open(file_path)
+            # Pagine e sommario dalla cache del testo estratto (nessun nuovo parsing del PDF)
+            document = self.pdf_text_cache.get_document(file_path)
+            pages = document["pages"]
 
             # Extract table of contents if available
-            toc = doc.get_toc()
+            toc = document["toc"]
             chapters = []
 
             if toc:
@@ -788,10 +841,9 @@ class RAGService:
                         })
             else:
                 # No TOC available - try to detect chapters from text patterns
-                full_text = ""
-                for page_num in range(len(doc)):
-                    page = doc.load_page(page_num)
-                    full_text += page.get_text() + f"\n--- PAGE {page_num + 1} ---\n"
+                full_text = "".join(
+                    f"{page_text}\n--- PAGE {page_num + 1} ---\n" for page_num, page_text in enumerate(pages)
+                )
 
                 # Common chapter patterns in Italian textbooks
                 chapter_patterns = [
@@ -841,15 +893,9 @@ class RAGService:
             chapter_contents = []
             for i, chapter in enumerate(chapters):
                 start_page = chapter['page'] - 1  # 0-based indexing
-                end_page = chapters[i + 1]['page'] - 1 if i + 1 < len(chapters) else len(doc)
+                end_page = chapters[i + 1]['page'] - 1 if i + 1 < len(chapters) else len(pages)
 
-                chapter_text = ""
-                for page_num in range(start_page, end_page):
-                    try:
-                        page = doc.load_page(page_num)
-                        chapter_text += page.get_text() + "\n"
-                    except:
-                        continue
+                chapter_text = "".join(page_text + "\n" for page_text in pages[max(0, start_page):end_page])
 
                 # Extract key topics from chapter content
                 topics = self._extract_topics_from_text(chapter_text)
@@ -864,8 +910,6 @@ class RAGService:
                     'estimated_reading_time': len(chapter_text.split()) // 200  # ~200 words per minute
                 })
 
-            doc.close()
-
             return {
                 'chapters': chapter_contents,
                 'total_chapters': len(chapters),
@@ -1021,7 +1065,7 @@ class RAGService:
                     base_result = vector_result or local_result
 
             if include_annotations:
-                return self._merge_user_annotations(base_result, course_id, book_id, user_id)
+                return self._merge_user_annotations(base_result, course_id, book_id, user_id, query)
 
             return base_result
 
@@ -1030,7 +1074,7 @@ class RAGService:
             scope = self._build_scope_metadata(course_id, book_id)
             empty_context = self._build_empty_context_response(course_id, book_id, scope, "Errore nel recupero del contesto")
             if include_annotations:
-                return self._merge_user_annotations(empty_context, course_id, book_id, user_id)
+                return self._merge_user_annotations(empty_context, course_id, book_id, user_id, query)
             return empty_context
 
     async def search_documents(self, course_id: str, search_query: str = None) -> Dict[str, Any]:
@@ -1094,6 +1138,8 @@ class RAGService:
                 where={"course_id": course_id}
             )
             print(f"Deleted all documents for course {course_id}")
+            self._invalidate_keyword_indexes(course_id)
+            self._schedule_cache_invalidation(course_id)
         except Exception as e:
             print(f"Error deleting course documents: {e}")
 
@@ -1104,9 +1150,35 @@ class RAGService:
                 where=self._build_where_filter(course_id, book_id)
             )
             print(f"Deleted all documents for book {book_id} in course {course_id}")
+            self._invalidate_keyword_indexes(course_id, book_id)
+            self._schedule_cache_invalidation(course_id, book_id)
         except Exception as e:
             print(f"Error deleting book documents: {e}")
 
+    def _invalidate_keyword_indexes(self, course_id: str, book_id: Optional[str] = None):
+        """Invalida (e ricostruisce in background) gli indici BM25 dello scope modificato"""
+        if self.hybrid_search is None:
+            return
+        try:
+            self.hybrid_search.invalidate_bm25_scope(course_id, book_id)
+        except Exception as e:
+            logger.error("Failed to invalidate BM25 indexes", course_id=course_id, book_id=book_id, error=str(e))
+
+    def _schedule_cache_invalidation(self, course_id: str, book_id: Optional[str] = None):
+        """
+        Invalida contesti e risposte in cache dello scope cancellato. Dentro l'event loop
+        l'invalidazione parte come task; fuori (script, worker) viene eseguita subito.
+        """
+        invalidation = self.invalidate_course_cache(course_id, book_id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(invalidation)
+            return
+        task = loop.create_task(invalidation)
+        self._invalidation_tasks.add(task)
+        task.add_done_callback(self._invalidation_tasks.discard)
+
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the indexed documents"""
         try:
@@ -1177,13 +1249,17 @@ class RAGService:
         """Inizializza il servizio di cache Redis"""
         if self.cache_service is None:
             try:
-                from services.cache_service import RedisCacheService, CacheType
-                self.cache_service = RedisCacheService()
+                from services.service_container import get_cache
+                self.cache_service = get_cache()
                 logger.info("Redis cache service initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Redis cache service: {e}")
                 self.cache_service = None
 
+    def _get_l2_cache(self):
+        self._init_cache_service()
+        return self.cache_service
+
     def _generate_cache_key(self, query: str, course_id: str, book_id: Optional[str] = None,
                            k: int = 5, use_hybrid: bool = False) -> str:
         """
@@ -1210,52 +1286,26 @@ class RAGService:
         Retrieve context con cache layer per performance ottimizzate
         """
         try:
-            # Inizializza cache service se necessario
-            self._init_cache_service()
-
-            result: Dict[str, Any]
-            cache_key = None
-            cache_type_cls = None
+            cache_key = self._generate_cache_key(query, course_id, book_id, k, use_hybrid)
 
-            if self.cache_service:
-                try:
-                    from services.cache_service import CacheType  # type: ignore
-                    cache_type_cls = CacheType
-                except Exception as import_error:
-                    logger.error("Unable to import CacheType", error=str(import_error))
-                    cache_type_cls = None
-
-                cache_key = self._generate_cache_key(query, course_id, book_id, k, use_hybrid)
-                cached_result = None
-                if cache_type_cls is not None:
-                    cached_result = await self.cache_service.get(cache_type_cls.QUERY_RESULT, cache_key)
-
-                if cached_result is not None:
-                    logger.info("Cache hit for RAG query", query=query[:50], cache_key=cache_key)
-                    result = {
-                        **cached_result,
-                        "sources": list(cached_result.get("sources", []) or []),
-                        "scope": dict(cached_result.get("scope") or {})
-                    }
-                else:
-                    if use_hybrid:
-                        result = await self.retrieve_context_hybrid(query, course_id, book_id, k)
-                    else:
-                        result = await self.retrieve_context(query, course_id, book_id, k,
-                                                             user_id=user_id, include_annotations=False)
-
-                    if cache_type_cls is not None and result.get("text"):
-                        await self.cache_service.set(cache_type_cls.QUERY_RESULT, cache_key, copy.deepcopy(result))
-                        logger.info("Cached RAG query result", query=query[:50], cache_key=cache_key)
-            else:
+            async def compute() -> Dict[str, Any]:
                 if use_hybrid:
-                    result = await self.retrieve_context_hybrid(query, course_id, book_id, k)
-                else:
-                    result = await self.retrieve_context(query, course_id, book_id, k,
-                                                         user_id=user_id, include_annotations=False)
+                    return await self.retrieve_context_hybrid(query, course_id, book_id, k)
+                return await self.retrieve_context(query, course_id, book_id, k,
+                                                   user_id=user_id, include_annotations=False)
+
+            # Le richieste identiche concorrenti attendono un unico calcolo (L1 -> Redis -> retrieval)
+            cached_result = await self.context_cache.get_or_compute(
+                cache_key,
+                compute,
+                tags=scope_cache_tags(course_id, book_id),
+                cache_if=lambda context: bool(context.get("text"))
+            )
+            # Il valore in L1 è condiviso: le annotazioni dell'utente vanno aggiunte a una copia
+            result = copy.deepcopy(cached_result)
 
             if include_annotations:
-                return self._merge_user_annotations(result, course_id, book_id, user_id)
+                return self._merge_user_annotations(result, course_id, book_id, user_id, query)
 
             return result
 
@@ -1304,27 +1354,23 @@ class RAGService:
             self._load_embedding_model()
             return self.embedding_model.encode([text])[0].tolist()
 
-    def invalidate_course_cache(self, course_id: str, book_id: Optional[str] = None):
+    async def invalidate_course_cache(self, course_id: str, book_id: Optional[str] = None) -> int:
         """
-        Invalida tutte le cache entries per un corso specifico
+        Invalida tutte le cache entries per un corso specifico (o per un suo libro)
         """
         try:
-            self._init_cache_service()
-
-            if self.cache_service:
-                # Pattern per invalidazione
-                pattern = f"tutor_ai:query_result:*:course:{course_id}:*"
-                if book_id:
-                    pattern = f"tutor_ai:query_result:*:course:{course_id}:*:book:{book_id}:*"
-
-                # Esegui invalidazione asincrona
-                import asyncio
-                asyncio.create_task(self.cache_service.invalidate_by_pattern(pattern))
-
-                logger.info("Invalidated cache for course", course_id=course_id, book_id=book_id)
+            tags = scope_invalidation_tags(course_id, book_id)
+            deleted = self.query_cache.invalidate_tags(tags)
+            # Query RAG e risultati hybrid sono registrati negli stessi tag di scope (L1 e Redis)
+            deleted += await self.context_cache.invalidate_tags(tags)
+            # Le risposte LLM memorizzate si basano sui materiali precedenti
+            deleted += get_answer_cache().invalidate(course_id, book_id)
+            logger.info("Invalidated cache for course", course_id=course_id, book_id=book_id, deleted=deleted)
+            return deleted
 
         except Exception as e:
             logger.error(f"Error invalidating course cache: {e}")
+        return 0
 
     async def get_cache_metrics(self) -> Dict[str, Any]:
         """
@@ -1335,19 +1381,23 @@ class RAGService:
 
             if self.cache_service:
                 cache_metrics = self.cache_service.get_metrics()
-                redis_info = self.cache_service.get_redis_info()
+                redis_info = await self.cache_service.get_redis_info()
                 health_status = await self.cache_service.health_check()
 
                 return {
                     "cache_enabled": True,
                     "metrics": cache_metrics,
                     "redis_info": redis_info,
-                    "health": health_status
+                    "health": health_status,
+                    "context_cache": self.context_cache.stats(),
+                    "answer_cache": get_answer_cache().stats()
                 }
             else:
                 return {
                     "cache_enabled": False,
-                    "message": "Redis cache service not available"
+                    "message": "Redis cache service not available",
+                    "context_cache": self.context_cache.stats(),
+                    "answer_cache": get_answer_cache().stats()
                 }
 
         except Exception as e:
@@ -1364,9 +1414,12 @@ class RAGService:
         try:
             self._init_cache_service()
 
+            # La cache semantica delle risposte è in processo: va svuotata anche senza Redis
+            if cache_type in (None, CacheType.LLM_RESPONSE.value):
+                get_answer_cache().clear()
+
             if self.cache_service:
                 if cache_type:
-                    from services.cache_service import CacheType
                     try:
                         cache_enum = CacheType(cache_type)
                         deleted_count = await self.cache_service.clear_by_type(cache_enum)
@@ -1377,7 +1430,6 @@ class RAGService:
                         return {"success": False, "error": f"Invalid cache type: {cache_type}"}
                 else:
                     # Clear all cache
-                    from services.cache_service import CacheType
                     total_deleted = 0
                     for cache_type_enum in CacheType:
                         deleted = await self.cache_service.clear_by_type(cache_type_enum)
@@ -1406,8 +1458,7 @@ class BookContentAnalyzer:
     def _get_llm_service(self):
         """Lazy loading del LLM service"""
         if self.llm_service is None:
-            from services.llm_service import LLMService
-            self.llm_service = LLMService()
+            self.llm_service = get_llm_service()
         return self.llm_service
 
     async def analyze_book_content(self, course_id: str, book_id: str) -> Dict[str, Any]:
@@ -1875,17 +1926,11 @@ class BookContentAnalyzer:
         Recupera il titolo del libro dall'ID
         """
         try:
-            courses_path = Path("data/courses/courses.json")
-            if courses_path.exists():
-                with open(courses_path, 'r', encoding='utf-8') as f:
-                    courses_data = json.load(f)
-
-                for course in courses_data.get("courses", []):
-                    for book in course.get("books", []):
-                        if book.get("id") == book_id:
-                            return book.get("title", f"Libro {book_id}")
-        except Exception:
-            pass
+            book = self.rag_service.course_service.books.get(book_id)
+            if book:
+                return book.get("title", f"Libro {book_id}")
+        except Exception as exc:
+            logger.warning("Failed to load book title", book_id=book_id, error=str(exc))
         return f"Libro {book_id}"
 
     def _calculate_coverage_score(self, documents: List[Dict], book_id: str) -> float:
@@ -0,0 +1,240 @@
+"""
+Scope Index Store - Indici persistenti per il retrieval locale di RAGService
+
+Ogni materiale (PDF) viene estratto, suddiviso in chunk ed embeddato una sola volta:
+testi ed embedding vengono salvati su disco con chiave derivata da path, mtime e size.
+Per ogni scope (corso o libro) viene salvato un manifest con la firma dei materiali
+(`RAGService._build_material_signature`) e, se FAISS è disponibile, un indice ANN
+ricaricabile in memory-map. Un riavvio o un'eviction della cache in memoria non
+richiede quindi di ri-estrarre e ri-embeddare un intero libro.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+try:
+    import faiss as _faiss
+except Exception:
+    _faiss = None
+
+logger = structlog.get_logger()
+
+
+class ScopeIndexStore:
+    """
+    Store su disco per chunk ed embedding per-materiale e indici ANN per-scope.
+
+    Layout:
+        <base_dir>/materials/<material_key>.json   testi dei chunk
+        <base_dir>/materials/<material_key>.npy    embedding normalizzati (float32)
+        <base_dir>/scopes/<scope_file>.json        manifest dello scope
+        <base_dir>/scopes/<scope_file>.npy         embedding concatenati dello scope
+        <base_dir>/scopes/<scope_file>.faiss       indice FAISS (opzionale)
+    """
+
+    def __init__(self, base_dir: str = "data/rag_index", model_name: str = ""):
+        self.base_dir = Path(base_dir)
+        self.materials_dir = self.base_dir / "materials"
+        self.scopes_dir = self.base_dir / "scopes"
+        self.model_name = model_name
+        self._ensure_structure()
+
+    def _ensure_structure(self):
+        try:
+            self.materials_dir.mkdir(parents=True, exist_ok=True)
+            self.scopes_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as exc:
+            logger.warning("Unable to create scope index directories", path=str(self.base_dir), error=str(exc))
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+
+    def material_key(self, file_path: str) -> Optional[str]:
+        """Chiave content-addressed di un materiale (path, mtime, size, modello)."""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        raw = f"{os.path.abspath(file_path)}:{int(stat.st_mtime)}:{stat.st_size}:{self.model_name}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _scope_file(self, scope_key: str) -> str:
+        safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in scope_key)
+        digest = hashlib.sha1(scope_key.encode("utf-8")).hexdigest()[:10]
+        return f"{safe[:80]}_{digest}"
+
+    @staticmethod
+    def _signature_digest(signature: str, model_name: str) -> str:
+        return hashlib.sha1(f"{signature}|{model_name}".encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Per-material chunks
+    # ------------------------------------------------------------------
+
+    def load_material(self, key: str) -> Optional[Tuple[List[str], Optional[np.ndarray]]]:
+        """Restituisce (testi, embedding) salvati per un materiale, o None."""
+        text_path = self.materials_dir / f"{key}.json"
+        if not text_path.exists():
+            return None
+
+        try:
+            with open(text_path, "r", encoding="utf-8") as handle:
+                texts = json.load(handle).get("chunks", [])
+        except (OSError, ValueError) as exc:
+            logger.warning("Corrupted material chunk file, ignoring", key=key, error=str(exc))
+            return None
+
+        embeddings = None
+        emb_path = self.materials_dir / f"{key}.npy"
+        if emb_path.exists():
+            try:
+                embeddings = np.load(emb_path, mmap_mode="r")
+            except (OSError, ValueError) as exc:
+                logger.warning("Corrupted material embeddings, ignoring", key=key, error=str(exc))
+                embeddings = None
+
+        return texts, embeddings
+
+    def save_material(self, key: str, texts: List[str], embeddings: Optional[np.ndarray] = None):
+        """Salva testi ed embedding di un materiale (scrittura atomica)."""
+        try:
+            self._atomic_write_json(self.materials_dir / f"{key}.json", {
+                "chunks": texts,
+                "model_name": self.model_name,
+                "created_at": time.time()
+            })
+            if embeddings is not None and len(embeddings) == len(texts):
+                self._atomic_save_npy(self.materials_dir / f"{key}.npy", np.asarray(embeddings, dtype="float32"))
+        except OSError as exc:
+            logger.warning("Unable to persist material chunks", key=key, error=str(exc))
+
+    # ------------------------------------------------------------------
+    # Per-scope manifest and ANN index
+    # ------------------------------------------------------------------
+
+    def load_scope(self, scope_key: str, signature: str) -> Optional[Dict[str, Any]]:
+        """
+        Carica il manifest dello scope se la firma dei materiali coincide.
+        Embedding e indice FAISS sono caricati in memory-map.
+        """
+        base = self.scopes_dir / self._scope_file(scope_key)
+        manifest_path = base.with_suffix(".json")
+        if not manifest_path.exists():
+            return None
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("signature_digest") != self._signature_digest(signature, self.model_name):
+            return None
+
+        embeddings = None
+        emb_path = base.with_suffix(".npy")
+        if emb_path.exists():
+            try:
+                embeddings = np.load(emb_path, mmap_mode="r")
+            except (OSError, ValueError):
+                embeddings = None
+
+        return {
+            "chunks": manifest.get("chunks", []),
+            "embeddings": embeddings,
+            "ann_index": self._read_faiss(base.with_suffix(".faiss")) if embeddings is not None else None
+        }
+
+    def save_scope(self, scope_key: str, signature: str, chunks: List[Dict[str, Any]],
+                   embeddings: Optional[np.ndarray]) -> Optional[Any]:
+        """Salva manifest, embedding e indice ANN dello scope. Restituisce l'indice FAISS costruito."""
+        base = self.scopes_dir / self._scope_file(scope_key)
+        ann_index = None
+        try:
+            has_embeddings = embeddings is not None and len(embeddings) == len(chunks) and len(chunks) > 0
+            if has_embeddings:
+                matrix = np.ascontiguousarray(embeddings, dtype="float32")
+                self._atomic_save_npy(base.with_suffix(".npy"), matrix)
+                ann_index = self._build_faiss(matrix)
+                if ann_index is not None:
+                    tmp_path = f"{base}.faiss.tmp"
+                    _faiss.write_index(ann_index, tmp_path)
+                    os.replace(tmp_path, base.with_suffix(".faiss"))
+            else:
+                for suffix in (".npy", ".faiss"):
+                    stale = base.with_suffix(suffix)
+                    if stale.exists():
+                        stale.unlink()
+
+            self._atomic_write_json(base.with_suffix(".json"), {
+                "scope_key": scope_key,
+                "signature_digest": self._signature_digest(signature, self.model_name),
+                "model_name": self.model_name,
+                "chunks": chunks,
+                "updated_at": time.time()
+            })
+        except OSError as exc:
+            logger.warning("Unable to persist scope index", scope=scope_key, error=str(exc))
+
+        return ann_index
+
+    def invalidate_scope(self, scope_key: str):
+        """Rimuove il manifest di uno scope (i chunk per-materiale restano riutilizzabili)."""
+        base = self.scopes_dir / self._scope_file(scope_key)
+        for suffix in (".json", ".npy", ".faiss"):
+            path = base.with_suffix(suffix)
+            try:
+                if path.exists():
+                    path.unlink()
+            except OSError:
+                continue
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _build_faiss(matrix: np.ndarray) -> Optional[Any]:
+        if _faiss is None or matrix.ndim != 2 or matrix.shape[0] == 0:
+            return None
+        try:
+            index = _faiss.IndexFlatIP(matrix.shape[1])
+            index.add(matrix)
+            return index
+        except Exception as exc:
+            logger.warning("Unable to build FAISS index", error=str(exc))
+            return None
+
+    @staticmethod
+    def _read_faiss(path: Path) -> Optional[Any]:
+        if _faiss is None or not path.exists():
+            return None
+        try:
+            return _faiss.read_index(str(path), _faiss.IO_FLAG_MMAP | _faiss.IO_FLAG_READ_ONLY)
+        except Exception:
+            try:
+                return _faiss.read_index(str(path))
+            except Exception as exc:
+                logger.warning("Unable to load FAISS index", path=str(path), error=str(exc))
+                return None
+
+    @staticmethod
+    def _atomic_write_json(path: Path, payload: Dict[str, Any]):
+        tmp_path = Path(f"{path}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _atomic_save_npy(path: Path, array: np.ndarray):
+        tmp_path = Path(f"{path.with_suffix('')}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
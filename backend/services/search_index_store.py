@@ -0,0 +1,289 @@
+"""
+Search Index Store - Indice invertito su SQLite per la ricerca avanzata
+
+Ogni documento indicizzato (annotazione o risultato OCR) è una riga con le colonne di
+faccetta (tipo, utente, corso, libro) e il payload JSON; le posting list sono righe
+(termine, documento, campo, tf) con chiave primaria sul termine, così la ricerca di un
+termine o di un prefisso è una scansione di intervallo sul B-tree. La tabella `terms`
+mantiene la document frequency di ogni termine (autocompletamento ordinato per frequenza)
+e `sources` registra mtime e dimensione dei file già indicizzati: un file viene riletto
+solo quando cambia, quindi l'aggiornamento è incrementale e l'apertura dell'indice non
+dipende dalla dimensione del corpus.
+
+Il database è in WAL mode e condiviso dai worker; ogni thread usa la propria connessione.
+"""
+
+import json
+import re
+import sqlite3
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import structlog
+
+from services.sqlite_connections import ThreadLocalSQLite
+
+logger = structlog.get_logger()
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Prefissi più corti di così cercano solo il termine esatto (evita scansioni enormi)
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    user_id TEXT,
+    course_id TEXT,
+    book_id TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_source ON documents(source);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);
+CREATE TABLE IF NOT EXISTS doc_tags (
+    doc_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (doc_id, tag)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    doc_freq INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall((text or "").lower())
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    # Limite superiore esclusivo dell'intervallo [prefix, upper) nell'ordinamento binario di SQLite
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class IndexedDocument:
+    """Documento pronto per l'indicizzazione: faccette, payload e testo per campo."""
+
+    __slots__ = ("doc_id", "doc_type", "user_id", "course_id", "book_id", "payload", "fields", "tags")
+
+    def __init__(self, doc_id: str, doc_type: str, payload: Dict[str, Any], fields: Dict[str, str],
+                 user_id: str = "", course_id: str = "", book_id: str = "", tags: Iterable[str] = ()):
+        self.doc_id = doc_id
+        self.doc_type = doc_type
+        self.user_id = user_id
+        self.course_id = course_id
+        self.book_id = book_id
+        self.payload = payload
+        self.fields = fields
+        self.tags = list(dict.fromkeys(tags))
+
+
+class SearchIndexStore(ThreadLocalSQLite):
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        with self.transaction() as conn:
+            for statement in SCHEMA.strip().split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+
+    # ------------------------------------------------------------------
+    # Scrittura
+    # ------------------------------------------------------------------
+
+    def source_signatures(self) -> Dict[str, Tuple[str, float, int]]:
+        """path -> (kind, mtime, size) dei file già indicizzati."""
+        rows = self.connection().execute("SELECT path, kind, mtime, size FROM sources").fetchall()
+        return {path: (kind, mtime, size) for path, kind, mtime, size in rows}
+
+    def replace_source(self, path: str, kind: str, mtime: float, size: int, documents: List[IndexedDocument]):
+        """Sostituisce in un'unica transazione tutti i documenti provenienti da un file."""
+        with self.transaction() as conn:
+            self._delete_documents(conn, path)
+            for document in documents:
+                self._insert_document(conn, path, document)
+            conn.execute(
+                "INSERT INTO sources (path, kind, mtime, size) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET kind = excluded.kind, mtime = excluded.mtime, size = excluded.size",
+                (path, kind, mtime, size)
+            )
+
+    def remove_source(self, path: str):
+        with self.transaction() as conn:
+            self._delete_documents(conn, path)
+            conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+
+    def clear(self):
+        with self.transaction() as conn:
+            for table in ("postings", "doc_tags", "terms", "documents", "sources"):
+                conn.execute(f"DELETE FROM {table}")
+
+    def _delete_documents(self, conn: sqlite3.Connection, path: str):
+        doc_ids = [row[0] for row in conn.execute("SELECT doc_id FROM documents WHERE source = ?", (path,))]
+        for doc_id in doc_ids:
+            self._delete_document(conn, doc_id)
+        if doc_ids:
+            conn.execute("DELETE FROM terms WHERE doc_freq <= 0")
+
+    def _delete_document(self, conn: sqlite3.Connection, doc_id: str):
+        terms = [row[0] for row in conn.execute("SELECT DISTINCT term FROM postings WHERE doc_id = ?", (doc_id,))]
+        conn.executemany("UPDATE terms SET doc_freq = doc_freq - 1 WHERE term = ?", [(term,) for term in terms])
+        conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM doc_tags WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def _insert_document(self, conn: sqlite3.Connection, path: str, document: IndexedDocument):
+        # Lo stesso id può comparire in un altro file (es. annotazione spostata): vince l'ultimo
+        if conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (document.doc_id,)).fetchone():
+            self._delete_document(conn, document.doc_id)
+            conn.execute("DELETE FROM terms WHERE doc_freq <= 0")
+
+        conn.execute(
+            "INSERT INTO documents (doc_id, source, doc_type, user_id, course_id, book_id, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (document.doc_id, path, document.doc_type, document.user_id, document.course_id,
+             document.book_id, json.dumps(document.payload, ensure_ascii=False, default=str))
+        )
+
+        postings = []
+        distinct_terms = set()
+        for field, text in document.fields.items():
+            for term, tf in Counter(tokenize(text)).items():
+                postings.append((term, document.doc_id, field, tf))
+                distinct_terms.add(term)
+        conn.executemany("INSERT INTO postings (term, doc_id, field, tf) VALUES (?, ?, ?, ?)", postings)
+        conn.executemany(
+            "INSERT INTO terms (term, doc_freq) VALUES (?, 1) "
+            "ON CONFLICT(term) DO UPDATE SET doc_freq = doc_freq + 1",
+            [(term,) for term in distinct_terms]
+        )
+        conn.executemany("INSERT OR IGNORE INTO doc_tags (doc_id, tag) VALUES (?, ?)",
+                         [(document.doc_id, tag) for tag in document.tags])
+
+    # ------------------------------------------------------------------
+    # Lettura
+    # ------------------------------------------------------------------
+
+    def expand_term(self, term: str) -> List[str]:
+        """Termini indicizzati che iniziano con `term` (solo il termine esatto se troppo corto)."""
+        conn = self.connection()
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [term] if conn.execute("SELECT 1 FROM terms WHERE term = ?", (term,)).fetchone() else []
+        rows = conn.execute(
+            "SELECT term FROM terms WHERE term >= ? AND term < ? ORDER BY term = ? DESC, doc_freq DESC LIMIT ?",
+            (term, _prefix_upper_bound(term), term, MAX_PREFIX_EXPANSIONS)
+        )
+        return [row[0] for row in rows]
+
+    def match(self, query_terms: List[str], facets: Optional[Dict[str, List[str]]] = None
+              ) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """
+        doc_id -> termine della query -> campo -> tf, per i documenti che contengono almeno
+        un termine (o un suo completamento). `facets` filtra per user_id/course_id/book_id.
+        """
+        conn = self.connection()
+        facet_clause, facet_params = self._facet_clause(facets)
+        matches: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(lambda: defaultdict(dict))
+
+        for query_term in dict.fromkeys(query_terms):
+            expansions = self.expand_term(query_term)
+            if not expansions:
+                continue
+            placeholders = ",".join("?" * len(expansions))
+            rows = conn.execute(
+                f"SELECT p.doc_id, p.field, SUM(p.tf) FROM postings p "
+                f"JOIN documents d ON d.doc_id = p.doc_id "
+                f"WHERE p.term IN ({placeholders}){facet_clause} GROUP BY p.doc_id, p.field",
+                (*expansions, *facet_params)
+            )
+            for doc_id, field, tf in rows:
+                matches[doc_id][query_term][field] = int(tf)
+        return matches
+
+    def get_documents(self, doc_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        conn = self.connection()
+        doc_ids = list(doc_ids)
+        documents: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(doc_ids), 500):
+            batch = doc_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT doc_id, doc_type, user_id, course_id, book_id, payload FROM documents "
+                f"WHERE doc_id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for doc_id, doc_type, user_id, course_id, book_id, payload in rows:
+                documents[doc_id] = {
+                    "doc_type": doc_type,
+                    "user_id": user_id or "",
+                    "course_id": course_id or "",
+                    "book_id": book_id or "",
+                    "payload": json.loads(payload)
+                }
+        return documents
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """Completamenti del prefisso, dai termini più frequenti."""
+        prefix = (prefix or "").strip().lower()
+        if not prefix or limit <= 0:
+            return []
+        rows = self.connection().execute(
+            "SELECT term FROM terms WHERE term > ? AND term < ? ORDER BY doc_freq DESC, term LIMIT ?",
+            (prefix, _prefix_upper_bound(prefix), limit)
+        )
+        return [row[0] for row in rows]
+
+    def facet_counts(self, facets: Optional[Dict[str, List[str]]] = None) -> Dict[str, Dict[str, int]]:
+        """Conteggi per tipo, corso, utente e tag su tutti i documenti indicizzati."""
+        conn = self.connection()
+        facet_clause, params = self._facet_clause(facets)
+        where = f" WHERE 1 = 1{facet_clause}" if facet_clause else ""
+        counts: Dict[str, Dict[str, int]] = {}
+        for name, column in (("types", "doc_type"), ("courses", "course_id"), ("users", "user_id")):
+            rows = conn.execute(
+                f"SELECT d.{column}, COUNT(*) FROM documents d{where} GROUP BY d.{column}", params
+            )
+            values = {value: count for value, count in rows if value}
+            if values:
+                counts[name] = values
+        rows = conn.execute(
+            f"SELECT t.tag, COUNT(*) FROM doc_tags t JOIN documents d ON d.doc_id = t.doc_id{where} "
+            f"GROUP BY t.tag", params
+        )
+        tags = {tag: count for tag, count in rows}
+        if tags:
+            counts["tags"] = tags
+        return counts
+
+    @staticmethod
+    def _facet_clause(facets: Optional[Dict[str, List[str]]]) -> Tuple[str, List[str]]:
+        clause = ""
+        params: List[str] = []
+        for column in ("user_id", "course_id", "book_id"):
+            values = (facets or {}).get(column)
+            if values:
+                clause += f" AND d.{column} IN ({','.join('?' * len(values))})"
+                params.extend(values)
+        return clause, params
+
+    def stats(self) -> Dict[str, int]:
+        conn = self.connection()
+        return {
+            "documents": conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "terms": conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0],
+            "sources": conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+        }
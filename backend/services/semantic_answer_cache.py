@@ -0,0 +1,222 @@
+"""
+Semantic Answer Cache - Riuso delle risposte LLM per domande parafrasate
+
+Le risposte del tutor sono indicizzate per scope (corso, libro, modello, variante di stile)
+con l'embedding normalizzato della domanda: una nuova domanda riceve la risposta già generata
+se la similarità coseno con una domanda precedente supera la soglia. La ricerca è un singolo
+prodotto matrice-vettore sugli embedding dello scope; le domande identiche (dopo
+normalizzazione) sono servite senza calcolare l'embedding.
+
+Quando cambiano i materiali di un corso/libro le entry dello scope vengono invalidate con gli
+stessi tag usati dalle altre cache (`scope_invalidation_tags`). La cache è per processo: il TTL
+limita per quanto un worker può servire risposte su materiali aggiornati da un altro worker.
+
+Configurazione:
+    SEMANTIC_CACHE_ENABLED       abilita la cache semantica delle risposte (default: true)
+    SEMANTIC_CACHE_THRESHOLD     similarità coseno minima per un hit (default: 0.92)
+    SEMANTIC_CACHE_TTL           durata delle risposte in secondi (default: 900)
+    SEMANTIC_CACHE_MAX_ENTRIES   risposte massime per scope (default: 256)
+    SEMANTIC_CACHE_MAX_SCOPES    scope tenuti in memoria (default: 128)
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+from services.cache_service import scope_cache_tags, scope_invalidation_tags
+from services.tiered_cache import LRUCache
+
+logger = structlog.get_logger()
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Forma canonica di una domanda per il confronto esatto (maiuscole, spazi, punteggiatura finale)."""
+    return _WHITESPACE.sub(" ", query.strip().lower()).rstrip(" ?!.")
+
+
+class _ScopeAnswers:
+    """Risposte di uno scope: matrice degli embedding in un buffer circolare di dimensione fissa."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.embeddings: Optional[np.ndarray] = None
+        self.queries: List[Optional[str]] = [None] * max_entries
+        self.responses: List[Optional[str]] = [None] * max_entries
+        self.expires_at = np.zeros(max_entries, dtype="float64")
+        self.exact: Dict[str, int] = {}
+        self.cursor = 0
+        self.lock = threading.Lock()
+
+    def add(self, normalized: str, embedding: np.ndarray, response: str, expires_at: float):
+        with self.lock:
+            if self.embeddings is None:
+                self.embeddings = np.zeros((self.max_entries, embedding.shape[0]), dtype="float32")
+            slot = self.exact.get(normalized)
+            if slot is None:
+                slot = self.cursor
+                self.cursor = (self.cursor + 1) % self.max_entries
+                previous = self.queries[slot]
+                if previous is not None and self.exact.get(previous) == slot:
+                    del self.exact[previous]
+            self.embeddings[slot] = embedding
+            self.queries[slot] = normalized
+            self.responses[slot] = response
+            self.expires_at[slot] = expires_at
+            self.exact[normalized] = slot
+
+    def get_exact(self, normalized: str, now: float) -> Optional[str]:
+        with self.lock:
+            slot = self.exact.get(normalized)
+            if slot is None or self.expires_at[slot] <= now:
+                return None
+            return self.responses[slot]
+
+    def best_match(self, embedding: np.ndarray, now: float) -> Tuple[float, Optional[str], Optional[str]]:
+        """Restituisce (similarità, domanda, risposta) della entry valida più vicina."""
+        with self.lock:
+            if self.embeddings is None or self.embeddings.shape[1] != embedding.shape[0]:
+                return 0.0, None, None
+            scores = self.embeddings @ embedding
+            # Slot vuoti o scaduti non possono vincere
+            scores[self.expires_at <= now] = -1.0
+            best = int(np.argmax(scores))
+            return float(scores[best]), self.queries[best], self.responses[best]
+
+
+class SemanticAnswerCache:
+    """
+    Cache delle risposte LLM con lookup per similarità semantica della domanda.
+
+    `embed_texts` restituisce embedding normalizzati (una riga per testo) o None se il modello
+    non è disponibile: in quel caso la cache serve solo le domande identiche.
+    """
+
+    def __init__(self, embed_texts: Callable[[List[str]], Optional[np.ndarray]],
+                 threshold: Optional[float] = None, ttl: Optional[float] = None,
+                 max_entries_per_scope: Optional[int] = None, max_scopes: Optional[int] = None,
+                 enabled: Optional[bool] = None, clock: Callable[[], float] = time.monotonic):
+        self._embed_texts = embed_texts
+        self.threshold = threshold if threshold is not None else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("SEMANTIC_CACHE_TTL", "900"))
+        self.max_entries_per_scope = max_entries_per_scope or int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+        )
+        self._clock = clock
+        self._scopes = LRUCache(max_size=max_scopes or int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "128")))
+        self._scope_lock = threading.Lock()
+        # Embedding delle ultime domande: il miss in lookup e il successivo store ne calcolano uno solo
+        self._query_embeddings = LRUCache(max_size=512)
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def _scope_key(course_id: str, book_id: Optional[str], model: str, variant: str) -> Tuple[str, str, str, str]:
+        return (course_id, book_id or "", model or "", variant or "")
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        cached = self._query_embeddings.get(text)
+        if cached is not None:
+            return cached
+        try:
+            embeddings = self._embed_texts([text])
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed", error=str(e))
+            return None
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        vector = np.asarray(embeddings[0], dtype="float32")
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None
+        vector = vector / norm
+        self._query_embeddings.set(text, vector)
+        return vector
+
+    def lookup(self, query: str, course_id: str, book_id: Optional[str] = None,
+               model: str = "", variant: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Cerca una risposta per la domanda nello scope indicato. Restituisce
+        {"response", "similarity", "matched_query"} oppure None.
+        Operazione CPU-bound (embedding): dal codice async va chiamata in un thread.
+        """
+        if not self.enabled:
+            return None
+
+        scope = self._scopes.get(self._scope_key(course_id, book_id, model, variant))
+        if scope is None:
+            self.misses += 1
+            return None
+
+        now = self._clock()
+        normalized = normalize_query(query)
+        response = scope.get_exact(normalized, now)
+        if response is not None:
+            self.hits += 1
+            self.exact_hits += 1
+            return {"response": response, "similarity": 1.0, "matched_query": normalized}
+
+        embedding = self._embed(normalized)
+        if embedding is None:
+            self.misses += 1
+            return None
+
+        similarity, matched_query, response = scope.best_match(embedding, now)
+        if response is None or similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {"response": response, "similarity": round(similarity, 4), "matched_query": matched_query}
+
+    def store(self, query: str, response: str, course_id: str, book_id: Optional[str] = None,
+              model: str = "", variant: str = "") -> bool:
+        """Memorizza la risposta per la domanda; restituisce False se l'embedding non è disponibile."""
+        if not self.enabled or not response:
+            return False
+
+        normalized = normalize_query(query)
+        embedding = self._embed(normalized)
+        if embedding is None:
+            return False
+
+        key = self._scope_key(course_id, book_id, model, variant)
+        with self._scope_lock:
+            scope = self._scopes.get(key)
+            if scope is None:
+                scope = _ScopeAnswers(self.max_entries_per_scope)
+                self._scopes.set(key, scope, tags=scope_cache_tags(course_id, book_id))
+        scope.add(normalized, embedding, response, self._clock() + self.ttl)
+        self.stores += 1
+        return True
+
+    def invalidate(self, course_id: str, book_id: Optional[str] = None) -> int:
+        """Elimina le risposte degli scope toccati dal cambio di materiali; restituisce gli scope rimossi."""
+        return self._scopes.invalidate_tags(scope_invalidation_tags(course_id, book_id))
+
+    def clear(self):
+        self._scopes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "scopes": len(self._scopes),
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
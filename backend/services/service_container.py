@@ -0,0 +1,382 @@
+"""
+Service Container - Istanze condivise e "calde" dei servizi principali
+
+RAGService, LLMService, CourseService e AnnotationService vengono creati una sola volta
+per processo e distribuiti tramite provider (usabili anche con `Depends`), invece di essere
+ricostruiti a ogni richiesta: niente nuovi PersistentClient ChromaDB, modelli di embedding
+ricaricati o cache dei chunk buttate via. Il ciclo di vita (warm-up all'avvio, chiusura allo
+shutdown) è gestito dal lifespan dell'app FastAPI.
+
+I servizi pesanti (OCR, ricerca avanzata, motori cognitivi) sono esposti ai moduli come
+proxy `lazy`: l'import del modulo non crea nulla, l'istanza nasce al primo accesso a un
+attributo oppure nel warm-up in background se il servizio è in SERVICE_PRELOAD.
+
+Configurazione:
+    SERVICE_WARMUP   esegue i warm-up all'avvio in background (default: true)
+    SERVICE_PRELOAD  servizi lazy da creare nel warm-up, separati da virgola (default: nessuno)
+"""
+
+import asyncio
+import inspect
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+@dataclass
+class ServiceRegistration:
+    factory: Callable[[], Any]
+    warmup: Optional[Callable[[Any], Any]] = None
+    health: Optional[Callable[[Any], Dict[str, Any]]] = None
+    close: Optional[Callable[[Any], Any]] = None
+    eager: bool = False
+
+
+class LazyService:
+    """Proxy verso un servizio del container, risolto al primo accesso a un attributo."""
+
+    __slots__ = ("_container", "_name")
+
+    def __init__(self, container: "ServiceContainer", name: str):
+        object.__setattr__(self, "_container", container)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._container.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._container.get(self._name), attr, value)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self._container.is_initialized(self._name) else "not initialized"
+        return f"<LazyService {self._name} ({state})>"
+
+
+class ServiceContainer:
+    def __init__(self):
+        self._registrations: Dict[str, ServiceRegistration] = {}
+        self._instances: Dict[str, Any] = {}
+        self._status: Dict[str, str] = {}
+        self._errors: Dict[str, str] = {}
+        self._warmup_seconds: Dict[str, float] = {}
+        # RLock: le factory possono richiedere altri servizi del container
+        self._lock = threading.RLock()
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, factory: Callable[[], Any], warmup: Optional[Callable[[Any], Any]] = None,
+                 health: Optional[Callable[[Any], Dict[str, Any]]] = None,
+                 close: Optional[Callable[[Any], Any]] = None, eager: bool = False):
+        """Registra un servizio; l'istanza viene creata al primo `get` (o all'avvio se `eager`)."""
+        with self._lock:
+            self._registrations[name] = ServiceRegistration(factory, warmup, health, close, eager)
+
+    def provide(self, name: str, instance: Any):
+        """Sostituisce l'istanza di un servizio (utile nei test)."""
+        with self._lock:
+            self._instances[name] = instance
+            self._status[name] = "ready"
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+            if name not in self._registrations:
+                raise KeyError(f"Service not registered: {name}")
+
+            started = time.perf_counter()
+            instance = self._registrations[name].factory()
+            self._instances[name] = instance
+            self._status.setdefault(name, "ready")
+            logger.info("Service created", service=name,
+                        elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+            return instance
+
+    def provider(self, name: str) -> Callable[[], Any]:
+        """Restituisce una funzione senza argomenti, adatta a `Depends(...)`."""
+        def provide_service():
+            return self.get(name)
+
+        provide_service.__name__ = f"get_{name}_service"
+        return provide_service
+
+    def lazy(self, name: str) -> LazyService:
+        """Proxy del servizio utilizzabile come istanza globale di modulo, senza crearlo all'import."""
+        return LazyService(self, name)
+
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def startup(self, warmup: Optional[bool] = None, preload: Optional[List[str]] = None):
+        """Crea i servizi `eager` e avvia i warm-up in background, senza ritardare l'avvio."""
+        if warmup is None:
+            warmup = os.getenv("SERVICE_WARMUP", "true").lower() == "true"
+        if preload is None:
+            preload = [name.strip() for name in os.getenv("SERVICE_PRELOAD", "").split(",") if name.strip()]
+
+        for name, registration in list(self._registrations.items()):
+            if registration.eager and not self.is_initialized(name):
+                try:
+                    await asyncio.to_thread(self.get, name)
+                except Exception as e:
+                    self._mark_error(name, e)
+
+        if warmup:
+            self._warmup_task = asyncio.create_task(self.warm_up(preload))
+
+    async def warm_up(self, preload: Optional[List[str]] = None):
+        for name in preload or []:
+            if name not in self._registrations:
+                logger.warning("Unknown service in preload list", service=name)
+                continue
+            if not self.is_initialized(name):
+                try:
+                    await asyncio.to_thread(self.get, name)
+                except Exception as e:
+                    self._mark_error(name, e)
+
+        for name, registration in list(self._registrations.items()):
+            if registration.warmup is None or not self.is_initialized(name):
+                continue
+            self._status[name] = "warming"
+            started = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(registration.warmup, self._instances[name])
+                if inspect.isawaitable(result):
+                    await result
+                self._status[name] = "ready"
+                self._warmup_seconds[name] = round(time.perf_counter() - started, 3)
+                logger.info("Service warmed up", service=name, seconds=self._warmup_seconds[name])
+            except Exception as e:
+                self._mark_error(name, e)
+
+    async def shutdown(self):
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+
+        for name, registration in list(self._registrations.items()):
+            instance = self._instances.get(name)
+            if instance is None or registration.close is None:
+                continue
+            try:
+                result = registration.close(instance)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning("Service close failed", service=name, error=str(e))
+
+    def health(self) -> Dict[str, Any]:
+        report = {}
+        for name, registration in list(self._registrations.items()):
+            instance = self._instances.get(name)
+            entry: Dict[str, Any] = {
+                "status": self._status.get(name, "ready") if instance is not None else "not_initialized"
+            }
+            if name in self._errors:
+                entry["error"] = self._errors[name]
+            if name in self._warmup_seconds:
+                entry["warmup_seconds"] = self._warmup_seconds[name]
+            if instance is not None and registration.health is not None:
+                try:
+                    entry.update(registration.health(instance))
+                except Exception as e:
+                    entry.update({"status": "error", "error": str(e)})
+            report[name] = entry
+        return report
+
+    def _mark_error(self, name: str, error: Exception):
+        self._status[name] = "error"
+        self._errors[name] = str(error)
+        logger.error("Service lifecycle hook failed", service=name, error=str(error))
+
+
+# ----------------------------------------------------------------------
+# Servizi principali
+# ----------------------------------------------------------------------
+
+def _create_rag_service():
+    from services.rag_service import RAGService
+    return RAGService()
+
+
+def _create_llm_service():
+    from services.llm_service import LLMService
+    return LLMService()
+
+
+def _create_course_service():
+    from services.course_service import CourseService
+    return CourseService()
+
+
+def _create_annotation_service():
+    from services.annotation_service import AnnotationService
+    return AnnotationService()
+
+
+def _create_cache_service():
+    from services.cache_service import get_cache_service
+    return get_cache_service()
+
+
+def _create_entity_store():
+    from services.entity_store import EntityStore
+    return EntityStore()
+
+
+def _create_background_task_service():
+    from services.background_task_service import BackgroundTaskService
+    return BackgroundTaskService()
+
+
+def _create_course_chat_session_manager():
+    from services.course_chat_session import CourseChatSessionManager
+    return CourseChatSessionManager()
+
+
+def _create_concept_map_service():
+    from services.concept_map_service import ConceptMapService
+    return ConceptMapService()
+
+
+def _create_ab_testing_framework():
+    from services.ab_testing_framework import ABTestingFramework
+    return ABTestingFramework()
+
+
+def _create_prompt_analytics():
+    # Istanza globale del modulo: il container ne gestisce solo il flush allo shutdown
+    from services.prompt_analytics_service import prompt_analytics_service
+    return prompt_analytics_service
+
+
+def _create_book_concept_cache():
+    # Istanza globale del modulo: il container ne gestisce solo il flush delle metrics allo shutdown
+    from services.book_concept_cache import book_concept_cache
+    return book_concept_cache
+
+
+def _create_answer_cache():
+    from services.semantic_answer_cache import SemanticAnswerCache
+    # Stesso modello di embedding del retrieval, risolto al primo uso
+    return SemanticAnswerCache(embed_texts=lambda texts: service_container.get("rag")._embed_texts(texts))
+
+
+def _create_ocr_service():
+    # cv2, easyocr e pytesseract vengono importati solo al primo uso dell'OCR
+    from services.ocr_service import OCRService
+    return OCRService()
+
+
+def _create_advanced_search_service():
+    from services.advanced_search_service import AdvancedSearchService
+    return AdvancedSearchService()
+
+
+def _create_spaced_repetition_service():
+    from services.spaced_repetition_service import SpacedRepetitionService
+    return SpacedRepetitionService()
+
+
+def _create_active_recall_engine():
+    from services.active_recall_service import ActiveRecallEngine
+    return ActiveRecallEngine()
+
+
+def _create_dual_coding_engine():
+    from services.dual_coding_service import DualCodingEngine
+    return DualCodingEngine(service_container.get("llm"), service_container.get("rag"))
+
+
+def _create_interleaved_practice_service():
+    from services.interleaved_practice_service import InterleavedPracticeScheduler
+    return InterleavedPracticeScheduler()
+
+
+def _create_metacognition_service():
+    from services.metacognition_service import MetacognitionFramework
+    return MetacognitionFramework()
+
+
+def _create_elaboration_network_service():
+    from services.elaboration_network_service import ElaborationNetworkService
+    return ElaborationNetworkService()
+
+
+def _warm_up_rag(rag_service):
+    # Carica il modello di embedding prima della prima richiesta
+    rag_service._load_embedding_model()
+
+
+def _rag_health(rag_service) -> Dict[str, Any]:
+    return {
+        "chromadb": rag_service.chroma_client is not None,
+        "embedding_model_loaded": rag_service.embedding_model is not None,
+        "cached_chunk_sets": len(rag_service.book_chunk_cache)
+    }
+
+
+def _llm_health(llm_service) -> Dict[str, Any]:
+    return {
+        "provider": llm_service.model_type,
+        "model": getattr(llm_service, "model", None),
+        "requests": llm_service.request_count
+    }
+
+
+service_container = ServiceContainer()
+service_container.register("course", _create_course_service)
+service_container.register("annotation", _create_annotation_service)
+service_container.register("rag", _create_rag_service, warmup=_warm_up_rag, health=_rag_health, eager=True)
+service_container.register("llm", _create_llm_service, health=_llm_health, eager=True)
+service_container.register("cache", _create_cache_service, close=lambda cache: cache.aclose())
+service_container.register("entity_store", _create_entity_store, close=lambda store: store.close())
+# Servizi persistiti nell'entity store: il database viene aperto al primo uso, non all'import
+service_container.register("background_tasks", _create_background_task_service)
+service_container.register("course_chat_sessions", _create_course_chat_session_manager)
+service_container.register("concept_map", _create_concept_map_service)
+service_container.register("answer_cache", _create_answer_cache, health=lambda cache: cache.stats())
+# Risultati A/B bufferizzati: scritti periodicamente e allo shutdown
+service_container.register("ab_testing", _create_ab_testing_framework, close=lambda framework: framework.close())
+service_container.register("prompt_analytics", _create_prompt_analytics, close=lambda analytics: analytics.close(),
+                           eager=True)
+service_container.register("book_concept_cache", _create_book_concept_cache,
+                           close=lambda cache: cache.flush_metrics(), eager=True)
+
+# Servizi pesanti: creati al primo uso (o nel warm-up, se elencati in SERVICE_PRELOAD)
+service_container.register("ocr", _create_ocr_service, close=lambda ocr: ocr.shutdown())
+service_container.register("advanced_search", _create_advanced_search_service,
+                           warmup=lambda search: search.sync_indexes(),
+                           health=lambda search: search.index_store.stats(),
+                           close=lambda search: search.close())
+service_container.register("spaced_repetition", _create_spaced_repetition_service,
+                           close=lambda service: service.close())
+service_container.register("active_recall", _create_active_recall_engine,
+                           health=lambda engine: {"question_cache": engine.get_cache_stats()})
+service_container.register("dual_coding", _create_dual_coding_engine)
+service_container.register("interleaved_practice", _create_interleaved_practice_service)
+service_container.register("metacognition", _create_metacognition_service)
+service_container.register("elaboration_network", _create_elaboration_network_service)
+
+get_rag_service = service_container.provider("rag")
+get_llm_service = service_container.provider("llm")
+get_course_service = service_container.provider("course")
+get_annotation_service = service_container.provider("annotation")
+get_cache = service_container.provider("cache")
+get_answer_cache = service_container.provider("answer_cache")
+get_entity_store = service_container.provider("entity_store")
+get_ab_testing_framework = service_container.provider("ab_testing")
@@ -2,9 +2,13 @@
 Spaced Repetition Service
 Enhanced SM-2 algorithm implementation for optimal learning scheduling
 Based on latest cognitive science research (2024-2025)
+
+The database runs in WAL mode and each thread reuses its own connection (and the
+sqlite3 prepared statement cache). The `*_async` variants run on a worker thread,
+off the event loop. `review_cards` applies a whole session's ratings in one transaction.
 """
 
-import os
+import asyncio
 import json
 import uuid
 import math
@@ -13,6 +17,30 @@ from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 from collections import defaultdict
 import sqlite3
+from services.service_container import service_container
+from services.sqlite_connections import ThreadLocalSQLite
+
+CARD_COLUMNS = (
+    "id, course_id, concept_id, question, answer, card_type, difficulty, "
+    "ease_factor, interval_days, repetitions, next_review, created_at, "
+    "last_reviewed, review_count, total_quality, context_tags, source_material"
+)
+
+# Constant SQL text, so sqlite3 reuses the prepared statement cached on the connection
+SAVE_CARD_SQL = f"INSERT OR REPLACE INTO learning_cards ({CARD_COLUMNS}) VALUES ({', '.join('?' * 17)})"
+UPDATE_REVIEWED_CARD_SQL = """
+    UPDATE learning_cards SET
+        ease_factor = ?, interval_days = ?, repetitions = ?,
+        next_review = ?, last_reviewed = ?, review_count = ?,
+        total_quality = ?, difficulty = ?
+    WHERE id = ?
+"""
+INSERT_REVIEW_SQL = """
+    INSERT INTO review_sessions
+    (id, card_id, session_id, quality_rating, response_time_ms, reviewed_at,
+     previous_interval, previous_ease_factor, previous_repetitions)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
 @dataclass
 class LearningCard:
@@ -64,11 +92,11 @@ class StudySession:
     average_response_time: float
     session_type: str  # new_review, overdue, mixed
 
-class SpacedRepetitionService:
+class SpacedRepetitionService(ThreadLocalSQLite):
     """Enhanced Spaced Repetition System with SM-2 algorithm and cognitive optimizations"""
 
     def __init__(self, db_path: str = "data/spaced_repetition.db"):
-        self.db_path = db_path
+        super().__init__(db_path, cached_statements=256)
         self.ensure_database()
 
         # SM-2 Algorithm parameters (enhanced based on 2024 research)
@@ -86,11 +114,11 @@ class SpacedRepetitionService:
 
     def ensure_database(self):
         """Ensure database and tables exist"""
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.transaction() as cursor:
+            self._create_schema(cursor)
 
+    def _create_schema(self, cursor: sqlite3.Connection):
+        """Create tables and indexes"""
         # Learning cards table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS learning_cards (
@@ -147,12 +175,13 @@ class SpacedRepetitionService:
         # Indexes for performance
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_next_review ON learning_cards(next_review)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_course_id ON learning_cards(course_id)")
+        # Due cards per course: filter and ORDER BY are both served by this index
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cards_course_next_review ON learning_cards(course_id, next_review)"
+        )
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_reviews_card_id ON review_sessions(card_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_reviews_session_id ON review_sessions(session_id)")
 
-        conn.commit()
-        conn.close()
-
     def calculate_next_review_sm2(self, card: LearningCard, quality_rating: int,
                                  response_time_ms: int) -> Tuple[float, int, int]:
         """
@@ -280,37 +309,33 @@ class SpacedRepetitionService:
 
     def _save_card(self, card: LearningCard):
         """Save card to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            conn.execute(SAVE_CARD_SQL, self._card_row(card))
 
-        cursor.execute("""
-            INSERT OR REPLACE INTO learning_cards
-            (id, course_id, concept_id, question, answer, card_type, difficulty,
-             ease_factor, interval_days, repetitions, next_review, created_at,
-             last_reviewed, review_count, total_quality, context_tags, source_material)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+    def _card_row(self, card: LearningCard) -> Tuple:
+        return (
             card.id, card.course_id, card.concept_id, card.question, card.answer,
             card.card_type, card.difficulty, card.ease_factor, card.interval_days,
             card.repetitions, card.next_review.isoformat(), card.created_at.isoformat(),
             card.last_reviewed.isoformat() if card.last_reviewed else None,
             card.review_count, card.total_quality, json.dumps(card.context_tags),
             card.source_material
-        ))
+        )
 
-        conn.commit()
-        conn.close()
+    def get_card(self, card_id: str) -> Optional[LearningCard]:
+        """Get a single card by id"""
+        row = self.connection().execute(
+            f"SELECT {CARD_COLUMNS} FROM learning_cards WHERE id = ?", (card_id,)
+        ).fetchone()
+        return self._row_to_card(row) if row else None
 
     def get_due_cards(self, course_id: str, limit: int = 20,
                      card_types: List[str] = None) -> List[LearningCard]:
         """Get cards due for review"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         now = datetime.now(timezone.utc).isoformat()
 
-        query = """
-            SELECT * FROM learning_cards
+        query = f"""
+            SELECT {CARD_COLUMNS} FROM learning_cards
             WHERE course_id = ? AND next_review <= ?
         """
         params = [course_id, now]
@@ -323,15 +348,8 @@ class SpacedRepetitionService:
         query += " ORDER BY next_review ASC LIMIT ?"
         params.append(limit)
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
-
-        cards = []
-        for row in rows:
-            cards.append(self._row_to_card(row))
-
-        return cards
+        rows = self.connection().execute(query, params).fetchall()
+        return [self._row_to_card(row) for row in rows]
 
     def _row_to_card(self, row) -> LearningCard:
         """Convert database row to LearningCard object"""
@@ -358,26 +376,87 @@ class SpacedRepetitionService:
     def review_card(self, card_id: str, quality_rating: int, response_time_ms: int,
                    session_id: str = None) -> Dict[str, Any]:
         """Process card review and update scheduling"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Get current card
-        cursor.execute("SELECT * FROM learning_cards WHERE id = ?", (card_id,))
-        row = cursor.fetchone()
-        if not row:
-            conn.close()
-            raise ValueError(f"Card {card_id} not found")
+        return self.review_cards([{
+            "card_id": card_id,
+            "quality_rating": quality_rating,
+            "response_time_ms": response_time_ms
+        }], session_id=session_id)[0]
 
-        card = self._row_to_card(row)
+    def review_cards(self, reviews: List[Dict[str, Any]], session_id: str = None) -> List[Dict[str, Any]]:
+        """
+        Apply a whole session's ratings in a single transaction.
 
+        Each review is a dict with card_id, quality_rating, response_time_ms and an
+        optional session_id. Reviews of the same card are applied in order. If any
+        card does not exist nothing is written.
+        """
+        if not reviews:
+            return []
+
+        card_ids = list(dict.fromkeys(review["card_id"] for review in reviews))
+        placeholders = ','.join('?' * len(card_ids))
+        reviewed_at = datetime.now(timezone.utc)
+        default_session_id = session_id or str(uuid.uuid4())
+
+        with self.transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {CARD_COLUMNS} FROM learning_cards WHERE id IN ({placeholders})", card_ids
+            ).fetchall()
+            cards = {row[0]: self._row_to_card(row) for row in rows}
+            missing = [card_id for card_id in card_ids if card_id not in cards]
+            if missing:
+                raise ValueError(f"Card {missing[0]} not found")
+
+            results, review_rows = [], []
+            for review in reviews:
+                card = cards[review["card_id"]]
+                result, review_row = self._apply_review(
+                    card, review["quality_rating"], review["response_time_ms"],
+                    review.get("session_id") or default_session_id, reviewed_at
+                )
+                results.append(result)
+                review_rows.append(review_row)
+
+            conn.executemany(UPDATE_REVIEWED_CARD_SQL, [
+                (card.ease_factor, card.interval_days, card.repetitions, card.next_review.isoformat(),
+                 card.last_reviewed.isoformat(), card.review_count, card.total_quality,
+                 card.difficulty, card.id)
+                for card in cards.values()
+            ])
+            conn.executemany(INSERT_REVIEW_SQL, review_rows)
+
+        return results
+
+    async def get_due_cards_async(self, course_id: str, limit: int = 20,
+                                  card_types: List[str] = None) -> List[LearningCard]:
+        """get_due_cards off the event loop"""
+        return await asyncio.to_thread(self.get_due_cards, course_id, limit, card_types)
+
+    async def review_card_async(self, card_id: str, quality_rating: int, response_time_ms: int,
+                                session_id: str = None) -> Dict[str, Any]:
+        """review_card off the event loop"""
+        return await asyncio.to_thread(self.review_card, card_id, quality_rating, response_time_ms, session_id)
+
+    async def review_cards_async(self, reviews: List[Dict[str, Any]],
+                                 session_id: str = None) -> List[Dict[str, Any]]:
+        """review_cards off the event loop"""
+        return await asyncio.to_thread(self.review_cards, reviews, session_id)
+
+    async def get_learning_analytics_async(self, course_id: str, days: int = 30) -> Dict[str, Any]:
+        """get_learning_analytics off the event loop"""
+        return await asyncio.to_thread(self.get_learning_analytics, course_id, days)
+
+    def _apply_review(self, card: LearningCard, quality_rating: int, response_time_ms: int,
+                      session_id: str, reviewed_at: datetime) -> Tuple[Dict[str, Any], Tuple]:
+        """Update the card in place; return the review result and its review_sessions row"""
         # Record previous state
         review_session = ReviewSession(
             id=str(uuid.uuid4()),
-            card_id=card_id,
-            session_id=session_id or str(uuid.uuid4()),
+            card_id=card.id,
+            session_id=session_id,
             quality_rating=quality_rating,
             response_time_ms=response_time_ms,
-            reviewed_at=datetime.now(timezone.utc),
+            reviewed_at=reviewed_at,
             previous_interval=card.interval_days,
             previous_ease_factor=card.ease_factor,
             previous_repetitions=card.repetitions
@@ -387,44 +466,29 @@ class SpacedRepetitionService:
         new_ease, new_interval, new_repetitions = self.calculate_next_review_sm2(
             card, quality_rating, response_time_ms
         )
-
-        # Update card
-        next_review = datetime.now(timezone.utc) + timedelta(days=new_interval)
+        next_review = reviewed_at + timedelta(days=new_interval)
 
         # Update statistics
         total_reviews = card.review_count + 1
         total_quality = ((card.total_quality * card.review_count) + quality_rating) / total_reviews
 
-        cursor.execute("""
-            UPDATE learning_cards SET
-                ease_factor = ?, interval_days = ?, repetitions = ?,
-                next_review = ?, last_reviewed = ?, review_count = ?,
-                total_quality = ?, difficulty = ?
-            WHERE id = ?
-        """, (
-            new_ease, new_interval, new_repetitions, next_review.isoformat(),
-            review_session.reviewed_at.isoformat(), total_reviews,
-            total_quality, self._update_difficulty(card, quality_rating), card_id
-        ))
-
-        # Save review session
-        cursor.execute("""
-            INSERT INTO review_sessions
-            (id, card_id, session_id, quality_rating, response_time_ms, reviewed_at,
-             previous_interval, previous_ease_factor, previous_repetitions)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        card.difficulty = self._update_difficulty(card, quality_rating)
+        card.ease_factor = new_ease
+        card.interval_days = new_interval
+        card.repetitions = new_repetitions
+        card.next_review = next_review
+        card.last_reviewed = reviewed_at
+        card.review_count = total_reviews
+        card.total_quality = total_quality
+
+        review_row = (
             review_session.id, review_session.card_id, review_session.session_id,
             review_session.quality_rating, review_session.response_time_ms,
             review_session.reviewed_at.isoformat(), review_session.previous_interval,
             review_session.previous_ease_factor, review_session.previous_repetitions
-        ))
-
-        conn.commit()
-        conn.close()
-
-        return {
-            "card_id": card_id,
+        )
+        result = {
+            "card_id": card.id,
             "next_review": next_review.isoformat(),
             "interval_days": new_interval,
             "ease_factor": new_ease,
@@ -432,6 +496,7 @@ class SpacedRepetitionService:
             "quality_rating": quality_rating,
             "review_session_id": review_session.id
         }
+        return result, review_row
 
     def _update_difficulty(self, card: LearningCard, quality_rating: int) -> float:
         """Update card difficulty based on review performance"""
@@ -443,19 +508,19 @@ class SpacedRepetitionService:
 
     def get_learning_analytics(self, course_id: str, days: int = 30) -> Dict[str, Any]:
         """Get comprehensive learning analytics for a course"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.connection().cursor()
 
-        since_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+        now = datetime.now(timezone.utc)
+        since_date = (now - timedelta(days=days)).isoformat()
 
-        # Card statistics
+        # Card statistics (next_review is stored as ISO text, so compare with an ISO timestamp)
         cursor.execute("""
             SELECT COUNT(*) as total_cards,
-                   COUNT(CASE WHEN next_review <= datetime('now') THEN 1 END) as due_cards,
+                   COUNT(CASE WHEN next_review <= ? THEN 1 END) as due_cards,
                    AVG(difficulty) as avg_difficulty,
                    AVG(total_quality) as avg_quality
             FROM learning_cards WHERE course_id = ?
-        """, (course_id,))
+        """, (now.isoformat(), course_id))
         card_stats = cursor.fetchone()
 
         # Review statistics
@@ -482,8 +547,7 @@ class SpacedRepetitionService:
             ORDER BY review_date
         """, (course_id, since_date))
         learning_curve = cursor.fetchall()
-
-        conn.close()
+        cursor.close()
 
         return {
             "period_days": days,
@@ -632,4 +696,4 @@ class SpacedRepetitionService:
             return "new_cards"
 
 # Global instance
-spaced_repetition_service = SpacedRepetitionService()
\ No newline at end of file
+spaced_repetition_service = service_container.lazy("spaced_repetition")
\ No newline at end of file
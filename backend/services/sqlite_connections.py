@@ -0,0 +1,77 @@
+"""
+SQLite Connections - Connessioni SQLite per thread in WAL mode, condivise dagli store
+
+Ogni thread apre (una volta) la propria connessione in autocommit, con WAL, synchronous
+NORMAL e busy timeout: le letture non bloccano le scritture e la cache degli statement
+preparati resta sulla connessione. Le scritture passano da `transaction()`, una transazione
+`BEGIN IMMEDIATE` annidabile nello stesso thread (vale la più esterna), così le
+read-modify-write concorrenti non perdono aggiornamenti.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+
+class ThreadLocalSQLite:
+    def __init__(self, db_path: str, cached_statements: int = 128):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections_lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def connection(self) -> sqlite3.Connection:
+        """Connessione del thread corrente (autocommit; le scritture usano `transaction`)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self._cached_statements)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transazione in scrittura (annidabile nello stesso thread: vale la più esterna)."""
+        conn = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def close(self):
+        """Chiude le connessioni aperte da tutti i thread."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
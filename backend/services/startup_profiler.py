@@ -0,0 +1,143 @@
+"""
+Startup Profiler - Tempo di import per modulo durante l'avvio del backend
+
+Installa un finder in `sys.meta_path` che avvolge i loader dei moduli importati e ne misura
+l'esecuzione: per ogni modulo registra il tempo cumulativo (import annidati compresi) e il
+tempo "self" (al netto dei sotto-moduli), così da individuare le dipendenze che rallentano
+l'avvio dei worker. Deve essere installato prima degli altri import di `main.py`.
+
+Configurazione:
+    STARTUP_PROFILE        abilita la misura degli import all'avvio (default: false)
+    STARTUP_PROFILE_TOP    numero di moduli più lenti riportati nel report (default: 25)
+"""
+
+import importlib.abc
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Loader che delega a quello originale misurando `exec_module`."""
+
+    def __init__(self, profiler: "StartupProfiler", loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__, time.perf_counter() - started)
+
+    def __getattr__(self, name: str) -> Any:
+        # get_resource_reader, is_package, get_source...: comportamento invariato
+        return getattr(self._loader, name)
+
+
+class StartupProfiler(importlib.abc.MetaPathFinder):
+    def __init__(self):
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._local = threading.local()
+        self._finding = threading.local()
+        self._installed_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Installazione
+    # ------------------------------------------------------------------
+
+    @property
+    def installed(self) -> bool:
+        return self in sys.meta_path
+
+    def install(self):
+        if not self.installed:
+            sys.meta_path.insert(0, self)
+            self._installed_at = time.perf_counter()
+            self._finished_at = None
+
+    def finish(self):
+        """Smette di misurare: gli import successivi (lazy, a richiesta) non entrano nel report."""
+        if self.installed:
+            sys.meta_path.remove(self)
+            self._finished_at = time.perf_counter()
+
+    def find_spec(self, fullname, path=None, target=None):
+        if getattr(self._finding, "active", False):
+            return None
+        self._finding.active = True
+        try:
+            # Gli altri finder trovano lo spec; noi ne avvolgiamo soltanto il loader
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(self, spec.loader)
+                    return spec
+            return None
+        finally:
+            self._finding.active = False
+
+    # ------------------------------------------------------------------
+    # Misura
+    # ------------------------------------------------------------------
+
+    def _stack(self) -> List[float]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self):
+        # Accumula il tempo dei moduli figli per ricavare il tempo "self" del genitore
+        self._stack().append(0.0)
+
+    def _exit(self, name: str, elapsed: float):
+        stack = self._stack()
+        children = stack.pop() if stack else 0.0
+        if stack:
+            stack[-1] += elapsed
+        self._timings[name] = {
+            "cumulative_ms": round(elapsed * 1000, 2),
+            "self_ms": round(max(elapsed - children, 0.0) * 1000, 2)
+        }
+
+    # ------------------------------------------------------------------
+    # Report
+    # ------------------------------------------------------------------
+
+    def report(self, top: Optional[int] = None, sort_by: str = "self_ms") -> Dict[str, Any]:
+        if top is None:
+            top = int(os.getenv("STARTUP_PROFILE_TOP", "25"))
+        timings = dict(self._timings)
+        ordered = sorted(timings.items(), key=lambda item: item[1][sort_by], reverse=True)
+        total_ms = None
+        if self._installed_at is not None:
+            total_ms = round(((self._finished_at or time.perf_counter()) - self._installed_at) * 1000, 1)
+        return {
+            "enabled": self._installed_at is not None,
+            "modules_imported": len(timings),
+            "total_ms": total_ms,
+            "modules": [dict(module=name, **values) for name, values in ordered[:top]]
+        }
+
+
+startup_profiler = StartupProfiler()
+
+
+def install_from_env() -> bool:
+    """Installa il profiler se STARTUP_PROFILE è attivo; restituisce True se installato."""
+    if os.getenv("STARTUP_PROFILE", "false").lower() == "true":
+        startup_profiler.install()
+        return True
+    return False
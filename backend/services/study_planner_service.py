@@ -12,8 +12,8 @@ from pydantic import BaseModel, Field
 from .background_task_service import background_task_service, TaskType, TaskStatus
 from .book_service import BookService
 from .concept_map_service import concept_map_service
-from .llm_service import LLMService
-from .rag_service import RAGService
+from .entity_store import EntityStore
+from .service_container import get_entity_store, get_llm_service, get_rag_service
 
 logger = structlog.get_logger()
 
@@ -81,12 +81,16 @@ class StudyPlan(BaseModel):
     is_active: bool = True
 
 class StudyPlannerService:
-    def __init__(self):
-        self.rag_service = RAGService()
-        self.llm_service = LLMService()
-        self.book_service = BookService()
+    def __init__(self, store: Optional[EntityStore] = None):
+        self.rag_service = get_rag_service()
+        self.llm_service = get_llm_service()
+        self.book_service = BookService(store)
+        # File JSON legacy, importato una sola volta nell'entity store
         self.plans_data_file = "data/study_plans.json"
         self._ensure_data_directory()
+        store = store or get_entity_store()
+        self.plans = store.collection("study_plans", sort_field="created_at")
+        store.migrate_json(self.plans_data_file, self._import_legacy_plans)
         logger.info("Study Planner Service initialized")
 
     def _ensure_data_directory(self):
@@ -94,25 +98,17 @@ class StudyPlannerService:
         import os
         os.makedirs("data", exist_ok=True)
 
-    def _load_plans(self) -> Dict[str, Any]:
-        """Load existing study plans from file"""
-        try:
-            with open(self.plans_data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {"plans": {}}
-        except Exception as e:
-            logger.error(f"Error loading study plans: {e}")
-            return {"plans": {}}
+    def _import_legacy_plans(self, plans_data: Dict[str, Any]) -> int:
+        """Import study plans from the legacy JSON file"""
+        plans = (plans_data or {}).get("plans", {})
+        for plan_id, plan_data in plans.items():
+            self._save_plan_data(plan_id, plan_data)
+        return len(plans)
 
-    def _save_plans(self, plans_data: Dict[str, Any]):
-        """Save study plans to file"""
-        try:
-            with open(self.plans_data_file, 'w', encoding='utf-8') as f:
-                json.dump(plans_data, f, indent=2, ensure_ascii=False, default=str)
-        except Exception as e:
-            logger.error(f"Error saving study plans: {e}")
-            raise e
+    def _save_plan_data(self, plan_id: str, plan_data: Dict[str, Any]):
+        """Save a single study plan (one row per plan)"""
+        # Normalizza datetime e altri tipi come faceva il salvataggio JSON (default=str)
+        self.plans.put(plan_id, json.loads(json.dumps(plan_data, ensure_ascii=False, default=str)))
 
     async def generate_study_plan(self, course_id: str, preferences: Dict[str, Any]) -> StudyPlan:
         """Generate a comprehensive study plan that covers all course chapters and concepts."""
@@ -829,8 +825,8 @@ class StudyPlannerService:
         if not books:
             return
 
-        plans_data = self._load_plans()
-        if not plans_data.get("plans"):
+        course_plans = self.plans.find(course_id=course_id)
+        if not course_plans:
             return
 
         chapter_lookup: Dict[tuple, Dict[str, Any]] = {}
@@ -870,13 +866,9 @@ class StudyPlannerService:
                 chapter_lookup[(normalized_book, normalized_chapter)] = info
                 chapter_only_lookup.setdefault(normalized_chapter, info)
 
-        changed = False
         now = datetime.now().isoformat()
 
-        for plan_id, plan_data in plans_data.get("plans", {}).items():
-            if plan_data.get("course_id") != course_id:
-                continue
-
+        for plan_data in course_plans:
             sessions = plan_data.get("sessions") or []
             missions = plan_data.get("missions") or []
             plan_changed = False
@@ -993,17 +985,12 @@ class StudyPlannerService:
                 durations_sum = sum(int(session.get("duration_minutes") or 0) for session in sessions)
                 plan_data["estimated_hours"] = math.ceil(durations_sum / 60) if durations_sum else 0
                 plan_data["updated_at"] = now
-                changed = True
-
-        if changed:
-            self._save_plans(plans_data)
+                self._save_plan_data(plan_data["id"], plan_data)
 
     async def save_study_plan(self, plan: StudyPlan):
         """Save a study plan"""
         try:
-            plans_data = self._load_plans()
-            plans_data['plans'][plan.id] = plan.dict()
-            self._save_plans(plans_data)
+            self._save_plan_data(plan.id, plan.dict())
             logger.info(f"Saved study plan {plan.id}")
         except Exception as e:
             logger.error(f"Error saving study plan: {e}")
@@ -1022,8 +1009,7 @@ class StudyPlannerService:
         task_id: str,
         completed: bool
     ) -> StudyMission:
-        plans_data = self._load_plans()
-        plan_data = plans_data['plans'].get(plan_id)
+        plan_data = self.plans.get(plan_id)
         if not plan_data:
             raise ValueError("Study plan not found")
 
@@ -1044,16 +1030,14 @@ class StudyPlannerService:
 
         plan_data['missions'] = missions
         plan_data['updated_at'] = datetime.now().isoformat()
-        plans_data['plans'][plan_id] = plan_data
-        self._save_plans(plans_data)
+        self._save_plan_data(plan_id, plan_data)
 
         return StudyMission(**mission_data)
 
     async def get_study_plan(self, plan_id: str) -> Optional[StudyPlan]:
         """Get a specific study plan"""
         try:
-            plans_data = self._load_plans()
-            plan_data = plans_data['plans'].get(plan_id)
+            plan_data = self.plans.get(plan_id)
             if plan_data:
                 return StudyPlan(**plan_data)
             return None
@@ -1064,14 +1048,10 @@ class StudyPlannerService:
     async def get_course_study_plans(self, course_id: str) -> List[StudyPlan]:
         """Get all study plans for a course"""
         try:
-            plans_data = self._load_plans()
-            course_plans = []
-
-            for plan_data in plans_data['plans'].values():
-                if plan_data.get('course_id') == course_id:
-                    course_plans.append(StudyPlan(**plan_data))
-
-            return sorted(course_plans, key=lambda p: p.created_at, reverse=True)
+            return [
+                StudyPlan(**plan_data)
+                for plan_data in self.plans.find(course_id=course_id, descending=True)
+            ]
         except Exception as e:
             logger.error(f"Error getting study plans for course {course_id}: {e}")
             return []
@@ -1079,8 +1059,7 @@ class StudyPlannerService:
     async def update_session_progress(self, plan_id: str, session_id: str, completed: bool):
         """Update session completion status"""
         try:
-            plans_data = self._load_plans()
-            plan_data = plans_data['plans'].get(plan_id)
+            plan_data = self.plans.get(plan_id)
 
             if not plan_data:
                 raise ValueError(f"Study plan {plan_id} not found")
@@ -1114,7 +1093,7 @@ class StudyPlannerService:
 
             plan_data['missions'] = missions
             plan_data['updated_at'] = datetime.now().isoformat()
-            self._save_plans(plans_data)
+            self._save_plan_data(plan_id, plan_data)
 
             logger.info(f"Updated session {session_id} progress for plan {plan_id}")
             return True
@@ -1126,10 +1105,7 @@ class StudyPlannerService:
     async def delete_study_plan(self, plan_id: str) -> bool:
         """Delete a study plan"""
         try:
-            plans_data = self._load_plans()
-            if plan_id in plans_data['plans']:
-                del plans_data['plans'][plan_id]
-                self._save_plans(plans_data)
+            if self.plans.delete(plan_id):
                 logger.info(f"Deleted study plan {plan_id}")
                 return True
             return False
@@ -1,29 +1,40 @@
 import os
-import json
 import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 
+from services.entity_store import EntityStore
+
 class StudyTracker:
-    def __init__(self):
+    def __init__(self, store: Optional[EntityStore] = None):
         self.tracking_dir = "data/tracking"
+        # File JSON legacy, importati una sola volta nell'entity store
         self.sessions_file = os.path.join(self.tracking_dir, "study_sessions.json")
         self.progress_file = os.path.join(self.tracking_dir, "progress.json")
         self.ensure_tracking_directory()
 
+        if store is None:
+            from services.service_container import get_entity_store
+            store = get_entity_store()
+        self.store = store
+        self.sessions = store.collection("study_sessions", sort_field="start_time")
+        self.progress = store.collection("study_progress", sort_field="created_at")
+        store.migrate_json(self.sessions_file, self._import_legacy_sessions)
+        store.migrate_json(self.progress_file, self._import_legacy_progress)
+
     def ensure_tracking_directory(self):
-        """Ensure the tracking directory and files exist"""
+        """Ensure the tracking directory exists"""
         os.makedirs(self.tracking_dir, exist_ok=True)
 
-        # Initialize sessions file
-        if not os.path.exists(self.sessions_file):
-            with open(self.sessions_file, 'w') as f:
-                json.dump([], f)
+    def _import_legacy_sessions(self, sessions: List[Dict[str, Any]]) -> int:
+        for session in sessions or []:
+            self.sessions.put(session["id"], session)
+        return len(sessions or [])
 
-        # Initialize progress file
-        if not os.path.exists(self.progress_file):
-            with open(self.progress_file, 'w') as f:
-                json.dump({}, f)
+    def _import_legacy_progress(self, progress_data: Dict[str, Any]) -> int:
+        for course_id, progress in (progress_data or {}).items():
+            self.progress.put(course_id, progress, course_id=course_id)
+        return len(progress_data or {})
 
     def track_interaction(self, course_id: str, session_id: str = None, question: str = "", answer: str = "") -> str:
         """Track a chat interaction within a study session"""
@@ -32,22 +43,6 @@ class StudyTracker:
             if not session_id:
                 session_id = str(uuid.uuid4())
 
-            # Load existing sessions
-            sessions = self.get_sessions_raw()
-
-            # Find or create session
-            session = next((s for s in sessions if s["id"] == session_id), None)
-            if not session:
-                session = {
-                    "id": session_id,
-                    "course_id": course_id,
-                    "start_time": datetime.now().isoformat(),
-                    "interactions": [],
-                    "topics_studied": set(),
-                    "duration_minutes": 0
-                }
-                sessions.append(session)
-
             # Add interaction
             interaction = {
                 "timestamp": datetime.now().isoformat(),
@@ -55,18 +50,29 @@ class StudyTracker:
                 "answer": answer,
                 "type": "chat"
             }
-            session["interactions"].append(interaction)
 
             # Extract topics from question (simple keyword extraction)
             topics = self.extract_topics(question)
-            session["topics_studied"].update(topics)
-
-            # Update session end time
-            session["last_interaction"] = datetime.now().isoformat()
 
-            # Save sessions
-            with open(self.sessions_file, 'w') as f:
-                json.dump(sessions, f, indent=2)
+            def apply(session: Dict[str, Any]):
+                session["interactions"].append(interaction)
+                session["topics_studied"] = sorted(set(session.get("topics_studied", [])) | set(topics))
+                # Update session end time
+                session["last_interaction"] = datetime.now().isoformat()
+
+            # Find or create session (aggiorna solo la riga della sessione)
+            with self.store.transaction():
+                if self.sessions.update(session_id, apply) is None:
+                    session = {
+                        "id": session_id,
+                        "course_id": course_id,
+                        "start_time": datetime.now().isoformat(),
+                        "interactions": [],
+                        "topics_studied": [],
+                        "duration_minutes": 0
+                    }
+                    apply(session)
+                    self.sessions.put(session_id, session)
 
             # Update progress
             self.update_progress(course_id, session_id, topics)
@@ -80,8 +86,6 @@ class StudyTracker:
     def record_study_session(self, session_data: Dict[str, Any]) -> str:
         """Record a completed study session"""
         try:
-            sessions = self.get_sessions_raw()
-
             new_session = {
                 "id": str(uuid.uuid4()),
                 "course_id": session_data["course_id"],
@@ -93,11 +97,7 @@ class StudyTracker:
                 "type": "manual"
             }
 
-            sessions.append(new_session)
-
-            # Save sessions
-            with open(self.sessions_file, 'w') as f:
-                json.dump(sessions, f, indent=2)
+            self.sessions.put(new_session["id"], new_session)
 
             # Update progress
             self.update_progress(session_data["course_id"], new_session["id"], session_data["topics_studied"])
@@ -108,22 +108,19 @@ class StudyTracker:
             print(f"Error recording study session: {e}")
             raise Exception(f"Error recording study session: {e}")
 
-    def get_sessions_raw(self) -> List[Dict[str, Any]]:
-        """Get raw sessions data from file"""
-        try:
-            with open(self.sessions_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+    def get_sessions_raw(self, course_id: Optional[str] = None, since: Optional[datetime] = None,
+                         limit: Optional[int] = None, newest_first: bool = False) -> List[Dict[str, Any]]:
+        """Get raw sessions data ordered by start time, optionally filtered by course and start date (indexed)"""
+        filters = {"course_id": course_id} if course_id else {}
+        return self.sessions.find(limit=limit, descending=newest_first,
+                                  since=since.isoformat() if since else None, **filters)
 
     def get_progress(self, course_id: str) -> Dict[str, Any]:
         """Get study progress for a specific course"""
         try:
-            # Load progress data
-            with open(self.progress_file, 'r') as f:
-                progress_data = json.load(f)
+            progress = self.progress.get(course_id)
 
-            if course_id not in progress_data:
+            if progress is None:
                 return {
                     "course_id": course_id,
                     "total_sessions": 0,
@@ -135,8 +132,6 @@ class StudyTracker:
                     "weekly_progress": 0
                 }
 
-            progress = progress_data[course_id]
-
             # Calculate current streak
             progress["streak_days"] = self.calculate_streak(course_id)
 
@@ -157,38 +152,32 @@ class StudyTracker:
     def update_progress(self, course_id: str, session_id: str, topics: List[str]):
         """Update progress data after a session"""
         try:
-            # Load existing progress
-            with open(self.progress_file, 'r') as f:
-                progress_data = json.load(f)
-
-            # Initialize course progress if not exists
-            if course_id not in progress_data:
-                progress_data[course_id] = {
-                    "total_sessions": 0,
-                    "total_study_time": 0,
-                    "topics_covered": [],
-                    "last_study_date": None,
-                    "created_at": datetime.now().isoformat()
-                }
-
-            progress = progress_data[course_id]
-            progress["total_sessions"] += 1
-            progress["last_study_date"] = datetime.now().isoformat()
-
-            # Add new topics
-            for topic in topics:
-                if topic not in progress["topics_covered"]:
-                    progress["topics_covered"].append(topic)
-
             # Calculate session duration (if it's a chat session)
-            sessions = self.get_sessions_raw()
-            session = next((s for s in sessions if s["id"] == session_id), None)
-            if session and session.get("duration_minutes"):
-                progress["total_study_time"] += session["duration_minutes"]
-
-            # Save progress
-            with open(self.progress_file, 'w') as f:
-                json.dump(progress_data, f, indent=2)
+            session = self.sessions.get(session_id)
+
+            def apply(progress: Dict[str, Any]):
+                progress["total_sessions"] += 1
+                progress["last_study_date"] = datetime.now().isoformat()
+
+                # Add new topics
+                for topic in topics:
+                    if topic not in progress["topics_covered"]:
+                        progress["topics_covered"].append(topic)
+
+                if session and session.get("duration_minutes"):
+                    progress["total_study_time"] += session["duration_minutes"]
+
+            with self.store.transaction():
+                # Initialize course progress if not exists
+                if self.progress.get(course_id) is None:
+                    self.progress.put(course_id, {
+                        "total_sessions": 0,
+                        "total_study_time": 0,
+                        "topics_covered": [],
+                        "last_study_date": None,
+                        "created_at": datetime.now().isoformat()
+                    }, course_id=course_id)
+                self.progress.update(course_id, apply, course_id=course_id)
 
         except Exception as e:
             print(f"Error updating progress: {e}")
@@ -219,15 +208,12 @@ class StudyTracker:
     def calculate_streak(self, course_id: str) -> int:
         """Calculate current study streak for a course"""
         try:
-            sessions = self.get_sessions_raw()
-            course_sessions = [s for s in sessions if s["course_id"] == course_id]
+            # Sessions are returned sorted by start time
+            course_sessions = self.get_sessions_raw(course_id)
 
             if not course_sessions:
                 return 0
 
-            # Sort sessions by date
-            course_sessions.sort(key=lambda x: x.get("start_time", ""))
-
             # Calculate streak
             streak = 0
             current_date = datetime.now().date()
@@ -273,12 +259,10 @@ class StudyTracker:
     def get_weekly_study_time(self, course_id: str) -> float:
         """Get total study time for the current week (in hours)"""
         try:
-            sessions = self.get_sessions_raw()
-            course_sessions = [s for s in sessions if s["course_id"] == course_id]
-
             # Get current week's start (Monday)
             today = datetime.now().date()
             week_start = today - timedelta(days=today.weekday())
+            course_sessions = self.get_sessions_raw(course_id, since=datetime.combine(week_start, datetime.min.time()))
 
             weekly_time = 0
             for session in course_sessions:
@@ -297,8 +281,6 @@ class StudyTracker:
         try:
             session_id = str(uuid.uuid4())
 
-            sessions = self.get_sessions_raw()
-
             timer_session = {
                 "id": session_id,
                 "course_id": course_id or "general",
@@ -311,11 +293,7 @@ class StudyTracker:
                 "type": "timer"
             }
 
-            sessions.append(timer_session)
-
-            # Save sessions
-            with open(self.sessions_file, 'w') as f:
-                json.dump(sessions, f, indent=2)
+            self.sessions.put(session_id, timer_session)
 
             # Update progress if it's a work session
             if session_type == "work" and course_id:
@@ -330,16 +308,10 @@ class StudyTracker:
     def get_comprehensive_analytics(self, course_id: str = None, days_range: int = 30) -> Dict[str, Any]:
         """Get comprehensive learning analytics with advanced metrics"""
         try:
-            sessions = self.get_sessions_raw()
-
-            # Filter by course if specified
-            if course_id:
-                sessions = [s for s in sessions if s["course_id"] == course_id]
-
-            # Filter by date range
+            # Filter by course and date range
             cutoff_date = datetime.now() - timedelta(days=days_range)
             recent_sessions = [
-                s for s in sessions
+                s for s in self.get_sessions_raw(course_id)
                 if datetime.fromisoformat(s["start_time"]) >= cutoff_date
             ]
 
@@ -483,9 +455,7 @@ class StudyTracker:
     def calculate_longest_streak(self, course_id: str = None) -> int:
         """Calculate the longest study streak"""
         try:
-            sessions = self.get_sessions_raw()
-            if course_id:
-                sessions = [s for s in sessions if s["course_id"] == course_id]
+            sessions = self.get_sessions_raw(course_id)
 
             if not sessions:
                 return 0
@@ -0,0 +1,348 @@
+"""
+Tiered Cache - Cache a due livelli (L1 in processo + Redis L2) con protezione dallo stampede
+
+L1 è un LRU su OrderedDict (lettura, scrittura ed eviction in O(1)); le scadenze sono
+gestite da una timing wheel: le chiavi sono raggruppate per slot di scadenza e ogni sweep
+visita solo gli slot già scaduti, mai l'intera cache. L2 è il RedisCacheService condiviso
+tra i worker. `get_or_compute` coalizza le richieste concorrenti sulla stessa chiave
+(single-flight): la stessa domanda posta da un'intera classe produce un solo calcolo.
+
+Configurazione:
+    CACHE_L1_MAX_TTL   TTL massimo (secondi) delle voci L1 quando esiste un L2 (default: 60):
+                       limita quanto un worker può servire un valore invalidato da un altro
+"""
+
+import asyncio
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Cache LRU in memoria, thread-safe, con TTL opzionale per voce e tag per l'invalidazione.
+    """
+
+    def __init__(self, max_size: int = 1024, default_ttl: Optional[float] = None,
+                 resolution: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.resolution = resolution
+        self._clock = clock
+        # key -> (value, expires_at, tags); l'ordine è quello d'uso (ultimo = più recente)
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float], Tuple[str, ...]]]" = OrderedDict()
+        # Timing wheel: slot di scadenza -> chiavi, più un heap degli slot da visitare
+        self._wheel: Dict[int, Set[Hashable]] = {}
+        self._slots: List[int] = []
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at = entry[1]
+                if expires_at is None or expires_at > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            tags: Optional[Iterable[str]] = None) -> bool:
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            if key in self._data:
+                self._remove(key)
+
+            expires_at = now + ttl if ttl is not None else None
+            tags = tuple(tags or ())
+            self._data[key] = (value, expires_at, tags)
+            if expires_at is not None:
+                slot = self._slot(expires_at)
+                bucket = self._wheel.get(slot)
+                if bucket is None:
+                    bucket = self._wheel[slot] = set()
+                    heapq.heappush(self._slots, slot)
+                bucket.add(key)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._data) > self.max_size:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+            return True
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._remove(key)
+            return value
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """Rimuove tutte le voci registrate con almeno uno dei tag indicati."""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            return sum(1 for key in keys if self._remove(key))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._expire(self._clock())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._wheel.clear()
+            self._slots.clear()
+            self._tags.clear()
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            self._expire(self._clock())
+            return list(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > self._clock())
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    # ------------------------------------------------------------------
+    # Internals (chiamati con il lock acquisito)
+    # ------------------------------------------------------------------
+
+    def _slot(self, expires_at: float) -> int:
+        # Lo slot viene visitato solo quando tutte le sue chiavi sono certamente scadute
+        return int(expires_at // self.resolution) + 1
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        _, expires_at, tags = entry
+        if expires_at is not None:
+            bucket = self._wheel.get(self._slot(expires_at))
+            if bucket is not None:
+                bucket.discard(key)
+        for tag in tags:
+            tagged = self._tags.get(tag)
+            if tagged is not None:
+                tagged.discard(key)
+                if not tagged:
+                    del self._tags[tag]
+        return True
+
+    def _expire(self, now: float) -> int:
+        current = int(now // self.resolution)
+        expired = 0
+        while self._slots and self._slots[0] <= current:
+            slot = heapq.heappop(self._slots)
+            for key in list(self._wheel.pop(slot, ())):
+                if self._remove(key):
+                    expired += 1
+        self.expirations += expired
+        return expired
+
+
+class SingleFlight:
+    """
+    Coalizza le chiamate async concorrenti sulla stessa chiave: la prima esegue,
+    le altre attendono e ricevono lo stesso risultato (o la stessa eccezione).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        while True:
+            future = self._calls.get(call_key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Il chiamante principale è stato cancellato: si riprova invece di propagare
+                if not future.cancelled():
+                    raise
+
+        future = loop.create_future()
+        self._calls[call_key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # evita il warning "exception was never retrieved" senza waiter
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._calls.pop(call_key, None)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class TieredCache:
+    """
+    L1 LRU in processo davanti a un RedisCacheService (L2) opzionale.
+
+    `l2_provider` restituisce il servizio Redis (o None) ed è risolto a ogni accesso,
+    così il servizio può essere inizializzato pigramente o risultare irraggiungibile.
+    """
+
+    def __init__(self, name: str, cache_type: Any = None, max_size: int = 1024,
+                 ttl: Optional[float] = None, l1_max_ttl: Optional[float] = None,
+                 l2_provider: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.cache_type = cache_type
+        self.ttl = ttl
+        if l2_provider is not None:
+            l1_max_ttl = l1_max_ttl or float(os.getenv("CACHE_L1_MAX_TTL", "60"))
+            self.l1_ttl = min(ttl, l1_max_ttl) if ttl else l1_max_ttl
+        else:
+            self.l1_ttl = ttl
+        self.l1 = LRUCache(max_size=max_size, default_ttl=self.l1_ttl)
+        self._l2_provider = l2_provider
+        self._flight = SingleFlight()
+        self.l2_hits = 0
+        self.computations = 0
+
+    def _l2(self):
+        if self._l2_provider is None or self.cache_type is None:
+            return None
+        try:
+            return self._l2_provider()
+        except Exception as e:
+            logger.warning("L2 cache unavailable", cache=self.name, error=str(e))
+            return None
+
+    def _l1_ttl_for(self, ttl: Optional[float]) -> Optional[float]:
+        if ttl is None:
+            return self.l1_ttl
+        return min(ttl, self.l1_ttl) if self.l1_ttl else ttl
+
+    async def get(self, key: str, tags: Optional[Iterable[str]] = None) -> Any:
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        l2 = self._l2()
+        if l2 is not None:
+            value = await l2.get(self.cache_type, key)
+            if value is not None:
+                self.l2_hits += 1
+                # Promozione in L1 con gli stessi tag, per l'invalidazione locale
+                self.l1.set(key, value, tags=tags)
+                return value
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None,
+                  tags: Optional[Iterable[str]] = None) -> bool:
+        tags = list(tags or ())
+        self.l1.set(key, value, ttl=self._l1_ttl_for(ttl), tags=tags)
+        l2 = self._l2()
+        if l2 is not None:
+            return await l2.set(self.cache_type, key, value, custom_ttl=ttl or self.ttl, tags=tags or None)
+        return True
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             ttl: Optional[float] = None, tags: Optional[Iterable[str]] = None,
+                             cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Restituisce il valore in cache o lo calcola una sola volta per tutte le richieste
+        concorrenti sulla stessa chiave. `cache_if` decide se il risultato va memorizzato.
+        """
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        tags = list(tags or ())
+
+        async def load():
+            cached = await self.get(key, tags)
+            if cached is not None:
+                return cached
+            self.computations += 1
+            result = await compute()
+            if result is not None and (cache_if is None or cache_if(result)):
+                await self.set(key, result, ttl=ttl, tags=tags)
+            return result
+
+        return await self._flight.do(key, load)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """Invalida le voci con i tag indicati in entrambi i livelli; restituisce le voci rimosse."""
+        tags = list(tags)
+        deleted = self.l1.invalidate_tags(tags)
+        l2 = self._l2()
+        if l2 is not None:
+            deleted += await l2.invalidate_tags(tags)
+        return deleted
+
+    async def delete(self, key: str) -> bool:
+        self.l1.delete(key)
+        l2 = self._l2()
+        if l2 is not None:
+            return await l2.delete(self.cache_type, key)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "l1": self.l1.stats(),
+            "l2_enabled": self._l2_provider is not None,
+            "l2_hits": self.l2_hits,
+            "computations": self.computations,
+            "coalesced_requests": self._flight.coalesced,
+            "in_flight": self._flight.in_flight()
+        }
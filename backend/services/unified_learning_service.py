@@ -14,7 +14,7 @@ from models.unified_learning import (
     UnifiedLearningManager, Quiz, QuizQuestion, DifficultyLevel,
     ConceptNode, Mindmap, MindmapNode, UserProgress, migration_helper
 )
-from services.llm_service import LLMService
+from services.service_container import get_llm_service
 from services.concept_map_service import ConceptMapService
 from app.api.mindmaps import load_mindmaps, save_mindmaps
 
@@ -25,7 +25,7 @@ class UnifiedLearningService:
 
     def __init__(self):
         self.manager = UnifiedLearningManager()
-        self.llm_service = LLMService()
+        self.llm_service = get_llm_service()
         self.concept_service = ConceptMapService()
 
     # ==================== QUIZ MANAGEMENT ====================
@@ -4,9 +4,7 @@ Script semplice per creare mappe concettuali basate sui materiali PDF esistenti.
 """
 
 import asyncio
-import json
 import sys
-import os
 import re
 from pathlib import Path
 from datetime import datetime
@@ -16,6 +14,7 @@ from typing import List, Dict, Any
 sys.path.append(str(Path(__file__).parent))
 
 from services.concept_map_service import ConceptMapService
+from services.course_service import CourseService
 import structlog
 
 logger = structlog.get_logger()
@@ -28,8 +27,8 @@ class SimpleConceptBuilder:
         """Costruisci concetti analizzando direttamente i file materials del corso."""
         logger.info(f"Building concepts from materials for course: {course_id}")
 
-        # 1. Carica dati corso da file JSON
-        course_data = self.load_course_from_file(course_id)
+        # 1. Carica dati corso (con i materiali) dall'entity store
+        course_data = self.load_course(course_id)
         if not course_data:
             logger.error(f"Course {course_id} not found")
             return None
@@ -77,27 +76,10 @@ class SimpleConceptBuilder:
             "generated_at": concept_map["generated_at"]
         }
 
-    def load_course_from_file(self, course_id: str) -> Dict[str, Any]:
-        """Carica dati del corso dal file JSON."""
+    def load_course(self, course_id: str) -> Dict[str, Any]:
+        """Carica dati del corso tramite CourseService (courses.json è solo il backup della migrazione)."""
         try:
-            # Try multiple possible paths
-            paths = [
-                f"data/courses/courses.json",
-                "/app/data/courses/courses.json"
-            ]
-
-            courses = []
-            for path in paths:
-                if os.path.exists(path):
-                    with open(path, "r", encoding="utf-8") as f:
-                        courses = json.load(f)
-                    break
-
-            for course in courses:
-                if course.get("id") == course_id:
-                    return course
-
-            return None
+            return CourseService().get_course(course_id)
 
         except Exception as e:
             logger.error(f"Error loading course data: {str(e)}")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test suite for the A/B testing store (persistence, assignment cache, batched results, running sums)
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from services.ab_testing_framework import (
+    ABTestingFramework, MetricType, StatisticalTest, TestStatus, TestType, TrafficAllocationMethod
+)
+
+
+VARIANTS = [
+    {"name": "control", "prompt_template": "Spiega {topic}"},
+    {"name": "socratic", "prompt_template": "Guida lo studente su {topic} con domande"}
+]
+
+
+class TestABTestingFramework(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "ab_testing.db")
+        self.framework = ABTestingFramework(db_path=self.db_path)
+
+    def tearDown(self):
+        self.framework.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def create_running_test(self, **kwargs):
+        test = self.run_async(self.framework.create_test(
+            name="Prompt socratico",
+            description="Confronto tra spiegazione diretta e socratica",
+            test_type=TestType.PROMPT_TEMPLATE,
+            variants=VARIANTS,
+            control_variant_id="control",
+            created_by="teacher",
+            **kwargs
+        ))
+        self.assertTrue(self.run_async(self.framework.start_test(test.id)))
+        return test
+
+    def record(self, test_id, user_id, success, response_time_ms, satisfaction=None):
+        return self.run_async(self.framework.record_result(
+            test_id, user_id, {MetricType.SUCCESS_RATE: 1.0 if success else 0.0},
+            success, response_time_ms, user_satisfaction=satisfaction
+        ))
+
+    def test_test_round_trips_through_database(self):
+        test = self.create_running_test(statistical_test=StatisticalTest.T_TEST)
+
+        reloaded = self.run_async(ABTestingFramework(db_path=self.db_path).get_test(test.id))
+        self.assertEqual(reloaded.status, TestStatus.RUNNING)
+        self.assertEqual(reloaded.statistical_test, StatisticalTest.T_TEST)
+        self.assertEqual([variant.name for variant in reloaded.variants], ["control", "socratic"])
+        # Il controllo indicato per nome viene risolto nell'ID della variante
+        self.assertEqual(reloaded.control_variant_id, reloaded.variants[0].id)
+
+        tests = self.run_async(self.framework.get_all_tests(status=TestStatus.RUNNING, created_by="teacher"))
+        self.assertEqual([item.id for item in tests], [test.id])
+
+    def test_assignment_is_sticky_and_persisted(self):
+        test = self.create_running_test(traffic_allocation_method=TrafficAllocationMethod.HASH_BASED)
+
+        first = self.run_async(self.framework.assign_variant(test.id, "user-1"))
+        self.assertIsNotNone(first)
+        self.assertEqual(self.run_async(self.framework.assign_variant(test.id, "user-1")).id, first.id)
+
+        other_worker = ABTestingFramework(db_path=self.db_path)
+        self.assertEqual(self.run_async(other_worker.assign_variant(test.id, "user-1")).id, first.id)
+
+    def test_results_are_batched_and_running_sums_match(self):
+        self.framework.result_batch_size = 4
+        self.framework.flush_interval = 3600
+        test = self.create_running_test()
+        for user in range(6):
+            self.run_async(self.framework.assign_variant(test.id, f"user-{user}"))
+
+        for user in range(6):
+            self.assertTrue(self.record(test.id, f"user-{user}", user % 2 == 0, 1000 + 100 * user, satisfaction=4.0))
+        # Quattro risultati scritti in un batch, due ancora in memoria
+        self.assertEqual(len(self.framework._pending_results), 2)
+
+        variant_stats = self.run_async(self.framework._get_variant_statistics(test.id, refresh=True))
+        self.assertEqual(sum(stat.n for stat in variant_stats.values()), 6)
+
+        results = self.run_async(self.framework._get_test_results(test.id))
+        self.assertEqual(len(results), 6)
+        for variant_id, stat in variant_stats.items():
+            times = [r.response_time_ms for r in results if r.variant_id == variant_id]
+            self.assertEqual(stat.n, len(times))
+            self.assertAlmostEqual(stat.response_time_mean, sum(times) / len(times))
+            self.assertEqual(stat.successes, sum(1 for r in results if r.variant_id == variant_id and r.success))
+
+    def test_analysis_runs_on_sufficient_statistics(self):
+        test = self.create_running_test()
+        control, treatment = test.variants
+        for index in range(200):
+            user_id = f"user-{index}"
+            variant = self.run_async(self.framework.assign_variant(test.id, user_id))
+            is_treatment = variant.id == treatment.id
+            success = index % 10 < (9 if is_treatment else 3)
+            self.record(test.id, user_id, success, 900 if is_treatment else 1500)
+
+        analysis = self.run_async(self.framework.analyze_test(test.id))
+        self.assertNotIn("error", analysis)
+        self.assertTrue(analysis["is_significant"])
+        self.assertEqual(analysis["winner_variant_id"], treatment.id)
+
+        bayesian = self.run_async(self.framework._bayesian_ab_test(
+            test, self.run_async(self.framework._get_variant_statistics(test.id))
+        ))
+        self.assertEqual(bayesian["best_variant_id"], treatment.id)
+
+        report = self.run_async(self.framework.get_test_results(test.id))
+        self.assertEqual(sum(variant["results"] for variant in report["variants"]), 200)
+        self.assertEqual(sum(variant["participants"] for variant in report["variants"]), 200)
+
+    def test_buffered_results_are_flushed_on_a_timer(self):
+        self.framework.flush_interval = 0.5
+        test = self.create_running_test()
+        self.run_async(self.framework.assign_variant(test.id, "user-1"))
+        # Nessun flush al momento della registrazione: lo scrive solo il timer
+        self.framework._last_flush = time.monotonic() + 60
+        self.record(test.id, "user-1", True, 1200)
+        self.assertEqual(len(self.framework._pending_results), 1)
+
+        deadline = time.monotonic() + 5
+        while self.framework._pending_results and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.framework._pending_results, [])
+
+    def test_reports_flush_the_buffer_once_off_the_event_loop(self):
+        self.framework.result_batch_size = 100
+        self.framework.flush_interval = 3600
+        test = self.create_running_test(statistical_test=StatisticalTest.MANN_WHITNEY)
+        for index in range(6):
+            self.run_async(self.framework.assign_variant(test.id, f"user-{index}"))
+            self.record(test.id, f"user-{index}", index % 2 == 0, 1000, satisfaction=float(index % 5))
+        self.assertEqual(len(self.framework._pending_results), 6)
+
+        flush_threads = []
+        flush_results = self.framework.flush_results
+        self.framework.flush_results = lambda: flush_threads.append(threading.current_thread()) or flush_results()
+
+        self.run_async(self.framework.analyze_test(test.id))
+        self.assertEqual(len(flush_threads), 1)
+
+        report = self.run_async(self.framework.get_test_results(test.id))
+        self.assertEqual(sum(point["results"] for point in report["time_series"]), 6)
+        self.assertEqual(len(flush_threads), 2)
+        self.assertNotIn(threading.main_thread(), flush_threads)
+
+    def test_running_sums_survive_restart(self):
+        test = self.create_running_test()
+        self.run_async(self.framework.assign_variant(test.id, "user-1"))
+        self.record(test.id, "user-1", True, 1200)
+        self.framework.close()
+
+        reloaded = ABTestingFramework(db_path=self.db_path)
+        variant_stats = self.run_async(reloaded._get_variant_statistics(test.id))
+        self.assertEqual(sum(stat.n for stat in variant_stats.values()), 1)
+        participant = self.run_async(reloaded._get_user_assignment(test.id, "user-1"))
+        self.assertEqual(participant.total_interactions, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
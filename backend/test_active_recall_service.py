@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test suite for the active recall engine (stable cache keys, TTL)
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from services.active_recall_service import ActiveRecallEngine, QuestionGenerationRequest
+
+CONTENT = (
+    "Photosynthesis is the process by which Plants convert light energy into chemical energy. "
+    "Chlorophyll absorbs light in the Chloroplasts. Cellular Respiration releases the stored energy."
+)
+
+
+class TestActiveRecallEngine(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "active_recall.db")
+        self.engine = ActiveRecallEngine(db_path=self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def request(self, **overrides):
+        params = dict(course_id="course-1", content=CONTENT, difficulty_target=0.5, num_questions=6,
+                      question_types=["multiple_choice", "short_answer"])
+        params.update(overrides)
+        return QuestionGenerationRequest(**params)
+
+    def test_cache_key_is_stable_across_processes(self):
+        key = self.engine._cache_key(self.request())
+        script = (
+            "from services.active_recall_service import ActiveRecallEngine, QuestionGenerationRequest\n"
+            f"engine = ActiveRecallEngine(db_path={self.db_path!r})\n"
+            "print(engine._cache_key(QuestionGenerationRequest(course_id='course-1', content="
+            f"{CONTENT!r}, difficulty_target=0.5, num_questions=6, "
+            "question_types=['short_answer', 'multiple_choice'])))"
+        )
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1], key)
+        self.assertNotEqual(key, self.engine._cache_key(self.request(num_questions=3)))
+        self.assertNotEqual(key, self.engine._cache_key(self.request(course_id="course-2")))
+
+    def test_generated_set_is_cached_with_usage_stats(self):
+        first = asyncio.run(self.engine.generate_questions(self.request()))
+        self.assertEqual(len(first), 6)
+
+        # A fresh engine (another worker or a restart) reuses the persisted set
+        other = ActiveRecallEngine(db_path=self.db_path)
+        with patch.object(other, "_generate_specific_question", side_effect=AssertionError("cache miss")):
+            second = asyncio.run(other.generate_questions(self.request()))
+        self.assertEqual([q.id for q in second], [q.id for q in first])
+        self.assertIsInstance(second[0].created_at, datetime)
+
+        stats = other.get_cache_stats()
+        self.assertEqual((stats["entries"], stats["total_hits"], stats["process_hits"]), (1, 1, 1))
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0], 6)
+
+    def test_expired_entries_are_regenerated(self):
+        first = asyncio.run(self.engine.generate_questions(self.request()))
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE question_cache SET generation_time = ?",
+                         ((datetime.now() - timedelta(days=30)).isoformat(),))
+
+        second = asyncio.run(self.engine.generate_questions(self.request()))
+        self.assertNotEqual({q.id for q in second}, {q.id for q in first})
+        self.assertEqual(self.engine.get_cache_stats()["expired_entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test suite for the per-user annotation index (incremental updates, BM25 ranking, scope filtering)
+"""
+
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from services.annotation_service import AnnotationService
+
+
+class TestAnnotationIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.service = AnnotationService()
+        self.service.annotations_dir = self.test_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def create(self, selected_text, content="", pdf_filename="fisica.pdf", **extra):
+        data = {
+            "user_id": "student",
+            "pdf_filename": pdf_filename,
+            "pdf_path": f"/tmp/{pdf_filename}",
+            "course_id": "course-1",
+            "book_id": "book-1",
+            "page_number": 3,
+            "selected_text": selected_text,
+            "content": content,
+            "share_with_ai": True
+        }
+        data.update(extra)
+        return self.service.create_annotation(data)
+
+    def relevant_ids(self, query, **kwargs):
+        return [annotation["id"] for annotation, _ in
+                self.service.find_relevant_annotations("student", query, **kwargs)]
+
+    def test_ranks_annotations_by_relevance_to_query(self):
+        entropy = self.create("L'entropia misura il disordine", "entropia e secondo principio")
+        newton = self.create("Seconda legge di Newton", "forza uguale massa per accelerazione")
+        self.create("Unità di misura del sistema internazionale", pdf_filename="chimica.pdf")
+
+        self.assertEqual(self.relevant_ids("cos'è l'entropia?"), [entropy["id"]])
+        self.assertEqual(self.relevant_ids("spiegami la legge di Newton sulla forza")[0], newton["id"])
+        self.assertEqual(self.relevant_ids("fotosintesi clorofilliana"), [])
+
+    def test_index_follows_create_update_and_delete_without_rescanning(self):
+        first = self.create("Teorema di Pitagora")
+        self.assertEqual(self.relevant_ids("pitagora"), [first["id"]])
+
+        with patch.object(self.service, "_iter_user_annotation_files",
+                          side_effect=AssertionError("the index must not rescan the disk")):
+            second = self.create("Dimostrazione con i triangoli simili")
+            self.assertEqual(self.relevant_ids("triangoli"), [second["id"]])
+
+            self.service.update_annotation("student", first["id"], {"tags": ["triangoli"]},
+                                           "fisica.pdf", "course-1", "book-1")
+            self.assertCountEqual(self.relevant_ids("triangoli"), [first["id"], second["id"]])
+
+            self.service.delete_annotation("student", second["id"], "fisica.pdf", "course-1", "book-1")
+            self.assertEqual(self.relevant_ids("triangoli"), [first["id"]])
+
+    def test_predicate_and_limit_are_applied_after_ranking(self):
+        shared = self.create("Equazione di Schrödinger", "onda")
+        self.create("Equazione di Schrödinger, note private", "onda", share_with_ai=False)
+        for index in range(5):
+            self.create(f"Funzione d'onda numero {index}")
+
+        results = self.service.find_relevant_annotations(
+            "student", "onda", limit=3, predicate=lambda annotation: annotation.get("share_with_ai"))
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(annotation["share_with_ai"] for annotation, _ in results))
+        self.assertEqual([score for _, score in results], sorted((score for _, score in results), reverse=True))
+        self.assertIn(shared["id"], [annotation["id"] for annotation, _ in
+                                     self.service.find_relevant_annotations("student", "schrödinger onda")])
+
+    def test_empty_query_returns_most_recent(self):
+        self.create("Prima nota")
+        latest = self.create("Seconda nota")
+        results = self.service.find_relevant_annotations("student", "", limit=1)
+        self.assertEqual(results[0][0]["id"], latest["id"])
+        self.assertEqual(results[0][1], 0.0)
+
+    def test_expired_index_reloads_changes_from_other_processes(self):
+        self.create("Circuiti elettrici")
+        self.relevant_ids("circuiti")
+
+        # Un altro worker scrive sullo stesso albero: visibile solo dopo il TTL
+        other_worker = AnnotationService()
+        other_worker.annotations_dir = self.test_dir
+        written = other_worker.create_annotation({
+            "user_id": "student", "pdf_filename": "elettronica.pdf", "pdf_path": "/tmp/elettronica.pdf",
+            "page_number": 1, "selected_text": "Legge di Ohm sui circuiti", "share_with_ai": True
+        })
+        self.assertNotIn(written["id"], self.relevant_ids("ohm"))
+
+        self.service.index.ttl = 0
+        self.assertEqual(self.relevant_ids("ohm"), [written["id"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
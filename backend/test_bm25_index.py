@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test suite for the inverted-index BM25 engine used by HybridSearchService
+"""
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+from services.bm25_index import BM25Index, BM25IndexRegistry
+
+
+def reference_scores(corpus, query, k1=1.2, b=0.75):
+    """Scansione lineare equivalente alla vecchia implementazione SimpleBM25."""
+    corpus_size = len(corpus)
+    avgdl = sum(len(doc) for doc in corpus) / corpus_size
+    df = Counter()
+    for doc in corpus:
+        df.update(set(doc))
+    idf = {term: math.log((corpus_size - df[term] + 0.5) / (df[term] + 0.5)) for term in df}
+
+    scores = []
+    for doc in corpus:
+        score = 0.0
+        for term in query:
+            if term in doc:
+                tf = doc.count(term)
+                score += idf[term] * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
+
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.corpus = [
+            ["rivoluzione", "francese", "bastiglia", "parigi"],
+            ["napoleone", "imperatore", "francia"],
+            ["rivoluzione", "industriale", "inghilterra", "vapore", "vapore"],
+            ["congresso", "vienna", "napoleone", "restaurazione"],
+            ["unità", "italia", "garibaldi", "mille"],
+            ["guerra", "mondiale", "trincea"]
+        ]
+        self.index = BM25Index(self.corpus)
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_scores_match_linear_scan(self):
+        query = ["rivoluzione", "vapore", "napoleone", "sconosciuto"]
+        expected = reference_scores(self.corpus, query)
+        for actual, reference in zip(self.index.get_scores(query), expected):
+            self.assertAlmostEqual(actual, reference, places=6)
+
+    def test_top_k_returns_best_positive_documents(self):
+        top = self.index.top_k(["vapore", "rivoluzione"], 2)
+        self.assertEqual([doc for doc, _ in top], [2, 0])
+        self.assertGreater(top[0][1], top[1][1])
+        self.assertEqual(self.index.top_k(["sconosciuto"], 3), [])
+
+    def test_save_and_load_roundtrip(self):
+        path = os.path.join(self.test_dir, "bm25.npz")
+        self.index.save(path)
+        loaded = BM25Index.load(path)
+
+        query = ["napoleone", "italia", "rivoluzione"]
+        self.assertEqual(loaded.corpus_size, self.index.corpus_size)
+        self.assertEqual(loaded.top_k(query, 3), self.index.top_k(query, 3))
+        self.assertAlmostEqual(loaded.idf["<UNK>"], self.index.idf["<UNK>"])
+
+    def test_empty_corpus(self):
+        index = BM25Index([])
+        self.assertEqual(index.get_scores(["a"]), [])
+        self.assertEqual(index.top_k(["a"], 5), [])
+
+
+class TestBM25IndexRegistry(unittest.TestCase):
+    def _entry(self, docs):
+        return {"index": BM25Index([["termine", str(i)] for i in range(docs)]), "metadata": []}
+
+    def test_scopes_are_isolated(self):
+        registry = BM25IndexRegistry()
+        registry.put("course-a", None, self._entry(2))
+        registry.put("course-b", "book-1", self._entry(5))
+
+        self.assertEqual(registry.get("course-a")["index"].corpus_size, 2)
+        self.assertEqual(registry.get("course-b", "book-1")["index"].corpus_size, 5)
+        self.assertIsNone(registry.get("course-b"))
+
+    def test_lru_eviction_by_memory_budget(self):
+        entry_size = self._entry(50)["index"].memory_bytes()
+        registry = BM25IndexRegistry(memory_budget_bytes=int(entry_size * 2.5))
+        registry.put("c1", None, self._entry(50))
+        registry.put("c2", None, self._entry(50))
+        registry.get("c1")  # c1 diventa il più recente
+        registry.put("c3", None, self._entry(50))
+
+        self.assertIsNotNone(registry.get("c1"))
+        self.assertIsNone(registry.get("c2"))
+        self.assertIsNotNone(registry.get("c3"))
+        self.assertEqual(registry.evictions, 1)
+        self.assertLessEqual(registry.memory_bytes, registry.memory_budget_bytes)
+
+    def test_book_invalidation_drops_book_and_course_scopes(self):
+        registry = BM25IndexRegistry()
+        registry.put("c1", None, self._entry(2))
+        registry.put("c1", "b1", self._entry(2))
+        registry.put("c1", "b2", self._entry(2))
+
+        removed = registry.invalidate("c1", "b1")
+        self.assertEqual(set(removed), {("c1", "b1"), ("c1", None)})
+        self.assertIsNotNone(registry.get("c1", "b2"))
+
+        registry.invalidate("c1")
+        self.assertIsNone(registry.get("c1", "b2"))
+
+    def test_stale_build_is_discarded(self):
+        registry = BM25IndexRegistry()
+        generation = registry.generation("c1", "b1")
+        registry.invalidate("c1", "b1")
+        self.assertFalse(registry.put("c1", "b1", self._entry(2), generation=generation))
+        self.assertIsNone(registry.get("c1", "b1"))
+
+    def test_background_rebuild(self):
+        registry = BM25IndexRegistry()
+
+        def builder(course_id, book_id):
+            registry.put(course_id, book_id, self._entry(3))
+
+        registry.schedule_rebuild(("c1", None), builder).result(timeout=5)
+        self.assertEqual(registry.get("c1")["index"].corpus_size, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test suite for the async Redis cache service (compression, tag invalidation, multi-get)
+"""
+
+import asyncio
+import fnmatch
+import pickle
+import unittest
+
+from services.cache_service import CacheType, RedisCacheService, scope_cache_tags, scope_invalidation_tags
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeAsyncRedis:
+    """Client Redis in memoria con il sottoinsieme di comandi usato dal servizio."""
+
+    def __init__(self):
+        self.data = {}
+        self.sets = {}
+        self.scan_calls = 0
+
+    async def ping(self):
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+        return True
+
+    async def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+        return len(members)
+
+    async def expire(self, key, ttl):
+        return True
+
+    async def unlink(self, *keys):
+        deleted = 0
+        for key in keys:
+            deleted += int(self.data.pop(key, None) is not None or self.sets.pop(key, None) is not None)
+        return deleted
+
+    async def scan_iter(self, match=None, count=None):
+        self.scan_calls += 1
+        for key in list(self.data):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+    async def sscan_iter(self, key, count=None):
+        for member in list(self.sets.get(key, ())):
+            yield member
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class TestRedisCacheService(unittest.TestCase):
+    def setUp(self):
+        self.cache = RedisCacheService(compression_threshold=256)
+        self.client = FakeAsyncRedis()
+
+        async def get_client():
+            return self.client
+
+        self.cache._get_client = get_client
+
+    def test_large_payloads_are_compressed(self):
+        data = {"text": "contesto ripetuto " * 200, "sources": [{"source": "libro.pdf"}]}
+        config = self.cache.cache_configs[CacheType.QUERY_RESULT]
+
+        serialized = self.cache._serialize_data(data, config)
+        self.assertEqual(serialized[:1], b"P")
+        self.assertLess(len(serialized), len(pickle.dumps(data)) // 4)
+        self.assertEqual(self.cache._deserialize_data(serialized, config), data)
+
+        small = self.cache._serialize_data({"a": 1}, config)
+        self.assertEqual(small[:1], b"p")
+        self.assertEqual(self.cache._deserialize_data(small, config), {"a": 1})
+
+    def test_legacy_entries_are_still_readable(self):
+        config = self.cache.cache_configs[CacheType.EMBEDDING]
+        self.assertEqual(self.cache._deserialize_data(pickle.dumps([0.1, 0.2]), config), [0.1, 0.2])
+
+    def test_set_get_and_mget(self):
+        async def run():
+            await self.cache.set(CacheType.QUERY_RESULT, "q1", {"text": "uno"})
+            await self.cache.set(CacheType.QUERY_RESULT, "q3", {"text": "tre"})
+            single = await self.cache.get(CacheType.QUERY_RESULT, "q1")
+            many = await self.cache.mget(CacheType.QUERY_RESULT, ["q1", "q2", "q3"])
+            return single, many
+
+        single, many = asyncio.run(run())
+        self.assertEqual(single, {"text": "uno"})
+        self.assertEqual(many, [{"text": "uno"}, None, {"text": "tre"}])
+
+    def test_book_invalidation_uses_tags_without_scanning(self):
+        async def run():
+            await self.cache.set(CacheType.QUERY_RESULT, "course-wide", "a", tags=scope_cache_tags("c1"))
+            await self.cache.set(CacheType.QUERY_RESULT, "book-1", "b", tags=scope_cache_tags("c1", "b1"))
+            await self.cache.set(CacheType.HYBRAR_SEARCH, "book-2", "c", tags=scope_cache_tags("c1", "b2"))
+            await self.cache.set(CacheType.QUERY_RESULT, "other", "d", tags=scope_cache_tags("c2"))
+
+            deleted = await self.cache.invalidate_tags(scope_invalidation_tags("c1", "b1"))
+            remaining = await self.cache.mget(CacheType.QUERY_RESULT, ["course-wide", "book-1", "other"])
+            return deleted, remaining, await self.cache.get(CacheType.HYBRAR_SEARCH, "book-2")
+
+        deleted, remaining, other_book = asyncio.run(run())
+        self.assertEqual(deleted, 2)
+        self.assertEqual(remaining, [None, None, "d"])
+        self.assertEqual(other_book, "c")
+        self.assertEqual(self.client.scan_calls, 0)
+
+    def test_course_invalidation_removes_all_books(self):
+        async def run():
+            await self.cache.set(CacheType.QUERY_RESULT, "b1", "x", tags=scope_cache_tags("c1", "b1"))
+            await self.cache.set(CacheType.QUERY_RESULT, "b2", "y", tags=scope_cache_tags("c1", "b2"))
+            return await self.cache.invalidate_tags(scope_invalidation_tags("c1"))
+
+        self.assertEqual(asyncio.run(run()), 2)
+        self.assertEqual(self.client.data, {})
+
+    def test_clear_by_type_scans_in_batches(self):
+        self.cache.SCAN_BATCH_SIZE = 3
+
+        async def run():
+            for i in range(7):
+                await self.cache.set(CacheType.EMBEDDING, f"e{i}", [i])
+            await self.cache.set(CacheType.SESSION, "s", {"id": 1})
+            return await self.cache.clear_by_type(CacheType.EMBEDDING)
+
+        self.assertEqual(asyncio.run(run()), 7)
+        self.assertEqual(list(self.client.data), ["tutor_ai:session:s"])
+
+    def test_unreachable_redis_is_a_cache_miss(self):
+        cache = RedisCacheService(redis_url="redis://127.0.0.1:1")
+
+        async def run():
+            first = await cache.get(CacheType.QUERY_RESULT, "q")
+            stored = await cache.set(CacheType.QUERY_RESULT, "q", {"text": "x"})
+            return first, stored
+
+        self.assertEqual(asyncio.run(run()), (None, False))
+        self.assertGreater(cache._retry_after, 0)
+        self.assertFalse(cache.get_metrics()["redis_connected"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test suite for index-backed Jaro-Winkler concept deduplication
+"""
+
+import random
+import unittest
+
+from services.concept_dedup import (
+    ConceptDeduplicator, dedup_threshold, jaro_winkler, normalize_concept_name
+)
+
+
+def exhaustive_assignment(names):
+    """Confronto esaustivo originale: ogni nome contro tutti i gruppi, in ordine."""
+    bucket_keys, assignment = [], []
+    for name in names:
+        key = normalize_concept_name(name)
+        for index, bucket_key in enumerate(bucket_keys):
+            if jaro_winkler(key, bucket_key) >= dedup_threshold(key):
+                assignment.append(index)
+                break
+        else:
+            bucket_keys.append(key)
+            assignment.append(len(bucket_keys) - 1)
+    return assignment
+
+
+def noisy_names(count, seed):
+    rng = random.Random(seed)
+    bases = ["Teorema di Pitagora", "Legge di Ohm", "Energia cinetica", "Moto rettilineo uniforme",
+             "Principio di Archimede", "Equazioni di secondo grado", "Fotosintesi", "Ciclo di Krebs",
+             "DNA", "RNA", "Seconda legge della termodinamica", "Campo elettrico"]
+    names = []
+    for _ in range(count):
+        name = list(rng.choice(bases))
+        for _ in range(rng.randint(0, 3)):
+            position = rng.randrange(len(name))
+            edit = rng.random()
+            if edit < 0.4:
+                name[position] = rng.choice("abcdefghilmnoprstuvz")
+            elif edit < 0.7 and len(name) > 2:
+                del name[position]
+            else:
+                name.insert(position, rng.choice("aeiou "))
+        names.append("".join(name) if rng.random() > 0.1 else "".join(name).upper() + "!")
+    return names
+
+
+class TestConceptDedup(unittest.TestCase):
+    def test_normalization(self):
+        self.assertEqual(normalize_concept_name("  Équazioni   di 2° grado! "), "equazioni di 2 grado")
+        self.assertEqual(normalize_concept_name("!!!"), "")
+
+    def test_matches_exhaustive_comparison(self):
+        for seed in range(5):
+            names = noisy_names(300, seed)
+            dedup = ConceptDeduplicator(initial_capacity=2)
+
+            assignment = [dedup.resolve(normalize_concept_name(name)) for name in names]
+
+            self.assertEqual(assignment, exhaustive_assignment(names))
+
+    def test_first_similar_bucket_wins(self):
+        dedup = ConceptDeduplicator()
+        first = dedup.add("legge di ohm")
+        dedup.add("legge di ohms")
+
+        self.assertEqual(dedup.find("legge di ohm s"), first)
+        self.assertIsNone(dedup.find("fotosintesi"))
+        self.assertEqual(dedup.resolve(""), 2)
+        self.assertEqual(dedup.resolve(""), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
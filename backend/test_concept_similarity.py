@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test suite for the vectorized concept similarity engine and its use in interleaved practice
+"""
+
+import asyncio
+import random
+import unittest
+
+import numpy as np
+
+from services.concept_similarity import ConceptSimilarityEngine, jaccard_matrix, top_k_neighbors
+from services.interleaved_practice_service import InterleavedPracticeScheduler
+
+
+def pairwise_similarity(concept1, concept2):
+    """Formula a coppie originale dello scheduler di interleaving."""
+    similarity = 0.0
+    if concept1["category"] == concept2["category"]:
+        similarity += 0.3
+    tags1, tags2 = set(concept1["tags"]), set(concept2["tags"])
+    if tags1 and tags2:
+        similarity += 0.4 * len(tags1 & tags2) / len(tags1 | tags2)
+    similarity += 0.3 * (1.0 - min(abs(concept1["difficulty"] - concept2["difficulty"]), 1.0))
+    words1, words2 = set(concept1["name"].lower().split()), set(concept2["name"].lower().split())
+    if words1 and words2:
+        similarity += 0.2 * len(words1 & words2) / len(words1 | words2)
+    return min(similarity, 1.0)
+
+
+def make_concepts(count, seed=7):
+    rng = random.Random(seed)
+    words = ["legge", "moto", "energia", "forza", "campo", "onda", "calore", "massa"]
+    tags = ["fisica", "meccanica", "termodinamica", "elettricità", "ottica"]
+    return [{
+        "id": f"c{index}",
+        "name": " ".join(rng.sample(words, rng.randint(0, 3))),
+        "difficulty": round(rng.random(), 2),
+        "mastery_level": round(rng.random(), 2),
+        "category": rng.choice(["fisica", "chimica", "general"]),
+        "tags": rng.sample(tags, rng.randint(0, 3))
+    } for index in range(count)]
+
+
+class TestConceptSimilarity(unittest.TestCase):
+    def test_matrix_matches_pairwise_formula(self):
+        concepts = make_concepts(40)
+        matrix = ConceptSimilarityEngine().similarity_matrix(concepts)
+
+        for i in range(len(concepts)):
+            for j in range(i + 1, len(concepts)):
+                self.assertAlmostEqual(matrix[i, j], pairwise_similarity(concepts[i], concepts[j]), places=12)
+                self.assertEqual(matrix[i, j], matrix[j, i])
+        self.assertTrue(np.all(np.diag(matrix) == 0))
+
+    def test_jaccard_ignores_empty_sets(self):
+        matrix = jaccard_matrix([["a", "b"], [], ["b", "c"], []])
+
+        self.assertAlmostEqual(matrix[0, 2], 1 / 3)
+        self.assertEqual(matrix[0, 1], 0.0)
+        self.assertEqual(matrix[1, 3], 0.0)
+
+    def test_embeddings_are_optional(self):
+        concepts = make_concepts(3)
+        engine = ConceptSimilarityEngine(category_weight=0, tag_weight=0, difficulty_weight=0,
+                                         name_weight=0, embedding_weight=1.0)
+        embeddings = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+
+        self.assertAlmostEqual(engine.similarity_matrix(concepts, embeddings=embeddings)[0, 1], 1.0)
+        self.assertEqual(engine.similarity_matrix(concepts, embeddings=embeddings)[0, 2], 0.0)
+        self.assertFalse(engine.similarity_matrix(concepts).any())
+
+    def test_top_k_neighbors(self):
+        matrix = np.array([
+            [0.0, 0.9, 0.2, 0.5],
+            [0.9, 0.0, 0.1, 0.3],
+            [0.2, 0.1, 0.0, 0.05],
+            [0.5, 0.3, 0.05, 0.0]
+        ])
+
+        neighbors = top_k_neighbors(["a", "b", "c", "d"], matrix, k=2, min_similarity=0.1)
+
+        self.assertEqual(neighbors["a"], [("b", 0.9), ("d", 0.5)])
+        self.assertEqual(neighbors["c"], [("a", 0.2), ("b", 0.1)])
+        self.assertEqual(top_k_neighbors(["a"], np.zeros((1, 1)), k=3), {"a": []})
+
+
+class TestInterleavedPracticeSimilarity(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = InterleavedPracticeScheduler()
+
+    def test_analysis_keeps_pair_keys_and_suitability_rules(self):
+        concepts = make_concepts(25)
+        analysis = asyncio.run(self.scheduler._analyze_concepts(concepts))
+        by_id = {concept["id"]: concept for concept in concepts}
+
+        self.assertEqual(len(analysis["similarity_matrix"]), 25 * 24 // 2)
+        self.assertAlmostEqual(analysis["similarity_matrix"]["c0-c1"], pairwise_similarity(by_id["c0"], by_id["c1"]))
+
+        suitabilities = [pair["suitability"] for pair in analysis["interleaving_pairs"]]
+        self.assertEqual(suitabilities, sorted(suitabilities, reverse=True))
+        for pair in analysis["interleaving_pairs"]:
+            self.assertGreater(pair["suitability"], 0.5)
+            self.assertAlmostEqual(pair["similarity"],
+                                   analysis["similarity_matrix"][f"{pair['concept1_id']}-{pair['concept2_id']}"])
+
+        self.assertEqual(len(analysis["nearest_concepts"]["c0"]), 3)
+
+    def test_groups_cover_every_concept_once(self):
+        concepts = make_concepts(30)
+        analysis = asyncio.run(self.scheduler._analyze_concepts(concepts))
+        similarity = analysis["similarity_matrix"]
+
+        grouped = [concept_id for group in analysis["concept_groups"] for concept_id in group]
+        self.assertEqual(sorted(grouped), sorted(concept["id"] for concept in concepts))
+        for group in analysis["concept_groups"]:
+            self.assertLessEqual(len(group), 3)
+            for member in group[1:]:
+                self.assertTrue(any(
+                    similarity.get(f"{member}-{other}", similarity.get(f"{other}-{member}", 0.0)) >= 0.4
+                    for other in group if other != member
+                ))
+
+
+if __name__ == "__main__":
+    unittest.main()
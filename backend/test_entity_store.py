@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test suite for the SQLite entity store (per-row writes, concurrency, legacy JSON migration)
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from services.book_service import BookService
+from services.course_chat_session import CourseChatSessionManager
+from services.course_service import CourseService
+from services.entity_store import EntityStore
+from services.study_tracker import StudyTracker
+
+
+class EntityStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.previous_cwd = os.getcwd()
+        # I servizi usano percorsi relativi a data/
+        os.chdir(self.test_dir)
+        self.store = EntityStore(os.path.join(self.test_dir, "tutor_ai.db"))
+
+    def tearDown(self):
+        self.store.close()
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def write_json(self, path, payload):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle)
+
+
+class TestEntityStore(EntityStoreTestCase):
+    def test_put_get_find_by_index_in_sort_order(self):
+        items = self.store.collection("items", sort_field="created_at")
+        items.put("b", {"id": "b", "course_id": "c1", "created_at": "2024-01-02"})
+        items.put("a", {"id": "a", "course_id": "c1", "created_at": "2024-01-01"})
+        items.put("c", {"id": "c", "course_id": "c2", "created_at": "2024-01-03"})
+
+        self.assertEqual(items.get("a")["created_at"], "2024-01-01")
+        self.assertEqual([item["id"] for item in items.find(course_id="c1")], ["a", "b"])
+        self.assertEqual([item["id"] for item in items.find(descending=True, limit=2)], ["c", "b"])
+        self.assertEqual([item["id"] for item in items.find(since="2024-01-02")], ["b", "c"])
+        self.assertEqual(items.count(course_id="c1"), 2)
+
+    def test_filters_only_on_indexed_fields(self):
+        items = self.store.collection("items")
+        with self.assertRaises(ValueError):
+            items.find(title="x")
+
+    def test_sets_are_serialized(self):
+        items = self.store.collection("items")
+        items.put("a", {"id": "a", "tags": {"y", "x"}})
+
+        self.assertEqual(items.get("a")["tags"], ["x", "y"])
+
+    def test_concurrent_updates_are_not_lost(self):
+        counters = self.store.collection("counters")
+        counters.put("hits", {"id": "hits", "value": 0})
+
+        def increment(row):
+            row["value"] += 1
+
+        def worker():
+            for _ in range(25):
+                counters.update("hits", increment)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(counters.get("hits")["value"], 100)
+
+    def test_failed_transaction_rolls_back(self):
+        items = self.store.collection("items")
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction():
+                items.put("a", {"id": "a"})
+                raise RuntimeError("boom")
+
+        self.assertIsNone(items.get("a"))
+
+    def test_migration_runs_once(self):
+        path = os.path.join(self.test_dir, "legacy.json")
+        self.write_json(path, [{"id": "a"}])
+        items = self.store.collection("items")
+
+        def importer(payload):
+            for row in payload:
+                items.put(row["id"], row)
+            return len(payload)
+
+        self.assertEqual(self.store.migrate_json(path, importer), 1)
+        items.delete("a")
+        self.assertEqual(self.store.migrate_json(path, importer), 0)
+        self.assertIsNone(items.get("a"))
+        # Il file originale resta come backup
+        self.assertTrue(os.path.exists(path))
+
+
+class TestServicesOnEntityStore(EntityStoreTestCase):
+    def test_courses_and_books_migrate_from_legacy_json(self):
+        self.write_json("data/courses/courses.json", [{
+            "id": "course-1", "name": "Fisica", "description": "", "subject": "physics",
+            "created_at": "2024-01-01T10:00:00", "updated_at": "2024-01-01T10:00:00",
+            "books": [{"id": "book-1", "title": "Meccanica", "created_at": "2024-01-01T10:00:00"}]
+        }])
+
+        course_service = CourseService(store=self.store)
+        book_service = BookService(store=self.store)
+
+        self.assertEqual(course_service.get_course_raw("course-1")["name"], "Fisica")
+        self.assertEqual([book["id"] for book in book_service.get_books_by_course("course-1")], ["book-1"])
+
+        book = book_service.create_book("course-1", {"title": "Termodinamica"})
+        self.assertEqual(len(book_service.get_books_by_course("course-1")), 2)
+        self.assertTrue(book_service.delete_book("course-1", book["id"]))
+        self.assertEqual(len(book_service.get_books_by_course("course-1")), 1)
+
+    def test_chat_messages_are_stored_per_row(self):
+        manager = CourseChatSessionManager(store=self.store)
+        session = manager.get_or_create_session("course-1")
+
+        manager.add_message(session.id, "user", "Cos'è un \"vettore\"?", topic_tags=["vettore"])
+        manager.add_message(session.id, "assistant", "Un vettore è...", sources=[{"book_title": "Algebra"}])
+
+        loaded = manager.load_session(session.id)
+        self.assertEqual([message.role for message in loaded.messages], ["user", "assistant"])
+        self.assertEqual(loaded.statistics["topics_discussed"], {"vettore"})
+        self.assertEqual(loaded.statistics["total_messages"], 2)
+        self.assertEqual(manager.messages.count(session_id=session.id), 2)
+        self.assertEqual(manager.get_conversation_history(session.id, limit=1)[0]["role"], "assistant")
+
+    def test_concurrent_chat_messages_keep_statistics(self):
+        manager = CourseChatSessionManager(store=self.store)
+        session = manager.get_or_create_session("course-1")
+
+        def worker(index):
+            manager.add_message(session.id, "user", f"Domanda {index}", topic_tags=[f"tema-{index}"])
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        loaded = manager.load_session(session.id)
+        self.assertEqual(loaded.statistics["total_messages"], 8)
+        self.assertEqual(loaded.statistics["topics_discussed"], {f"tema-{index}" for index in range(8)})
+        self.assertEqual(manager.get_course_analytics("course-1")["total_sessions"], 1)
+
+        self.assertTrue(manager.delete_session(session.id))
+        self.assertIsNone(manager.load_session(session.id))
+        self.assertEqual(manager.messages.count(session_id=session.id), 0)
+
+    def test_study_tracker_filters_sessions_by_course(self):
+        tracker = StudyTracker(store=self.store)
+        session_id = tracker.track_interaction("course-1", question="Una domanda sul teorema")
+        tracker.track_interaction("course-1", session_id=session_id, question="Un'altra sulla matrice")
+        tracker.track_timer_session("work", 25, course_id="course-2")
+
+        sessions = tracker.get_sessions_raw("course-1")
+        self.assertEqual(len(sessions), 1)
+        self.assertEqual(len(sessions[0]["interactions"]), 2)
+        self.assertEqual(sessions[0]["topics_studied"], ["matrice", "teorema"])
+        self.assertEqual(tracker.get_progress("course-1")["total_sessions"], 2)
+        self.assertEqual(len(tracker.get_sessions_raw()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,6 +18,11 @@ class MockRAGService:
         self.embedding_model = MockEmbeddingModel()
         self.collection = MockChromaCollection()
 
+    def _build_where_filter(self, course_id, book_id=None):
+        if book_id:
+            return {"$and": [{"course_id": course_id}, {"book_id": book_id}]}
+        return {"course_id": course_id}
+
 class MockEmbeddingModel:
     """Mock embedding model per testing"""
 
@@ -85,15 +90,24 @@ class MockChromaCollection:
             "ids": [[f"doc_{i}" for i in range(n_results)]]
         }
 
-    def get(self, where=None, limit=1000):
-        """Mock get che restituisce tutti i documenti"""
+    def get(self, ids=None, where=None, limit=1000, offset=0, include=None):
+        """Mock get che restituisce tutti i documenti (o quelli con gli id richiesti)"""
+        if ids is not None:
+            positions = [int(doc_id.split("_")[1]) for doc_id in ids]
+            return {
+                "documents": [self.documents[i] for i in positions],
+                "metadatas": [self.metadatas[i] for i in positions],
+                "ids": list(ids)
+            }
+
         if where and where.get("course_id") != "cs101":
             return {"documents": [], "metadatas": [], "ids": []}
 
+        window = slice(offset, offset + limit)
         return {
-            "documents": self.documents,
-            "metadatas": self.metadatas,
-            "ids": [f"doc_{i}" for i in range(len(self.documents))]
+            "documents": self.documents[window],
+            "metadatas": self.metadatas[window],
+            "ids": [f"doc_{i}" for i in range(len(self.documents))][window]
         }
 
 class TestHybridSearch:
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test suite for background PDF ingestion (task progress, failures, streamed uploads)
+"""
+
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from services.background_task_service import BackgroundTaskService, TaskStatus
+from services.entity_store import EntityStore
+from services.ingestion_service import IngestionService
+from utils.file_utils import AsyncFileOperations
+
+
+class FakeRAGService:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+        self.threads = []
+
+    def index_pdf_sync(self, file_path, course_id, book_id=None, progress_callback=None):
+        self.calls.append((file_path, course_id, book_id))
+        self.threads.append(threading.current_thread().name)
+        progress_callback(50.0, "Embedding 1/2 chunk")
+        if self.fail:
+            raise ValueError("No text content found in PDF")
+        return {"file_path": file_path, "chunks_indexed": 2}
+
+
+class FakeUpload:
+    def __init__(self, data):
+        self._buffer = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._buffer.read(size)
+
+
+class TestIngestionService(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = EntityStore(os.path.join(self.test_dir, "tutor_ai.db"))
+        self.task_service = BackgroundTaskService(store=self.store)
+        self.ingestion = IngestionService(task_service=self.task_service, max_workers=1)
+        self.pdf_path = os.path.join(self.test_dir, "book.pdf")
+        with open(self.pdf_path, "wb") as handle:
+            handle.write(b"%PDF-1.4 fake")
+
+    def tearDown(self):
+        self.ingestion.shutdown(wait=True)
+        self.store.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def _run_task(self, rag_service, **kwargs):
+        async def run():
+            task_id = self.ingestion.enqueue_pdf_indexing(rag_service, self.pdf_path, "course-1", **kwargs)
+            await self.task_service.running_tasks[task_id]
+            return task_id
+
+        return asyncio.run(run())
+
+    def test_indexing_runs_in_worker_and_completes(self):
+        rag = FakeRAGService()
+        task_id = self._run_task(rag, book_id="book-1")
+
+        task = self.task_service.get_task(task_id)
+        self.assertEqual(task.status, TaskStatus.COMPLETED)
+        self.assertEqual(task.progress, 100.0)
+        self.assertEqual(task.result["chunks_indexed"], 2)
+        self.assertEqual(task.metadata["book_id"], "book-1")
+        self.assertEqual(rag.calls, [(self.pdf_path, "course-1", "book-1")])
+        self.assertTrue(rag.threads[0].startswith("pdf-ingestion"))
+
+    def test_failure_removes_upload_when_requested(self):
+        task_id = self._run_task(FakeRAGService(fail=True), remove_on_failure=True)
+
+        task = self.task_service.get_task(task_id)
+        self.assertEqual(task.status, TaskStatus.FAILED)
+        self.assertIn("No text content", task.error)
+        self.assertFalse(os.path.exists(self.pdf_path))
+
+    def test_save_upload_streams_and_enforces_limit(self):
+        target = os.path.join(self.test_dir, "uploads", "file.pdf")
+        data = b"x" * (3 * 1024)
+
+        written = asyncio.run(AsyncFileOperations.save_upload(FakeUpload(data), target, chunk_size=1024))
+        self.assertEqual(written, len(data))
+        with open(target, "rb") as handle:
+            self.assertEqual(handle.read(), data)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(AsyncFileOperations.save_upload(FakeUpload(data), target, max_bytes=2048, chunk_size=1024))
+        self.assertFalse(os.path.exists(target))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test suite for the sparse lexical index used by RAGService re-ranking
+"""
+
+import math
+import re
+import unittest
+from collections import Counter
+
+from services.lexical_index import LexicalIndex
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def counter_cosine(text_a, text_b):
+    vec_a = Counter(tokenize(text_a))
+    vec_b = Counter(tokenize(text_b))
+    if not vec_a or not vec_b:
+        return 0.0
+    dot = sum(vec_a[token] * vec_b.get(token, 0) for token in vec_a)
+    norm_a = math.sqrt(sum(value * value for value in vec_a.values()))
+    norm_b = math.sqrt(sum(value * value for value in vec_b.values()))
+    return dot / (norm_a * norm_b)
+
+
+class TestLexicalIndex(unittest.TestCase):
+    def setUp(self):
+        self.documents = [
+            "La rivoluzione francese inizia nel 1789 con la presa della Bastiglia.",
+            "Napoleone Bonaparte diventa imperatore dei francesi nel 1804.",
+            "",
+            "La rivoluzione industriale trasforma l'economia europea.",
+            "Il congresso di Vienna ridisegna l'Europa dopo Napoleone."
+        ]
+        self.index = LexicalIndex(self.documents, tokenize)
+
+    def test_scores_match_counter_cosine(self):
+        query = "rivoluzione francese e Napoleone"
+        scores = self.index.scores(query)
+        for doc, score in zip(self.documents, scores):
+            self.assertAlmostEqual(score, counter_cosine(query, doc), places=6)
+
+    def test_scores_for_subset_of_rows(self):
+        query = "Napoleone imperatore"
+        rows = [4, 1]
+        scores = self.index.scores(query, rows)
+        self.assertEqual(len(scores), 2)
+        self.assertAlmostEqual(scores[0], counter_cosine(query, self.documents[4]), places=6)
+        self.assertAlmostEqual(scores[1], counter_cosine(query, self.documents[1]), places=6)
+
+    def test_top_k_orders_by_score(self):
+        top = self.index.top_k("rivoluzione", 2)
+        self.assertEqual([idx for idx, _ in top], [3, 0])
+        self.assertGreater(top[0][1], 0.0)
+
+    def test_unknown_terms_and_empty_query(self):
+        self.assertEqual(self.index.scores("fotosintesi").tolist(), [0.0] * len(self.documents))
+        self.assertEqual(self.index.scores("").tolist(), [0.0] * len(self.documents))
+
+    def test_empty_corpus(self):
+        index = LexicalIndex([], tokenize)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.top_k("query", 5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test suite for the async LLM transport (pooling, retry/backoff, concurrency limits)
+"""
+
+import asyncio
+import json
+import os
+import unittest
+
+import httpx
+
+from services import llm_transport
+from services.llm_transport import AsyncLLMTransport, LLMTransportError, get_transport
+
+
+def make_transport(handler, provider="test-provider", max_retries=2):
+    transport = AsyncLLMTransport(provider, "http://llm.local/v1", max_retries=max_retries, base_delay=0.0)
+    transport._build_client = lambda: httpx.AsyncClient(
+        base_url=transport.base_url,
+        transport=httpx.MockTransport(handler)
+    )
+    return transport
+
+
+class TestAsyncLLMTransport(unittest.TestCase):
+    def tearDown(self):
+        llm_transport._limiters.clear()
+        llm_transport._transports.clear()
+        os.environ.pop("TEST-PROVIDER_MAX_CONCURRENCY", None)
+
+    def test_retries_server_errors_then_succeeds(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            if len(calls) < 3:
+                return httpx.Response(503, text="busy")
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ciao"}}]})
+
+        async def run():
+            transport = make_transport(handler)
+            try:
+                return await transport.post_json("/chat/completions", {"model": "m"})
+            finally:
+                await transport.aclose()
+
+        result = asyncio.run(run())
+        self.assertEqual(result["choices"][0]["message"]["content"], "ciao")
+        self.assertEqual(calls, ["/v1/chat/completions"] * 3)
+
+    def test_client_errors_are_not_retried(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(429, text="rate limited")
+
+        async def run():
+            transport = make_transport(handler)
+            try:
+                await transport.post_json("/chat/completions", {"model": "m"})
+            finally:
+                await transport.aclose()
+
+        with self.assertRaises(LLMTransportError) as ctx:
+            asyncio.run(run())
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertIn("429", str(ctx.exception))
+        self.assertEqual(len(calls), 1)
+
+    def test_connection_errors_raise_after_retries(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            raise httpx.ConnectError("refused", request=request)
+
+        async def run():
+            transport = make_transport(handler, max_retries=1)
+            try:
+                await transport.request("GET", "/models")
+            finally:
+                await transport.aclose()
+
+        with self.assertRaises(httpx.ConnectError):
+            asyncio.run(run())
+        self.assertEqual(len(calls), 2)
+
+    def test_stream_chat_yields_deltas(self):
+        body = "\n".join([
+            'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+            "",
+            'data: {"choices": [{"delta": {"content": "Cia"}}]}',
+            ": keep-alive",
+            'data: {"choices": [{"delta": {"content": "o!"}}]}',
+            "data: [DONE]",
+            'data: {"choices": [{"delta": {"content": "ignored"}}]}',
+            ""
+        ])
+        payloads = []
+
+        def handler(request):
+            payloads.append(request.content)
+            return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+        async def run():
+            transport = make_transport(handler)
+            try:
+                return [delta async for delta in transport.stream_chat("/chat/completions", {"model": "m"})]
+            finally:
+                await transport.aclose()
+
+        self.assertEqual(asyncio.run(run()), ["Cia", "o!"])
+        self.assertTrue(json.loads(payloads[0])["stream"])
+
+    def test_stream_error_status_raises(self):
+        async def run():
+            transport = make_transport(lambda request: httpx.Response(401, text="unauthorized"))
+            try:
+                async for _ in transport.stream_chat("/chat/completions", {"model": "m"}):
+                    pass
+            finally:
+                await transport.aclose()
+
+        with self.assertRaises(LLMTransportError) as ctx:
+            asyncio.run(run())
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    def test_concurrency_limit_per_provider(self):
+        os.environ["TEST-PROVIDER_MAX_CONCURRENCY"] = "2"
+        state = {"active": 0, "peak": 0}
+
+        async def run():
+            async def slow_call():
+                async with get_transport("test-provider", "http://llm.local/v1").slot():
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                    await asyncio.sleep(0.01)
+                    state["active"] -= 1
+
+            await asyncio.gather(*(slow_call() for _ in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(state["peak"], 2)
+
+    def test_shared_transport_per_credentials(self):
+        first = get_transport("zai", "http://llm.local/v1", headers={"Authorization": "Bearer a"})
+        second = get_transport("zai", "http://llm.local/v1/", headers={"Authorization": "Bearer a"})
+        other = get_transport("zai", "http://llm.local/v1", headers={"Authorization": "Bearer b"})
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+
+if __name__ == '__main__':
+    unittest.main()
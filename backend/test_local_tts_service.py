@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test suite for local TTS synthesis (content-addressed cache, sentence segmentation, recordings index)
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from services import local_tts_service
+
+
+class TestLocalTTSService(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.previous_paths = (local_tts_service.AUDIO_DIR, local_tts_service.SEGMENTS_DIR,
+                               local_tts_service.METADATA_PATH)
+        local_tts_service.AUDIO_DIR = self.test_dir
+        local_tts_service.SEGMENTS_DIR = os.path.join(self.test_dir, "segments")
+        local_tts_service.METADATA_PATH = os.path.join(self.test_dir, "recordings.json")
+
+    def tearDown(self):
+        (local_tts_service.AUDIO_DIR, local_tts_service.SEGMENTS_DIR,
+         local_tts_service.METADATA_PATH) = self.previous_paths
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def store_recording(self, text, **params):
+        request = local_tts_service._prepare(text, params.get("language", "it"), params.get("speed", 1.0),
+                                             params.get("tone", "neutral"), None)
+        file_path = os.path.join(self.test_dir, f"{request['id']}.mp3")
+        with open(file_path, "wb") as handle:
+            handle.write(b"ID3")
+        entry = {"id": request["id"], "title": text[:20], "file_path": file_path, "language": "it"}
+        local_tts_service._save_metadata([entry])
+        return entry
+
+    def test_segments_keep_sentences_within_limit(self):
+        text = ("Il teorema di Pitagora lega i lati di un triangolo rettangolo. " * 6
+                + "Una frase molto lunga, " + "con parecchie parole in fila " * 12 + "finisce qui.")
+
+        segments = local_tts_service.split_segments(text, max_chars=120)
+
+        self.assertTrue(all(len(segment) <= 120 for segment in segments))
+        self.assertTrue(segments[0].endswith("rettangolo."))
+        self.assertEqual(" ".join(" ".join(segments).split()), " ".join(text.split()))
+        self.assertEqual(local_tts_service.split_segments("Breve."), ["Breve."])
+
+    def test_key_depends_on_text_and_parameters(self):
+        key = local_tts_service.recording_key("Ciao", "it", None, 1.0, "neutral")
+
+        self.assertEqual(key, local_tts_service.recording_key("Ciao", "it", None, 1.0004, "neutral"))
+        self.assertNotEqual(key, local_tts_service.recording_key("Ciao", "en", None, 1.0, "neutral"))
+        self.assertNotEqual(key, local_tts_service.recording_key("Ciao", "it", None, 1.25, "neutral"))
+        self.assertNotEqual(key, local_tts_service.recording_key("Ciao", "it", None, 1.0, "warm"))
+        self.assertNotEqual(key, local_tts_service.recording_key("Ciao", "it", "voice-1", 1.0, "neutral"))
+
+    def test_cached_recordings_are_returned_without_synthesis(self):
+        entry = self.store_recording("Una slide già narrata.")
+
+        self.assertEqual(local_tts_service.synthesize_local("Una slide già narrata.")["id"], entry["id"])
+        results = local_tts_service.synthesize_batch_local([
+            {"text": "Una slide già narrata."}, {"text": "Una slide già narrata.", "title": "Copia"}
+        ])
+        self.assertEqual([result["id"] for result in results], [entry["id"], entry["id"]])
+        self.assertEqual(len(local_tts_service.list_recordings()), 1)
+
+    def test_recordings_index_follows_external_updates(self):
+        entry = self.store_recording("Prima registrazione.")
+        self.assertEqual(local_tts_service.list_recordings({"q": "prima"})[0]["id"], entry["id"])
+
+        # audio_library_service riscrive lo stesso file (es. nuove categorie)
+        with open(local_tts_service.METADATA_PATH, "w", encoding="utf-8") as handle:
+            json.dump([dict(entry, categories=["fisica"])], handle)
+
+        self.assertEqual(len(local_tts_service.list_recordings({"category": "fisica"})), 1)
+
+        # Se l'MP3 è stato cancellato la voce in cache non viene riusata
+        os.remove(entry["file_path"])
+        self.assertIsNone(local_tts_service._cached_recording(entry["id"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -166,6 +166,49 @@ class TestOCRService(unittest.TestCase):
         self.assertGreaterEqual(result["processed_pages"], 0)
         self.assertLessEqual(result["processed_pages"], 2)
 
+    def test_iter_page_images_is_lazy(self):
+        """Test that pages are rasterized one at a time."""
+        pdf_path = self.create_test_pdf_with_images(["Page 1", "Page 2", "Page 3"])
+        pages = self.ocr_service.iter_page_images(pdf_path)
+
+        page_num, img = next(pages)
+        self.assertEqual(page_num, 1)
+        img.close()
+        pages.close()
+
+    def test_ocr_pdf_resumes_from_checkpoint(self):
+        """Test that an interrupted OCR run restarts from the first missing page."""
+        service = OCRService()
+        service.max_workers = 1
+        service.checkpoint_dir = os.path.join(self.test_dir, "checkpoints")
+        calls = []
+
+        def fake_ocr_image(image, language='ita'):
+            calls.append(language)
+            return {"text": f"Testo {len(calls)}", "confidence": 90, "engine": "tesseract"}
+
+        service.ocr_image = fake_ocr_image
+        pdf_path = self.create_test_pdf_with_images(["One", "Two", "Three"])
+
+        # Simula un crash dopo la prima pagina
+        pages = service.iter_ocr_pdf(pdf_path)
+        first = next(pages)
+        pages.close()
+        self.assertEqual(first["page"], 1)
+        self.assertEqual(len(calls), 1)
+
+        progress = []
+        result = service.ocr_pdf(pdf_path, progress_callback=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(len(calls), 3)  # only pages 2 and 3 were OCR'd again
+        self.assertEqual(result["total_pages"], 3)
+        self.assertEqual([page["page"] for page in result["pages_data"]], [1, 2, 3])
+        self.assertEqual(progress[-1], (3, 3))
+
+        # Una nuova esecuzione completa riusa interamente il checkpoint
+        service.ocr_pdf(pdf_path)
+        self.assertEqual(len(calls), 3)
+
     def test_detect_scanned_pdf(self):
         """Test scanned PDF detection."""
         # Create PDF with images (scanned-like)
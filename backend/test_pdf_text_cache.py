@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test suite for the per-page PDF text cache (content-addressed keys, parallel extraction)
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fitz  # PyMuPDF
+
+from services.pdf_text_cache import PDFTextCache
+
+
+def write_pdf(path, page_count, prefix="Pagina"):
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"{prefix} {page_num + 1}")
+    doc.set_toc([[1, "Capitolo 1", 1], [1, "Capitolo 2", max(1, page_count // 2)]])
+    doc.save(path)
+    doc.close()
+
+
+class TestPDFTextCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.test_dir, "cache")
+        self.pdf_path = os.path.join(self.test_dir, "book.pdf")
+        write_pdf(self.pdf_path, 20)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_pages_and_toc_are_extracted(self):
+        cache = PDFTextCache(base_dir=self.cache_dir, max_workers=1)
+        document = cache.get_document(self.pdf_path)
+
+        self.assertEqual(len(document["pages"]), 20)
+        self.assertIn("Pagina 1", document["pages"][0])
+        self.assertIn("Pagina 20", document["pages"][19])
+        self.assertEqual(document["toc"][0], [1, "Capitolo 1", 1])
+        self.assertEqual(cache.get_text(self.pdf_path), "".join(document["pages"]))
+
+    def test_persistent_cache_is_reused_without_extraction(self):
+        PDFTextCache(base_dir=self.cache_dir, max_workers=1).get_document(self.pdf_path)
+
+        cache = PDFTextCache(base_dir=self.cache_dir, max_workers=1)
+        cache._extract = lambda file_path: self.fail("PDF should not be extracted again")
+        pages = cache.get_pages(self.pdf_path)
+        self.assertEqual(len(pages), 20)
+
+    def test_key_changes_with_content(self):
+        cache = PDFTextCache(base_dir=self.cache_dir, max_workers=1)
+        first_hash = cache.get_document(self.pdf_path)["hash"]
+
+        write_pdf(self.pdf_path, 5, prefix="Nuova")
+        document = cache.get_document(self.pdf_path)
+        self.assertNotEqual(document["hash"], first_hash)
+        self.assertEqual(len(document["pages"]), 5)
+        self.assertIn("Nuova 1", document["pages"][0])
+
+    def test_parallel_extraction_matches_sequential(self):
+        sequential = PDFTextCache(base_dir=os.path.join(self.test_dir, "seq"), max_workers=1)
+        parallel = PDFTextCache(base_dir=os.path.join(self.test_dir, "par"), max_workers=2, parallel_min_pages=1)
+        try:
+            self.assertEqual(parallel.get_pages(self.pdf_path), sequential.get_pages(self.pdf_path))
+        finally:
+            parallel.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
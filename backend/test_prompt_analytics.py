@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test suite for prompt analytics (append-only event log, incremental rollups, windowed queries)
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from services.event_log import SegmentedEventLog
+from services.prompt_analytics_service import (
+    CognitiveLoad, ModelProvider, PromptAnalyticsService, PromptPerformance, PromptType
+)
+
+
+def make_performance(prompt_type=PromptType.CHAT_TUTORING, provider=ModelProvider.OPENAI,
+                     success=True, execution_time_ms=100.0, cost=0.001, template="Template A",
+                     timestamp=None):
+    return PromptPerformance(
+        id="",
+        prompt_type=prompt_type,
+        model_provider=provider,
+        model_name="gpt-4o",
+        prompt_template=template,
+        prompt_length=100,
+        response_length=200,
+        execution_time_ms=execution_time_ms,
+        token_usage=300,
+        cost_estimate=cost,
+        cognitive_load=CognitiveLoad.MEDIUM,
+        success=success,
+        timestamp=timestamp
+    )
+
+
+class TestSegmentedEventLog(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_segments_rotate_by_day_and_size(self):
+        log = SegmentedEventLog(self.test_dir, max_segment_bytes=64)
+        for index in range(4):
+            log.append({"timestamp": "2024-03-01T10:00:00", "payload": "x" * 40, "index": index})
+        log.append({"timestamp": "2024-03-02T10:00:00", "index": 4})
+        log.close()
+
+        days = [(day, sequence) for day, sequence, _ in log.segments()]
+        self.assertEqual(days, [("2024-03-01", 0), ("2024-03-01", 1), ("2024-03-01", 2), ("2024-03-01", 3),
+                                ("2024-03-02", 0)])
+        self.assertEqual([event["index"] for event in log.read()], [0, 1, 2, 3, 4])
+
+    def test_window_reads_only_recent_segments(self):
+        log = SegmentedEventLog(self.test_dir)
+        log.append({"timestamp": "2024-03-01T10:00:00", "index": 0})
+        log.append({"timestamp": "2024-03-05T10:00:00", "index": 1})
+        log.append({"timestamp": "2024-03-05T12:00:00", "index": 2})
+
+        # Una riga troncata da una scrittura interrotta viene saltata
+        with open(log.segments()[-1][2], "a") as handle:
+            handle.write('{"timestamp": "2024-03-05T13')
+
+        events = list(log.read(since=datetime(2024, 3, 5, 11)))
+        self.assertEqual([event["index"] for event in events], [2])
+        newest = list(log.read(newest_first=True))
+        self.assertEqual([event["index"] for event in newest], [2, 1, 0])
+
+
+class TestPromptAnalyticsService(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.service = PromptAnalyticsService(storage_path=self.test_dir)
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_record_appends_and_updates_aggregates(self):
+        self.service.record_prompt_execution(make_performance(execution_time_ms=100.0))
+        self.service.record_prompt_execution(make_performance(execution_time_ms=300.0, success=False))
+
+        self.assertEqual(self.service.metrics["total_prompts"], 2)
+        self.assertEqual(self.service.metrics["average_execution_time"], 200.0)
+        chat = self.service.metrics["prompt_types"][PromptType.CHAT_TUTORING.value]
+        self.assertEqual(chat["avg_execution_time"], 200.0)
+        self.assertEqual(chat["success_rate"], 0.5)
+
+        stats = self.service.get_prompt_performance_stats(prompt_type=PromptType.CHAT_TUTORING)
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["avg_execution_time"], 200.0)
+
+        rollup = self.service.get_rollup_stats(prompt_type=PromptType.CHAT_TUTORING)
+        self.assertEqual(rollup["count"], 2)
+        self.assertEqual(rollup["success_rate"], 0.5)
+        self.assertEqual(self.service.get_rollup_stats(model_provider=ModelProvider.ZAI)["count"], 0)
+
+    def test_window_excludes_old_events(self):
+        self.service.record_prompt_execution(make_performance(timestamp=datetime.now() - timedelta(days=3)))
+        self.service.record_prompt_execution(make_performance())
+
+        self.assertEqual(self.service.get_prompt_performance_stats(hours_back=24)["count"], 1)
+        self.assertEqual(self.service.get_rollup_stats(hours_back=24)["count"], 1)
+        self.assertEqual(self.service.get_rollup_stats(hours_back=24 * 7)["count"], 2)
+
+    def test_aggregates_survive_restart(self):
+        self.service.record_prompt_execution(make_performance())
+        self.service.close()
+
+        reloaded = PromptAnalyticsService(storage_path=self.test_dir)
+        self.assertEqual(reloaded.metrics["total_prompts"], 1)
+        self.assertEqual(reloaded.get_rollup_stats()["count"], 1)
+        reloaded.close()
+
+    def test_compare_variants_uses_most_recent_samples(self):
+        for _ in range(12):
+            self.service.record_prompt_execution(make_performance(template="Variant A prompt"))
+            self.service.record_prompt_execution(make_performance(template="Variant B prompt", execution_time_ms=50.0))
+
+        result = self.service.compare_prompt_variants(
+            PromptType.CHAT_TUTORING, "Variant A prompt", "Variant B prompt", sample_size=10
+        )
+        self.assertEqual(result["variant_a"]["count"], 10)
+        self.assertEqual(result["variant_b"]["avg_execution_time"], 50.0)
+
+    def test_legacy_performances_are_migrated_once(self):
+        legacy_dir = tempfile.mkdtemp()
+        try:
+            timestamp = datetime.now().isoformat()
+            with open(os.path.join(legacy_dir, "performances.json"), "w") as handle:
+                json.dump({"p1": {
+                    "id": "p1", "prompt_type": "quiz_generation", "model_provider": "zai",
+                    "execution_time_ms": 10.0, "cost_estimate": 0.0, "success": True, "timestamp": timestamp
+                }}, handle)
+
+            service = PromptAnalyticsService(storage_path=legacy_dir)
+            self.assertEqual(service.get_prompt_performance_stats(prompt_type=PromptType.QUIZ_GENERATION)["count"], 1)
+            self.assertEqual(service.get_rollup_stats(prompt_type=PromptType.QUIZ_GENERATION)["count"], 1)
+            service.close()
+
+            service = PromptAnalyticsService(storage_path=legacy_dir)
+            self.assertEqual(service.get_prompt_performance_stats(prompt_type=PromptType.QUIZ_GENERATION)["count"], 1)
+            service.close()
+        finally:
+            shutil.rmtree(legacy_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
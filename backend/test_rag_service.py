@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test suite for RAGService local scope indexes
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.entity_store import EntityStore
+from services.course_service import CourseService
+from services.rag_service import BookContentAnalyzer, RAGService
+from services.scope_index_store import ScopeIndexStore
+from services.tiered_cache import LRUCache
+
+
+class FakeEmbeddingModel:
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, normalize_embeddings=True):
+        self.encoded += len(texts)
+        return np.ones((len(texts), 4), dtype="float32") / 2.0
+
+
+class FakePDFTextCache:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def get_text(self, file_path):
+        return self.texts[os.path.basename(file_path)]
+
+
+class TestRAGScopeIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.materials = []
+        texts = {"scansione.pdf": "", "appunti.pdf": "La rivoluzione francese inizia nel 1789. " * 40}
+        for filename in texts:
+            path = os.path.join(self.test_dir, filename)
+            with open(path, "wb") as handle:
+                handle.write(filename.encode("utf-8"))
+            self.materials.append({"file_path": path, "filename": filename})
+
+        # Solo gli attributi usati dalla costruzione degli scope: niente ChromaDB né modello reale
+        self.rag = RAGService.__new__(RAGService)
+        self.rag.model_name = "fake-model"
+        self.rag.chunk_size = 800
+        self.rag.chunk_overlap = 0.25
+        self.rag.embedding_model = FakeEmbeddingModel()
+        self.rag.embedding_fallback_enabled = False
+        self.rag.max_cached_chunks = 1200
+        self.rag.book_chunk_cache = LRUCache(max_size=8)
+        self.rag.scope_index_store = ScopeIndexStore(base_dir=os.path.join(self.test_dir, "index"),
+                                                     model_name="fake-model")
+        self.rag.pdf_text_cache = FakePDFTextCache(texts)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_empty_material_keeps_scope_embeddings_and_is_not_rebuilt(self):
+        saved_scopes = []
+        save_scope = self.rag.scope_index_store.save_scope
+        self.rag.scope_index_store.save_scope = lambda *args: saved_scopes.append(args) or save_scope(*args)
+
+        entry = self.rag._get_or_build_chunk_entry("c1", None, self.materials, {})
+        self.assertTrue(entry["chunks"])
+        self.assertEqual(len(entry["embeddings"]), len(entry["chunks"]))
+
+        self.rag.book_chunk_cache = LRUCache(max_size=8)
+        reloaded = self.rag._get_or_build_chunk_entry("c1", None, self.materials, {})
+        self.rag._get_or_build_chunk_entry("c1", None, self.materials, {})
+
+        self.assertEqual(len(saved_scopes), 1)
+        self.assertEqual(len(reloaded["embeddings"]), len(entry["chunks"]))
+
+
+class TestBookContentAnalyzer(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = EntityStore(os.path.join(self.test_dir, "tutor.db"))
+        self.course_service = CourseService(store=self.store)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_book_title_comes_from_the_course_service(self):
+        self.course_service.books.put("b1", {"id": "b1", "course_id": "c1", "title": "Storia moderna"})
+        rag = RAGService.__new__(RAGService)
+        rag.course_service = self.course_service
+        analyzer = BookContentAnalyzer(rag)
+
+        self.assertEqual(analyzer._get_book_title("b1"), "Storia moderna")
+        self.assertEqual(analyzer._get_book_title("missing"), "Libro missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test suite for the persistent per-scope RAG index store
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.scope_index_store import ScopeIndexStore
+
+
+class TestScopeIndexStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = ScopeIndexStore(base_dir=os.path.join(self.test_dir, "rag_index"), model_name="test-model")
+        self.material_path = os.path.join(self.test_dir, "book.pdf")
+        with open(self.material_path, "wb") as handle:
+            handle.write(b"%PDF-1.4 fake")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_material_roundtrip(self):
+        key = self.store.material_key(self.material_path)
+        self.assertIsNotNone(key)
+        self.assertIsNone(self.store.load_material(key))
+
+        embeddings = np.eye(2, dtype="float32")
+        self.store.save_material(key, ["primo chunk", "secondo chunk"], embeddings)
+
+        texts, loaded = self.store.load_material(key)
+        self.assertEqual(texts, ["primo chunk", "secondo chunk"])
+        np.testing.assert_allclose(np.asarray(loaded), embeddings)
+
+    def test_material_key_changes_with_content(self):
+        key_before = self.store.material_key(self.material_path)
+        with open(self.material_path, "ab") as handle:
+            handle.write(b" more bytes")
+        self.assertNotEqual(key_before, self.store.material_key(self.material_path))
+
+    def test_scope_requires_matching_signature(self):
+        chunks = [{"text": "a", "metadata": {"chunk_index": 0}}, {"text": "b", "metadata": {"chunk_index": 1}}]
+        embeddings = np.array([[1.0, 0.0], [0.0, 1.0]], dtype="float32")
+        self.store.save_scope("course-1:all", "sig-1", chunks, embeddings)
+
+        loaded = self.store.load_scope("course-1:all", "sig-1")
+        self.assertIsNotNone(loaded)
+        self.assertEqual(loaded["chunks"], chunks)
+        np.testing.assert_allclose(np.asarray(loaded["embeddings"]), embeddings)
+
+        self.assertIsNone(self.store.load_scope("course-1:all", "sig-2"))
+
+        self.store.invalidate_scope("course-1:all")
+        self.assertIsNone(self.store.load_scope("course-1:all", "sig-1"))
+
+    def test_scope_without_embeddings(self):
+        chunks = [{"text": "solo testo", "metadata": {"chunk_index": 0}}]
+        self.store.save_scope("course-1:book-1", "sig", chunks, None)
+
+        loaded = self.store.load_scope("course-1:book-1", "sig")
+        self.assertEqual(loaded["chunks"], chunks)
+        self.assertIsNone(loaded["embeddings"])
+        self.assertIsNone(loaded["ann_index"])
+
+    def test_model_change_invalidates_scope(self):
+        chunks = [{"text": "a", "metadata": {"chunk_index": 0}}]
+        self.store.save_scope("course-1:all", "sig", chunks, np.ones((1, 3), dtype="float32"))
+
+        other_model = ScopeIndexStore(base_dir=str(self.store.base_dir), model_name="other-model")
+        self.assertIsNone(other_model.load_scope("course-1:all", "sig"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test suite for the advanced search inverted index (incremental updates, facets, suggestions)
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from services.advanced_search_service import AdvancedSearchService, SearchFilter, SearchQuery
+from services.annotation_service import AnnotationService
+from services.service_container import service_container
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.write_annotations("alice", "course-1", "book-1", "fisica.pdf", [
+            self.annotation("a1", "Il teorema di Pitagora sui triangoli", "dimostrazione geometrica", ["geometria"]),
+            self.annotation("a2", "Energia cinetica e potenziale", "", ["fisica"])
+        ])
+        self.write_annotations("bob", "course-2", "book-9", "storia.pdf", [
+            self.annotation("b1", "Triangoli commerciali nel Settecento", "", ["storia"])
+        ])
+        ocr_dir = self.test_dir / "ocr_results"
+        ocr_dir.mkdir()
+        (ocr_dir / "scan_ocr.txt").write_text(
+            "OCR Result for: scan.pdf\nTotal Pages: 2\nAverage Confidence: 91.5%\n\n"
+            "triangolo rettangolo, triangolo isoscele", encoding="utf-8")
+        self.service = AdvancedSearchService(str(self.test_dir))
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    @staticmethod
+    def annotation(annotation_id, selected_text, content, tags):
+        return {"id": annotation_id, "selected_text": selected_text, "content": content, "tags": tags,
+                "page_number": 1, "type": "highlight", "created_at": "2025-01-01T10:00:00"}
+
+    def write_annotations(self, user_id, course_id, book_id, pdf_filename, annotations):
+        directory = self.test_dir / "annotations" / user_id / course_id / book_id
+        directory.mkdir(parents=True, exist_ok=True)
+        for annotation in annotations:
+            annotation.update(course_id=course_id, book_id=book_id)
+        path = directory / f"{pdf_filename}.json"
+        path.write_text(json.dumps(annotations), encoding="utf-8")
+        return path
+
+    def search(self, text, **kwargs):
+        return asyncio.run(self.service.search(SearchQuery(query=text, **kwargs)))
+
+    def test_construction_does_not_scan_and_sync_is_incremental(self):
+        self.assertEqual(self.service.index_store.stats()["documents"], 0)
+
+        response = self.search("pitagora")
+        self.assertEqual([result.id for result in response.results], ["a1"])
+        self.assertEqual(self.service.index_store.stats()["documents"], 4)
+
+        stats = self.service.sync_indexes()
+        self.assertEqual(stats["indexed"], 0)
+        self.assertEqual(stats["unchanged"], 3)
+
+        # A reopened index is already populated: nothing to parse again
+        reopened = AdvancedSearchService(str(self.test_dir))
+        try:
+            self.assertEqual(reopened.sync_indexes()["indexed"], 0)
+        finally:
+            reopened.close()
+
+    def test_prefix_matching_scores_and_pushed_down_filters(self):
+        response = self.search("triangol")
+        by_id = {result.id: result for result in response.results}
+        self.assertEqual(set(by_id), {"a1", "b1", self.service._source_key(self.test_dir / "ocr_results" / "scan_ocr.txt")})
+        self.assertEqual(response.facets["types"], {"annotation": 2, "ocr_result": 1})
+        self.assertEqual(response.facets["users"], {"alice": 1, "bob": 1})
+
+        filtered = self.search("triangoli", filters=SearchFilter(user_ids=["alice"]))
+        self.assertEqual([result.id for result in filtered.results], ["a1"])
+        self.assertEqual(filtered.results[0].score, 100.0)
+        self.assertEqual(filtered.results[0].user_id, "alice")
+
+        # Facets cover all matches even when the page is empty
+        self.assertEqual(self.search("triangoli", limit=0).facets["courses"], {"course-1": 1, "course-2": 1})
+
+    def test_suggestions_and_global_facets_come_from_the_index(self):
+        self.assertEqual(self.service.get_search_suggestions("triang", 5)[0], "triangoli")
+        self.assertNotIn("tri", self.service.get_search_suggestions("tri"))
+        facets = self.service.get_facets()
+        self.assertEqual(facets["types"], {"annotation": 3, "ocr_result": 1})
+        self.assertEqual(facets["tags"]["geometria"], 1)
+        self.assertEqual(self.service.get_facets(SearchFilter(course_ids=["course-2"]))["users"], {"bob": 1})
+
+    def test_annotation_writes_update_the_running_index(self):
+        self.service.sync_indexes()
+        annotations = AnnotationService()
+        annotations.annotations_dir = str(self.test_dir / "annotations")
+
+        with patch.dict(service_container._instances, {"advanced_search": self.service}):
+            created = annotations.create_annotation({
+                "user_id": "alice", "pdf_filename": "chimica.pdf", "pdf_path": "/tmp/chimica.pdf",
+                "course_id": "course-1", "book_id": "book-1", "page_number": 4,
+                "selected_text": "Legame covalente polare"
+            })
+            with patch.object(self.service, "sync_indexes", side_effect=AssertionError("no rescan expected")):
+                self.assertEqual([result.id for result in self.search("covalente").results], [created["id"]])
+
+            annotations.delete_annotation("alice", created["id"], "chimica.pdf", "course-1", "book-1")
+            with patch.object(self.service, "sync_indexes", side_effect=AssertionError("no rescan expected")):
+                self.assertEqual(self.search("covalente").results, [])
+                self.assertNotIn("covalente", self.service.get_search_suggestions("coval"))
+
+    def test_sync_picks_up_external_changes_and_rebuild(self):
+        self.service.sync_indexes()
+        ocr_file = self.test_dir / "ocr_results" / "scan_ocr.txt"
+        ocr_file.write_text("OCR Result for: scan.pdf\n\nparallelogramma", encoding="utf-8")
+        os.utime(ocr_file, (ocr_file.stat().st_atime, ocr_file.stat().st_mtime + 5))
+        (self.test_dir / "annotations" / "bob" / "course-2" / "book-9" / "storia.pdf.json").unlink()
+
+        stats = self.service.sync_indexes()
+        self.assertEqual((stats["indexed"], stats["removed"]), (1, 1))
+        self.assertEqual(len(self.search("parallelogramma").results), 1)
+        self.assertEqual([result.id for result in self.search("triangoli").results], ["a1"])
+
+        self.service.rebuild_indexes()
+        self.assertEqual(self.service.index_store.stats()["documents"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
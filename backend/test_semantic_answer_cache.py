@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test suite for the semantic LLM answer cache (paraphrase matching, scoping, invalidation)
+"""
+
+import unittest
+
+import numpy as np
+
+from services.semantic_answer_cache import SemanticAnswerCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class KeywordEmbedder:
+    """Embedding deterministico: un asse per parola chiave, così le parafrasi restano vicine."""
+
+    VOCABULARY = ["fotosintesi", "clorofilla", "luce", "rivoluzione", "francese", "cellula"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        vectors = np.zeros((len(texts), len(self.VOCABULARY)), dtype="float32")
+        for row, text in enumerate(texts):
+            for column, word in enumerate(self.VOCABULARY):
+                if word in text:
+                    vectors[row, column] = 1.0
+        return vectors
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault("threshold", 0.9)
+    kwargs.setdefault("ttl", 60)
+    kwargs.setdefault("enabled", True)
+    embedder = KeywordEmbedder()
+    return SemanticAnswerCache(embedder, **kwargs), embedder
+
+
+class TestSemanticAnswerCache(unittest.TestCase):
+    def test_paraphrase_hits_above_threshold(self):
+        cache, _ = make_cache()
+        cache.store("Cos'è la fotosintesi e a cosa serve la clorofilla?", "Risposta A", "course-1")
+
+        hit = cache.lookup("Spiegami fotosintesi e clorofilla", "course-1")
+
+        self.assertIsNotNone(hit)
+        self.assertEqual(hit["response"], "Risposta A")
+        self.assertGreaterEqual(hit["similarity"], 0.9)
+
+    def test_unrelated_question_misses(self):
+        cache, _ = make_cache()
+        cache.store("Cos'è la fotosintesi?", "Risposta A", "course-1")
+
+        self.assertIsNone(cache.lookup("Cause della rivoluzione francese", "course-1"))
+
+    def test_exact_match_skips_embedding(self):
+        cache, embedder = make_cache()
+        cache.store("Cos'è la fotosintesi?", "Risposta A", "course-1")
+        calls = embedder.calls
+
+        hit = cache.lookup("  cos'è la FOTOSINTESI  ", "course-1")
+
+        self.assertEqual(hit["response"], "Risposta A")
+        self.assertEqual(embedder.calls, calls)
+        self.assertEqual(cache.exact_hits, 1)
+
+    def test_scope_isolation_by_course_book_model_and_variant(self):
+        cache, _ = make_cache()
+        cache.store("fotosintesi", "Risposta A", "course-1", book_id="book-1", model="zai:glm-4.6", variant="short")
+
+        self.assertIsNone(cache.lookup("fotosintesi", "course-2", book_id="book-1", model="zai:glm-4.6", variant="short"))
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1", book_id="book-2", model="zai:glm-4.6", variant="short"))
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1", book_id="book-1", model="openai:gpt-4o", variant="short"))
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1", book_id="book-1", model="zai:glm-4.6", variant="long"))
+        self.assertIsNotNone(cache.lookup("fotosintesi", "course-1", book_id="book-1", model="zai:glm-4.6", variant="short"))
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache, _ = make_cache(clock=clock)
+        cache.store("fotosintesi", "Risposta A", "course-1")
+
+        clock.now += 61
+
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1"))
+        self.assertIsNone(cache.lookup("fotosintesi e clorofilla luce", "course-1"))
+
+    def test_book_invalidation_keeps_other_books(self):
+        cache, _ = make_cache()
+        cache.store("fotosintesi", "Libro 1", "course-1", book_id="book-1")
+        cache.store("fotosintesi", "Libro 2", "course-1", book_id="book-2")
+        cache.store("fotosintesi", "Corso", "course-1")
+
+        cache.invalidate("course-1", "book-1")
+
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1", book_id="book-1"))
+        # Le risposte a livello di corso includono i contenuti del libro modificato
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1"))
+        self.assertEqual(cache.lookup("fotosintesi", "course-1", book_id="book-2")["response"], "Libro 2")
+
+    def test_course_invalidation_clears_all_scopes(self):
+        cache, _ = make_cache()
+        cache.store("fotosintesi", "Libro 1", "course-1", book_id="book-1", variant="short")
+        cache.store("fotosintesi", "Corso", "course-1", variant="long")
+
+        cache.invalidate("course-1")
+
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1", book_id="book-1", variant="short"))
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1", variant="long"))
+
+    def test_ring_buffer_replaces_oldest_entry(self):
+        cache, _ = make_cache(max_entries_per_scope=2)
+        cache.store("fotosintesi", "A", "course-1")
+        cache.store("rivoluzione francese", "B", "course-1")
+        cache.store("cellula", "C", "course-1")
+
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1"))
+        self.assertEqual(cache.lookup("rivoluzione francese", "course-1")["response"], "B")
+        self.assertEqual(cache.lookup("cellula", "course-1")["response"], "C")
+
+    def test_without_embeddings_nothing_is_stored(self):
+        cache = SemanticAnswerCache(lambda texts: None, threshold=0.9, ttl=60, enabled=True)
+
+        self.assertFalse(cache.store("fotosintesi", "A", "course-1"))
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1"))
+
+    def test_disabled_cache_is_a_no_op(self):
+        cache, embedder = make_cache(enabled=False)
+
+        self.assertFalse(cache.store("fotosintesi", "A", "course-1"))
+        self.assertIsNone(cache.lookup("fotosintesi", "course-1"))
+        self.assertEqual(embedder.calls, 0)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Cos'è   la Fotosintesi?? "), "cos'è la fotosintesi")
+
+
+if __name__ == "__main__":
+    unittest.main()
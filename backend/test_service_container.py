@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test suite for the service container (shared instances, lazy proxies, warm-up and health hooks)
+"""
+
+import asyncio
+import threading
+import unittest
+
+from services.service_container import ServiceContainer
+
+
+class FakeService:
+    def __init__(self):
+        self.warmed = False
+        self.closed = False
+
+
+class TestServiceContainer(unittest.TestCase):
+    def setUp(self):
+        self.container = ServiceContainer()
+        self.created = []
+
+        def factory():
+            service = FakeService()
+            self.created.append(service)
+            return service
+
+        self.container.register(
+            "rag",
+            factory,
+            warmup=lambda service: setattr(service, "warmed", True),
+            health=lambda service: {"warmed": service.warmed},
+            close=lambda service: setattr(service, "closed", True),
+            eager=True
+        )
+
+    def test_get_returns_shared_instance(self):
+        provider = self.container.provider("rag")
+        self.assertFalse(self.container.is_initialized("rag"))
+        self.assertIs(provider(), self.container.get("rag"))
+        self.assertEqual(len(self.created), 1)
+
+    def test_concurrent_first_access_creates_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.container.get("rag"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.created), 1)
+        self.assertTrue(all(result is self.created[0] for result in results))
+
+    def test_factories_can_depend_on_other_services(self):
+        self.container.register("chat", lambda: ("chat", self.container.get("rag")))
+        self.assertIs(self.container.get("chat")[1], self.container.get("rag"))
+
+    def test_lifecycle_warmup_health_and_close(self):
+        async def run():
+            await self.container.startup(warmup=False)
+            self.assertEqual(self.container.health()["rag"], {"status": "ready", "warmed": False})
+            await self.container.warm_up()
+            health = self.container.health()["rag"]
+            await self.container.shutdown()
+            return health
+
+        health = asyncio.run(run())
+        self.assertEqual(len(self.created), 1)  # created eagerly at startup
+        self.assertTrue(health["warmed"])
+        self.assertIn("warmup_seconds", health)
+        self.assertTrue(self.created[0].closed)
+
+    def test_warmup_failure_is_reported(self):
+        self.container.register("llm", FakeService, warmup=lambda service: 1 / 0, eager=True)
+
+        async def run():
+            await self.container.startup(warmup=False)
+            await self.container.warm_up()
+
+        asyncio.run(run())
+        health = self.container.health()
+        self.assertEqual(health["llm"]["status"], "error")
+        self.assertIn("division by zero", health["llm"]["error"])
+        self.assertEqual(health["rag"]["status"], "ready")
+
+    def test_lazy_proxy_creates_service_on_first_use(self):
+        self.container.register("ocr", FakeService, close=lambda service: setattr(service, "closed", True))
+        ocr = self.container.lazy("ocr")
+        self.assertFalse(self.container.is_initialized("ocr"))
+        self.assertIn("not initialized", repr(ocr))
+
+        ocr.prefer_engine = "tesseract"
+        self.assertTrue(self.container.is_initialized("ocr"))
+        self.assertEqual(self.container.get("ocr").prefer_engine, "tesseract")
+        self.assertFalse(ocr.closed)
+
+        asyncio.run(self.container.shutdown())
+        self.assertTrue(self.container.get("ocr").closed)
+
+    def test_close_hooks_skip_services_never_used(self):
+        closed = []
+        self.container.register("ocr", FakeService, close=lambda service: closed.append(service))
+        self.container.lazy("ocr")
+        asyncio.run(self.container.shutdown())
+        self.assertEqual(closed, [])
+        self.assertFalse(self.container.is_initialized("ocr"))
+
+    def test_preload_creates_lazy_services_in_background(self):
+        self.container.register("metacognition", FakeService)
+        self.container.register("ocr", FakeService)
+
+        async def run():
+            await self.container.startup(warmup=True, preload=["metacognition", "unknown"])
+            await self.container._warmup_task
+
+        asyncio.run(run())
+        self.assertTrue(self.container.is_initialized("metacognition"))
+        self.assertFalse(self.container.is_initialized("ocr"))
+        self.assertTrue(self.created[0].warmed)
+
+    def test_unregistered_service_raises(self):
+        with self.assertRaises(KeyError):
+            self.container.get("missing")
+        self.assertEqual(self.container.health()["rag"]["status"], "not_initialized")
+
+    def test_importing_store_backed_services_does_not_open_the_database(self):
+        from services.background_task_service import background_task_service
+        from services.course_chat_session import course_chat_session_manager
+        from services.service_container import LazyService, service_container
+
+        self.assertIsInstance(background_task_service, LazyService)
+        self.assertIsInstance(course_chat_session_manager, LazyService)
+        self.assertFalse(service_container.is_initialized("entity_store"))
+        self.assertFalse(service_container.is_initialized("background_tasks"))
+
+
+if __name__ == '__main__':
+    unittest.main()
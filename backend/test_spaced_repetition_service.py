@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test suite for the spaced repetition store (per-thread WAL connections, batched reviews, due-card index)
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from services.spaced_repetition_service import SpacedRepetitionService
+
+
+class TestSpacedRepetitionService(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.service = SpacedRepetitionService(db_path=os.path.join(self.test_dir, "spaced_repetition.db"))
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def create_cards(self, count, course_id="course-1"):
+        return [
+            self.service.create_card(course_id, f"Domanda {index}", f"Risposta {index}")
+            for index in range(count)
+        ]
+
+    def test_database_uses_wal_and_due_index(self):
+        conn = self.service.connection()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM learning_cards "
+            "WHERE course_id = ? AND next_review <= ? ORDER BY next_review LIMIT 20",
+            ("course-1", "2030-01-01")
+        ))
+        self.assertIn("idx_cards_course_next_review", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_review_cards_applies_session_in_one_transaction(self):
+        card_ids = self.create_cards(3)
+
+        results = self.service.review_cards([
+            {"card_id": card_ids[0], "quality_rating": 5, "response_time_ms": 2000},
+            {"card_id": card_ids[1], "quality_rating": 1, "response_time_ms": 8000},
+            {"card_id": card_ids[0], "quality_rating": 5, "response_time_ms": 2000}
+        ], session_id="session-1")
+
+        self.assertEqual([result["repetitions"] for result in results], [1, 1, 2])
+        self.assertEqual(results[2]["interval_days"], 6)
+        first = self.service.get_card(card_ids[0])
+        self.assertEqual(first.review_count, 2)
+        self.assertEqual(first.repetitions, 2)
+        self.assertEqual([card.id for card in self.service.get_due_cards("course-1")], [card_ids[2]])
+
+        reviews = self.service.connection().execute(
+            "SELECT COUNT(*) FROM review_sessions WHERE session_id = ?", ("session-1",)
+        ).fetchone()[0]
+        self.assertEqual(reviews, 3)
+
+    def test_unknown_card_rolls_back_the_batch(self):
+        card_ids = self.create_cards(1)
+
+        with self.assertRaises(ValueError):
+            self.service.review_cards([
+                {"card_id": card_ids[0], "quality_rating": 5, "response_time_ms": 2000},
+                {"card_id": "missing", "quality_rating": 5, "response_time_ms": 2000}
+            ])
+
+        self.assertEqual(self.service.get_card(card_ids[0]).review_count, 0)
+        self.assertEqual(self.service.connection().execute("SELECT COUNT(*) FROM review_sessions").fetchone()[0], 0)
+
+    def test_concurrent_reviews_from_worker_threads(self):
+        card_ids = self.create_cards(8)
+
+        def worker(card_id):
+            for _ in range(5):
+                self.service.review_card(card_id, 4, 4000)
+
+        threads = [threading.Thread(target=worker, args=(card_id,)) for card_id in card_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(self.service.get_card(card_id).review_count == 5 for card_id in card_ids))
+        analytics = asyncio.run(self.service.get_learning_analytics_async("course-1"))
+        self.assertEqual(analytics["review_statistics"]["total_reviews"], 40)
+        self.assertEqual(analytics["card_statistics"]["due_cards"], 0)
+
+    def test_async_variants(self):
+        card_ids = self.create_cards(2)
+
+        async def run():
+            due = await self.service.get_due_cards_async("course-1")
+            results = await self.service.review_cards_async([
+                {"card_id": card.id, "quality_rating": 4, "response_time_ms": 4000} for card in due
+            ])
+            return due, results
+
+        due, results = asyncio.run(run())
+        self.assertEqual(sorted(card.id for card in due), sorted(card_ids))
+        self.assertEqual(len(results), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test suite for the startup import profiler (per-module cumulative and self timings)
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from services.startup_profiler import StartupProfiler
+
+
+class TestStartupProfiler(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        sys.path.insert(0, self.test_dir)
+        self.write_module("profiled_child", "import time\ntime.sleep(0.05)\nVALUE = 42\n")
+        self.write_module("profiled_parent", "import profiled_child\nVALUE = profiled_child.VALUE\n")
+        self.profiler = StartupProfiler()
+
+    def tearDown(self):
+        self.profiler.finish()
+        sys.path.remove(self.test_dir)
+        for name in ("profiled_parent", "profiled_child"):
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def write_module(self, name, source):
+        with open(os.path.join(self.test_dir, f"{name}.py"), "w") as handle:
+            handle.write(source)
+
+    def test_reports_cumulative_and_self_time(self):
+        self.profiler.install()
+        import profiled_parent
+        self.profiler.finish()
+
+        self.assertEqual(profiled_parent.VALUE, 42)
+        report = self.profiler.report(top=10)
+        timings = {entry["module"]: entry for entry in report["modules"]}
+        self.assertTrue(report["enabled"])
+        self.assertGreaterEqual(timings["profiled_child"]["self_ms"], 45)
+        self.assertGreaterEqual(timings["profiled_parent"]["cumulative_ms"], 45)
+        self.assertLess(timings["profiled_parent"]["self_ms"], timings["profiled_child"]["self_ms"])
+        self.assertEqual(report["modules"][0]["module"], "profiled_child")
+
+    def test_finish_stops_measuring_lazy_imports(self):
+        self.profiler.install()
+        self.profiler.finish()
+        self.assertNotIn(self.profiler, sys.meta_path)
+
+        importlib.import_module("profiled_child")
+        self.assertEqual(self.profiler.report()["modules"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Test suite for the two-tier cache (O(1) LRU, TTL wheel, tags, single-flight coalescing)
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from services.tiered_cache import LRUCache, SingleFlight, TieredCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeL2:
+    """Sottoinsieme async di RedisCacheService usato da TieredCache."""
+
+    def __init__(self):
+        self.data = {}
+        self.tags = {}
+        self.gets = 0
+
+    async def get(self, cache_type, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    async def set(self, cache_type, key, value, custom_ttl=None, tags=None):
+        self.data[key] = value
+        for tag in tags or ():
+            self.tags.setdefault(tag, set()).add(key)
+        return True
+
+    async def invalidate_tags(self, tags):
+        keys = set()
+        for tag in tags:
+            keys.update(self.tags.pop(tag, ()))
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    async def delete(self, cache_type, key):
+        return self.data.pop(key, None) is not None
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=3)
+        for key in ("a", "b", "c"):
+            cache.set(key, key.upper())
+        cache.get("a")
+        cache.set("d", "D")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual([cache.get(key) for key in ("a", "c", "d")], ["A", "C", "D"])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_ttl_wheel_expires_only_due_slots(self):
+        clock = FakeClock()
+        cache = LRUCache(max_size=100, clock=clock)
+        cache.set("short", 1, ttl=5)
+        cache.set("long", 2, ttl=60)
+        cache.set("forever", 3)
+
+        clock.now += 10
+        self.assertEqual(cache.purge_expired(), 1)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("short", cache)
+        self.assertEqual(cache.get("long"), 2)
+
+        clock.now += 100
+        self.assertEqual(cache.keys(), ["forever"])
+
+    def test_overwrite_resets_expiry(self):
+        clock = FakeClock()
+        cache = LRUCache(clock=clock)
+        cache.set("k", "old", ttl=5)
+        cache.set("k", "new", ttl=50)
+        clock.now += 10
+        self.assertEqual(cache.purge_expired(), 0)
+        self.assertEqual(cache.get("k"), "new")
+
+    def test_tag_invalidation(self):
+        cache = LRUCache()
+        cache.set("q1", 1, tags=["course:c1", "book:c1:b1"])
+        cache.set("q2", 2, tags=["course:c1", "book:c1:b2"])
+        cache.set("q3", 3, tags=["course:c2"])
+
+        self.assertEqual(cache.invalidate_tags(["book:c1:b1"]), 1)
+        self.assertEqual(cache.invalidate_tags(["course:c1"]), 1)
+        self.assertEqual(cache.keys(), ["q3"])
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"text": "contesto"}
+
+        async def run():
+            return await asyncio.gather(*(flight.do("q", compute) for _ in range(20)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(flight.coalesced, 19)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_errors_propagate_to_waiters(self):
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            return await asyncio.gather(*(flight.do("q", failing) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+class TestTieredCache(unittest.TestCase):
+    def setUp(self):
+        self.l2 = FakeL2()
+        self.cache = TieredCache("test", cache_type="query_result", ttl=600, l1_max_ttl=30,
+                                 l2_provider=lambda: self.l2)
+
+    def test_identical_queries_compute_once(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"text": "risposta"}
+
+        async def run():
+            results = await asyncio.gather(*(self.cache.get_or_compute("q", compute, tags=["course:c1"])
+                                             for _ in range(10)))
+            again = await self.cache.get_or_compute("q", compute)
+            return results, again
+
+        results, again = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(again, {"text": "risposta"})
+        self.assertEqual(self.l2.data["q"], {"text": "risposta"})
+        self.assertEqual(self.cache.stats()["coalesced_requests"], 9)
+
+    def test_l2_hit_is_promoted_to_l1(self):
+        self.l2.data["q"] = {"text": "da redis"}
+
+        async def run():
+            first = await self.cache.get_or_compute("q", self.fail_compute)
+            second = await self.cache.get("q")
+            return first, second
+
+        self.assertEqual(asyncio.run(run()), ({"text": "da redis"}, {"text": "da redis"}))
+        self.assertEqual(self.l2.gets, 1)
+        self.assertEqual(self.cache.l1_ttl, 30)
+
+    def test_cache_if_and_tag_invalidation(self):
+        async def empty():
+            return {"text": ""}
+
+        async def run():
+            await self.cache.get_or_compute("empty", empty, cache_if=lambda r: bool(r["text"]))
+            await self.cache.set("q", {"text": "x"}, tags=["course:c1"])
+            deleted = await self.cache.invalidate_tags(["course:c1"])
+            return deleted, await self.cache.get("q")
+
+        deleted, value = asyncio.run(run())
+        self.assertNotIn("empty", self.l2.data)
+        self.assertEqual(deleted, 2)  # una voce in L1 e una in L2
+        self.assertIsNone(value)
+
+    async def fail_compute(self):
+        self.fail("value should come from L2")
+
+
+class TestBookConceptCacheL1(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.test_dir)
+
+    def test_hits_are_served_from_memory_and_invalidated_by_book(self):
+        from services.book_concept_cache import BookConceptCache
+
+        cache = BookConceptCache(cache_path="data/book_concept_cache.json")
+        concept_map = {"concepts": [{"name": "Rivoluzione"}], "rag_analysis_quality_score": 0.9}
+        self.assertTrue(cache.store_concept_map("c1", "b1", concept_map))
+
+        cache._is_expired = lambda entry: self.fail("L1 hit should not parse the expiry")
+        for _ in range(5):
+            self.assertEqual(cache.get_concept_map("c1", "b1"), concept_map)
+        self.assertEqual(cache.metrics["cache_hits"], 5)
+
+        del cache._is_expired
+        self.assertTrue(cache.invalidate_book_cache("c1", "b1"))
+        self.assertIsNone(cache.get_concept_map("c1", "b1"))
+        self.assertEqual(cache.get_cache_stats()["cache_content"]["memory_entries"], 0)
+
+    def test_debounced_metrics_are_flushed_by_the_shutdown_hook(self):
+        from services.book_concept_cache import BookConceptCache
+        from services.service_container import service_container
+
+        cache = BookConceptCache(cache_path="data/book_concept_cache.json")
+        cache.metrics_flush_interval = 3600
+        for _ in range(3):
+            cache.get_concept_map("c1", "missing")
+        self.assertTrue(cache._metrics_dirty)
+
+        service_container._registrations["book_concept_cache"].close(cache)
+
+        self.assertFalse(cache._metrics_dirty)
+        with open(cache.metrics_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["cache_misses"], cache.metrics["cache_misses"])
+
+
+if __name__ == '__main__':
+    unittest.main()
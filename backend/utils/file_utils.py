@@ -100,6 +100,39 @@ class AsyncFileOperations:
             logger.error(f"Error copying file from {src_path} to {dst_path}: {e}")
             raise
 
+    @staticmethod
+    async def save_upload(upload, dst_path: str, max_bytes: Optional[int] = None,
+                          chunk_size: int = 1024 * 1024) -> int:
+        """
+        Stream an uploaded file (FastAPI UploadFile) to disk without loading it in memory.
+
+        Args:
+            upload: Object exposing an async read(size) method
+            dst_path: Destination file path
+            max_bytes: Abort (and remove the partial file) once this size is exceeded
+            chunk_size: Size of each chunk to read
+
+        Returns:
+            Number of bytes written
+        """
+        Path(dst_path).parent.mkdir(parents=True, exist_ok=True)
+        bytes_written = 0
+        try:
+            async with aiofiles.open(dst_path, 'wb') as dst_file:
+                while True:
+                    chunk = await upload.read(chunk_size)
+                    if not chunk:
+                        break
+                    bytes_written += len(chunk)
+                    if max_bytes is not None and bytes_written > max_bytes:
+                        raise ValueError(f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+                    await dst_file.write(chunk)
+            return bytes_written
+        except Exception:
+            if os.path.exists(dst_path):
+                os.remove(dst_path)
+            raise
+
     @staticmethod
     async def file_exists(file_path: str) -> bool:
         """